@@ -212,7 +212,8 @@ setup(name='unicycler',
       author_email='rrwick@gmail.com',
       license='GPL',
       packages=['unicycler'],
-      entry_points={"console_scripts": ['unicycler = unicycler.unicycler:main']},
+      entry_points={"console_scripts": ['unicycler = unicycler.unicycler:main',
+                                         'unicycler-batch = unicycler.batch:main']},
       zip_safe=False,
       cmdclass={'install': UnicyclerInstall,
                 'clean': UnicyclerClean,
@@ -0,0 +1,73 @@
+"""
+Copyright 2017 Ryan Wick (rrwick@gmail.com)
+https://github.com/rrwick/Unicycler
+
+This script times the semi-global aligner on the tough alignment test data at a range of
+sensitivity levels. It outputs a table with the number of alignments found and the time taken.
+
+This file is part of Unicycler. Unicycler is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version. Unicycler is distributed in
+the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along with Unicycler. If
+not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+import unicycler.alignment
+import unicycler.log
+import unicycler.misc
+import unicycler.read_ref
+import unicycler.unicycler_align
+
+
+def main():
+    args = get_arguments()
+    test_dir = os.path.dirname(os.path.realpath(__file__))
+    ref_fasta = os.path.join(test_dir, 'test_semi_global_alignment_tough.fasta')
+    read_fastq = os.path.join(test_dir, 'test_semi_global_alignment_tough.fastq')
+
+    unicycler.log.logger = unicycler.log.Log(log_filename=None, stdout_verbosity_level=0)
+    refs = unicycler.read_ref.load_references(ref_fasta, show_progress=False)
+    read_dict, read_names, _ = unicycler.read_ref.load_long_reads(read_fastq, silent=True)
+    scoring_scheme = unicycler.alignment.AlignmentScoringScheme('3,-6,-5,-2')
+
+    print()
+    table = [['Level', 'Reads', 'Alignments', 'Best time (s)', 'Mean time (s)']]
+    for level in args.levels:
+        times = []
+        alignment_count = 0
+        for _ in range(args.repeats):
+            start_time = time.time()
+            aligned_reads = unicycler.unicycler_align.\
+                semi_global_align_long_reads(refs, ref_fasta, read_dict, read_names, read_fastq,
+                                             args.threads, scoring_scheme, [None], False, 10,
+                                             None, None, 0, level, None, 0)
+            times.append(time.time() - start_time)
+            alignment_count = sum(len(r.alignments) for r in aligned_reads.values())
+        table.append([str(level), str(len(read_names)), str(alignment_count),
+                      '%.2f' % min(times), '%.2f' % (sum(times) / len(times))])
+    unicycler.misc.print_table(table, col_separation=3, header_format='underline', indent=0,
+                               alignments='RRRRR', verbosity=0)
+    print()
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description='Semi-global alignment benchmark')
+    parser.add_argument('--levels', type=int, nargs='+', default=[0, 1],
+                        help='Sensitivity levels to time')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='Number of times to align the reads at each level')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='Number of alignment threads')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
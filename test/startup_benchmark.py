@@ -0,0 +1,65 @@
+"""
+Copyright 2017 Ryan Wick (rrwick@gmail.com)
+https://github.com/rrwick/Unicycler
+
+This script times how long Unicycler takes to start up and exit for commands which don't assemble
+anything (--version, --help and an argument error). It outputs a table of the times and exits with
+an error if any is over --max_time, so it can be used to catch startup regressions.
+
+This file is part of Unicycler. Unicycler is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version. Unicycler is distributed in
+the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along with Unicycler. If
+not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+import unicycler.misc
+
+
+COMMANDS = [['--version'], ['--help'], ['--mode', 'x']]
+
+
+def main():
+    args = get_arguments()
+    repo_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    unicycler_runner = os.path.join(repo_dir, 'unicycler-runner.py')
+
+    print()
+    table = [['Command', 'Best time (s)', 'Mean time (s)']]
+    slow = False
+    for command in COMMANDS:
+        times = []
+        for _ in range(args.repeats):
+            start_time = time.time()
+            subprocess.run([sys.executable, unicycler_runner] + command, cwd=repo_dir,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            times.append(time.time() - start_time)
+        slow = slow or min(times) > args.max_time
+        table.append([' '.join(command), '%.3f' % min(times), '%.3f' % (sum(times) / len(times))])
+    unicycler.misc.print_table(table, col_separation=3, header_format='underline', indent=0,
+                               alignments='LRR', verbosity=0)
+    print()
+    if slow:
+        sys.exit('Error: startup took longer than ' + str(args.max_time) + ' s')
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description='Startup time benchmark')
+    parser.add_argument('--repeats', type=int, default=10,
+                        help='Number of times to run each command')
+    parser.add_argument('--max_time', type=float, default=0.5,
+                        help='Fail if the best time for any command is over this (seconds)')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,8 @@ not, see <http://www.gnu.org/licenses/>.
 
 import unittest
 import os
+import gzip
+import pickle
 import unicycler.assembly_graph
 import unicycler.misc
 import unicycler.log
@@ -197,6 +199,70 @@ class TestAssemblyGraphFunctions1(unittest.TestCase):
         self.assertEqual(link_count_1, link_count_2)
         os.remove(temp_gfa)
 
+    def test_save_to_gfa_with_cache(self):
+        """
+        A graph loaded from the binary cache should be the same as one parsed from the GFA, and
+        the cache should be ignored once the GFA changes.
+        """
+        temp_gfa = os.path.join(os.path.dirname(__file__), 'temp_cache.gfa')
+        temp_cache = unicycler.assembly_graph.gfa_cache_filename(temp_gfa)
+        self.graph.save_to_gfa(temp_gfa, include_insert_size=True, save_cache=True)
+        self.assertTrue(os.path.isfile(temp_cache))
+        from_gfa = unicycler.assembly_graph.parse_gfa(temp_gfa)
+        from_cache = unicycler.assembly_graph.load_gfa_cache(temp_gfa)
+        self.assertEqual(from_gfa, from_cache)
+        graph2 = unicycler.assembly_graph.AssemblyGraph(temp_gfa, None, use_cache=True)
+        self.assertEqual(graph2.overlap, 25)
+        self.assertEqual(self.graph.forward_links, graph2.forward_links)
+        self.assertEqual(self.graph.reverse_links, graph2.reverse_links)
+        for seg_num, segment in self.graph.segments.items():
+            self.assertEqual(segment.forward_sequence, graph2.segments[seg_num].forward_sequence)
+            self.assertEqual(segment.reverse_sequence, graph2.segments[seg_num].reverse_sequence)
+        with open(temp_gfa, 'at') as gfa:
+            gfa.write('S\t999999\tACGT\tdp:f:1.0\n')
+        self.assertIsNone(unicycler.assembly_graph.load_gfa_cache(temp_gfa))
+        graph3 = unicycler.assembly_graph.AssemblyGraph(temp_gfa, None, use_cache=True)
+        self.assertTrue(999999 in graph3.segments)
+        os.remove(temp_gfa)
+        os.remove(temp_cache)
+
+    def test_gfa_cache_only_used_on_request(self):
+        """
+        A cache file next to a GFA is only used when asked for, and an unreadable cache is
+        ignored rather than crashing the load.
+        """
+        temp_gfa = os.path.join(os.path.dirname(__file__), 'temp_cache_2.gfa')
+        temp_cache = unicycler.assembly_graph.gfa_cache_filename(temp_gfa)
+        self.graph.save_to_gfa(temp_gfa, save_cache=True)
+        cached = unicycler.assembly_graph.load_gfa_cache(temp_gfa)
+        cached[0].append((999999, 1.0, 'ACGT'))
+        with open(temp_cache, 'wb') as cache_file:
+            pickle.dump((unicycler.assembly_graph.GFA_CACHE_VERSION,
+                         unicycler.misc.get_file_stamp(temp_gfa), cached), cache_file)
+        graph2 = unicycler.assembly_graph.AssemblyGraph(temp_gfa, None)
+        self.assertFalse(999999 in graph2.segments)
+        graph3 = unicycler.assembly_graph.AssemblyGraph(temp_gfa, None, use_cache=True)
+        self.assertTrue(999999 in graph3.segments)
+        with open(temp_cache, 'wb') as cache_file:
+            cache_file.write(pickle.dumps(cached)[:-10])
+        self.assertIsNone(unicycler.assembly_graph.load_gfa_cache(temp_gfa))
+        graph4 = unicycler.assembly_graph.AssemblyGraph(temp_gfa, None, use_cache=True)
+        self.assertFalse(999999 in graph4.segments)
+        os.remove(temp_gfa)
+        os.remove(temp_cache)
+
+    def test_load_gzipped_gfa(self):
+        test_gfa = os.path.join(os.path.dirname(__file__), 'test_assembly_graph.gfa')
+        temp_gfa_gz = os.path.join(os.path.dirname(__file__), 'temp.gfa.gz')
+        with open(test_gfa, 'rb') as gfa, gzip.open(temp_gfa_gz, 'wb') as gfa_gz:
+            gfa_gz.write(gfa.read())
+        graph2 = unicycler.assembly_graph.AssemblyGraph(temp_gfa_gz, None)
+        self.assertEqual(graph2.overlap, 25)
+        self.assertEqual(len(self.graph.segments), len(graph2.segments))
+        self.assertEqual(self.graph.forward_links, graph2.forward_links)
+        self.assertEqual(self.graph.paths, graph2.paths)
+        os.remove(temp_gfa_gz)
+
     def test_get_all_gfa_link_lines(self):
         gfa_link_lines = self.graph.get_all_gfa_link_lines()
         self.assertEqual(gfa_link_lines.count('\n'), 452)
@@ -25,6 +25,10 @@ class TestCopyDepth(unittest.TestCase):
                                                             insert_size_deviation=60)
         unicycler.assembly_graph_copy_depth.determine_copy_depth(self.graph)
 
+    def test_arrangement_cache_cleared(self):
+        copy_depth = unicycler.assembly_graph_copy_depth
+        self.assertEqual(copy_depth.get_best_arrangement.cache_info().currsize, 0)
+
     def test_single_copy_segments_1(self):
         """
         Tests large contigs from the largest replicon, all of which should have a copy depth of 1.
@@ -90,3 +94,43 @@ class TestCopyDepth(unittest.TestCase):
         self.assertEqual(len(self.graph.copy_depths[308]), 3)
         self.assertEqual(len(self.graph.copy_depths[9]), 1)
         self.assertEqual(len(self.graph.copy_depths[10]), 2)
+
+
+class TestBestArrangement(unittest.TestCase):
+
+    def check_against_all_arrangements(self, items, targets, bin_depths):
+        """
+        The branch-and-bound search should give the same result as scoring every arrangement.
+        """
+        copy_depth = unicycler.assembly_graph_copy_depth
+        arrangements = copy_depth.shuffle_into_bins(list(items), [[]] * len(targets),
+                                                    list(targets))
+        lowest_error, best_arrangement = float('inf'), None
+        for i, arrangement in enumerate(arrangements):
+            error = max(copy_depth.get_error(sum(x), depth)
+                        for x, depth in zip(arrangement, bin_depths))
+            if i == 0 or error < lowest_error:
+                lowest_error = error
+                best_arrangement = tuple(tuple(x) for x in arrangement)
+        error, arrangement = copy_depth.get_best_arrangement(items, targets, bin_depths)
+        self.assertEqual(arrangement, best_arrangement)
+        self.assertEqual(error, lowest_error)
+
+    def test_best_arrangement_1(self):
+        self.check_against_all_arrangements((1.0, 1.0), (None, None), (1.0, 1.0))
+
+    def test_best_arrangement_2(self):
+        self.check_against_all_arrangements((2.1, 1.9, 1.0, 0.9), (None, None), (3.0, 3.0))
+
+    def test_best_arrangement_3(self):
+        self.check_against_all_arrangements((2.1, 1.9, 1.0, 0.9), (None, 1), (4.0, 1.0))
+
+    def test_best_arrangement_4(self):
+        self.check_against_all_arrangements((1.2, 1.1, 1.0, 0.9, 0.8), (2, None, None),
+                                            (2.0, 2.1, 0.9))
+
+    def test_no_valid_arrangement(self):
+        error, arrangement = \
+            unicycler.assembly_graph_copy_depth.get_best_arrangement((1.0,), (None, None),
+                                                                     (1.0, 1.0))
+        self.assertIsNone(arrangement)
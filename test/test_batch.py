@@ -0,0 +1,107 @@
+"""
+Copyright 2017 Ryan Wick (rrwick@gmail.com)
+https://github.com/rrwick/Unicycler
+
+This file is part of Unicycler. Unicycler is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version. Unicycler is distributed in
+the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along with Unicycler. If
+not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import unicycler.batch
+import unicycler.log
+
+
+def fake_run_sample(args, _):
+    """
+    Stands in for a sample's assembly: samples whose output directory ends in 'bad' fail.
+    """
+    sys.exit(1 if args.out.endswith('bad') else 0)
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        unicycler.log.logger = unicycler.log.Log(log_filename=None, stdout_verbosity_level=0)
+        self.temp_dir = tempfile.mkdtemp()
+        self.sample_sheet = os.path.join(self.temp_dir, 'samples.tsv')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_sample_sheet(self, lines):
+        with open(self.sample_sheet, 'wt') as sheet:
+            sheet.write('\n'.join(lines) + '\n')
+
+    def test_load_sample_sheet(self):
+        self.write_sample_sheet(['sample\tshort1\tshort2\tlong',
+                                 '# a comment',
+                                 'a\ta_1.fastq\ta_2.fastq\t/reads/a_long.fastq',
+                                 '',
+                                 'b\t\t\tb_long.fastq'])
+        samples = unicycler.batch.load_sample_sheet(self.sample_sheet)
+        self.assertEqual([s.name for s in samples], ['a', 'b'])
+        self.assertEqual(samples[0].short1, os.path.join(self.temp_dir, 'a_1.fastq'))
+        self.assertEqual(samples[0].long, '/reads/a_long.fastq')
+        self.assertIsNone(samples[0].unpaired)
+        self.assertIsNone(samples[1].short1)
+        self.assertEqual(samples[1].get_read_files(),
+                         [os.path.join(self.temp_dir, 'b_long.fastq')])
+
+    def test_duplicate_sample_names(self):
+        self.write_sample_sheet(['sample\tlong', 'a\ta.fastq', 'a\tb.fastq'])
+        with self.assertRaises(SystemExit):
+            unicycler.batch.load_sample_sheet(self.sample_sheet)
+
+    def test_bad_sample_name(self):
+        self.write_sample_sheet(['sample\tlong', '../a\ta.fastq'])
+        with self.assertRaises(SystemExit):
+            unicycler.batch.load_sample_sheet(self.sample_sheet)
+
+    def test_unknown_column(self):
+        self.write_sample_sheet(['sample\treads', 'a\ta.fastq'])
+        with self.assertRaises(SystemExit):
+            unicycler.batch.load_sample_sheet(self.sample_sheet)
+
+    def test_sample_arguments(self):
+        sample = unicycler.batch.BatchSample('a', None, None, None, '/reads/a.fastq')
+        arguments = sample.get_unicycler_arguments('/out/a', 4, ['--mode', 'bold'])
+        self.assertEqual(arguments, ['--long', '/reads/a.fastq', '--out', '/out/a',
+                                     '--threads', '4', '--mode', 'bold'])
+
+    def run_fake_samples(self, names, threads, sample_threads):
+        samples = []
+        for name in names:
+            sample = unicycler.batch.BatchSample(name, None, None, None, None)
+            sample.args = argparse.Namespace(out=os.path.join(self.temp_dir, name), threads=0)
+            samples.append(sample)
+        original_run_sample = unicycler.batch.run_sample
+        unicycler.batch.run_sample = fake_run_sample
+        try:
+            unicycler.batch.run_samples(samples, threads, sample_threads)
+        finally:
+            unicycler.batch.run_sample = original_run_sample
+        return samples
+
+    def test_run_samples(self):
+        samples = self.run_fake_samples(['a', 'b', 'c_bad', 'd'], 8, 3)
+        self.assertEqual([s.status for s in samples], ['complete', 'complete', 'failed',
+                                                       'complete'])
+        for sample in samples:
+            self.assertGreaterEqual(sample.threads, 3)
+            self.assertLessEqual(sample.threads, 8)
+            self.assertEqual(sample.args.threads, sample.threads)
+
+    def test_last_sample_gets_free_threads(self):
+        samples = self.run_fake_samples(['a'], 8, 3)
+        self.assertEqual(samples[0].threads, 8)
+        self.assertEqual(samples[0].status, 'complete')
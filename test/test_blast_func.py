@@ -33,11 +33,15 @@ class TestBlastFunc(unittest.TestCase):
         self.verbosity = 0
         self.start_gene_id = 90.0
         self.start_gene_cov = 95.0
-        self.blast_dir = 'TEMP_' + str(os.getpid())
+        self.starting_dir = os.getcwd()
+        self.blast_dir = os.path.abspath('TEMP_' + str(os.getpid()))
         if not os.path.exists(self.blast_dir):
             os.makedirs(self.blast_dir)
 
     def tearDown(self):
+        # find_start_gene runs BLAST from inside blast_dir, and it doesn't move back out if the
+        # BLAST tools can't be run at all.
+        os.chdir(self.starting_dir)
         if os.path.exists(self.blast_dir):
             shutil.rmtree(self.blast_dir)
 
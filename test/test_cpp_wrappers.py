@@ -13,6 +13,7 @@ not, see <http://www.gnu.org/licenses/>.
 
 import unittest
 import os
+import random
 import unicycler.cpp_wrappers
 import unicycler.read_ref
 import unicycler.alignment
@@ -125,6 +126,110 @@ class TestFullyGlobalAlignment(unittest.TestCase):
         self.assertEqual(scaled_score_1, scaled_score_2)
 
 
+class TestAlignmentScores(unittest.TestCase):
+    """
+    The score-only aligners should give the same scores as the aligners which make the full
+    alignment. The scaled scores can differ very slightly when there are equally good alignments of
+    different lengths.
+    """
+    def setUp(self):
+        test_fasta = os.path.join(os.path.dirname(__file__), 'test_cpp_wrappers.fasta')
+        fasta = unicycler.misc.load_fasta(test_fasta)
+        self.seqs = [x[1] for x in fasta]
+        self.scoring_scheme = unicycler.alignment.AlignmentScoringScheme('3,-6,-5,-2')
+        self.pairs = [(self.seqs[0], self.seqs[i]) for i in range(1, 8)] + \
+                     [(self.seqs[8], self.seqs[9]), (self.seqs[8], self.seqs[10]),
+                      (self.seqs[10], self.seqs[8]), (self.seqs[11], self.seqs[12])]
+
+    def check_scores(self, full_function, scores_function, band_size):
+        scores = scores_function(self.pairs, self.scoring_scheme, True, band_size)
+        self.assertEqual(len(scores), len(self.pairs))
+        for (seq_1, seq_2), (raw_score, scaled_score) in zip(self.pairs, scores):
+            result = full_function(seq_1, seq_2, self.scoring_scheme, True, band_size)
+            seqan_parts = result.split(',', 9)
+            self.assertEqual(raw_score, int(seqan_parts[6]))
+            self.assertAlmostEqual(scaled_score, float(seqan_parts[7]), delta=0.1)
+
+    def test_fully_global_scores(self):
+        self.check_scores(unicycler.cpp_wrappers.fully_global_alignment,
+                          unicycler.cpp_wrappers.fully_global_alignment_scores, 1000)
+
+    def test_fully_global_scores_small_band(self):
+        self.check_scores(unicycler.cpp_wrappers.fully_global_alignment,
+                          unicycler.cpp_wrappers.fully_global_alignment_scores, 10)
+
+    def test_path_scores(self):
+        self.check_scores(unicycler.cpp_wrappers.path_alignment,
+                          unicycler.cpp_wrappers.path_alignment_scores, 1000)
+
+    def test_no_pairs(self):
+        self.assertEqual(unicycler.cpp_wrappers.fully_global_alignment_scores(
+            [], self.scoring_scheme, True, 1000), [])
+
+
+class TestLoopAlignmentScores(unittest.TestCase):
+    """
+    Scoring all loop counts at once should agree with aligning the read to each loop count's
+    sequence separately.
+    """
+    def setUp(self):
+        self.scoring_scheme = unicycler.alignment.AlignmentScoringScheme('3,-6,-5,-2')
+        random.seed(0)
+        self.start = unicycler.misc.get_random_sequence(500)
+        self.repeat = unicycler.misc.get_random_sequence(300)
+        self.middle = unicycler.misc.get_random_sequence(100)
+        self.end = unicycler.misc.get_random_sequence(400)
+
+    @staticmethod
+    def add_errors(seq, error_rate):
+        """
+        Adds an equal mix of substitutions, insertions and deletions to the sequence.
+        """
+        new_seq = []
+        for base in seq:
+            r = random.random() / error_rate
+            if r < 1/3:  # deletion
+                continue
+            elif r < 2/3:  # insertion
+                new_seq += [unicycler.misc.get_random_base(), base]
+            elif r < 1:  # substitution
+                new_seq.append(unicycler.misc.get_random_base())
+            else:
+                new_seq.append(base)
+        return ''.join(new_seq)
+
+    def get_separate_scores(self, read, middle, max_loop_count):
+        pairs = [(read, self.start + self.repeat + (middle + self.repeat) * i + self.end)
+                 for i in range(max_loop_count + 1)]
+        scores = unicycler.cpp_wrappers.fully_global_alignment_scores(pairs, self.scoring_scheme,
+                                                                      True, 50)
+        return [x[0] for x in scores]
+
+    def check_loop_count(self, loop_count, middle):
+        read = self.start + self.repeat + (middle + self.repeat) * loop_count + self.end
+        read = self.add_errors(read, 0.05)
+        scores = unicycler.cpp_wrappers.loop_alignment_scores(read, self.start, self.repeat,
+                                                              middle, self.end, 6,
+                                                              self.scoring_scheme, 50)
+        separate_scores = self.get_separate_scores(read, middle, 6)
+        self.assertEqual(len(scores), 7)
+        self.assertEqual(scores.index(max(scores)), loop_count)
+        self.assertEqual(separate_scores.index(max(separate_scores)), loop_count)
+        self.assertEqual(scores[loop_count], separate_scores[loop_count])
+
+    def test_no_loops(self):
+        self.check_loop_count(0, self.middle)
+
+    def test_two_loops(self):
+        self.check_loop_count(2, self.middle)
+
+    def test_two_loops_no_middle(self):
+        self.check_loop_count(2, '')
+
+    def test_five_loops(self):
+        self.check_loop_count(5, self.middle)
+
+
 class TestPathAlignment(unittest.TestCase):
     pass
 
@@ -0,0 +1,75 @@
+"""
+Copyright 2017 Ryan Wick (rrwick@gmail.com)
+https://github.com/rrwick/Unicycler
+
+This file is part of Unicycler. Unicycler is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version. Unicycler is distributed in
+the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along with Unicycler. If
+not, see <http://www.gnu.org/licenses/>.
+"""
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import unicycler.log
+
+
+class TestLog(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.log_filename = os.path.join(self.temp_dir, 'test.log')
+        self.old_stdout = sys.stdout
+        sys.stdout = io.StringIO()
+        unicycler.log.logger = unicycler.log.Log(log_filename=self.log_filename,
+                                                 stdout_verbosity_level=1)
+
+    def tearDown(self):
+        unicycler.log.flush_log()
+        sys.stdout = self.old_stdout
+        unicycler.log.logger = unicycler.log.Log(log_filename=None, stdout_verbosity_level=0)
+        shutil.rmtree(self.temp_dir)
+
+    def get_output(self):
+        unicycler.log.flush_log()
+        with open(self.log_filename, 'rt') as log_file:
+            return sys.stdout.getvalue(), log_file.read()
+
+    def test_log_order(self):
+        for i in range(1000):
+            unicycler.log.log(str(i))
+        stdout, log_file = self.get_output()
+        expected = ''.join(str(i) + '\n' for i in range(1000))
+        self.assertEqual(stdout, expected)
+        self.assertEqual(log_file, expected)
+
+    def test_formatting_removed_from_log_file(self):
+        unicycler.log.log(unicycler.log.dim('dim text'))
+        _, log_file = self.get_output()
+        self.assertEqual(log_file, 'dim text\n')
+
+    def test_verbosity(self):
+        unicycler.log.log('shown', 1)
+        unicycler.log.log('hidden', 2)
+        unicycler.log.log('file only', 1, print_to_screen=False)
+        unicycler.log.log_explanation('hidden explanation', verbosity=2)
+        stdout, log_file = self.get_output()
+        self.assertEqual(stdout, 'shown\n')
+        self.assertEqual(log_file, 'shown\nfile only\n')
+
+    def test_progress_lines_throttled(self):
+        for i in range(1001):
+            unicycler.log.log_progress_line(i, 1000)
+        unicycler.log.log_progress_line(1000, 1000, end_newline=True)
+        stdout, log_file = self.get_output()
+        progress_lines = stdout.split('\r')[1:]
+        self.assertLess(len(progress_lines), 100)
+        self.assertTrue(progress_lines[0].startswith('0 / 1,000'))
+        self.assertEqual(progress_lines[-1], '1,000 / 1,000 (100.0%)\n')
+        self.assertEqual(log_file, '1,000 / 1,000 (100.0%)\n')
@@ -13,6 +13,7 @@ not, see <http://www.gnu.org/licenses/>.
 
 import unittest
 import os
+import random
 import shutil
 import unicycler.miniasm_assembly
 import unicycler.log
@@ -156,3 +157,38 @@ class TestContigPlacement(unittest.TestCase):
                                                       unitig_graph.segments['3'].forward_sequence))
         self.assertTrue(sequences_match_some_rotation(merged_seqs[3],
                                                       unitig_graph.segments['4'].forward_sequence))
+
+
+class TestRaconPolishAlignments(unittest.TestCase):
+
+    def setUp(self):
+        self.working_dir = 'TEMP_' + str(os.getpid())
+        if not os.path.exists(self.working_dir):
+            os.makedirs(self.working_dir)
+        unicycler.log.logger = unicycler.log.Log(log_filename=None, stdout_verbosity_level=0)
+
+    def tearDown(self):
+        if os.path.exists(self.working_dir):
+            shutil.rmtree(self.working_dir)
+
+    def test_make_racon_polish_alignments(self):
+        random.seed(0)
+        unitig_seq = ''.join(random.choice('ACGT') for _ in range(5000))
+        unitig_fasta = os.path.join(self.working_dir, 'unitigs.fasta')
+        with open(unitig_fasta, 'wt') as f:
+            f.write('>1\n' + unitig_seq + '\n')
+        polish_reads = os.path.join(self.working_dir, 'polishing_reads.fastq')
+        with open(polish_reads, 'wt') as f:
+            f.write('@read\n' + unitig_seq[1000:4000] + '\n+\n' + 'I' * 3000 + '\n')
+        mappings_filename = os.path.join(self.working_dir, 'alignments.paf')
+
+        mapping_quality, unitig_depths = \
+            unicycler.miniasm_assembly.make_racon_polish_alignments(unitig_fasta,
+                                                                   mappings_filename,
+                                                                   polish_reads, 1)
+        self.assertGreater(mapping_quality, 0.0)
+        self.assertAlmostEqual(unitig_depths['1'], 0.6, places=1)
+        with open(mappings_filename, 'rt') as mappings:
+            paf_lines = mappings.read().splitlines()
+        self.assertEqual(len(paf_lines), 1)
+        self.assertTrue(paf_lines[0].startswith('read\t3000\t'))
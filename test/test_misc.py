@@ -13,6 +13,7 @@ not, see <http://www.gnu.org/licenses/>.
 
 import unittest
 import os
+import random
 import unicycler.misc
 
 
@@ -58,6 +59,8 @@ class TestMiscFunctions(unittest.TestCase):
                                                            'ATCTATTCATTAAGCGGCCTGC'))
         self.assertEqual('', unicycler.misc.reverse_complement(''))
         self.assertEqual('TATTTNGTTANAT', unicycler.misc.reverse_complement('ATNTAACNAAATA'))
+        self.assertEqual('NNacgt', unicycler.misc.reverse_complement('acgtXZ'))
+        self.assertEqual('TNA', unicycler.misc.reverse_complement('T\u00e9A'))
         self.assertEqual('ATNTAACNAAATA', unicycler.misc.reverse_complement('TATTTNGTTANAT'))
         self.assertEqual('TGACBWDARAYACHASKGVTMACNG',
                          unicycler.misc.reverse_complement('CNGTKABCMSTDGTRTYTHWVGTCA'))
@@ -382,3 +385,26 @@ class TestMiscFunctions(unittest.TestCase):
 
     def test_spades_version_status_13(self):
         self.assertEqual(unicycler.misc.spades_status_from_version('4.0.0'), 'too new')
+
+    def test_simplify_ranges(self):
+        self.assertEqual(unicycler.misc.simplify_ranges([(5, 10), (0, 2), (8, 12), (20, 14)]),
+                         [(0, 2), (5, 12), (14, 20)])
+        self.assertEqual(unicycler.misc.simplify_ranges([(0, 5), (5, 10), (3, 3)]), [(0, 10)])
+        self.assertEqual(unicycler.misc.simplify_ranges([]), [])
+
+    def test_range_set_matches_range_lists(self):
+        random.seed(0)
+        for _ in range(200):
+            range_list, range_set = [], unicycler.misc.RangeSet()
+            for _ in range(20):
+                start = random.randint(0, 1000)
+                new_range = (start, start + random.randint(0, 100))
+                range_list = unicycler.misc.simplify_ranges(range_list + [new_range])
+                range_set.add(new_range)
+                self.assertEqual(range_set.get_ranges(), range_list)
+                start = random.randint(0, 1000)
+                test_range = (start, start + random.randint(0, 200))
+                self.assertEqual(unicycler.misc.range_is_contained(test_range, range_set),
+                                 unicycler.misc.range_is_contained(test_range, range_list))
+                self.assertEqual(unicycler.misc.range_overlap_size(test_range, range_set),
+                                 unicycler.misc.range_overlap_size(test_range, range_list))
@@ -0,0 +1,254 @@
+"""
+Copyright 2017 Ryan Wick (rrwick@gmail.com)
+https://github.com/rrwick/Unicycler
+
+This file is part of Unicycler. Unicycler is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version. Unicycler is distributed in
+the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along with Unicycler. If
+not, see <http://www.gnu.org/licenses/>.
+"""
+
+import gzip
+import os
+import random
+import shutil
+import struct
+import subprocess
+import tempfile
+import unittest
+import zlib
+import unicycler.log
+import unicycler.misc
+import unicycler.read_input
+import unicycler.read_ref
+from unicycler.cpp_wrappers import minimap_align_reads
+from unicycler.minimap_alignment import load_minimap_alignments
+
+
+def make_bgzf(data, block_size=1000):
+    """
+    Compresses data into BGZF blocks (with the empty end-of-file block, as bgzip makes).
+    """
+    blocks = [data[i:i + block_size] for i in range(0, len(data), block_size)] + [b'']
+    bgzf = []
+    for block in blocks:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        compressed = compressor.compress(block) + compressor.flush()
+        header = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00' + \
+            struct.pack('<H', len(compressed) + 25)
+        bgzf.append(header + compressed + struct.pack('<II', zlib.crc32(block), len(block)))
+    return b''.join(bgzf)
+
+
+class TestReadInput(unittest.TestCase):
+
+    def setUp(self):
+        unicycler.log.logger = unicycler.log.Log(log_filename=None, stdout_verbosity_level=0)
+        self.temp_dir = tempfile.mkdtemp()
+        self.fastq = b''.join(b'@read_' + str(i).encode() + b' comment\n' + b'ACGT' * (i + 1) +
+                              b'\n+\n' + b'I' * 4 * (i + 1) + b'\n' for i in range(500))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_file(self, name, data):
+        filename = os.path.join(self.temp_dir, name)
+        with open(filename, 'wb') as f:
+            f.write(data)
+        return filename
+
+    def load(self, filename, threads=1):
+        with unicycler.read_input.SequenceFile(filename, threads) as reads:
+            return list(reads), reads.well_formed
+
+    def test_compression_types(self):
+        plain = self.write_file('reads.fastq', self.fastq)
+        gz = self.write_file('reads.fastq.gz', gzip.compress(self.fastq))
+        bgzf = self.write_file('reads_bgzf.fastq.gz', make_bgzf(self.fastq))
+        self.assertEqual(unicycler.misc.get_compression_type(plain), 'plain')
+        self.assertEqual(unicycler.misc.get_compression_type(gz), 'gz')
+        self.assertTrue(unicycler.read_input.is_bgzf(bgzf))
+        self.assertFalse(unicycler.read_input.is_bgzf(gz))
+
+        records, well_formed = self.load(plain)
+        self.assertTrue(well_formed)
+        self.assertEqual(len(records), 500)
+        self.assertEqual(records[2], (b'read_2 comment', b'ACGTACGTACGT', b'IIIIIIIIIIII'))
+        for filename in (gz, bgzf):
+            for threads in (1, 4):
+                self.assertEqual(self.load(filename, threads), (records, True))
+
+    def test_multi_member_gzip(self):
+        half = len(self.fastq) // 2
+        gz = self.write_file('reads.fastq.gz', gzip.compress(self.fastq[:half]) +
+                             gzip.compress(self.fastq[half:]))
+        with unicycler.misc.get_open_function(gz)(gz, 'rb') as f:
+            self.assertEqual(f.read(), self.fastq)
+
+    def test_zstd(self):
+        if shutil.which('zstd') is None:
+            self.skipTest('zstd not installed')
+        plain = self.write_file('reads.fastq', self.fastq)
+        subprocess.run(['zstd', '-q', plain], check=True)
+        zst = plain + '.zst'
+        self.assertEqual(unicycler.misc.get_compression_type(zst), 'zstd')
+        self.assertEqual(self.load(zst), self.load(plain))
+        with unicycler.misc.get_open_function(zst)(zst, 'rt') as f:
+            self.assertEqual(f.readline(), '@read_0 comment\n')
+
+    def test_fasta(self):
+        fasta = self.write_file('reads.fasta', b'>a x\nACGT\nAC\n\n>b\nGG\n>c\n')
+        records, well_formed = self.load(fasta)
+        self.assertTrue(well_formed)
+        self.assertEqual(records, [(b'a x', b'ACGTAC', None), (b'b', b'GG', None),
+                                   (b'c', b'', None)])
+
+    def test_badly_formed_fastq(self):
+        fastq = self.write_file('reads.fastq', b'@a\nACGT\n+\nIIII\n\n@b\nGG\n+\nII\n')
+        records, well_formed = self.load(fastq)
+        self.assertFalse(well_formed)
+        self.assertEqual([x[0] for x in records], [b'a', b'b'])
+
+    def test_truncated_gzip(self):
+        gz = self.write_file('reads.fastq.gz', gzip.compress(self.fastq)[:-100])
+        with self.assertRaises(SystemExit):
+            self.load(gz)
+
+    def test_truncated_bgzf(self):
+        """
+        A BGZF file cut off anywhere in its last data block is reported as a bad input file.
+        """
+        bgzf = make_bgzf(self.fastq)
+        last_block_end = len(bgzf) - 28  # before the empty end-of-file block
+        for cut in (3, 10, 16, 20, 40, 100):
+            truncated = self.write_file('truncated.fastq.gz', bgzf[:last_block_end - cut])
+            for threads in (1, 4):
+                with self.assertRaises(SystemExit):
+                    self.load(truncated, threads)
+
+    def test_load_long_reads(self):
+        plain = self.write_file('reads.fastq', self.fastq + b'@read_1\nA\n+\nI\n')
+        bgzf = self.write_file('reads.fastq.gz', make_bgzf(self.fastq + b'@read_1\nA\n+\nI\n'))
+        read_dict, read_names, _ = \
+            unicycler.read_ref.load_long_reads(plain, output_dir=self.temp_dir)
+        self.assertEqual(len(read_names), 501)
+        self.assertEqual(read_names[-1], 'read_1_2')
+        self.assertEqual(read_dict['read_3'].sequence, 'ACGT' * 4)
+        bgzf_read_dict, bgzf_read_names, _ = \
+            unicycler.read_ref.load_long_reads(bgzf, output_dir=self.temp_dir, threads=4)
+        self.assertEqual(bgzf_read_names, read_names)
+
+
+class TestReadNameTable(unittest.TestCase):
+
+    def setUp(self):
+        unicycler.log.logger = unicycler.log.Log(log_filename=None, stdout_verbosity_level=0)
+        self.temp_dir = tempfile.mkdtemp()
+        random.seed(0)
+        self.ref_seq = ''.join(random.choice('ACGT') for _ in range(10000))
+        self.ref_fasta = os.path.join(self.temp_dir, 'ref.fasta')
+        with open(self.ref_fasta, 'wt') as f:
+            f.write('>1\n' + self.ref_seq + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def align(self, read_filename):
+        _, read_names, tool_filename = \
+            unicycler.read_ref.load_long_reads(read_filename, output_dir=self.temp_dir)
+        alignments_str = minimap_align_reads(self.ref_fasta, tool_filename, 1, 0, 'default')
+        table = unicycler.read_ref.get_read_name_table(tool_filename)
+        return read_names, tool_filename, load_minimap_alignments(alignments_str,
+                                                                  read_name_table=table)
+
+    def test_duplicate_names(self):
+        reads = os.path.join(self.temp_dir, 'reads.fastq')
+        with open(reads, 'wt') as f:
+            for start in (0, 3000, 6000):
+                seq = self.ref_seq[start:start + 3000]
+                f.write('@read comment\n' + seq + '\n+\n' + 'I' * len(seq) + '\n')
+        read_names, tool_filename, alignments = self.align(reads)
+        self.assertEqual(read_names, ['read', 'read_2', 'read_3'])
+        self.assertEqual(tool_filename, reads)
+        self.assertEqual(sorted(alignments), read_names)
+        self.assertEqual(alignments['read_3'][0].ref_start // 1000, 6)
+
+    def test_duplicate_names_after_empty_read(self):
+        """
+        minimap counts empty and unaligned reads too, so the reads after them still get the right
+        names.
+        """
+        reads = os.path.join(self.temp_dir, 'reads.fasta')
+        with open(reads, 'wt') as f:
+            f.write('>read first\n' + self.ref_seq[:3000] + '\n')
+            f.write('>empty\n\n')
+            f.write('>unaligned\n' + 'A' * 3000 + '\n')
+            for start in (3000, 6000):
+                f.write('>read\n' + self.ref_seq[start:start + 3000] + '\n')
+        read_names, _, alignments = self.align(reads)
+        self.assertEqual(read_names, ['read', 'empty', 'unaligned', 'read_2', 'read_3'])
+        self.assertEqual(sorted(alignments), ['read', 'read_2', 'read_3'])
+        for i, name in enumerate(['read', 'read_2', 'read_3']):
+            self.assertEqual(len(alignments[name]), 1)
+            self.assertEqual(alignments[name][0].ref_start // 1000, [0, 3, 6][i])
+
+    def test_name_table_mismatch(self):
+        """
+        If the read at a PAF line's index has a different name in the file, the table doesn't
+        match minimap's reads, so the read isn't renamed.
+        """
+        table = [('a', 'a'), ('a', 'a_2'), ('b', 'b')]
+        paf = '\t'.join(['a', '3000', '0', '3000', '+', '1', '10000', '0', '3000', '3000', '3000',
+                         '60', 'cm:i:100', 'ri:i:{}'])
+        alignments = load_minimap_alignments(paf.format(1) + '\n', read_name_table=table)
+        self.assertEqual(list(alignments), ['a_2'])
+        alignments = load_minimap_alignments(paf.format(2) + '\n', read_name_table=table)
+        self.assertEqual(list(alignments), ['a'])
+        alignments = load_minimap_alignments(paf.format(5) + '\n', read_name_table=table)
+        self.assertEqual(list(alignments), ['a'])
+
+    def test_unique_names(self):
+        reads = os.path.join(self.temp_dir, 'reads.fastq')
+        with open(reads, 'wt') as f:
+            f.write('@a\n' + self.ref_seq[:3000] + '\n+\n' + 'I' * 3000 + '\n')
+        read_names, _, alignments = self.align(reads)
+        self.assertIsNone(unicycler.read_ref.get_read_name_table(reads))
+        self.assertEqual(list(alignments), ['a'])
+
+    def test_zstd_decompressed_copy(self):
+        if shutil.which('zstd') is None:
+            self.skipTest('zstd not installed')
+        reads = os.path.join(self.temp_dir, 'reads.fastq')
+        with open(reads, 'wt') as f:
+            f.write('@a\n' + self.ref_seq[:3000] + '\n+\n' + 'I' * 3000 + '\n')
+        subprocess.run(['zstd', '-q', '--rm', reads], check=True)
+        _, tool_filename, alignments = self.align(reads + '.zst')
+        self.assertEqual(tool_filename, os.path.join(self.temp_dir, 'reads_decompressed.fastq'))
+        self.assertEqual(list(alignments), ['a'])
+
+        # A second run reuses the decompressed copy.
+        modified_time = os.path.getmtime(tool_filename)
+        _, tool_filename, _ = self.align(reads + '.zst')
+        self.assertEqual(os.path.getmtime(tool_filename), modified_time)
+
+    def test_interrupted_decompression(self):
+        """
+        A failed decompression leaves neither a partial copy nor a cache entry behind.
+        """
+        if shutil.which('zstd') is None:
+            self.skipTest('zstd not installed')
+        reads = os.path.join(self.temp_dir, 'reads.fastq')
+        with open(reads, 'wt') as f:
+            f.write('@a\n' + self.ref_seq + '\n+\n' + 'I' * len(self.ref_seq) + '\n')
+        subprocess.run(['zstd', '-q', '--rm', reads], check=True)
+        with open(reads + '.zst', 'rb') as f:
+            truncated = f.read()[:-100]
+        with open(reads + '.zst', 'wb') as f:
+            f.write(truncated)
+        with self.assertRaises((SystemExit, OSError, ValueError)):
+            unicycler.read_ref.get_decompressed_reads(reads + '.zst', 'FASTQ', self.temp_dir,
+                                                      True)
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ['reads.fastq.zst', 'ref.fasta'])
@@ -0,0 +1,229 @@
+"""
+Copyright 2017 Ryan Wick (rrwick@gmail.com)
+https://github.com/rrwick/Unicycler
+
+This file is part of Unicycler. Unicycler is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version. Unicycler is distributed in
+the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along with Unicycler. If
+not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import unittest
+import unicycler.assembly_graph
+import unicycler.bridge_long_read
+import unicycler.log
+import unicycler.read_ref
+import unicycler.read_selection
+import unicycler.settings
+import unicycler.unicycler
+from unicycler.alignment import AlignmentScoringScheme
+from unicycler.minimap_alignment import MinimapAlignment
+from unicycler.read_ref import Read
+
+
+def make_alignment(read_name, ref_name, ref_start, ref_end, ref_length=10000, read_start=0,
+                   read_end=None, read_length=None, read_strand='+'):
+    alignment = MinimapAlignment()
+    alignment.read_name = read_name
+    alignment.ref_name = ref_name
+    alignment.ref_start = ref_start
+    alignment.ref_end = ref_end
+    alignment.ref_length = ref_length
+    alignment.read_start = read_start
+    alignment.read_end = read_start + ref_end - ref_start if read_end is None else read_end
+    alignment.read_length = alignment.read_end if read_length is None else read_length
+    alignment.read_strand = read_strand
+    return alignment
+
+
+class TestReadSelection(unittest.TestCase):
+
+    def setUp(self):
+        unicycler.log.logger = unicycler.log.Log(log_filename=None, stdout_verbosity_level=0)
+        self.read_dict, self.read_names, self.alignments = {}, [], {}
+
+    def add_read(self, name, length, ref_start, ref_end, ref_name='1', qualities=''):
+        self.read_dict[name] = Read(name, 'A' * length, qualities)
+        self.read_names.append(name)
+        if ref_name is not None:
+            self.alignments[name] = [make_alignment(name, ref_name, ref_start, ref_end)]
+
+    def select(self, target_depth, **kwargs):
+        return unicycler.read_selection.select_reads('test', self.read_names, self.read_dict,
+                                                     self.alignments, {'1': 10000},
+                                                     target_depth, **kwargs)
+
+    def test_shallow_reads_all_used(self):
+        for i in range(10):
+            self.add_read('read_' + str(i), 10000, 0, 10000)
+        self.assertEqual(self.select(20), self.read_names)
+        self.assertEqual(self.select(0), self.read_names)
+
+    def test_deep_reads_subsampled(self):
+        for i in range(200):
+            self.add_read('read_' + str(i), 5000 + i, 0, 10000)
+        selected = self.select(50)
+        self.assertEqual(len(selected), 50)
+        self.assertEqual(selected, ['read_' + str(i) for i in range(150, 200)])
+
+    def test_uneven_coverage(self):
+        """
+        Reads on a part of the reference which is below the target are used, even when they are
+        shorter than reads elsewhere which are not.
+        """
+        for i in range(100):
+            self.add_read('long_' + str(i), 9000, 0, 9000)
+        for i in range(20):
+            self.add_read('short_' + str(i), 2000, 8000, 10000)
+        selected = self.select(10)
+        self.assertEqual(len([x for x in selected if x.startswith('long_')]), 10)
+        self.assertEqual(len([x for x in selected if x.startswith('short_')]), 10)
+
+    def test_unaligned_reads(self):
+        for i in range(100):
+            self.add_read('read_' + str(i), 10000, 0, 10000)
+        self.add_read('unaligned', 10000, 0, 0, ref_name=None)
+        self.add_read('contamination', 10000, 0, 10000, ref_name='lambda')
+        self.assertIn('unaligned', self.select(10))
+        self.assertIn('contamination', self.select(10))
+        self.assertNotIn('unaligned', self.select(10, keep_unaligned=False))
+
+    def test_anchor_ends(self):
+        for i in range(100):
+            self.add_read('read_' + str(i), 10000, 0, 10000)
+        self.assertEqual(len(self.select(10)), 10)
+        self.assertEqual(len(self.select(10, anchor_names={'1'})), 20)
+
+    def test_quality_preferred(self):
+        self.add_read('low_quality', 10000, 0, 10000, qualities='%' * 10000)
+        self.add_read('high_quality', 10000, 0, 10000, qualities='?' * 10000)
+        for i in range(20):
+            self.add_read('short_' + str(i), 1000, 0, 10000)
+        self.assertEqual(self.select(1), ['high_quality'])
+
+
+class TestBridgingReadSelection(unittest.TestCase):
+
+    def setUp(self):
+        unicycler.log.logger = unicycler.log.Log(log_filename=None, stdout_verbosity_level=0)
+        self.reference_lengths = {'1': 10000, '2': 10000, '3': 500}
+        self.anchor_names = {'1', '2'}
+
+    def select(self, alignments_by_read, margin=100):
+        read_names = sorted(alignments_by_read)
+        read_dict = {x: Read(x, 'A' * 1000, '') for x in read_names}
+        return unicycler.read_selection.select_bridging_reads(read_names, read_dict,
+                                                              alignments_by_read,
+                                                              self.reference_lengths,
+                                                              self.anchor_names, margin)
+
+    def test_anchor_overhang(self):
+        # Read carries on 500 bp past the end of the reference.
+        a = make_alignment('r', '1', 9000, 10000, read_start=0, read_end=1000, read_length=1500)
+        self.assertEqual(unicycler.read_selection.get_anchor_overhang(a), 500)
+
+        # Same, but on the other strand, where the read's start is at the reference's end.
+        a = make_alignment('r', '1', 9000, 10000, read_start=500, read_end=1500,
+                           read_length=1500, read_strand='-')
+        self.assertEqual(unicycler.read_selection.get_anchor_overhang(a), 500)
+
+        # Read contained in the reference.
+        a = make_alignment('r', '1', 4000, 5000, read_start=0, read_end=1000, read_length=1000)
+        self.assertLess(unicycler.read_selection.get_anchor_overhang(a), 0)
+
+    def test_select_bridging_reads(self):
+        alignments_by_read = {
+            'two_anchors': [make_alignment('two_anchors', '1', 9500, 10000, read_length=1500),
+                            make_alignment('two_anchors', '2', 0, 500, read_start=1000)],
+            'overhang': [make_alignment('overhang', '1', 9500, 10000, read_length=1500)],
+            'repeat_only': [make_alignment('repeat_only', '3', 0, 500, ref_length=500)],
+            'unaligned': []}
+        for i in range(2000):
+            name = 'contained_' + str(i)
+            alignments_by_read[name] = [make_alignment(name, '1', 1000, 2000)]
+        selected = self.select(alignments_by_read)
+        self.assertIn('two_anchors', selected)
+        self.assertIn('overhang', selected)
+        self.assertNotIn('unaligned', selected)
+        contained = [x for x in selected if x.startswith('contained_')]
+        self.assertEqual(len(contained), 1000)
+
+        # With a bigger margin, the overhang isn't enough.
+        self.assertNotIn('overhang', self.select(alignments_by_read, margin=1000))
+
+
+class TestBridgingReadSelectionQuality(unittest.TestCase):
+    """
+    Skipping reads which can't bridge anchors shouldn't change the quality of the long-read
+    bridges, as each bridge's expected read count comes from all reads which aligned.
+    """
+
+    def setUp(self):
+        unicycler.log.logger = unicycler.log.Log(log_filename=None, stdout_verbosity_level=0)
+        self.temp_dir = tempfile.mkdtemp()
+        self.old_calibration_count = unicycler.settings.BRIDGING_READ_CALIBRATION_COUNT
+        unicycler.settings.BRIDGING_READ_CALIBRATION_COUNT = 3
+
+        # A circular genome of two anchors separated by two copies of a repeat.
+        random.seed(0)
+        anchor_1, repeat, anchor_2 = (''.join(random.choice('ACGT') for _ in range(x))
+                                      for x in (8000, 1500, 8000))
+        self.graph_filename = os.path.join(self.temp_dir, 'graph.gfa')
+        with open(self.graph_filename, 'wt') as gfa:
+            gfa.write('S\t1\t' + anchor_1 + '\tdp:f:1.0\n')
+            gfa.write('S\t2\t' + repeat + '\tdp:f:2.0\n')
+            gfa.write('S\t3\t' + anchor_2 + '\tdp:f:1.0\n')
+            for start, end in (('1', '2'), ('2', '3'), ('3', '2'), ('2', '1')):
+                gfa.write('L\t' + start + '\t+\t' + end + '\t+\t0M\n')
+                gfa.write('L\t' + end + '\t-\t' + start + '\t-\t0M\n')
+        # Half of the reads over the second repeat copy are left out, so the 3 -> 1 bridge has
+        # fewer reads than expected and its quality depends on the expected read count.
+        genome = anchor_1 + repeat + anchor_2 + repeat
+        second_repeat_middle = len(genome) - 750
+        self.reads_filename = os.path.join(self.temp_dir, 'reads.fastq')
+        with open(self.reads_filename, 'wt') as fastq:
+            for i, start in enumerate(range(0, len(genome), 400)):
+                if i % 2 == 1 and start <= second_repeat_middle < start + 4000:
+                    continue
+                seq = (genome + genome)[start:start + 4000]
+                fastq.write('@read_' + str(i) + '\n' + seq + '\n+\n' + 'I' * len(seq) + '\n')
+
+    def tearDown(self):
+        unicycler.settings.BRIDGING_READ_CALIBRATION_COUNT = self.old_calibration_count
+        shutil.rmtree(self.temp_dir)
+
+    def get_bridge_qualities(self, align_all_reads):
+        graph = unicycler.assembly_graph.AssemblyGraph(self.graph_filename, 0)
+        anchor_segments = [graph.segments[1], graph.segments[3]]
+        read_dict, read_names, read_filename = \
+            unicycler.read_ref.load_long_reads(self.reads_filename, silent=True)
+        args = argparse.Namespace(out=self.temp_dir, keep=0, scores='3,-6,-5,-2', low_score=None,
+                                  align_all_reads=align_all_reads, bridging_read_margin=100,
+                                  contamination=None, verbosity=0, threads=1,
+                                  max_alignment_depth=0)
+        aligned_read_names, min_scaled_score, min_alignment_length, read_lengths = \
+            unicycler.unicycler.align_long_reads_to_assembly_graph(graph, anchor_segments, args,
+                                                                   '', read_dict, read_names,
+                                                                   read_filename)
+        bridges = unicycler.bridge_long_read.create_long_read_bridges(
+            graph, read_dict, aligned_read_names, anchor_segments, 0, min_scaled_score, 1,
+            AlignmentScoringScheme(args.scores), min_alignment_length, False, 10.0, read_lengths)
+        aligned_count = len([x for x in read_dict.values() if x.alignments])
+        return {(x.start_segment, x.end_segment): x.quality for x in bridges}, aligned_count
+
+    def test_bridge_quality_unchanged(self):
+        all_qualities, all_aligned_count = self.get_bridge_qualities(align_all_reads=True)
+        qualities, aligned_count = self.get_bridge_qualities(align_all_reads=False)
+        self.assertLess(aligned_count, all_aligned_count)
+        self.assertEqual(len(qualities), 2)
+        self.assertEqual(sorted(qualities), sorted(all_qualities))
+        for bridge, quality in all_qualities.items():
+            self.assertAlmostEqual(qualities[bridge], quality)
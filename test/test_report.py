@@ -0,0 +1,96 @@
+"""
+Copyright 2017 Ryan Wick (rrwick@gmail.com)
+https://github.com/rrwick/Unicycler
+
+This file is part of Unicycler. Unicycler is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version. Unicycler is distributed in
+the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along with Unicycler. If
+not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import unicycler.log
+import unicycler.misc
+import unicycler.report
+
+
+class TestReport(unittest.TestCase):
+
+    def setUp(self):
+        unicycler.log.logger = unicycler.log.Log(log_filename=None, stdout_verbosity_level=0)
+        self.temp_dir = tempfile.mkdtemp()
+        args = argparse.Namespace(out=self.temp_dir, threads=4, kmers=[21, 31], mode=1)
+        unicycler.report.start_report(self.temp_dir, 'unicycler -o out', '0.0.0', args)
+
+    def tearDown(self):
+        unicycler.report.report = None
+        shutil.rmtree(self.temp_dir)
+
+    def load_report(self):
+        with open(os.path.join(self.temp_dir, unicycler.report.REPORT_FILENAME), 'rt') as f:
+            return json.load(f)
+
+    def test_cell_values(self):
+        self.assertEqual(unicycler.report.get_cell_value('1,234,567'), 1234567)
+        self.assertEqual(unicycler.report.get_cell_value(' -12 '), -12)
+        self.assertEqual(unicycler.report.get_cell_value('0.125'), 0.125)
+        self.assertEqual(unicycler.report.get_cell_value(unicycler.misc.green('12')), 12)
+        self.assertEqual(unicycler.report.get_cell_value('98.5%'), '98.5%')
+        self.assertEqual(unicycler.report.get_cell_value('1,23'), '1,23')
+        self.assertEqual(unicycler.report.get_cell_value('10 -> 20'), '10 -> 20')
+        self.assertIsNone(unicycler.report.get_cell_value(''))
+        self.assertEqual(unicycler.report.get_cell_value(7), 7)
+
+    def test_running_report(self):
+        report = self.load_report()
+        self.assertEqual(report['status'], 'running')
+        self.assertEqual(report['command'], 'unicycler -o out')
+        self.assertEqual(report['options']['kmers'], [21, 31])
+
+    def test_tables_and_sections(self):
+        unicycler.log.log_section_header('SPAdes assemblies')
+        unicycler.misc.print_table([['K-mer', 'Contigs', 'Score'], ['21', '1,024', '0.5'],
+                                    ['31', '12', '']], report_table='spades_assemblies')
+        unicycler.log.log_section_header('Loops')
+        unicycler.misc.print_table([['Start', 'End']], report_table='loops')
+        unicycler.report.add_table_rows('loops', [[1, 2]])
+        unicycler.report.add_table_rows('loops', [[3, '4']])
+        unicycler.report.add_output('assembly_fasta', 'assembly.fasta')
+        unicycler.report.finish_report('complete')
+
+        report = self.load_report()
+        self.assertEqual(report['status'], 'complete')
+        self.assertEqual([x['name'] for x in report['sections']], ['SPAdes assemblies', 'Loops'])
+        self.assertTrue(all(x['time'] >= 0.0 for x in report['sections']))
+        spades_table, loop_table = report['tables']
+        self.assertEqual(spades_table['section'], 'SPAdes assemblies')
+        self.assertEqual(spades_table['columns'], ['K-mer', 'Contigs', 'Score'])
+        self.assertEqual(spades_table['rows'], [[21, 1024, 0.5], [31, 12, None]])
+        self.assertEqual(loop_table['section'], 'Loops')
+        self.assertEqual(loop_table['rows'], [[1, 2], [3, 4]])
+        self.assertEqual(report['outputs'], {'assembly_fasta': 'assembly.fasta'})
+        self.assertIsNone(unicycler.report.report)
+
+    def test_rows_without_table(self):
+        unicycler.report.add_table_rows('bridges', [])
+        unicycler.report.add_table_rows('loops', [[1, 2]])
+        unicycler.report.finish_report('complete')
+        tables = self.load_report()['tables']
+        self.assertEqual([x['name'] for x in tables], ['loops'])
+        self.assertEqual(tables[0]['rows'], [[1, 2]])
+
+    def test_failed_report(self):
+        with self.assertRaises(SystemExit):
+            unicycler.misc.quit_with_error('something went wrong')
+        report = self.load_report()
+        self.assertEqual(report['status'], 'failed')
+        self.assertEqual(report['error'], 'something went wrong')
+        self.assertIsNotNone(report['total_time'])
@@ -0,0 +1,147 @@
+"""
+Copyright 2017 Ryan Wick (rrwick@gmail.com)
+https://github.com/rrwick/Unicycler
+
+This file is part of Unicycler. Unicycler is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version. Unicycler is distributed in
+the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along with Unicycler. If
+not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import unicycler.resources
+
+
+class TestResources(unittest.TestCase):
+
+    def setUp(self):
+        self.cgroup_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cgroup_dir)
+        unicycler.resources.close_thread_pool()
+
+    def write_cgroup_file(self, filename, contents):
+        path = os.path.join(self.cgroup_dir, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wt') as cgroup_file:
+            cgroup_file.write(contents + '\n')
+
+    def test_no_cgroup(self):
+        self.assertIsNone(unicycler.resources.get_cgroup_cpu_quota(self.cgroup_dir))
+        self.assertEqual(unicycler.resources.get_cgroup_memory_limit_and_usage(self.cgroup_dir),
+                         (None, None))
+        self.assertGreaterEqual(unicycler.resources.get_available_cpu_count(self.cgroup_dir), 1)
+
+    def test_cgroup_v2_cpu_quota(self):
+        self.write_cgroup_file('cpu.max', '250000 100000')
+        self.assertAlmostEqual(unicycler.resources.get_cgroup_cpu_quota(self.cgroup_dir), 2.5)
+
+    def test_cgroup_v2_no_cpu_quota(self):
+        self.write_cgroup_file('cpu.max', 'max 100000')
+        self.assertIsNone(unicycler.resources.get_cgroup_cpu_quota(self.cgroup_dir))
+
+    def test_cgroup_v1_cpu_quota(self):
+        self.write_cgroup_file('cpu,cpuacct/cpu.cfs_quota_us', '400000')
+        self.write_cgroup_file('cpu,cpuacct/cpu.cfs_period_us', '100000')
+        self.assertAlmostEqual(unicycler.resources.get_cgroup_cpu_quota(self.cgroup_dir), 4.0)
+
+    def test_cgroup_v1_no_cpu_quota(self):
+        self.write_cgroup_file('cpu/cpu.cfs_quota_us', '-1')
+        self.write_cgroup_file('cpu/cpu.cfs_period_us', '100000')
+        self.assertIsNone(unicycler.resources.get_cgroup_cpu_quota(self.cgroup_dir))
+
+    def test_cpu_count_limited_by_quota(self):
+        self.write_cgroup_file('cpu.max', '50000 100000')
+        self.assertEqual(unicycler.resources.get_available_cpu_count(self.cgroup_dir), 1)
+
+    def test_cgroup_v2_memory(self):
+        self.write_cgroup_file('memory.max', str(4 * 1024 ** 3))
+        self.write_cgroup_file('memory.current', str(1024 ** 3))
+        self.assertEqual(unicycler.resources.get_cgroup_memory_limit_and_usage(self.cgroup_dir),
+                         (4 * 1024 ** 3, 1024 ** 3))
+        self.assertLessEqual(unicycler.resources.get_available_memory(self.cgroup_dir),
+                             3 * 1024 ** 3)
+
+    def test_cgroup_v2_no_memory_limit(self):
+        self.write_cgroup_file('memory.max', 'max')
+        self.assertEqual(unicycler.resources.get_cgroup_memory_limit_and_usage(self.cgroup_dir),
+                         (None, None))
+
+    def test_cgroup_v1_unlimited_memory(self):
+        self.write_cgroup_file('memory/memory.limit_in_bytes', '9223372036854771712')
+        self.assertEqual(unicycler.resources.get_cgroup_memory_limit_and_usage(self.cgroup_dir),
+                         (None, None))
+
+    def test_spades_memory_limit(self):
+        self.write_cgroup_file('memory.max', str(int(5.5 * 1024 ** 3)))
+        self.write_cgroup_file('memory.current', str(5 * 1024 ** 3))
+        self.assertLessEqual(unicycler.resources.get_spades_memory_limit(self.cgroup_dir), 5)
+        self.write_cgroup_file('memory.max', str(1024 ** 2))
+        self.assertEqual(unicycler.resources.get_spades_memory_limit(self.cgroup_dir), 1)
+
+    def test_memory_limited_count(self):
+        self.write_cgroup_file('memory.max', str(10 * 1024 ** 2))
+        self.write_cgroup_file('memory.current', '0')
+        self.assertEqual(unicycler.resources.get_memory_limited_count(8, 3 * 1024 ** 2,
+                                                                      self.cgroup_dir), 3)
+        self.assertEqual(unicycler.resources.get_memory_limited_count(8, 1024 ** 3,
+                                                                      self.cgroup_dir), 1)
+        self.assertEqual(unicycler.resources.get_memory_limited_count(2, 1024, self.cgroup_dir), 2)
+
+    def test_slurm_cgroup_v2(self):
+        """
+        Under Slurm or systemd, the job's limits are in its own cgroup, below the root.
+        """
+        proc_cgroup = os.path.join(self.cgroup_dir, 'proc_cgroup')
+        with open(proc_cgroup, 'wt') as f:
+            f.write('0::/system.slice/slurmstepd.scope/job_42/step_0\n')
+        self.write_cgroup_file('memory.max', 'max')
+        self.write_cgroup_file('system.slice/slurmstepd.scope/job_42/memory.max',
+                               str(8 * 1024 ** 3))
+        self.write_cgroup_file('system.slice/slurmstepd.scope/job_42/memory.current',
+                               str(1024 ** 3))
+        self.write_cgroup_file('system.slice/slurmstepd.scope/job_42/step_0/memory.max', 'max')
+        self.write_cgroup_file('system.slice/slurmstepd.scope/job_42/step_0/cpu.max',
+                               '200000 100000')
+        self.write_cgroup_file('system.slice/cpu.max', '800000 100000')
+        self.write_cgroup_file('other_job/memory.max', str(1024 ** 3))
+        self.assertEqual(unicycler.resources.get_cgroup_memory_limit_and_usage(self.cgroup_dir,
+                                                                               proc_cgroup),
+                         (8 * 1024 ** 3, 1024 ** 3))
+        self.assertAlmostEqual(unicycler.resources.get_cgroup_cpu_quota(self.cgroup_dir,
+                                                                        proc_cgroup), 2.0)
+
+    def test_slurm_cgroup_v1(self):
+        proc_cgroup = os.path.join(self.cgroup_dir, 'proc_cgroup')
+        with open(proc_cgroup, 'wt') as f:
+            f.write('11:memory:/slurm/uid_1000/job_42/step_0\n'
+                    '4:cpu,cpuacct:/slurm/uid_1000/job_42/step_0\n'
+                    '1:name=systemd:/user.slice\n')
+        self.write_cgroup_file('memory/memory.limit_in_bytes', '9223372036854771712')
+        self.write_cgroup_file('memory/slurm/uid_1000/job_42/memory.limit_in_bytes',
+                               str(2 * 1024 ** 3))
+        self.write_cgroup_file('memory/slurm/uid_1000/job_42/memory.usage_in_bytes', '0')
+        self.write_cgroup_file('cpu,cpuacct/slurm/uid_1000/job_42/step_0/cpu.cfs_quota_us',
+                               '300000')
+        self.write_cgroup_file('cpu,cpuacct/slurm/uid_1000/job_42/step_0/cpu.cfs_period_us',
+                               '100000')
+        self.assertEqual(unicycler.resources.get_cgroup_memory_limit_and_usage(self.cgroup_dir,
+                                                                               proc_cgroup),
+                         (2 * 1024 ** 3, 0))
+        self.assertAlmostEqual(unicycler.resources.get_cgroup_cpu_quota(self.cgroup_dir,
+                                                                        proc_cgroup), 3.0)
+
+    def test_shared_thread_pool(self):
+        pool = unicycler.resources.get_thread_pool(2)
+        self.assertIs(unicycler.resources.get_thread_pool(2), pool)
+        self.assertEqual(sorted(pool.imap_unordered(abs, [-1, -2, 3])), [1, 2, 3])
+        other_pool = unicycler.resources.get_thread_pool(3)
+        self.assertIsNot(other_pool, pool)
+        self.assertEqual(list(other_pool.imap(abs, [-4, 5])), [4, 5])
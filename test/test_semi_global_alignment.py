@@ -13,10 +13,13 @@ not, see <http://www.gnu.org/licenses/>.
 
 import unittest
 import os
+import shutil
+import tempfile
 import unicycler.read_ref
 import unicycler.alignment
 import unicycler.unicycler_align
 import unicycler.log
+import unicycler.misc
 
 
 class TestPerfectMatchAlignments(unittest.TestCase):
@@ -662,3 +665,72 @@ class TestToughAlignments(unittest.TestCase):
         _, read_end = alignment_2.read_start_end_positive_strand()
         self.assertEqual(read_start, 0)    # start of read
         self.assertEqual(read_end, 4144)  # end of read
+
+
+class TestSamWriter(unittest.TestCase):
+
+    def write_and_read_sam(self, sam_filename):
+        writer = unicycler.unicycler_align.SamWriter(sam_filename, '@HD\tVN:1.5\n',
+                                                     ['a', 'b', 'c', 'd'])
+        writer.add_read('c', ['c1\n', 'c2\n'])
+        writer.add_read('a', ['a1\n'])
+        writer.add_read('d', ['d1\n'])
+        writer.add_read('b', [])
+        writer.close()
+        with unicycler.misc.get_open_function(sam_filename)(sam_filename, 'rt') as sam_file:
+            lines = sam_file.read().splitlines()
+        os.remove(sam_filename)
+        return lines
+
+    def test_reads_written_in_order(self):
+        sam_filename = os.path.join(os.path.dirname(__file__), 'temp_writer.sam')
+        self.assertEqual(self.write_and_read_sam(sam_filename),
+                         ['@HD\tVN:1.5', 'a1', 'c1', 'c2', 'd1'])
+
+    def test_gzipped_output(self):
+        sam_filename = os.path.join(os.path.dirname(__file__), 'temp_writer.sam.gz')
+        self.assertEqual(self.write_and_read_sam(sam_filename),
+                         ['@HD\tVN:1.5', 'a1', 'c1', 'c2', 'd1'])
+
+
+class TestAutoScoreThreshold(unittest.TestCase):
+
+    def setUp(self):
+        self.old_cache_home = os.environ.get('XDG_CACHE_HOME')
+        self.cache_home = tempfile.mkdtemp()
+        os.environ['XDG_CACHE_HOME'] = self.cache_home
+
+    def tearDown(self):
+        if self.old_cache_home is None:
+            del os.environ['XDG_CACHE_HOME']
+        else:
+            os.environ['XDG_CACHE_HOME'] = self.old_cache_home
+        shutil.rmtree(self.cache_home)
+
+    def test_precomputed_scheme(self):
+        scoring_scheme = unicycler.alignment.AlignmentScoringScheme('3,-6,-5,-2')
+        threshold, mean, std_dev = \
+            unicycler.unicycler_align.get_auto_score_threshold(scoring_scheme, 7)
+        self.assertEqual((mean, std_dev), (61.656918, 1.314624))
+        self.assertAlmostEqual(threshold, 61.656918 + 7 * 1.314624)
+        self.assertFalse(os.path.exists(
+            unicycler.unicycler_align.get_random_alignment_cache_filename()))
+
+    def test_cached_scheme(self):
+        scoring_scheme = unicycler.alignment.AlignmentScoringScheme('4,-5,-6,-3')
+        unicycler.unicycler_align.save_random_alignment_cache(
+            {'4,-5,-6,-3 (25000 x 100 bp)': [60.0, 1.0]})
+        threshold, mean, std_dev = \
+            unicycler.unicycler_align.get_auto_score_threshold(scoring_scheme, 7)
+        self.assertEqual((threshold, mean, std_dev), (67.0, 60.0, 1.0))
+
+    def test_failed_cache_save(self):
+        """
+        If the cache can't be replaced (here because a directory is in the way), the temp file
+        isn't left behind.
+        """
+        cache_filename = unicycler.unicycler_align.get_random_alignment_cache_filename()
+        os.makedirs(cache_filename)
+        unicycler.unicycler_align.save_random_alignment_cache({'a': [60.0, 1.0]})
+        self.assertEqual(os.listdir(os.path.dirname(cache_filename)),
+                         [os.path.basename(cache_filename)])
@@ -13,7 +13,11 @@ not, see <http://www.gnu.org/licenses/>.
 
 import unittest
 import os
+import functools
+import multiprocessing
+import statistics
 import unicycler.spades_func
+import unicycler.log
 
 
 class TestSPAdesFunc(unittest.TestCase):
@@ -89,3 +93,90 @@ class TestSPAdesFunc(unittest.TestCase):
                                    '--isolate', '-1', '1.fq.gz', '-2', '2.fq.gz', '--tmp-dir',
                                    'abc', '-m', '1024'])
 
+    def test_clean_and_score_spades_graph(self):
+        test_gfa = os.path.join(os.path.dirname(__file__), 'test_assembly_graph.gfa')
+        out_dir = os.path.dirname(__file__)
+        unicycler.log.logger = unicycler.log.Log(log_filename=None, stdout_verbosity_level=0)
+        graph, score, _, _, table_cells, _, _ = \
+            unicycler.spades_func.clean_and_score_spades_graph((test_gfa, 25, 401, 60, 0.25,
+                                                                False, 336, 0, out_dir, 1))
+        clean_gfa = os.path.join(out_dir, 'k025_assembly_graph.gfa')
+        self.assertTrue(os.path.isfile(clean_gfa))
+        self.assertEqual(len(graph.segments), int(table_cells[0]))
+        self.assertAlmostEqual(score, 1.0 / (len(graph.segments) * 2))
+        os.remove(clean_gfa)
+
+    def test_clean_and_score_spades_graph_log(self):
+        """
+        The graph cleaning's log output (e.g. from a worker process) is returned, not logged.
+        """
+        test_gfa = os.path.join(os.path.dirname(__file__), 'test_assembly_graph.gfa')
+        out_dir = os.path.dirname(__file__)
+        unicycler.log.logger = unicycler.log.Log(log_filename=None, stdout_verbosity_level=2)
+        unicycler.log.set_stage_log(None)
+        log_calls = unicycler.spades_func.clean_and_score_spades_graph(
+            (test_gfa, 25, 401, 60, 0.25, False, 336, 0, out_dir, 2))[-1]
+        unicycler.log.logger = unicycler.log.Log(log_filename=None, stdout_verbosity_level=0)
+        os.remove(os.path.join(out_dir, 'k025_assembly_graph.gfa'))
+        self.assertIsNone(unicycler.log.thread_state.stage_log)
+        logged_text = [args[0] for function, args in log_calls if function is unicycler.log.log]
+        self.assertIn('\nCleaning k25 graph', logged_text)
+
+    def test_clean_and_score_spades_graph_spawned_worker(self):
+        """
+        A worker process (here spawned, not forked) sends back the score and its held log calls
+        at the main process's verbosity, but not the graph.
+        """
+        test_gfa = os.path.join(os.path.dirname(__file__), 'test_assembly_graph.gfa')
+        out_dir = os.path.dirname(__file__)
+        pool = multiprocessing.get_context('spawn').Pool(
+            1, initializer=unicycler.spades_func.init_worker_logging, initargs=(0, 2, True))
+        try:
+            function = functools.partial(unicycler.spades_func.clean_and_score_spades_graph,
+                                         return_graph=False)
+            graph, score, _, _, table_cells, _, log_calls = \
+                pool.apply(function, ((test_gfa, 25, 401, 60, 0.25, False, 336, 0, out_dir, 1),))
+        finally:
+            pool.terminate()
+            pool.join()
+        os.remove(os.path.join(out_dir, 'k025_assembly_graph.gfa'))
+        self.assertIsNone(graph)
+        self.assertGreater(score, 0.0)
+        logged_text = [args[0] for function, args in log_calls if function is unicycler.log.log]
+        self.assertIn('\nCleaning k25 graph', logged_text)
+
+    def test_clean_and_score_spades_graph_too_complex(self):
+        test_gfa = os.path.join(os.path.dirname(__file__), 'test_assembly_graph.gfa')
+        graph, score, _, _, table_cells, _, _ = \
+            unicycler.spades_func.clean_and_score_spades_graph((test_gfa, 25, 401, 60, 0.25,
+                                                                False, 10, 0, None, 1))
+        self.assertIsNone(graph)
+        self.assertEqual(table_cells[-1], 'too complex')
+
+    def test_get_median_read_length(self):
+        test_fastq = os.path.join(os.path.dirname(__file__), 'test_semi_global_alignment.fastq')
+        read_stats = [unicycler.spades_func.get_read_file_stats(test_fastq)]
+        read_lengths = sorted(unicycler.spades_func.get_read_lengths(test_fastq))
+        self.assertEqual(unicycler.spades_func.get_median_read_length(read_stats),
+                         read_lengths[len(read_lengths) // 2 - 1])
+
+    def test_get_read_length_mean_and_stdev(self):
+        test_fastq = os.path.join(os.path.dirname(__file__), 'test_semi_global_alignment.fastq')
+        read_stats = [unicycler.spades_func.get_read_file_stats(test_fastq)]
+        read_lengths = unicycler.spades_func.get_read_lengths(test_fastq)
+        mean, stdev = unicycler.spades_func.get_read_length_mean_and_stdev(read_stats)
+        self.assertAlmostEqual(mean, statistics.mean(read_lengths))
+        self.assertAlmostEqual(stdev, statistics.stdev(read_lengths))
+
+    def test_read_stats_cache(self):
+        test_fastq = os.path.join(os.path.dirname(__file__), 'test_misc.fastq')
+        cache_dir = os.path.dirname(__file__)
+        cache_file = os.path.join(cache_dir, unicycler.spades_func.READ_STATS_CACHE_FILENAME)
+        unicycler.spades_func.READ_FILE_STATS = {}
+        self.assertEqual(unicycler.spades_func.get_read_count(test_fastq, cache_dir), 3)
+        self.assertTrue(os.path.isfile(cache_file))
+        unicycler.spades_func.READ_FILE_STATS = {}
+        stats = unicycler.spades_func.get_read_file_stats(test_fastq, cache_dir)
+        self.assertEqual(stats.read_count, 3)
+        self.assertEqual(stats.length_counts, {125: 3})
+        os.remove(cache_file)
@@ -0,0 +1,109 @@
+"""
+Copyright 2017 Ryan Wick (rrwick@gmail.com)
+https://github.com/rrwick/Unicycler
+
+This file is part of Unicycler. Unicycler is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version. Unicycler is distributed in
+the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along with Unicycler. If
+not, see <http://www.gnu.org/licenses/>.
+"""
+
+import io
+import sys
+import threading
+import unittest
+import unicycler.log
+from unicycler.stages import Stage, run_stages
+
+
+class TestStages(unittest.TestCase):
+
+    def setUp(self):
+        self.old_stdout = sys.stdout
+        sys.stdout = io.StringIO()
+        unicycler.log.logger = unicycler.log.Log(log_filename=None, stdout_verbosity_level=1)
+
+    def tearDown(self):
+        unicycler.log.flush_log()
+        sys.stdout = self.old_stdout
+        unicycler.log.logger = unicycler.log.Log(log_filename=None, stdout_verbosity_level=0)
+
+    def get_stdout(self):
+        unicycler.log.flush_log()
+        return sys.stdout.getvalue()
+
+    def test_dependency_results(self):
+        stages = [Stage('a', lambda threads: 2),
+                  Stage('b', lambda threads: 3),
+                  Stage('c', lambda threads, a, b: a * b, ['a', 'b'])]
+        for threads in (1, 4):
+            results = run_stages(stages, threads)
+            self.assertEqual(results, {'a': 2, 'b': 3, 'c': 6})
+            stages = [Stage(x.name, x.function, x.dependencies) for x in stages]
+
+    def test_dependencies_must_come_first(self):
+        stages = [Stage('b', lambda threads, a: a, ['a']),
+                  Stage('a', lambda threads: 1)]
+        with self.assertRaises(ValueError):
+            run_stages(stages, 4)
+
+    def test_log_order(self):
+        """
+        The second stage finishes before the first has logged anything, but its output still
+        comes second.
+        """
+        b_finished = threading.Event()
+
+        def stage_a(_):
+            b_finished.wait()
+            unicycler.log.log_section_header('A')
+            unicycler.log.log('a1')
+            unicycler.log.log('a2')
+
+        def stage_b(_):
+            unicycler.log.log_section_header('B')
+            unicycler.log.log('b1')
+            b_finished.set()
+
+        run_stages([Stage('a', stage_a), Stage('b', stage_b)], 2)
+        lines = [unicycler.log.remove_formatting(x) for x in self.get_stdout().splitlines()]
+        lines = [x.split(' (')[0] for x in lines if x]
+        self.assertEqual(lines, ['A', 'a1', 'a2', 'B', 'b1'])
+
+    def test_thread_budget(self):
+        thread_counts = {}
+
+        def record_threads(name):
+            def function(threads, *_):
+                thread_counts[name] = threads
+            return function
+
+        run_stages([Stage('a', record_threads('a')),
+                    Stage('b', record_threads('b'), ['a'], max_threads=1),
+                    Stage('c', record_threads('c'), weight=3)], 8)
+        self.assertEqual(thread_counts['a'], 2)
+        self.assertEqual(thread_counts['b'], 1)
+        self.assertEqual(thread_counts['c'], 6)
+
+        run_stages([Stage('a', record_threads('a')), Stage('c', record_threads('c'))], 1)
+        self.assertEqual(thread_counts['a'], 1)
+        self.assertEqual(thread_counts['c'], 1)
+
+    def test_error(self):
+        a_logged = threading.Event()
+
+        def stage_a(_):
+            unicycler.log.log('a')
+            a_logged.set()
+
+        def stage_b(_):
+            unicycler.log.log('b')
+            a_logged.wait()
+            sys.exit(1)
+
+        with self.assertRaises(SystemExit):
+            run_stages([Stage('a', stage_a), Stage('b', stage_b)], 2)
+        self.assertEqual(self.get_stdout(), 'a\nb\n')
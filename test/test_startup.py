@@ -0,0 +1,64 @@
+"""
+Copyright 2017 Ryan Wick (rrwick@gmail.com)
+https://github.com/rrwick/Unicycler
+
+This file is part of Unicycler. Unicycler is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version. Unicycler is distributed in
+the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along with Unicycler. If
+not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+# These are what make Unicycler slow to start, so parsing the arguments shouldn't load them.
+HEAVY_MODULES = ['unicycler.assembly_graph', 'unicycler.unicycler_align', 'unicycler.spades_func',
+                 'unicycler.bridge_long_read', 'unicycler.miniasm_assembly', 'multiprocessing']
+
+
+def get_modules_loaded(python_code):
+    """
+    Runs the code in a fresh Python process and returns the unicycler and multiprocessing modules
+    it loaded, plus 'cpp_functions.so' if the shared library was loaded.
+    """
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    python_code += ('\nimport sys\n'
+                    'modules = [m for m in sys.modules if m.startswith(("unicycler", '
+                    '"multiprocessing"))]\n'
+                    'cpp_wrappers = sys.modules.get("unicycler.cpp_wrappers")\n'
+                    'if cpp_wrappers is not None and cpp_wrappers.C_LIB.is_loaded():\n'
+                    '    modules.append("cpp_functions.so")\n'
+                    'print(" ".join(modules))\n')
+    output = subprocess.check_output([sys.executable, '-c', python_code], cwd=repo_dir)
+    return output.decode().split()
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_import(self):
+        modules = get_modules_loaded('import unicycler.unicycler')
+        self.assertIn('unicycler.unicycler', modules)
+        for heavy_module in HEAVY_MODULES:
+            self.assertNotIn(heavy_module, modules)
+
+    def test_parse_arguments(self):
+        modules = get_modules_loaded('import unicycler.unicycler\n'
+                                     'unicycler.unicycler.get_arguments(["-l", "reads.fastq", '
+                                     '"-o", "out"])')
+        self.assertIn('unicycler.unicycler_align', modules)
+        self.assertNotIn('unicycler.assembly_graph', modules)
+        self.assertNotIn('cpp_functions.so', modules)
+
+    def test_library_loads_on_first_call(self):
+        modules = get_modules_loaded('import unicycler.alignment\n'
+                                     'import unicycler.cpp_wrappers\n'
+                                     'scoring_scheme = unicycler.alignment.'
+                                     'AlignmentScoringScheme("3,-6,-5,-2")\n'
+                                     'unicycler.cpp_wrappers.fully_global_alignment('
+                                     '"ACGT", "ACGT", scoring_scheme, True, 1000)')
+        self.assertIn('cpp_functions.so', modules)
@@ -14,6 +14,7 @@ not, see <http://www.gnu.org/licenses/>.
 """
 
 import re
+import operator
 from .misc import get_nice_header, reverse_complement, float_to_str
 
 
@@ -86,26 +87,33 @@ class Alignment(object):
         self.milliseconds = None
 
         # How some of the values are gotten depends on whether this alignment came from SAM
-        # or a Seqan alignment.
+        # or a Seqan alignment. Seqan alignments come with their score and error counts already
+        # tallied, but for SAM alignments we must get them from the CIGAR.
         if seqan_output:
             self.setup_using_seqan_output(seqan_output, read, reference_dict)
+            self.finish_scores(scoring_scheme)
         elif sam_line:
             self.setup_using_sam(sam_line, read_dict, reference_dict)
-
-        self.tally_up_score_and_errors(scoring_scheme)
+            self.tally_up_score_and_errors(scoring_scheme)
 
     def setup_using_seqan_output(self, seqan_output, read, reference_dict):
         """
         This function sets up the Alignment using the Seqan results. This kind of alignment has
         complete details about the alignment.
         """
-        seqan_parts = seqan_output.split(',', 9)
-        assert len(seqan_parts) >= 10
+        seqan_parts = seqan_output.split(',')
+        assert len(seqan_parts) >= 14
 
         self.rev_comp = (seqan_parts[1] == '-')
         self.cigar_parts = re.findall(r'\d+\w', seqan_parts[9])
         self.milliseconds = int(seqan_parts[8])
 
+        self.raw_score = int(seqan_parts[6])
+        self.match_count = int(seqan_parts[10])
+        self.mismatch_count = int(seqan_parts[11])
+        self.insertion_count = int(seqan_parts[12])
+        self.deletion_count = int(seqan_parts[13])
+
         self.read = read
         self.read_start_pos = int(seqan_parts[2])
         self.read_end_pos = int(seqan_parts[3])
@@ -187,30 +195,39 @@ class Alignment(object):
                 self.deletion_count += cigar_count
                 ref_i += cigar_count
             else:  # match/mismatch
-                cigar_score = 0
-                for _ in range(cigar_count):
-                    # If all is good with the CIGAR, then we should never end up with a sequence
-                    # index out of the sequence range. But a CIGAR error can cause this, so check
-                    # here.
-                    if read_i >= read_len or ref_i >= ref_len:
-                        break
-                    read_base = read_seq[read_i]
-                    ref_base = ref_seq[ref_i]
-                    if read_base == ref_base:
-                        self.match_count += 1
-                        cigar_score += scoring_scheme.match
-                    else:
-                        self.mismatch_count += 1
-                        cigar_score += scoring_scheme.mismatch
-                    read_i += 1
-                    ref_i += 1
+                # If all is good with the CIGAR, then we should never end up with a sequence
+                # index out of the sequence range. But a CIGAR error can cause this, so check
+                # here.
+                base_count = max(0, min(cigar_count, read_len - read_i, ref_len - ref_i))
+                matches = sum(map(operator.eq, read_seq[read_i:read_i + base_count],
+                                  ref_seq[ref_i:ref_i + base_count]))
+                mismatches = base_count - matches
+                self.match_count += matches
+                self.mismatch_count += mismatches
+                cigar_score = matches * scoring_scheme.match + \
+                    mismatches * scoring_scheme.mismatch
+                read_i += base_count
+                ref_i += base_count
 
             self.raw_score += cigar_score
             align_i += cigar_count
 
-        self.percent_identity = 100.0 * self.match_count / align_i
+        self.finish_scores(scoring_scheme, align_i)
+
+    def finish_scores(self, scoring_scheme, alignment_length=None):
+        """
+        Uses the raw score and the error counts to get the identity, edit distance and scaled
+        score.
+        """
+        if alignment_length is None:
+            alignment_length = self.match_count + self.mismatch_count + \
+                self.insertion_count + self.deletion_count
+        if alignment_length == 0:
+            self.percent_identity = 0.0
+            return
+        self.percent_identity = 100.0 * self.match_count / alignment_length
         self.edit_distance = self.mismatch_count + self.insertion_count + self.deletion_count
-        self.alignment_length = align_i
+        self.alignment_length = alignment_length
         perfect_score = scoring_scheme.match * self.alignment_length
         worst_score = scoring_scheme.mismatch * self.alignment_length
         self.scaled_score = 100.0 * (self.raw_score - worst_score) / (perfect_score - worst_score)
@@ -17,11 +17,12 @@ import math
 import copy
 import os
 import itertools
+import pickle
 from collections import deque, defaultdict
 from .assembly_graph_segment import Segment
 from .misc import int_to_str, float_to_str, weighted_average_list, score_function, \
     add_line_breaks_to_sequence, print_table, get_dim_timestamp, get_right_arrow, \
-    remove_dupes_preserve_order
+    get_open_function, get_file_stamp
 from .bridge_long_read import LongReadBridge
 from .bridge_miniasm import MiniasmBridge
 from . import settings
@@ -46,7 +47,8 @@ class AssemblyGraph(object):
     graph was made by SPAdes).
     """
 
-    def __init__(self, filename, overlap, insert_size_mean=250, insert_size_deviation=50):
+    def __init__(self, filename, overlap, insert_size_mean=250, insert_size_deviation=50,
+                 use_cache=False):
         self.segments = {}  # Dict of unsigned segment number -> segment
         self.forward_links = {}  # Dict of signed segment number -> list of signed segment numbers
         self.reverse_links = {}  # Dict of signed segment number <- list of signed segment numbers
@@ -57,64 +59,46 @@ class AssemblyGraph(object):
         self.insert_size_mean = insert_size_mean
         self.insert_size_deviation = insert_size_deviation
 
-        self.load_from_gfa(filename)
+        gfa_overlap = self.load_from_gfa(filename, use_cache)
         if not overlap:
-            self.overlap = get_overlap_from_gfa_link(filename)
+            self.overlap = gfa_overlap
 
-    def load_from_gfa(self, filename):
+    def load_from_gfa(self, filename, use_cache=False):
         """
         Loads a Graph from a GFA file. It does not load any GFA file, but makes some restrictions:
         1) The segment names must be integers.
         2) The depths should be stored in a dp tag.
         3) All link overlaps are the same (equal to the graph overlap value).
-        """
-        # Load in the segments.
-        with open(filename, 'rt') as gfa_file:
-            for line in gfa_file:
-                if line.startswith('S'):
-                    line_parts = line.strip().split('\t')
-                    num = int(line_parts[1])
-                    depth = 1.0
-                    for part in line_parts:
-                        if part.lower().startswith('dp:'):
-                            depth = float(part[5:])
-                        if part.lower().startswith('ml:'):
-                            self.manual_multiplicity[num] = int(part[5:])
-                    sequence = line_parts[2]
-                    self.segments[num] = Segment(num, depth, sequence, True)
-                    self.segments[num].build_other_sequence_if_necessary()
-                if line.startswith('i'):
-                    line_parts = line.strip().split('\t')
-                    try:
-                        self.insert_size_mean = float(line_parts[1])
-                        self.insert_size_deviation = float(line_parts[2])
-                    except ValueError:
-                        pass
-
-        # Load in the links.
-        with open(filename, 'rt') as gfa_file:
-            for line in gfa_file:
-                if line.startswith('L'):
-                    line_parts = line.strip().split('\t')
-                    start = signed_string_to_int(line_parts[1] + line_parts[2])
-                    end = signed_string_to_int(line_parts[3] + line_parts[4])
-                    if start not in self.forward_links:
-                        self.forward_links[start] = [end]
-                    else:
-                        self.forward_links[start].append(end)
-            self.forward_links = build_rc_links_if_necessary(self.forward_links)
-            self.reverse_links = build_reverse_links(self.forward_links)
+        If use_cache is True and an up-to-date graph cache (made by save_to_gfa with save_cache)
+        exists for the file, it is loaded instead of the GFA. Returns the overlap of the first
+        link (0 if there are no links).
+        """
+        gfa_contents = load_gfa_cache(filename) if use_cache else None
+        if gfa_contents is None:
+            gfa_contents = parse_gfa(filename)
+        segments, manual_multiplicity, links, paths, insert_size, overlap = gfa_contents
+
+        for num, depth, sequence in segments:
+            self.segments[num] = Segment(num, depth, sequence, True)
+            self.segments[num].build_other_sequence_if_necessary()
+        self.manual_multiplicity.update(manual_multiplicity)
+        insert_size_mean, insert_size_deviation = insert_size
+        if insert_size_mean is not None:
+            self.insert_size_mean = insert_size_mean
+        if insert_size_deviation is not None:
+            self.insert_size_deviation = insert_size_deviation
+
+        for start, end in links:
+            if start not in self.forward_links:
+                self.forward_links[start] = [end]
+            else:
+                self.forward_links[start].append(end)
+        self.forward_links = build_rc_links_if_necessary(self.forward_links)
+        self.reverse_links = build_reverse_links(self.forward_links)
         self.sort_link_order()
 
-        # Load in the paths.
-        with open(filename, 'rt') as gfa_file:
-            for line in gfa_file:
-                if line.startswith('P'):
-                    line_parts = line.strip().split('\t')
-                    path_name = line_parts[1]
-                    segments = [signed_string_to_int(x) for x in line_parts[2].split(',')]
-                    if len(segments) > 1:
-                        self.paths[path_name] = segments
+        self.paths.update(paths)
+        return overlap
 
     def get_median_read_depth(self, segment_list=None):
         """
@@ -263,9 +247,12 @@ class AssemblyGraph(object):
                 fasta.write(add_line_breaks_to_sequence(segment.forward_sequence))
 
     def save_to_gfa(self, filename, verbosity=1, save_copy_depth_info=False,
-                    save_seg_type_info=False, newline=False, include_insert_size=False):
+                    save_seg_type_info=False, newline=False, include_insert_size=False,
+                    save_cache=False):
         """
-        Saves whole graph to a GFA file.
+        Saves whole graph to a GFA file. If save_cache is True, a binary copy of the graph is also
+        saved next to the GFA so it can be quickly reloaded with use_cache (e.g. when resuming a
+        run from the depth filter checkpoint).
         """
         log.log(('\n' if newline else '') + 'Saving ' + filename, verbosity)
         with open(filename, 'w') as gfa:
@@ -301,6 +288,29 @@ class AssemblyGraph(object):
                 gfa.write('\t')
                 gfa.write(str(self.insert_size_deviation))
                 gfa.write('\n')
+        if save_cache:
+            self.save_gfa_cache(filename, include_insert_size)
+
+    def save_gfa_cache(self, gfa_filename, include_insert_size):
+        """
+        Saves the graph's GFA contents (exactly what parse_gfa would get from the GFA file just
+        written) to a cache file which load_from_gfa will use in place of the GFA.
+        """
+        segments = [(x.number, float(x.depth), x.forward_sequence)
+                    for x in sorted(self.segments.values(), key=lambda x: x.number)]
+        links = [(start, end) for start, ends in self.forward_links.items() for end in ends
+                 if is_link_positive(start, end)]
+        paths = {name: list(path) for name, path in self.paths.items() if len(path) > 1}
+        if include_insert_size and self.insert_size_mean is not None and \
+                self.insert_size_deviation is not None:
+            insert_size = (float(self.insert_size_mean), float(self.insert_size_deviation))
+        else:
+            insert_size = (None, None)
+        overlap = self.overlap if links else 0
+        gfa_contents = (segments, {}, links, paths, insert_size, overlap)
+        with open(gfa_cache_filename(gfa_filename), 'wb') as cache_file:
+            pickle.dump((GFA_CACHE_VERSION, get_file_stamp(gfa_filename), gfa_contents),
+                        cache_file, protocol=pickle.HIGHEST_PROTOCOL)
 
     def get_all_gfa_link_lines(self):
         """
@@ -1127,8 +1137,11 @@ class AssemblyGraph(object):
         # a bridge applied off one side or the other.
         right_bridged = set()
         left_bridged = set()
-        seg_nums_used_in_bridges = []
-        applied_bridges = []
+        seg_nums_used_in_bridges = set()
+
+        # This dictionary indexes the applied bridges by the (unsigned) segments in their paths, so
+        # we can quickly find which earlier bridges used a particular segment.
+        applied_bridges_by_seg_num = defaultdict(list)
 
         # Sort bridges first by type: LongReadBridge, SpadesContigBridge and then
         # LoopUnrollingBridge. Then sort by quality so within each type we apply the best bridges
@@ -1164,17 +1177,9 @@ class AssemblyGraph(object):
                 # bridge that happens to start or end in this bridge. That arrangement (two bridges,
                 # each of which end inside the other's path) can break up the graph if they are
                 # both applied, so don't apply this bridge if such a case exists.
-                bridges_using_this_segment = []
-                if abs(bridge.start_segment) in seg_nums_used_in_bridges:
-                    for applied_bridge in applied_bridges:
-                        segs_in_applied_bridge_path = set(abs(x) for x in applied_bridge.graph_path)
-                        if abs(bridge.start_segment) in segs_in_applied_bridge_path:
-                            bridges_using_this_segment.append(applied_bridge)
-                if abs(bridge.end_segment) in seg_nums_used_in_bridges:
-                    for applied_bridge in applied_bridges:
-                        segs_in_applied_bridge_path = set(abs(x) for x in applied_bridge.graph_path)
-                        if abs(bridge.end_segment) in segs_in_applied_bridge_path:
-                            bridges_using_this_segment.append(applied_bridge)
+                bridges_using_this_segment = \
+                    applied_bridges_by_seg_num.get(abs(bridge.start_segment), []) + \
+                    applied_bridges_by_seg_num.get(abs(bridge.end_segment), [])
                 if bridges_using_this_segment:
                     segs_in_path = set(abs(x) for x in bridge.graph_path)
                     for bridge_using_this_segment in bridges_using_this_segment:
@@ -1192,8 +1197,8 @@ class AssemblyGraph(object):
                 # high enough for this bridge to be applicable.
                 if bridge.quality >= min_bridge_qual:
                     self.apply_bridge(bridge, right_bridged, left_bridged, seg_nums_used_in_bridges)
-                    seg_nums_used_in_bridges = remove_dupes_preserve_order(seg_nums_used_in_bridges)
-                    applied_bridges.append(bridge)
+                    for seg_num in set(abs(x) for x in bridge.graph_path):
+                        applied_bridges_by_seg_num[seg_num].append(bridge)
                     if verbosity > 1:
                         bridge_application_table_row.append('applied')
                     bridge_application_table.append(bridge_application_table_row)
@@ -1206,8 +1211,9 @@ class AssemblyGraph(object):
 
         print_table(bridge_application_table, alignments='LLLRR', indent=0,
                     sub_colour={'applied': 'green', 'rejected': 'clear_red'},
-                    row_colour=table_row_colours, max_col_width=40)
-        return set(seg_nums_used_in_bridges)
+                    row_colour=table_row_colours, max_col_width=40,
+                    report_table='bridge_application')
+        return seg_nums_used_in_bridges
 
     def apply_bridge(self, bridge, right_bridged, left_bridged, seg_nums_used_in_bridges):
         """
@@ -1253,7 +1259,7 @@ class AssemblyGraph(object):
             self.add_bridge_to_segment(self.segments[abs(seg_num)], bridge)
 
         add_to_bridged_sets(bridge.start_segment, bridge.end_segment, right_bridged, left_bridged)
-        seg_nums_used_in_bridges.extend([abs(x) for x in bridge.graph_path])
+        seg_nums_used_in_bridges.update(abs(x) for x in bridge.graph_path)
 
     def add_bridge_to_segment(self, segment, bridge):
         """
@@ -1709,7 +1715,8 @@ class AssemblyGraph(object):
                              status]
             component_table.append(component_row)
         print_table(component_table, alignments='RRRRRRR', indent=0,
-                    sub_colour={' complete': 'green', ' incomplete': 'red'})
+                    sub_colour={' complete': 'green', ' incomplete': 'red'},
+                    report_table='components')
 
     def get_total_link_count(self):
         """
@@ -2673,16 +2680,77 @@ def add_to_bridged_sets(start, end, right_bridged, left_bridged):
         right_bridged.add(-end)
 
 
-def get_overlap_from_gfa_link(filename):
+def parse_gfa(filename):
     """
-    Looks for the first link line and gets the overlap. Assumes that all overlaps in the graph are
-    the same.
+    Reads a (possibly gzipped) GFA file in a single pass and returns its contents as a tuple of:
+      * a list of (segment number, depth, sequence) for each S line
+      * a dict of segment number -> manual multiplicity (from ML tags)
+      * a list of (signed start, signed end) for each L line
+      * a dict of path name -> list of signed segment numbers (only paths with 2+ segments)
+      * the insert size mean and deviation from an i line (None if absent)
+      * the overlap of the first link (0 if there are no links)
     """
-    with open(filename, 'rt') as gfa_file:
+    segments, manual_multiplicity, links, paths = [], {}, [], {}
+    insert_size_mean, insert_size_deviation = None, None
+    overlap = None
+    with get_open_function(filename)(filename, 'rt') as gfa_file:
         for line in gfa_file:
-            if line.startswith('L'):
+            first_char = line[:1]
+            if first_char == 'S':
+                line_parts = line.strip().split('\t')
+                num = int(line_parts[1])
+                depth = 1.0
+                for part in line_parts[3:]:
+                    tag = part[:3].lower()
+                    if tag == 'dp:':
+                        depth = float(part[5:])
+                    elif tag == 'ml:':
+                        manual_multiplicity[num] = int(part[5:])
+                segments.append((num, depth, line_parts[2]))
+            elif first_char == 'L':
+                line_parts = line.strip().split('\t')
+                links.append((signed_string_to_int(line_parts[1] + line_parts[2]),
+                              signed_string_to_int(line_parts[3] + line_parts[4])))
+                if overlap is None and len(line_parts) > 5:
+                    overlap = int(line_parts[5][:-1])
+            elif first_char == 'P':
                 line_parts = line.strip().split('\t')
-                if len(line_parts) > 5:
-                    cigar = line_parts[5]
-                    return int(cigar[:-1])
-    return 0
+                path = [signed_string_to_int(x) for x in line_parts[2].split(',')]
+                if len(path) > 1:
+                    paths[line_parts[1]] = path
+            elif first_char == 'i':
+                line_parts = line.strip().split('\t')
+                try:
+                    insert_size_mean = float(line_parts[1])
+                    insert_size_deviation = float(line_parts[2])
+                except ValueError:
+                    pass
+    if overlap is None:
+        overlap = 0
+    return (segments, manual_multiplicity, links, paths,
+            (insert_size_mean, insert_size_deviation), overlap)
+
+
+GFA_CACHE_VERSION = 1
+
+
+def gfa_cache_filename(gfa_filename):
+    return gfa_filename + '.cache'
+
+
+def load_gfa_cache(gfa_filename):
+    """
+    Returns the cached GFA contents (as per parse_gfa) for the given GFA file, or None if there is
+    no cache or it is out of date.
+    """
+    cache_filename = gfa_cache_filename(gfa_filename)
+    if not os.path.isfile(cache_filename):
+        return None
+    try:
+        with open(cache_filename, 'rb') as cache_file:
+            version, file_stamp, gfa_contents = pickle.load(cache_file)
+    except Exception:
+        return None
+    if version != GFA_CACHE_VERSION or file_stamp != get_file_stamp(gfa_filename):
+        return None
+    return gfa_contents
@@ -13,6 +13,7 @@ details. You should have received a copy of the GNU General Public License along
 not, see <http://www.gnu.org/licenses/>.
 """
 
+import functools
 from .misc import print_table, get_right_arrow
 from . import settings
 from . import log
@@ -71,43 +72,83 @@ def determine_copy_depth(graph):
 
     # Propagate copy depth as much as possible using those initial assignments.
     copy_depth_table = [['Input', '', 'Output']]
-    determine_copy_depth_part_2(graph, settings.COPY_PROPAGATION_TOLERANCE, copy_depth_table)
+    state = PropagationState()
+    determine_copy_depth_part_2(graph, settings.COPY_PROPAGATION_TOLERANCE, copy_depth_table,
+                                state)
 
     # Assign single copy to the largest available segment, propagate and repeat.
     while True:
         assignments = assign_single_copy_depth(graph, settings.MIN_SINGLE_COPY_LENGTH,
-                                               copy_depth_table)
-        determine_copy_depth_part_2(graph, settings.COPY_PROPAGATION_TOLERANCE, copy_depth_table)
+                                               copy_depth_table, state)
+        determine_copy_depth_part_2(graph, settings.COPY_PROPAGATION_TOLERANCE, copy_depth_table,
+                                    state)
         if not assignments:
             break
 
     # Now propagate with no tolerance threshold to complete the remaining segments.
     if log.logger.stdout_verbosity_level >= 3:
         copy_depth_table.append(['REMOVING PROPAGATION TOLERANCE', '', ''])
-    determine_copy_depth_part_2(graph, 1.0, copy_depth_table)
+    determine_copy_depth_part_2(graph, 1.0, copy_depth_table, state)
+
+    # Arrangements are only reused within one graph, so the cache needn't outlive this function.
+    get_best_arrangement.cache_clear()
 
     print_table(copy_depth_table, alignments='RLL', max_col_width=999, hide_header=True,
-                indent=0, col_separation=1, verbosity=2)
+                indent=0, col_separation=1, verbosity=2, report_table='copy_depth')
 
 
-def determine_copy_depth_part_2(graph, tolerance, copy_depth_table):
+class PropagationState(object):
+    """
+    This class caches the results of copy depth propagation checks. A segment's merge candidate and
+    whether it can redistribute its copy depths only depend on which of its neighbours have copy
+    depths, so when a segment is assigned copy depths, only its neighbours need to be re-evaluated.
+    """
+    def __init__(self):
+        self.merge_candidates = {}  # Dict of unsigned segment number -> (error, depths, sources)
+        self.failed_redistributions = set()  # Unsigned segment numbers that can't redistribute
+        self.tolerance = None
+
+    def set_tolerance(self, tolerance):
+        """
+        Whether or not a redistribution succeeds depends on the tolerance, so failures are
+        forgotten when the tolerance changes.
+        """
+        if tolerance != self.tolerance:
+            self.failed_redistributions = set()
+            self.tolerance = tolerance
+
+    def segment_assigned(self, graph, segment_num):
+        """
+        Invalidates cached results for the given segment and all segments linked to it.
+        """
+        changed = {segment_num}
+        for links in (graph.forward_links, graph.reverse_links):
+            if segment_num in links:
+                changed.update(abs(x) for x in links[segment_num])
+        for num in changed:
+            self.merge_candidates.pop(num, None)
+            self.failed_redistributions.discard(num)
+
+
+def determine_copy_depth_part_2(graph, tolerance, copy_depth_table, state=None):
     """
     Propagates copy depth repeatedly until assignments stop.
     """
-    if log.logger.stdout_verbosity_level >= 3:
-        copy_depth_table.append(['MERGING MULTIPLICITY', '', ''])
-    while merge_copy_depths(graph, tolerance, copy_depth_table):
-        pass
-    if log.logger.stdout_verbosity_level >= 3:
-        copy_depth_table.append(['SPLITTING MULTIPLICITY', '', ''])
-    if redistribute_copy_depths(graph, tolerance, copy_depth_table):
-        try:
-            determine_copy_depth_part_2(graph, tolerance, copy_depth_table)
-        except RecursionError:
+    if state is None:
+        state = PropagationState()
+    state.set_tolerance(tolerance)
+    while True:
+        if log.logger.stdout_verbosity_level >= 3:
+            copy_depth_table.append(['MERGING MULTIPLICITY', '', ''])
+        while merge_copy_depths(graph, tolerance, copy_depth_table, state):
             pass
+        if log.logger.stdout_verbosity_level >= 3:
+            copy_depth_table.append(['SPLITTING MULTIPLICITY', '', ''])
+        if not redistribute_copy_depths(graph, tolerance, copy_depth_table, state):
+            break
 
 
-def assign_single_copy_depth(graph, min_single_copy_length, copy_depth_table):
+def assign_single_copy_depth(graph, min_single_copy_length, copy_depth_table, state=None):
     """
     This function assigns a single copy to the longest available segment.
     """
@@ -124,13 +165,15 @@ def assign_single_copy_depth(graph, min_single_copy_length, copy_depth_table):
         if exactly_one_link_per_end(graph, segment):
             name_depth_before = get_seg_name_depth_str(graph, segment.number)
             graph.copy_depths[segment.number] = [segment.depth]
+            if state is not None:
+                state.segment_assigned(graph, segment.number)
             name_depth_after = get_seg_name_depth_str(graph, segment.number)
             add_to_copy_depth_table(name_depth_before, name_depth_after, copy_depth_table)
             return 1
     return 0
 
 
-def merge_copy_depths(graph, error_margin, copy_depth_table):
+def merge_copy_depths(graph, error_margin, copy_depth_table, state=None):
     """
     This function looks for segments where they have input on one end where:
       1) All input segments have copy depth assigned.
@@ -142,6 +185,8 @@ def merge_copy_depths(graph, error_margin, copy_depth_table):
     segments = get_segments_without_copies(graph)
     if not segments:
         return 0
+    if state is None:
+        state = PropagationState()
 
     best_segment_num = None
     best_source_nums = None
@@ -150,30 +195,15 @@ def merge_copy_depths(graph, error_margin, copy_depth_table):
 
     for segment in segments:
         num = segment.number
-        exclusive_inputs = graph.get_exclusive_inputs(num)
-        exclusive_outputs = graph.get_exclusive_outputs(num)
-        in_depth_possible = exclusive_inputs and all_have_copy_depths(graph, exclusive_inputs)
-        out_depth_possible = exclusive_outputs and all_have_copy_depths(graph, exclusive_outputs)
-        if in_depth_possible:
-            depths, error = scale_copy_depths_from_source_segments(graph, num, exclusive_inputs)
-            conflict = (num in graph.manual_multiplicity and
-                        graph.manual_multiplicity[num] != len(depths))
-            if error < lowest_error and not conflict:
-                lowest_error = error
-                best_segment_num = num
-                best_source_nums = exclusive_inputs
-                best_new_depths = depths
-        if out_depth_possible:
-            depths, error = scale_copy_depths_from_source_segments(graph, num, exclusive_outputs)
-            conflict = (num in graph.manual_multiplicity and
-                        graph.manual_multiplicity[num] != len(depths))
-            if error < lowest_error and not conflict:
-                lowest_error = error
-                best_segment_num = num
-                best_source_nums = exclusive_outputs
-                best_new_depths = depths
+        if num not in state.merge_candidates:
+            state.merge_candidates[num] = get_merge_candidate(graph, num)
+        candidate = state.merge_candidates[num]
+        if candidate is not None and candidate[0] < lowest_error:
+            lowest_error, best_new_depths, best_source_nums = candidate
+            best_segment_num = num
     if best_segment_num and lowest_error < error_margin:
         graph.copy_depths[best_segment_num] = best_new_depths
+        state.segment_assigned(graph, best_segment_num)
         add_to_copy_depth_table(' + '.join(get_seg_name_depth_str(graph, x)
                                            for x in best_source_nums),
                                 get_seg_name_depth_str(graph, best_segment_num), copy_depth_table)
@@ -182,6 +212,29 @@ def merge_copy_depths(graph, error_margin, copy_depth_table):
         return 0
 
 
+def get_merge_candidate(graph, num):
+    """
+    Returns the lowest-error way of giving the segment copy depths from its exclusive inputs or
+    outputs, as a tuple of (error, depths, source segment numbers). Returns None if neither side
+    can be used.
+    """
+    exclusive_inputs = graph.get_exclusive_inputs(num)
+    exclusive_outputs = graph.get_exclusive_outputs(num)
+    in_depth_possible = exclusive_inputs and all_have_copy_depths(graph, exclusive_inputs)
+    out_depth_possible = exclusive_outputs and all_have_copy_depths(graph, exclusive_outputs)
+    best_candidate = None
+    for possible, source_nums in ((in_depth_possible, exclusive_inputs),
+                                  (out_depth_possible, exclusive_outputs)):
+        if not possible:
+            continue
+        depths, error = scale_copy_depths_from_source_segments(graph, num, source_nums)
+        conflict = (num in graph.manual_multiplicity and
+                    graph.manual_multiplicity[num] != len(depths))
+        if not conflict and (best_candidate is None or error < best_candidate[0]):
+            best_candidate = (error, depths, source_nums)
+    return best_candidate
+
+
 def get_seg_name_depth_str(graph, segment_num):
     if segment_num in graph.copy_depths and len(graph.copy_depths[segment_num]) > 0:
         copy_str = '(' + str(len(graph.copy_depths[segment_num])) + 'x)'
@@ -208,7 +261,7 @@ def add_to_copy_depth_table(before_str, after_str, copy_depth_table):
     copy_depth_table.append([before_str, get_right_arrow(), after_str])
 
 
-def redistribute_copy_depths(graph, error_margin, copy_depth_table):
+def redistribute_copy_depths(graph, error_margin, copy_depth_table, state=None):
     """
     This function deals with the easier case of copy depth redistribution: where one segments
     with copy depth leads exclusively to multiple segments without copy depth.
@@ -219,9 +272,15 @@ def redistribute_copy_depths(graph, error_margin, copy_depth_table):
     segments = get_segments_with_two_or_more_copies(graph)
     if not segments:
         return 0
+    if state is None:
+        state = PropagationState()
+    state.set_tolerance(error_margin)
 
     for segment in segments:
         num = segment.number
+        if num in state.failed_redistributions:
+            continue
+        state.failed_redistributions.add(num)
         connections = graph.get_exclusive_inputs(num)
         if not connections or all_have_copy_depths(graph, connections):
             connections = graph.get_exclusive_outputs(num)
@@ -231,27 +290,20 @@ def redistribute_copy_depths(graph, error_margin, copy_depth_table):
         # If we got here, then we can try to redistribute the segment's copy depths to its
         # connections which are lacking copy depth.
         copy_depths = graph.copy_depths[num]
-        bins = [[]] * len(connections)
         targets = [None if x not in graph.copy_depths else len(graph.copy_depths[x])
                    for x in connections]
 
         # For cases where there are many copy depths being distributed to many segments, there
         # will be too many combinations, so we don't bother trying.
-        arrangement_count = len(bins) ** len(copy_depths)
+        arrangement_count = len(connections) ** len(copy_depths)
         if arrangement_count > settings.MAX_COPY_DEPTH_DISTRIBUTION_ARRANGEMENTS:
             continue
-        arrangements = shuffle_into_bins(copy_depths, bins, targets)
-        if not arrangements:
+        segment_depths = [graph.segments[x].depth for x in connections]
+        lowest_error, best_arrangement = get_best_arrangement(tuple(copy_depths), tuple(targets),
+                                                              tuple(segment_depths))
+        if best_arrangement is None:
             continue
 
-        lowest_error = float('inf')
-        best_arrangement = None
-        for i, arrangement in enumerate(arrangements):
-            error = get_error_for_multiple_segments_and_depths(graph, connections, arrangement)
-            if i == 0 or error < lowest_error:
-                lowest_error = error
-                best_arrangement = arrangement
-
         # Make sure this redistribution of copy depths does not conflict with any manually assigned
         # multiplicities.
         conflict = False
@@ -263,6 +315,8 @@ def redistribute_copy_depths(graph, error_margin, copy_depth_table):
 
         if lowest_error < error_margin and not conflict:
             if assign_copy_depths_where_needed(graph, connections, best_arrangement, error_margin):
+                for connection_num in connections:
+                    state.segment_assigned(graph, connection_num)
                 add_to_copy_depth_table(get_seg_name_depth_str(graph, num),
                                         ' + '.join(get_seg_name_depth_str(graph, x)
                                                    for x in connections),
@@ -467,3 +521,56 @@ def shuffle_into_bins(items, bins, targets):
             all([not target or target == len(bins[i]) for i, target in enumerate(targets)]):
         arrangements.append(bins)
     return arrangements
+
+
+@functools.lru_cache(maxsize=None)
+def get_best_arrangement(items, targets, bin_depths):
+    """
+    Finds the arrangement of items into bins with the lowest error, where the error of an
+    arrangement is the largest error between a bin's item sum and that bin's depth. Only
+    arrangements allowed by shuffle_into_bins are considered and ties go to the arrangement
+    shuffle_into_bins would produce first, but partial arrangements which can't beat the best
+    arrangement found so far are abandoned instead of being enumerated.
+    Arguments must be tuples (so results can be cached) and it returns the error and the
+    arrangement as a tuple of tuples, or (inf, None) if no valid arrangement exists.
+    """
+    bin_count = len(targets)
+    bins = [[] for _ in range(bin_count)]
+    bin_sums = [0.0] * bin_count
+    best = [float('inf'), None]
+
+    def lower_bound():
+        # Bin sums only grow as items are added, so a bin which is already over its depth can't
+        # end up with a lower error than it has now.
+        bound = 0.0
+        for bin_sum, depth in zip(bin_sums, bin_depths):
+            if bin_sum > depth:
+                bound = max(bound, get_error(bin_sum, depth))
+        return bound
+
+    def search(item_index, empty_bin_count):
+        if item_index == len(items):
+            if empty_bin_count == 0 and \
+                    all(not target or target == len(bins[i]) for i, target in enumerate(targets)):
+                error = max(get_error(sum(x), depth) for x, depth in zip(bins, bin_depths))
+                if best[1] is None or error < best[0]:
+                    best[0], best[1] = error, tuple(tuple(x) for x in bins)
+            return
+        only_put_in_empty = len(items) - item_index <= empty_bin_count
+        for i in range(bin_count):
+            if targets[i] and len(bins[i]) >= targets[i]:
+                continue
+            if only_put_in_empty and bins[i]:
+                continue
+            was_empty = not bins[i]
+            previous_sum = bin_sums[i]
+            bins[i].append(items[item_index])
+            bin_sums[i] += items[item_index]
+            if best[1] is None or lower_bound() < best[0]:
+                search(item_index + 1, empty_bin_count - (1 if was_empty else 0))
+            bins[i].pop()
+            bin_sums[i] = previous_sum
+
+    if bin_count:
+        search(0, bin_count)
+    return best[0], best[1]
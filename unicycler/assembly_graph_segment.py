@@ -34,7 +34,7 @@ class Segment(object):
         self.depth = depth
         self.original_depth = original_depth
         self.forward_sequence = ''
-        self.reverse_sequence = ''
+        self._reverse_sequence = ''
         self.bridge = bridge
         self.graph_path = graph_path
         if positive:
@@ -50,6 +50,20 @@ class Segment(object):
             seq_string = self.forward_sequence
         return str(self.number) + ' (' + seq_string + ')'
 
+    @property
+    def reverse_sequence(self):
+        """
+        A reverse sequence of None means it hasn't been built yet, in which case it is made from
+        the forward sequence when first needed.
+        """
+        if self._reverse_sequence is None:
+            self._reverse_sequence = reverse_complement(self.forward_sequence)
+        return self._reverse_sequence
+
+    @reverse_sequence.setter
+    def reverse_sequence(self, sequence):
+        self._reverse_sequence = sequence
+
     def add_sequence(self, sequence, positive):
         if positive:
             self.forward_sequence = sequence
@@ -57,10 +71,14 @@ class Segment(object):
             self.reverse_sequence = sequence
 
     def build_other_sequence_if_necessary(self):
+        """
+        Makes sure both strands are available. The reverse strand is built lazily, because many
+        segments (e.g. in graphs loaded only for scoring) never need it.
+        """
         if not self.forward_sequence:
             self.forward_sequence = reverse_complement(self.reverse_sequence)
-        if not self.reverse_sequence:
-            self.reverse_sequence = reverse_complement(self.forward_sequence)
+        if not self._reverse_sequence:
+            self._reverse_sequence = None
 
     def get_length(self):
         return len(self.forward_sequence)
@@ -142,7 +160,8 @@ class Segment(object):
         if amount == 0:
             return
         self.forward_sequence = self.forward_sequence[:-amount]
-        self.reverse_sequence = self.reverse_sequence[amount:]
+        if self._reverse_sequence is not None:
+            self._reverse_sequence = self._reverse_sequence[amount:]
 
     def trim_from_start(self, amount):
         """
@@ -152,7 +171,8 @@ class Segment(object):
         if amount == 0:
             return
         self.forward_sequence = self.forward_sequence[amount:]
-        self.reverse_sequence = self.reverse_sequence[:-amount]
+        if self._reverse_sequence is not None:
+            self._reverse_sequence = self._reverse_sequence[:-amount]
 
     def append_to_forward_sequence(self, additional_seq):
         """
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Copyright 2017 Ryan Wick (rrwick@gmail.com)
+https://github.com/rrwick/Unicycler
+
+This module contains Unicycler's batch mode, which assembles all of the samples in a sample sheet
+from one controller process. The controller parses the options, checks the dependencies and
+prepares the alignment score threshold once, then runs the samples as forked child processes (so
+they inherit the loaded package and C++ library) while keeping the total thread count within the
+user's budget.
+
+This file is part of Unicycler. Unicycler is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version. Unicycler is distributed in
+the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along with Unicycler. If
+not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import multiprocessing
+import multiprocessing.connection
+import os
+import re
+import sys
+import time
+import traceback
+from .alignment import AlignmentScoringScheme
+from .misc import quit_with_error, check_input_files, MyHelpFormatter, print_table, bold, \
+    int_to_str
+from .resources import get_available_cpu_count
+from .unicycler import get_arguments as get_sample_arguments, assemble, check_dependencies
+from . import log
+from . import report
+from . import settings
+from .version import __version__
+
+
+SAMPLE_SHEET_COLUMNS = ['sample', 'short1', 'short2', 'unpaired', 'long']
+
+
+class BatchSample(object):
+
+    def __init__(self, name, short1, short2, unpaired, long):
+        self.name = name
+        self.short1 = short1
+        self.short2 = short2
+        self.unpaired = unpaired
+        self.long = long
+        self.args = None
+        self.command = ''
+        self.threads = 0
+        self.status = 'waiting'
+        self.start_time = None
+        self.run_time = None
+
+    def get_input_size(self):
+        return sum(os.path.getsize(f) for f in self.get_read_files() if os.path.isfile(f))
+
+    def get_read_files(self):
+        return [f for f in (self.short1, self.short2, self.unpaired, self.long) if f]
+
+    def get_unicycler_arguments(self, out_dir, threads, other_args):
+        arguments = []
+        for option, filename in (('--short1', self.short1), ('--short2', self.short2),
+                                 ('--unpaired', self.unpaired), ('--long', self.long)):
+            if filename:
+                arguments += [option, filename]
+        return arguments + ['--out', out_dir, '--threads', str(threads)] + other_args
+
+
+def main():
+    """
+    Batch mode execution starts here.
+    """
+    full_command = ' '.join(('"' + x + '"' if ' ' in x else x) for x in sys.argv)
+    args, other_args = get_arguments()
+    make_batch_output_directory(args.out)
+
+    log.log_section_header('Starting Unicycler batch', single_newline=True)
+    log.log('Command: ' + bold(full_command))
+    log.log('')
+    log.log('Unicycler version: v' + __version__)
+    log.log('Using ' + str(args.threads) + ' threads in total, ' + str(args.sample_threads) +
+            ' per sample')
+
+    samples = load_sample_sheet(args.sample_sheet)
+    log.log('Samples in sample sheet: ' + int_to_str(len(samples)))
+    for sample in samples:
+        prepare_sample(sample, args.out, args.sample_threads, other_args)
+
+    # These are done once here instead of in every sample's run.
+    check_batch_dependencies(samples)
+    prepare_score_threshold(samples, args.threads)
+
+    log.log_section_header('Assembling samples')
+    run_samples(samples, args.threads, args.sample_threads)
+
+    log.log_section_header('Batch complete')
+    print_batch_summary(samples, args.out)
+    log.log('')
+    failed = [s.name for s in samples if s.status != 'complete']
+    if failed:
+        quit_with_error('assembly failed for ' + ', '.join(failed) + ' (see their unicycler.log '
+                        'files for details)')
+
+
+def get_arguments():
+    """
+    Parse the batch mode's own options. Any other options are given to every sample's Unicycler
+    run, so they can be any of the usual Unicycler options (except for the read inputs, output
+    directory and threads, which come from the batch).
+    """
+    parser = argparse.ArgumentParser(description=bold('Unicycler batch: assemble many samples'),
+                                     formatter_class=MyHelpFormatter,
+                                     usage='%(prog)s --sample_sheet SAMPLE_SHEET --out OUT '
+                                           '[options] [Unicycler options]',
+                                     epilog='Any other options are passed to Unicycler for every '
+                                            'sample (see unicycler --help_all).')
+    parser.add_argument('--sample_sheet', required=True,
+                        help='Tab-delimited file with a header line and columns: ' +
+                             ', '.join(SAMPLE_SHEET_COLUMNS) + ' (relative paths are relative to '
+                             'the sample sheet, empty cells are allowed for unused inputs)')
+    parser.add_argument('-o', '--out', required=True,
+                        help='Output directory (required), each sample is assembled into a '
+                             'subdirectory')
+    parser.add_argument('-t', '--threads', type=int, default=get_available_cpu_count(),
+                        help='Total number of threads used by all running samples (default: '
+                             'all CPUs)')
+    parser.add_argument('--sample_threads', type=int, default=None,
+                        help='Number of threads used for each sample - more samples run at once '
+                             'with fewer threads per sample (default: ' +
+                             str(settings.MAX_AUTO_THREAD_COUNT) + ' or --threads, whichever is '
+                             'less)')
+    parser.add_argument('--version', action='version', version='Unicycler v' + __version__)
+
+    if len(sys.argv) == 1:
+        parser.print_help(file=sys.stderr)
+        sys.exit(1)
+    args, other_args = parser.parse_known_args()
+    args.out = os.path.abspath(args.out)
+    if args.threads <= 0:
+        quit_with_error('--threads must be at least 1')
+    if args.sample_threads is None:
+        args.sample_threads = settings.MAX_AUTO_THREAD_COUNT
+    if args.sample_threads <= 0:
+        quit_with_error('--sample_threads must be at least 1')
+    args.sample_threads = min(args.sample_threads, args.threads)
+
+    input_options = {'-1', '--short1', '-2', '--short2', '-s', '--unpaired', '-l', '--long'}
+    for arg in other_args:
+        if arg.split('=')[0] in input_options:
+            quit_with_error('read files must be given in the sample sheet, not with ' + arg)
+    return args, other_args
+
+
+def make_batch_output_directory(out_dir):
+    if not os.path.exists(out_dir):
+        try:
+            os.makedirs(out_dir)
+        except OSError:
+            quit_with_error('Unicycler was unable to make the output directory')
+    log.logger = log.Log(os.path.join(out_dir, 'unicycler_batch.log'), stdout_verbosity_level=1)
+
+
+def load_sample_sheet(sample_sheet):
+    """
+    Loads the samples from a tab-delimited sample sheet. Blank lines and lines starting with '#'
+    are ignored.
+    """
+    if not os.path.isfile(sample_sheet):
+        quit_with_error('could not find ' + sample_sheet)
+    sheet_dir = os.path.dirname(os.path.abspath(sample_sheet))
+    samples, header = [], None
+    with open(sample_sheet, 'rt') as sheet:
+        for line_num, line in enumerate(sheet, start=1):
+            line = line.rstrip('\r\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+            parts = [x.strip() for x in line.split('\t')]
+            if header is None:
+                header = [x.lower() for x in parts]
+                if 'sample' not in header:
+                    quit_with_error('the sample sheet header must have a "sample" column')
+                unknown_columns = [x for x in header if x not in SAMPLE_SHEET_COLUMNS]
+                if unknown_columns:
+                    quit_with_error('unknown sample sheet column: ' + unknown_columns[0])
+                continue
+            if len(parts) > len(header):
+                quit_with_error('sample sheet line ' + str(line_num) + ' has more columns than '
+                                'the header')
+            values = dict(zip(header, parts))
+            files = {}
+            for column in SAMPLE_SHEET_COLUMNS[1:]:
+                filename = values.get(column, '')
+                files[column] = os.path.join(sheet_dir, filename) if filename else None
+            samples.append(BatchSample(values['sample'], **files))
+
+    if not samples:
+        quit_with_error('no samples in ' + sample_sheet)
+    names = set()
+    for sample in samples:
+        if not re.match(r'^[\w.-]+$', sample.name) or sample.name.startswith('.'):
+            quit_with_error('sample names can only contain letters, numbers, dots, dashes and '
+                            'underscores: ' + sample.name)
+        if sample.name in names:
+            quit_with_error('duplicate sample name in sample sheet: ' + sample.name)
+        names.add(sample.name)
+    return samples
+
+
+def prepare_sample(sample, out_dir, sample_threads, other_args):
+    """
+    Parses the sample's Unicycler options now, so any problems are found before any assembly
+    starts. The thread count is set again when the sample is started.
+    """
+    sample_out = os.path.join(out_dir, sample.name)
+    arguments = sample.get_unicycler_arguments(sample_out, sample_threads, other_args)
+    batch_logger = log.logger
+    try:
+        sample.args = get_sample_arguments(arguments)
+    except SystemExit:
+        log.logger = batch_logger
+        quit_with_error('bad Unicycler options for sample ' + sample.name)
+    log.logger = batch_logger  # parsing the arguments makes a new logger
+    check_input_files(sample.args)
+    sample.command = 'unicycler ' + ' '.join(('"' + x + '"' if ' ' in x else x)
+                                             for x in arguments)
+
+
+def check_batch_dependencies(samples):
+    """
+    Checks the dependencies once for the whole batch, so only the programs needed by at least one
+    sample are required.
+    """
+    short_reads_available = any(s.args.short1 or s.args.unpaired for s in samples)
+    long_reads_available = any(s.args.long for s in samples)
+    check_dependencies(samples[0].args, short_reads_available, long_reads_available)
+
+
+def prepare_score_threshold(samples, threads):
+    """
+    If any sample will choose its alignment score threshold automatically, this does the random
+    alignments now, so each sample will find the result in the cache.
+    """
+    from .unicycler_align import get_auto_score_threshold
+    for sample in samples:
+        if sample.args.long and sample.args.low_score is None:
+            get_auto_score_threshold(AlignmentScoringScheme(sample.args.scores),
+                                     settings.AUTO_SCORE_STDEV_ABOVE_RANDOM_ALIGNMENT_MEAN,
+                                     threads)
+            return
+
+
+def run_samples(samples, threads, sample_threads):
+    """
+    Runs the samples as child processes, starting each one when enough of the thread budget is
+    free. Bigger samples go first, so the run doesn't end waiting on one big sample. Samples
+    started near the end (when there are fewer samples left than there is room for) get more
+    threads, so the CPUs stay busy.
+    """
+    context = multiprocessing.get_context('fork')
+    waiting = sorted(samples, key=lambda s: s.get_input_size(), reverse=True)
+    running = {}
+    free_threads = threads
+    completed_count = 0
+    while waiting or running:
+        while waiting and (free_threads >= sample_threads or not running):
+            sample = waiting.pop(0)
+            sample.threads = max(min(free_threads, max(sample_threads,
+                                                       free_threads // (len(waiting) + 1))), 1)
+            sample.args.threads = sample.threads
+            sample.status = 'running'
+            sample.start_time = time.time()
+            process = context.Process(target=run_sample, args=(sample.args, sample.command))
+            process.start()
+            running[process.sentinel] = (sample, process)
+            free_threads -= sample.threads
+            log.log('Started ' + sample.name + ' (' + str(sample.threads) + ' thread' +
+                    ('' if sample.threads == 1 else 's') + ')')
+
+        for sentinel in multiprocessing.connection.wait(list(running.keys())):
+            sample, process = running.pop(sentinel)
+            process.join()
+            sample.run_time = time.time() - sample.start_time
+            sample.status = 'complete' if process.exitcode == 0 else 'failed'
+            free_threads += sample.threads
+            completed_count += 1
+            log.log(('Finished ' if sample.status == 'complete' else 'Failed ') + sample.name +
+                    ' after ' + get_time_str(sample.run_time) + ' (' + str(completed_count) +
+                    ' / ' + str(len(samples)) + ')')
+
+
+def run_sample(args, full_command):
+    """
+    Runs in a sample's child process. The sample logs only to the unicycler.log file in its own
+    output directory, so the terminal shows just the batch's progress.
+    """
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+    os.dup2(devnull, sys.stderr.fileno())
+    try:
+        assemble(args, full_command, dependencies_checked=True)
+    except SystemExit:
+        raise
+    except Exception:
+        log.log(traceback.format_exc(), 0)
+        report.finish_report('failed', error=traceback.format_exc(limit=0).strip())
+        sys.exit(1)
+    finally:
+        log.flush_log()  # a child process exits without running atexit functions
+
+
+def print_batch_summary(samples, out_dir):
+    """
+    Prints a table of the samples' results and also saves it to a tab-delimited file.
+    """
+    table = [['Sample', 'Status', 'Threads', 'Time', 'Assembly']]
+    for sample in samples:
+        assembly = os.path.join(sample.args.out, 'assembly.fasta')
+        table.append([sample.name, sample.status, str(sample.threads),
+                      get_time_str(sample.run_time) if sample.run_time is not None else '',
+                      assembly if sample.status == 'complete' else ''])
+    row_colours = {i: 'red' for i, row in enumerate(table) if row[1] == 'failed'}
+    print_table(table, alignments='LLRRL', row_colour=row_colours, max_col_width=80,
+                sub_colour={'complete': 'green'})
+    with open(os.path.join(out_dir, 'batch_summary.tsv'), 'wt') as summary:
+        for row in table:
+            summary.write('\t'.join(row) + '\n')
+
+
+def get_time_str(seconds):
+    seconds = int(round(seconds))
+    return '%d:%02d:%02d' % (seconds // 3600, (seconds // 60) % 60, seconds % 60)
@@ -17,6 +17,7 @@ not, see <http://www.gnu.org/licenses/>.
 
 import math
 from .misc import weighted_average, print_table, get_right_arrow, float_to_str
+from . import report
 
 
 def get_mean_depth(seg_1, seg_2, graph):
@@ -139,6 +140,8 @@ def print_bridge_table_header(alignments, col_widths, verbosity, bridge_type):
                     header_format='normal', fixed_col_widths=col_widths, indent=0)
     print_table([header_line_2], col_separation=2, alignments=alignments,
                 header_format='underline', fixed_col_widths=col_widths, indent=0)
+    report.add_table(get_bridge_report_table_name(bridge_type),
+                     [[(x + ' ' + y).strip() for x, y in zip(header_line_1, header_line_2)]])
 
 
 def print_bridge_table_row(alignments, col_widths, output, completed_count, num_bridges,
@@ -181,3 +184,8 @@ def print_bridge_table_row(alignments, col_widths, output, completed_count, num_
     print_table([table_row], col_separation=2, header_format='normal', indent=0,
                 left_align_header=False, alignments=alignments, fixed_col_widths=col_widths,
                 sub_colour=sub_colour, bottom_align_header=False)
+    report.add_table_rows(get_bridge_report_table_name(bridge_type), [table_row])
+
+
+def get_bridge_report_table_name(bridge_type):
+    return 'long_read_bridges' if bridge_type == 'LongReadBridge' else 'miniasm_bridges'
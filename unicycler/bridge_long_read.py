@@ -14,7 +14,6 @@ details. You should have received a copy of the GNU General Public License along
 not, see <http://www.gnu.org/licenses/>.
 """
 
-from multiprocessing.dummy import Pool as ThreadPool
 import time
 import math
 import statistics
@@ -24,6 +23,7 @@ from .bridge_common import get_bridge_str, get_mean_depth, get_depth_agreement_f
     get_bridge_table_parameters, print_bridge_table_header, print_bridge_table_row
 from .misc import float_to_str, reverse_complement, flip_number_order, score_function
 from . import settings
+from .resources import get_thread_pool
 from .path_finding import get_best_paths_for_seq
 from . import log
 
@@ -402,9 +402,12 @@ class LongReadBridge(object):
 
 def create_long_read_bridges(graph, read_dict, read_names, anchor_segments, verbosity,
                              min_scaled_score, threads, scoring_scheme, min_alignment_length,
-                             expected_linear_seqs, min_bridge_qual):
+                             expected_linear_seqs, min_bridge_qual, read_lengths):
     """
     Makes bridges between single copy segments using the alignments in the long reads.
+    The read lengths (key = length, value = count) are for all reads which aligned to the graph,
+    including those which weren't given SeqAn alignments, and are used to get each bridge's
+    expected read count.
     """
     log.log_section_header('Building long read bridges')
     log.log_explanation('Unicycler uses the long read alignments to produce bridges between '
@@ -507,13 +510,7 @@ def create_long_read_bridges(graph, read_dict, read_names, anchor_segments, verb
     new_bridges = sorted(new_bridges, key=lambda x: (x.start_segment, x.end_segment))
 
     # During finalisation, we will compare the expected read count to the actual read count for
-    # each bridge. To do this, we'll need the lengths of all reads (excluding those with no
-    # alignments). We also need an estimate of the genome size.
-    read_lengths = defaultdict(int)
-    for read_name in read_names:
-        read = read_dict[read_name]
-        if read.alignments:
-            read_lengths[read.get_length()] += 1
+    # each bridge. To do this, we'll need the read lengths and an estimate of the genome size.
     estimated_genome_size = graph.get_estimated_sequence_len()
 
     # Now we need to finalise the bridges. This is the intensive step, as it involves creating a
@@ -540,7 +537,7 @@ def create_long_read_bridges(graph, read_dict, read_names, anchor_segments, verb
 
     # Use a thread pool if we have more than one thread.
     else:
-        pool = ThreadPool(threads)
+        pool = get_thread_pool(threads)
         arg_list = []
 
         # Sort the bridges based on how long they're predicted to take to finalise. This will make
@@ -25,15 +25,16 @@ import sys
 import math
 from collections import defaultdict
 import itertools
-from multiprocessing.dummy import Pool as ThreadPool
 from .minimap_alignment import align_long_reads_to_assembly_graph, build_start_end_overlap_sets
 from .misc import print_table, get_right_arrow, float_to_str
 from .bridge_common import get_bridge_str, get_mean_depth, get_depth_agreement_factor
 from . import log
+from . import report
 from . import settings
+from .resources import get_thread_pool
 
 try:
-    from .cpp_wrappers import fully_global_alignment
+    from .cpp_wrappers import loop_alignment_scores
 except AttributeError as att_err:
     sys.exit('Error when importing C++ library: ' + str(att_err) + '\n'
              'Have you successfully built the library file using make?')
@@ -263,7 +264,8 @@ def simple_bridge_two_way_junctions(graph, start_overlap_reads, end_overlap_read
     max_op_2_len = max(max(len(y) for y in x[2].split(', ')) for x in two_way_junctions_table) + 1
     print_table(two_way_junctions_table, alignments='RCCRRRRR', left_align_header=False, indent=0,
                 fixed_col_widths=[8, max_op_1_len, max_op_2_len, 5, 5, 7, 5, 7],
-                sub_colour={'no reads': 'red', 'tie vote': 'red'})
+                sub_colour={'no reads': 'red', 'tie vote': 'red'},
+                report_table='simple_two_way_junction_bridges')
     log.log('')
     return bridges
 
@@ -299,7 +301,7 @@ def simple_bridge_loops(graph, start_overlap_reads, end_overlap_reads, minimap_a
     loop_table_header = ['Start', 'Repeat', 'Middle', 'End', 'Read count', 'Read votes',
                          'Loop count', 'Bridge quality']
     print_table([loop_table_header], fixed_col_widths=col_widths, left_align_header=False,
-                alignments='RRRRRLRR', indent=0)
+                alignments='RRRRRLRR', indent=0, report_table='simple_loop_bridges')
 
     for start, end, middle, repeat in loops:
         if middle is None:
@@ -342,7 +344,7 @@ def simple_bridge_loops(graph, start_overlap_reads, end_overlap_reads, minimap_a
 
         # Use a thread pool if we have more than one thread.
         else:
-            pool = ThreadPool(threads)
+            pool = get_thread_pool(threads)
             arg_list = []
             for read, strand in zip(all_reads, strands):
                 arg_list.append((start, end, middle, repeat, strand, minimap_alignments,
@@ -397,6 +399,7 @@ def simple_bridge_loops(graph, start_overlap_reads, end_overlap_reads, minimap_a
         print_table([loop_table_row], fixed_col_widths=col_widths, header_format='normal',
                     alignments='RRRRRLRR', left_align_header=False, bottom_align_header=False,
                     sub_colour={'bad reads': 'red', 'no reads': 'red', 'tie vote': 'red'}, indent=0)
+        report.add_table_rows('simple_loop_bridges', [loop_table_row])
     return bridges
 
 
@@ -472,26 +475,21 @@ def get_read_loop_vote(start, end, middle, repeat, strand, minimap_alignments, r
         middle_seq = graph.seq_from_signed_seg_num(m)
     repeat_seq = graph.seq_from_signed_seg_num(r)
 
+    # The read is aligned to start + repeat + (middle + repeat) * n + end for every loop count n
+    # at once, up to the most loops which could be tested below.
+    loop_scores = loop_alignment_scores(read_seq, start_seg_seq, repeat_seq, middle_seq,
+                                        end_seg_seq, max_tested_loop_count * 10 + 1,
+                                        scoring_scheme, settings.SIMPLE_REPEAT_BRIDGING_BAND_SIZE)
     best_score = None
     best_count = None
 
     loop_count, fail_to_improve_count = 0, 0
     prev_test_seq_score = None
     while True:
-        test_seq = start_seg_seq + repeat_seq
-        for _ in range(loop_count):
-            test_seq += middle_seq + repeat_seq
-        test_seq += end_seg_seq
-        alignment_result = fully_global_alignment(read_seq, test_seq, scoring_scheme, True,
-                                                  settings.SIMPLE_REPEAT_BRIDGING_BAND_SIZE)
-        if alignment_result:
-            seqan_parts = alignment_result.split(',', 9)
-            test_seq_score = int(seqan_parts[6])
-            if best_score is None or test_seq_score > best_score:
-                best_score = test_seq_score
-                best_count = loop_count
-        else:
-            test_seq_score = 0
+        test_seq_score = loop_scores[loop_count]
+        if best_score is None or test_seq_score > best_score:
+            best_score = test_seq_score
+            best_count = loop_count
 
         # Break when we've hit the max loop count. But if the max is our best, then we keep
         # trying higher.
@@ -503,7 +501,7 @@ def get_read_loop_vote(start, end, middle, repeat, strand, minimap_alignments, r
             break
 
         # If the score fails to increase a few times in a row, we can assume that we're getting
-        # further from the correct answer and can break the loop to save time.
+        # further from the correct answer and can stop looking.
         if prev_test_seq_score is not None and test_seq_score <= prev_test_seq_score:
             fail_to_improve_count += 1
         else:
@@ -183,7 +183,8 @@ def create_loop_unrolling_bridges(graph, anchor_segments):
                                  float_to_str(bridge.loop_count_by_middle, 2),
                                  str(bridge.loop_count), float_to_str(bridge.quality, 1)])
         print_table(bridge_table, alignments='RRRRRRRR', left_align_header=False, indent=0,
-                    fixed_col_widths=[5, 6, 6, 5, 10, 10, 5, 7])
+                    fixed_col_widths=[5, 6, 6, 5, 10, 10, 5, 7],
+                    report_table='loop_unrolling_bridges')
     else:
         log.log('No loop unrolling bridges made')
 
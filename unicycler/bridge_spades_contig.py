@@ -195,7 +195,8 @@ def create_spades_contig_bridges(graph, anchor_segments):
             bridge_table.append([str(bridge.start_segment), path_str, str(bridge.end_segment),
                                  float_to_str(bridge.quality, 1)])
         print_table(bridge_table, alignments='RCLR', left_align_header=False, indent=0,
-                    fixed_col_widths=[5, max_path_str_len, 5, 7])
+                    fixed_col_widths=[5, max_path_str_len, 5, 7],
+                    report_table='spades_contig_bridges')
     else:
         log.log('No SPAdes contig bridges')
 
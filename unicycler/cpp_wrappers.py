@@ -15,6 +15,7 @@ not, see <http://www.gnu.org/licenses/>.
 """
 
 import os
+import threading
 from ctypes import CDLL, cast, c_char_p, c_int, c_uint, c_ulong, c_double, c_void_p, c_bool, \
     c_float, POINTER
 from .misc import quit_with_error
@@ -22,10 +23,66 @@ from .misc import quit_with_error
 
 SO_FILE = 'cpp_functions.so'
 SO_FILE_FULL = os.path.join(os.path.dirname(os.path.realpath(__file__)), SO_FILE)
-if not os.path.isfile(SO_FILE_FULL):
-    quit_with_error('could not find ' + SO_FILE + '\n' +
-                    "Please reinstall Unicycler or run make from Unicycler's source directory")
-C_LIB = CDLL(SO_FILE_FULL)
+
+
+class LazyCLibrary(object):
+    """
+    Stands in for CDLL(SO_FILE_FULL), but the shared library isn't loaded until one of its
+    functions is first called, so runs which never get that far (e.g. --help) don't pay for it.
+    Until then, the argtypes/restype given to each function are held by a LazyCFunction and they
+    are applied to the real function when the library loads. After that, looking up a function
+    gives the real ctypes function, so calls have no extra overhead.
+    """
+    def __init__(self, filename):
+        self._filename = filename
+        self._library = None
+        self._functions = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # Only called for names which aren't already attributes, i.e. before the library loads.
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._library is not None:
+            return getattr(self._library, name)
+        if name not in self._functions:
+            self._functions[name] = LazyCFunction(self, name)
+        return self._functions[name]
+
+    def load(self):
+        with self._lock:
+            if self._library is not None:
+                return
+            if not os.path.isfile(self._filename):
+                quit_with_error('could not find ' + SO_FILE + '\n' +
+                                "Please reinstall Unicycler or run make from Unicycler's source "
+                                'directory')
+            library = CDLL(self._filename)
+            for name, lazy_function in self._functions.items():
+                function = getattr(library, name)
+                if lazy_function.argtypes is not None:
+                    function.argtypes = lazy_function.argtypes
+                function.restype = lazy_function.restype
+                setattr(self, name, function)
+            self._library = library
+
+    def is_loaded(self):
+        return self._library is not None
+
+
+class LazyCFunction(object):
+    def __init__(self, library, name):
+        self.library = library
+        self.name = name
+        self.argtypes = None
+        self.restype = c_int  # the ctypes default
+
+    def __call__(self, *args):
+        self.library.load()
+        return getattr(self.library, self.name)(*args)
+
+
+C_LIB = LazyCLibrary(SO_FILE_FULL)
 
 
 
@@ -34,7 +91,7 @@ C_LIB.semiGlobalAlignment.argtypes = [c_char_p,  # Read name
                                       c_char_p,  # Read sequence
                                       c_int,     # Verbosity
                                       c_char_p,  # Minimap alignment info
-                                      c_void_p,  # KmerPositions pointer
+                                      c_void_p,  # RefSeqs pointer
                                       c_int,     # Match score
                                       c_int,     # Mismatch score
                                       c_int,     # Gap open score
@@ -45,11 +102,11 @@ C_LIB.semiGlobalAlignment.argtypes = [c_char_p,  # Read name
 C_LIB.semiGlobalAlignment.restype = c_void_p     # String describing alignments
 
 def semi_global_alignment(read_name, read_sequence, verbosity, minimap_alignments_str,
-                          kmer_positions_ptr, match_score, mismatch_score, gap_open_score,
+                          ref_seqs_ptr, match_score, mismatch_score, gap_open_score,
                           gap_extend_score, low_score_threshold, keep_bad, sensitivity_level):
     ptr = C_LIB.semiGlobalAlignment(read_name.encode('utf-8'), read_sequence.encode('utf-8'),
                                     verbosity, minimap_alignments_str.encode('utf-8'),
-                                    kmer_positions_ptr, match_score, mismatch_score,
+                                    ref_seqs_ptr, match_score, mismatch_score,
                                     gap_open_score, gap_extend_score, low_score_threshold,
                                     keep_bad, sensitivity_level)
     return c_string_to_python_string(ptr)
@@ -118,6 +175,83 @@ def path_alignment(partial_seq, full_seq, scoring_scheme, use_banding, band_size
 
 
 
+# These functions give only the scores of global/mostly-global alignments (no CIGAR or positions),
+# which is much faster than making the alignment. Many pairs of sequences can be scored in one call.
+# For each pair, the result is a tuple of (raw score, scaled score).
+C_LIB.fullyGlobalAlignmentScores.argtypes = [c_int,  # Pair count
+                                             POINTER(c_char_p),  # Sequence 1s
+                                             POINTER(c_char_p),  # Sequence 2s
+                                             c_int,  # Match score
+                                             c_int,  # Mismatch score
+                                             c_int,  # Gap open score
+                                             c_int,  # Gap extension score
+                                             c_bool,  # Use banding
+                                             c_int,  # Band size
+                                             POINTER(c_int),  # Raw scores (output)
+                                             POINTER(c_double)]  # Scaled scores (output)
+C_LIB.fullyGlobalAlignmentScores.restype = None
+
+C_LIB.pathAlignmentScores.argtypes = C_LIB.fullyGlobalAlignmentScores.argtypes
+C_LIB.pathAlignmentScores.restype = None
+
+def fully_global_alignment_scores(sequence_pairs, scoring_scheme, use_banding, band_size):
+    return alignment_scores(C_LIB.fullyGlobalAlignmentScores, sequence_pairs, scoring_scheme,
+                            use_banding, band_size)
+
+def path_alignment_scores(sequence_pairs, scoring_scheme, use_banding, band_size):
+    return alignment_scores(C_LIB.pathAlignmentScores, sequence_pairs, scoring_scheme,
+                            use_banding, band_size)
+
+def alignment_scores(c_function, sequence_pairs, scoring_scheme, use_banding, band_size):
+    count = len(sequence_pairs)
+    if not count:
+        return []
+    # noinspection PyCallingNonCallable
+    sequences_1 = (c_char_p * count)(*[x[0].encode('utf-8') for x in sequence_pairs])
+    # noinspection PyCallingNonCallable
+    sequences_2 = (c_char_p * count)(*[x[1].encode('utf-8') for x in sequence_pairs])
+    # noinspection PyCallingNonCallable
+    raw_scores = (c_int * count)()
+    # noinspection PyCallingNonCallable
+    scaled_scores = (c_double * count)()
+    c_function(count, sequences_1, sequences_2,
+               scoring_scheme.match, scoring_scheme.mismatch,
+               scoring_scheme.gap_open, scoring_scheme.gap_extend,
+               use_banding, band_size, raw_scores, scaled_scores)
+    return list(zip(raw_scores, scaled_scores))
+
+
+
+# This function scores a read against a simple loop (start + repeat + (middle + repeat) * k + end)
+# for every loop count k from 0 to max_loop_count, returning a list of raw scores.
+C_LIB.loopAlignmentScores.argtypes = [c_char_p,  # Read sequence
+                                      c_char_p,  # Start sequence
+                                      c_char_p,  # Repeat sequence
+                                      c_char_p,  # Middle sequence
+                                      c_char_p,  # End sequence
+                                      c_int,  # Max loop count
+                                      c_int,  # Match score
+                                      c_int,  # Mismatch score
+                                      c_int,  # Gap open score
+                                      c_int,  # Gap extension score
+                                      c_int,  # Band size
+                                      POINTER(c_int)]  # Raw scores (output)
+C_LIB.loopAlignmentScores.restype = None
+
+def loop_alignment_scores(read_seq, start_seq, repeat_seq, middle_seq, end_seq, max_loop_count,
+                          scoring_scheme, band_size):
+    # noinspection PyCallingNonCallable
+    raw_scores = (c_int * (max_loop_count + 1))()
+    C_LIB.loopAlignmentScores(read_seq.encode('utf-8'), start_seq.encode('utf-8'),
+                              repeat_seq.encode('utf-8'), middle_seq.encode('utf-8'),
+                              end_seq.encode('utf-8'), max_loop_count,
+                              scoring_scheme.match, scoring_scheme.mismatch,
+                              scoring_scheme.gap_open, scoring_scheme.gap_extend,
+                              band_size, raw_scores)
+    return list(raw_scores)
+
+
+
 # This function cleans up the heap memory for the C strings returned by the other C functions. It
 # must be called after them.
 C_LIB.freeCString.argtypes = [c_void_p]
@@ -163,13 +297,15 @@ C_LIB.getRandomSequenceAlignmentScores.argtypes = [c_int,  # Random sequence len
                                                    c_int,  # Match score
                                                    c_int,  # Mismatch score
                                                    c_int,  # Gap open score
-                                                   c_int]  # Gap extension score
+                                                   c_int,  # Gap extension score
+                                                   c_int]  # Threads
 C_LIB.getRandomSequenceAlignmentScores.restype = c_void_p
 
-def get_random_sequence_alignment_mean_and_std_dev(seq_length, count, scoring_scheme):
+def get_random_sequence_alignment_mean_and_std_dev(seq_length, count, scoring_scheme, threads=1):
     ptr = C_LIB.getRandomSequenceAlignmentScores(seq_length, count,
                                                  scoring_scheme.match, scoring_scheme.mismatch,
-                                                 scoring_scheme.gap_open, scoring_scheme.gap_extend)
+                                                 scoring_scheme.gap_open, scoring_scheme.gap_extend,
+                                                 threads)
     return_str = c_string_to_python_string(ptr)
     return_parts = return_str.split(',')
     return float(return_parts[0]), float(return_parts[1])
@@ -24,6 +24,11 @@ extern "C" {
     char * fullyGlobalAlignment(char * s1, char * s2,
                                 int matchScore, int mismatchScore, int gapOpenScore, int gapExtensionScore,
                                 bool useBanding=false, int bandSize=1000);
+
+    void fullyGlobalAlignmentScores(int pairCount, char ** s1s, char ** s2s,
+                                    int matchScore, int mismatchScore, int gapOpenScore, int gapExtensionScore,
+                                    bool useBanding, int bandSize,
+                                    int * rawScores, double * scaledScores);
 }
 
 
@@ -13,13 +13,9 @@
 #define KMERS_H
 
 #include <string>
-#include <cmath>
-#include <unordered_map>
 #include <vector>
+#include <cstdint>
 #include "settings.h"
-#include <mutex>
-
-typedef std::unordered_map<std::string, std::vector<int> > KmerPosMap;
 
 
 class CommonKmer {
@@ -30,30 +26,29 @@ public:
 };
 
 
-// KmerPositions is a class that holds maps of k-mer positions for named sequences. It exists so we
-// don't have to repeatedly find the same k-mer sets over and over.
-class KmerPositions {
+// KmerIndex holds the positions of every k-mer in one sequence, keyed by the k-mer's 2-bit integer
+// encoding in a flat open-addressing hash table. K-mers containing anything other than A, C, G or
+// T are not indexed. The object can be rebuilt for a new sequence without freeing its buffers,
+// so a single (thread-local) instance can be reused for many reads.
+class KmerIndex {
 public:
-    KmerPositions() {}
-    ~KmerPositions();
-    void addPositions(std::string & name, std::string & sequence, int kSize);
-    KmerPosMap * getKmerPositions(std::string & name);
-    std::string * getSequence(std::string & name);
-    std::vector<std::string> getAllNames();
-    int getLength(std::string & name);
+    KmerIndex() : m_kSize(0), m_slotBits(0) {}
+    void build(std::string const & sequence, int kSize);
+    void findCommonKmers(char const * otherSequence, int otherLength,
+                         std::vector<CommonKmer> & commonKmers) const;
+    int getKSize() const {return m_kSize;}
 
 private:
-    std::unordered_map<std::string, KmerPosMap *> m_kmerPositions;
-    std::unordered_map<std::string, std::string> m_sequences;
-    std::mutex m_mutex;
+    int m_kSize;
+    int m_slotBits;
+    std::vector<uint32_t> m_slotKeys;
+    std::vector<uint32_t> m_slotStarts;
+    std::vector<uint32_t> m_slotCounts;
+    std::vector<int> m_positions;
+    std::vector<int> m_positionSlots;
+
+    int findSlot(uint32_t kmerCode) const;
 };
 
-KmerPositions * newKmerPositions();
-
-void addKmerPositions(KmerPositions * kmerPositions, char * nameC, char * sequenceC, int kSize);
-
-void deleteAllKmerPositions(KmerPositions * kmerPositions);
-
 
 #endif // KMERS_H
-
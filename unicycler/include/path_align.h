@@ -24,6 +24,11 @@ extern "C" {
     char * pathAlignment(char * s1, char * s2,
                          int matchScore, int mismatchScore, int gapOpenScore, int gapExtensionScore,
                          bool useBanding=false, int bandSize=1000);
+
+    void pathAlignmentScores(int pairCount, char ** s1s, char ** s2s,
+                             int matchScore, int mismatchScore, int gapOpenScore, int gapExtensionScore,
+                             bool useBanding, int bandSize,
+                             int * rawScores, double * scaledScores);
 }
 
 
@@ -32,6 +37,8 @@ ScoredAlignment * pathAlignment(std::string s1, std::string s2,
                                 int matchScore, int mismatchScore, int gapOpenScore, int gapExtensionScore,
                                 bool useBanding=false, int bandSize=1000);
 
+void getPathBand(int length1, int length2, int bandSize, int * lowerDiagonal, int * upperDiagonal);
+
 
 
 
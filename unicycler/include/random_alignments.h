@@ -24,12 +24,17 @@ using namespace seqan;
 extern "C" {
 
     char * getRandomSequenceAlignmentScores(int seqLength, int n,
-                                            int matchScore, int mismatchScore, int gapOpenScore, int gapExtensionScore);
+                                            int matchScore, int mismatchScore, int gapOpenScore, int gapExtensionScore,
+                                            int threadCount);
     char * getRandomSequenceAlignmentErrorRates(int seqLength, int n,
                                                int matchScore, int mismatchScore, int gapOpenScore, int gapExtensionScore);
     char * simulateDepths(int alignmentLengths[], int alignmentCount, int refLength, int iterations, int threadCount);
 }
 
+void getRandomSequenceAlignmentScoresOneThread(int seqLength, int n,
+                                               int matchScore, int mismatchScore, int gapOpenScore, int gapExtensionScore,
+                                               std::vector<double> * scores, std::mutex * mut);
+
 void simulateDepthsOneThread(int alignmentLengths[], int alignmentCount, int refLength, int iterations,
                              std::vector<int> * minDepthCounts, std::vector<int> * maxDepthCounts,
                              std::mutex * mut);
@@ -14,14 +14,29 @@
 
 #include <string>
 #include <unordered_map>
+#include <vector>
 
-typedef std::unordered_map<std::string, std::string> SeqMap;
 
-// Functions that are called by the Python script must have C linkage, not C++ linkage.
+// RefSeqs holds the reference sequences for the aligner. Each reference gets an integer ID (its
+// index in the vectors) when it is added, so once a reference has been looked up by name the
+// aligner can refer to it without any more string hashing.
+class RefSeqs {
+public:
+    void add(std::string const & name, std::string const & sequence);
+    int getId(std::string const & name) const;
+    std::string const & getName(int id) const {return m_names[size_t(id)];}
+    std::string const & getSequence(int id) const {return m_sequences[size_t(id)];}
+
+private:
+    std::vector<std::string> m_names;
+    std::vector<std::string> m_sequences;
+    std::unordered_map<std::string, int> m_ids;
+};
+
 extern "C" {
-    SeqMap * newRefSeqs();
-    void addRefSeq(SeqMap * seqMap, char * nameC, char * sequenceC);
-    void deleteRefSeqs(SeqMap * seqMap);
+    RefSeqs * newRefSeqs();
+    void addRefSeq(RefSeqs * refSeqs, char * nameC, char * sequenceC);
+    void deleteRefSeqs(RefSeqs * refSeqs);
 }
 
 #endif // REF_SEQS_H
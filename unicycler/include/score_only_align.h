@@ -0,0 +1,57 @@
+// Copyright 2017 Ryan Wick (rrwick@gmail.com)
+// https://github.com/rrwick/Unicycler
+
+// This file is part of Unicycler. Unicycler is free software: you can redistribute it and/or
+// modify it under the terms of the GNU General Public License as published by the Free Software
+// Foundation, either version 3 of the License, or (at your option) any later version. Unicycler is
+// distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+// implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+// Public License for more details. You should have received a copy of the GNU General Public
+// License along with Unicycler. If not, see <http://www.gnu.org/licenses/>.
+
+#ifndef SCORE_ONLY_ALIGN_H
+#define SCORE_ONLY_ALIGN_H
+
+
+#include <string>
+
+
+struct AlignmentScore {
+    AlignmentScore() : rawScore(0), scaledScore(0.0), alignmentLength(0) {}
+    int rawScore;
+    double scaledScore;
+    int alignmentLength;
+};
+
+
+// Runs a banded global alignment of s1 (horizontal) against s2 (vertical), but only computes the
+// score, so no traceback matrix or CIGAR is made. The band includes diagonals (s1 position minus
+// s2 position) from lowerDiagonal to upperDiagonal. If freeEndGapsSeq2 is true, the alignment can
+// finish before the end of s2 without penalty, like the pathAlignment function.
+// The scaled score is calculated in the same way as in ScoredAlignment. When there are multiple
+// optimal alignments, the shortest is used.
+AlignmentScore bandedGlobalAlignmentScore(std::string const & s1, std::string const & s2,
+                                          int matchScore, int mismatchScore,
+                                          int gapOpenScore, int gapExtensionScore,
+                                          bool freeEndGapsSeq2,
+                                          int lowerDiagonal, int upperDiagonal);
+
+void getFullyGlobalBand(int length1, int length2, int bandSize,
+                        int * lowerDiagonal, int * upperDiagonal);
+
+
+// Functions that are called by the Python script must have C linkage, not C++ linkage.
+extern "C" {
+    // Scores the global alignment of a read to start + repeat + (middle + repeat) * k + end for
+    // each loop count k from 0 to maxLoopCount, storing them in rawScores. The test sequences share
+    // most of their bases, so this is done with one banded pass of the read over the shared part
+    // and one over the end segment, instead of an alignment for each loop count.
+    void loopAlignmentScores(char * readC, char * startC, char * repeatC, char * middleC,
+                             char * endC, int maxLoopCount,
+                             int matchScore, int mismatchScore,
+                             int gapOpenScore, int gapExtensionScore,
+                             int bandSize, int * rawScores);
+}
+
+
+#endif // SCORE_ONLY_ALIGN_H
@@ -33,6 +33,7 @@ public:
     std::string getFullString();
     std::string getShortDisplayString();
     bool isRevComp();
+    bool isSameAlignment(ScoredAlignment * other);
     int getReadAlignmentLength() {return m_readEndPos - m_readStartPos;}
     int getRefAlignmentLength() {return m_refEndPos - m_refStartPos;}
 
@@ -47,13 +48,17 @@ public:
     std::string m_cigar;
     int m_rawScore;
     double m_scaledScore;
+    int m_matchCount;
+    int m_mismatchCount;
+    int m_insertionCount;
+    int m_deletionCount;
     int m_milliseconds;
     int m_bandSize;
 
 private:
     CigarType getCigarType(char b1, char b2, bool alignmentStarted);
     std::string getCigarPart(CigarType type, int length);
-    int getCigarScore(CigarType type, int length, Score<int, Simple> & scoringScheme,
+    int scoreAndCountCigarPart(CigarType type, int length, Score<int, Simple> & scoringScheme,
                       std::string & readAlignment, std::string & refAlignment,
                       int alignmentPos);
 };
@@ -18,19 +18,18 @@
 #include <seqan/basic.h>
 #include <string>
 #include <vector>
-#include <unordered_set>
+#include <map>
 #include "kmers.h"
 #include "scoredalignment.h"
 #include "random_alignments.h"
 #include "string_functions.h"
 #include "ref_seqs.h"
-#include "nanoflann.hpp"
 
 using namespace seqan;
-using namespace nanoflann;
 
 typedef std::pair<int, int> StartEndRange;
-typedef std::unordered_map<std::string, std::vector<StartEndRange> > RefRangeMap;
+typedef std::pair<int, char> RefIdAndStrand;
+typedef std::map<RefIdAndStrand, std::vector<StartEndRange> > RefRangeMap;
 typedef Seed<Simple> TSeed;
 typedef SeedSet<TSeed> TSeedSet;
 
@@ -46,7 +45,6 @@ struct Point {
     }
 };
 
-typedef std::unordered_set<Point> PointSet;
 typedef std::vector<Point> PointVector;
 
 
@@ -54,84 +52,91 @@ typedef std::vector<Point> PointVector;
 extern "C" {
 
     char * semiGlobalAlignment(char * readNameC, char * readSeqC, int verbosity,
-                               char * minimapAlignmentsStr, SeqMap * refSeqs,
+                               char * minimapAlignmentsStr, RefSeqs * refSeqs,
                                int matchScore, int mismatchScore, int gapOpenScore,
                                int gapExtensionScore, double lowScoreThreshold, bool returnBad,
                                int sensitivityLevel);
 }
 
-std::vector<ScoredAlignment *> alignReadToReferenceRange(SeqMap * refSeqs, std::string refName,
-                                                         StartEndRange refRange, int refLen,
-                                                         std::string readName, char readStrand,
-                                                         KmerPosMap * kmerPositions, int kSize,
-                                                         std::string * readSeq, int matchScore,
-                                                         int mismatchScore, int gapOpenScore,
-                                                         int gapExtensionScore,
-                                                         int sensitivityLevel,
-                                                         int verbosity, std::string & output);
-
 std::pair<int,int> getRefRange(int refStart, int refEnd, int refLen,
                                int readStart, int readEnd, int readLen, bool posStrand);
 
 std::vector<std::pair<int, int> > simplifyRanges(std::vector<std::pair<int, int> > & ranges);
 
-// http://stackoverflow.com/questions/17016175/c-unordered-map-using-a-custom-class-type-as-the-key#
-namespace std {
-  template <>
-  struct hash<Point> {
-    size_t operator()(const Point& p) const {
-      return (std::hash<int>()(p.x) ^ (std::hash<int>()(p.y) << 1)) >> 1;
-    }
-  };
-}
-
-// This stuff is for the nanoflann NN searching.
-struct PointCloud
-{
+// A spatial index of the common k-mer points for one reference range, used for the radius
+// searches in line tracing. The points are split into columns of read positions and sorted by
+// reference position within each column, so a search only needs a binary search and a short scan
+// in each column it overlaps. Points are referred to by their position in pts, which lets the line
+// tracing keep per-point state (used or not, density) in flat vectors. Like KmerIndex, the object
+// can be rebuilt without freeing its buffers.
+class PointIndex {
+public:
+    void build(std::vector<CommonKmer> const & commonKmers, int readLen);
+    void radiusSearch(Point p, int radius, std::vector<int> & matches) const;
     PointVector pts;
-    inline size_t kdtree_get_point_count() const { return pts.size(); }
-    inline int kdtree_distance(const int *p1, const size_t idx_p2,size_t /*size*/) const
-    {
-        const int d0=p1[0]-pts[idx_p2].x;
-        const int d1=p1[1]-pts[idx_p2].y;
-        return d0+d1;
-    }
-    inline int kdtree_get_pt(const size_t idx, int dim) const
-    {
-        if (dim==0)
-            return pts[idx].x;
-        else
-            return pts[idx].y;
-    }
-    template <class BBOX>
-    bool kdtree_get_bbox(BBOX& /*bb*/) const { return false; }
+
+private:
+    std::vector<int> m_columnStarts;
+    std::vector<int> m_ids;
+    std::vector<int> m_xs;
+    std::vector<int> m_ys;
 };
 
-typedef KDTreeSingleIndexAdaptor<L1_Adaptor<int, PointCloud>, PointCloud, 2> my_kd_tree_t;
+// Buffers used while aligning a read to a reference range. Each thread keeps one of these and
+// reuses it for every read, so the containers keep their memory between alignments.
+struct AlignmentScratch {
+    AlignmentScratch() : usedPointCount(0) {}
+    PointIndex pointIndex;
+    std::vector<bool> usedPoints;
+    int usedPointCount;
+    std::vector<double> pointDensities;
+    std::vector<int> radiusMatches;
+    std::vector<int> pointSet;
+    std::vector<bool> inPointSet;
+    std::vector<int> pointsNearLine;
+    std::vector<bool> nearLine;
+};
 
-PointVector radiusSearchAroundPoint(Point point, int radius, PointCloud & cloud,
-                                    my_kd_tree_t & index);
+// The common k-mers between the read and one reference range. These are kept between sensitivity
+// levels so that levels with the same k-mer size don't need to find them again.
+struct RangeSeeds {
+    RangeSeeds() : kSize(0) {}
+    int kSize;
+    std::vector<CommonKmer> commonKmers;
+};
 
-Point getHighestDensityPoint(int densityRadius, PointCloud & cloud, my_kd_tree_t & index,
-                             std::string & trimmedRefSeq, std::string * readSeq);
+int getKmerSize(int sensitivityLevel);
 
-double getPointDensityScore(int densityRadius, Point p, PointCloud & cloud, my_kd_tree_t & index);
+std::vector<ScoredAlignment *> alignReadToReferenceRange(RefSeqs * refSeqs, int refId,
+                                                         StartEndRange refRange,
+                                                         std::string & readName, char readStrand,
+                                                         KmerIndex * readKmers,
+                                                         RangeSeeds & rangeSeeds, int kSize,
+                                                         std::string * readSeq, int matchScore,
+                                                         int mismatchScore, int gapOpenScore,
+                                                         int gapExtensionScore,
+                                                         int sensitivityLevel, int verbosity,
+                                                         std::string & output,
+                                                         AlignmentScratch & scratch);
 
-void addKmerPointsToNanoflann(PointCloud & cloud, std::vector<CommonKmer> & commonKmers,
-                              PointSet & usedPoints);
+void setPointDensities(AlignmentScratch & scratch);
+
+double getPointDensityContribution(Point p1, Point p2);
+
+int getHighestDensityPoint(AlignmentScratch & scratch);
+
+void setPointUsed(int pointId, AlignmentScratch & scratch);
 
 double getSlope(Point & p1, Point & p2);
 
-PointSet lineTracingWithNanoflann(std::vector<CommonKmer> & commonKmers, PointSet & usedPoints,
-                                  PointCloud & cloud, my_kd_tree_t & index, std::string readName,
-                                  char readStrand, std::string * readSeq, int readLen,
-                                  std::string refName, std::string & trimmedRefSeq, int lineNum,
-                                  int verbosity, std::string & output, bool & failedLine,
-                                  double & pointSetScore);
+PointVector traceLine(AlignmentScratch & scratch, std::string & readName, char readStrand,
+                      int readLen, std::string & refName, int trimmedRefLen, int lineNum,
+                      int verbosity, std::string & output, bool & failedLine,
+                      double & pointSetScore);
 
 void displayRFunctions(std::string & output);
 
-void displayRefRanges(std::string & output, RefRangeMap & simplifiedRefRanges);
+void displayRefRanges(std::string & output, RefRangeMap & refRanges, RefSeqs * refSeqs);
 
 void saveCommonKmersToFile(std::string readName, char readStrand, std::string refName,
                            std::vector<CommonKmer> & commonKmers, std::string & output);
@@ -141,23 +146,24 @@ void saveChainedSeedsToFile(std::string readName, char readStrand, std::string r
                             int bestLineNum);
 
 void saveTraceDotsToFile(std::string readName, char readStrand, std::string refName,
-                         PointVector & traceDots, PointSet & pointSet, std::string & output,
+                         PointVector & traceDots, PointVector & pointSet, std::string & output,
                          int lineNum);
 
-double scorePointSet(PointSet & pointSet, PointVector & traceDots, bool & failedLine);
+double scorePointSet(PointVector & pointSet, PointVector & traceDots, bool & failedLine);
 
 double getWorstSlope(PointVector traceDots);
 
-Point mutateLineToBestFitPoints(Point previousP, Point newP, PointCloud & cloud,
-                                my_kd_tree_t & index, PointSet & pointsNearLine,
+Point mutateLineToBestFitPoints(Point previousP, Point newP, AlignmentScratch & scratch,
                                 bool leftAlignmentRectangle);
 
-void addPointsNearLine(Point p1, Point p2, PointSet & pointsNearLine, PointSet & pointSet,
-                       double radius);
+void addPointToSet(int pointId, std::vector<int> & pointSet, std::vector<bool> & inPointSet);
+
+void addPointsNearLine(Point p1, Point p2, AlignmentScratch & scratch, double radius);
 
 double distanceToLineSegment(Point p, Point l1, Point l2);
 
-double scoreLineSegment(Point p1, Point p2, PointSet & pointsNearLine);
+double scoreLineSegment(Point p1, Point p2, std::vector<int> const & pointsNearLine,
+                        PointVector const & pts);
 
 double variance(std::vector<double> & v);
 
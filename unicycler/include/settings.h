@@ -45,6 +45,10 @@
 // regions of the space. This parameter controls the size of those regions.
 #define LINE_TRACING_START_POINT_SEARCH_RADIUS 100
 
+// The line tracing's point index groups common k-mer points into columns of this many read
+// positions. It should be close to the search radii above and below.
+#define LINE_TRACING_INDEX_COLUMN_WIDTH 128
+
 // Common k-mer points this close to the trace line will be collected into the point set that is
 // given to Seqan for global chaining and then banded alignment.
 #define TRACE_LINE_COLLECTION_DISTANCE 20.0
@@ -15,11 +15,44 @@ not, see <http://www.gnu.org/licenses/>.
 
 import sys
 import os
+import atexit
 import datetime
+import queue
 import re
 import shutil
 import textwrap
-import subprocess
+import threading
+import time
+from . import settings
+from . import report
+
+
+terminal_colour_count = None
+
+
+def get_terminal_colour_count():
+    """
+    Returns the number of colours the terminal supports (1 meaning no formatting at all), judged
+    from the TERM and COLORTERM environment variables in the same way that terminfo (and therefore
+    `tput colors`) would be, but without running a subprocess. This is only worked out once.
+    """
+    global terminal_colour_count
+    if terminal_colour_count is None:
+        term = os.environ.get('TERM', '').lower()
+        colour_term = os.environ.get('COLORTERM', '').lower()
+        if not term or term == 'dumb' or term.startswith('vt'):
+            terminal_colour_count = 1
+        elif colour_term in ('truecolor', '24bit') or term.endswith('direct'):
+            terminal_colour_count = 256
+        elif '256col' in term:
+            terminal_colour_count = 256
+        elif '88col' in term:
+            terminal_colour_count = 88
+        elif '16col' in term:
+            terminal_colour_count = 16
+        else:
+            terminal_colour_count = 8
+    return terminal_colour_count
 
 
 class Log(object):
@@ -28,10 +61,7 @@ class Log(object):
         self.log_filename = log_filename
 
         # Determine if the terminal supports colours or not.
-        try:
-            self.colours = int(subprocess.check_output(['tput', 'colors']).decode().strip())
-        except (ValueError, subprocess.CalledProcessError, FileNotFoundError, AttributeError):
-            self.colours = 1
+        self.colours = get_terminal_colour_count()
 
         # There are two verbosity levels: one for stdout and one for the log file. They are the
         # same, except that the log file verbosity level is never 0.
@@ -44,7 +74,7 @@ class Log(object):
 
         if self.log_filename:
             log_file_exists = os.path.isfile(self.log_filename)
-            self.log_file = open(self.log_filename, 'at', 1, encoding='utf8')  # line buffering
+            self.log_file = open(self.log_filename, 'at', encoding='utf8')
 
             # If the log file already exists, we pad out a bit of space before appending to it.
             if log_file_exists:
@@ -54,6 +84,7 @@ class Log(object):
 
     def __del__(self):
         if self.log_file and not self.log_file.closed:
+            flush_log()
             self.log_file.close()
 
 
@@ -61,25 +92,161 @@ class Log(object):
 logger = Log()
 
 
+# Messages are written by a background thread, so the threads doing the work don't wait on the
+# terminal or the disk. Each message in the queue is a (stream, text, log file, log file text)
+# tuple, where either part can be None, or a threading.Event to set when all messages before it
+# have been written. The writer belongs to the process which started it: a forked child process
+# (e.g. in batch mode) starts its own.
+message_queue = None
+writer_thread = None
+writer_pid = None
+writer_lock = threading.Lock()
+
+
+def queue_message(message):
+    global message_queue, writer_thread, writer_pid
+    if writer_pid != os.getpid():
+        with writer_lock:
+            if writer_pid != os.getpid():
+                message_queue = queue.Queue()
+                writer_thread = threading.Thread(target=write_messages, args=(message_queue,),
+                                                 daemon=True)
+                writer_thread.start()
+                writer_pid = os.getpid()
+    message_queue.put(message)
+
+
+def write_messages(messages):
+    """
+    The writer thread's loop. Streams and files are flushed whenever the queue runs empty, not for
+    every message, so a burst of messages is written together.
+    """
+    unflushed = set()
+    while True:
+        message = messages.get()
+        try:
+            if not isinstance(message, threading.Event):
+                stream, text, log_file, log_file_text = message
+                if stream is not None:
+                    stream.write(text)
+                    unflushed.add(stream)
+                if log_file_text is not None and not log_file.closed:
+                    log_file.write(log_file_text)
+                    unflushed.add(log_file)
+            if messages.empty() or isinstance(message, threading.Event):
+                for output in unflushed:
+                    if not output.closed:
+                        output.flush()
+                unflushed.clear()
+        except (OSError, ValueError):  # e.g. a closed pipe - there's nowhere left to report it
+            unflushed.clear()
+        if isinstance(message, threading.Event):
+            message.set()
+
+
+def flush_log():
+    """
+    Waits until every message logged so far (by this process) has been written.
+    """
+    if writer_pid != os.getpid() or threading.current_thread() is writer_thread:
+        return
+    written = threading.Event()
+    message_queue.put(written)
+    written.wait()
+
+
+atexit.register(flush_log)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=flush_log)
+
+
+# When pipeline stages run at the same time (see stages.py), only one of them logs directly. The
+# others' messages are held by their StageLog until it's their turn, so the log reads the same as
+# if the stages had run one after another.
+thread_state = threading.local()
+
+
+class StageLog(object):
+
+    def __init__(self):
+        self.live = False
+        self.held = []
+        self.lock = threading.Lock()
+
+    def hold(self, function, args):
+        """
+        Holds the call for later and returns True, or returns False if this stage is now live and
+        the call should be made straight away.
+        """
+        with self.lock:
+            if self.live:
+                return False
+            self.held.append((function, args))
+            return True
+
+    def go_live(self):
+        """
+        Makes the held calls (in the order they were held) and lets this stage log directly from
+        now on. This stage's thread waits on the lock meanwhile, so nothing gets out of order.
+        """
+        with self.lock:
+            for function, args in self.held:
+                function(*args)
+            self.held = []
+            self.live = True
+
+
+def set_stage_log(stage_log):
+    thread_state.stage_log = stage_log
+
+
+def in_log_order(function, *args):
+    """
+    Calls the function now, or later if the calling thread's stage isn't live yet. This is for
+    things which should happen in step with the log (e.g. adding tables to the run report).
+    """
+    stage_log = getattr(thread_state, 'stage_log', None)
+    if stage_log is None or not stage_log.hold(function, args):
+        function(*args)
+
+
 def log(text, verbosity=1, stderr=False, end='\n', print_to_screen=True, write_to_log_file=True):
-    text_no_formatting = remove_formatting(text)
+    to_screen = stderr or (verbosity <= logger.stdout_verbosity_level and print_to_screen)
+    to_log_file = logger.log_file is not None and write_to_log_file and \
+        verbosity <= logger.log_file_verbosity_level
+    if not to_screen and not to_log_file:
+        return
+    stage_log = getattr(thread_state, 'stage_log', None)
+    if stage_log is not None and not stderr and \
+            stage_log.hold(log, (text, verbosity, stderr, end, print_to_screen, write_to_log_file)):
+        return
+    text_no_formatting = remove_formatting(text) if '\033' in text else text
 
     # The text is printed to the screen with ANSI formatting, if supported. If there are only 8
     # colours available, then remove the 'dim' format which doesn't work.
-    if stderr or (verbosity <= logger.stdout_verbosity_level and print_to_screen):
+    stream, screen_text = None, None
+    if to_screen:
         if logger.colours <= 1:
-            text = text_no_formatting
+            screen_text = text_no_formatting
         elif logger.colours <= 8:
-            text = remove_dim_formatting(text)
-        if stderr:
-            print(text, file=sys.stderr, end=end, flush=True)
+            screen_text = remove_dim_formatting(text)
         else:
-            print(text, end=end, flush=True)
+            screen_text = text
+        stream = sys.stderr if stderr else sys.stdout
+
+    # Errors are written straight away (after anything already queued), as the program is
+    # probably about to stop.
+    if stderr:
+        flush_log()
+        print(screen_text, file=stream, end=end, flush=True)
+        stream = None
+        if not to_log_file:
+            return
 
     # The text is written to file without ANSI formatting.
-    if logger.log_file and verbosity <= logger.log_file_verbosity_level and write_to_log_file:
-        logger.log_file.write(text_no_formatting)
-        logger.log_file.write('\n')
+    log_file_text = text_no_formatting + '\n' if to_log_file else None
+    queue_message((stream, None if stream is None else screen_text + end, logger.log_file,
+                   log_file_text))
 
 
 def log_section_header(message, verbosity=1, single_newline=False):
@@ -92,12 +259,16 @@ def log_section_header(message, verbosity=1, single_newline=False):
     else:
         log('\n', verbosity)
 
-    time = get_timestamp()
-    time_str = '(' + time + ')'
+    report.start_section(message, time.time())
+    timestamp = get_timestamp()
+    time_str = '(' + timestamp + ')'
     if logger.colours > 8:
         time_str = dim(time_str)
     log(bold_yellow_underline(message) + ' ' + time_str, verbosity)
-    log('-' * (len(message) + 3 + len(time)), verbosity, print_to_screen=False)
+    log('-' * (len(message) + 3 + len(timestamp)), verbosity, print_to_screen=False)
+
+
+last_progress_line_time = 0.0
 
 
 def log_progress_line(completed, total, base_pairs=None, end_newline=False):
@@ -105,6 +276,18 @@ def log_progress_line(completed, total, base_pairs=None, end_newline=False):
     Logs a progress line using a carriage return to overwrite the previous progress line. Only the
     final progress line will be written to the log file.
     """
+    # Progress lines are only shown on screen, so if they wouldn't be, or if one was shown very
+    # recently, there's nothing to do (the first and last lines are always shown).
+    global last_progress_line_time
+    if not end_newline:
+        if logger.stdout_verbosity_level < 1:
+            return
+        now = time.monotonic()
+        if 0 < completed < total and \
+                now - last_progress_line_time < settings.PROGRESS_LINE_INTERVAL:
+            return
+        last_progress_line_time = now
+
     progress_str = int_to_str(completed) + ' / ' + int_to_str(total)
     if total > 0:
         percent = 100.0 * completed / total
@@ -126,6 +309,12 @@ def log_explanation(text, verbosity=1, print_to_screen=True, write_to_log_file=T
     This function writes explanatory text to the screen. It is wrapped to the terminal width for
     stdout but not wrapped for the log file.
     """
+    if verbosity > logger.stdout_verbosity_level:
+        print_to_screen = False
+    if logger.log_file is None or verbosity > logger.log_file_verbosity_level:
+        write_to_log_file = False
+    if not print_to_screen and not write_to_log_file:
+        return
     text = ' ' * indent_size + text
     if print_to_screen:
         terminal_width = shutil.get_terminal_size().columns
@@ -186,9 +375,12 @@ def dim(text):
     return DIM + text + END_FORMATTING
 
 
+FORMATTING_REGEX = re.compile('\033.*?m')
+
+
 def remove_formatting(text):
-    return re.sub('\033.*?m', '', text)
+    return FORMATTING_REGEX.sub('', text)
 
 
 def remove_dim_formatting(text):
-    return re.sub('\033\[2m', '', text)
+    return text.replace(DIM, '')
@@ -26,9 +26,11 @@ from .minimap_alignment import align_long_reads_to_assembly_graph, range_overlap
     load_minimap_alignments
 from .string_graph import StringGraph, StringGraphSegment, \
     merge_string_graph_segments_into_unitig_graph
-from .read_ref import load_references, load_long_reads
+from .read_ref import load_references, load_long_reads, get_read_name_table
+from .read_selection import get_read_depth, select_reads
 from .unicycler_align import semi_global_align_long_reads
 from . import log
+from . import report
 from . import settings
 
 try:
@@ -193,7 +195,8 @@ def make_miniasm_string_graph(graph, read_dict, long_read_filename, scoring_sche
             else:
                 polish_unitigs_with_racon(unitig_graph, miniasm_dir, read_dict, graph,
                                           args.racon_path, args.threads, scoring_scheme,
-                                          seg_nums_to_bridge)
+                                          seg_nums_to_bridge, long_read_filename,
+                                          args.max_polishing_depth)
                 unitig_graph.save_to_gfa(racon_polished_filename)
                 if not short_reads_available and args.keep > 0:
                     unitig_graph.save_to_gfa(gfa_path(args.out, next(counter),
@@ -286,7 +289,8 @@ def segment_suitable_for_miniasm_assembly(graph, segment, seg_nums_to_bridge):
 
 
 def polish_unitigs_with_racon(unitig_graph, miniasm_dir, read_dict, graph, racon_path, threads,
-                              scoring_scheme, seg_nums_to_bridge):
+                              scoring_scheme, seg_nums_to_bridge, long_read_filename,
+                              target_depth):
     log.log_section_header('Polishing miniasm assembly with Racon')
     log.log_explanation('Unicycler now uses Racon to polish the miniasm assembly. It does '
                         'multiple rounds of polishing to get the best consensus. Circular unitigs '
@@ -301,7 +305,14 @@ def polish_unitigs_with_racon(unitig_graph, miniasm_dir, read_dict, graph, racon
     # chimeric reads (if I come up with a good way of spotting them) and reads with a window that
     # drops below a quality threshold.
 
+    counter = itertools.count(start=1)
+    current_fasta = os.path.join(polish_dir, ('%03d' % next(counter)) + '_unpolished_unitigs.fasta')
+    unitig_graph.save_to_fasta(current_fasta)
+
     polish_read_names = sorted([x for x in read_dict.keys()])
+    polish_read_names = select_polishing_reads(polish_read_names, read_dict, unitig_graph,
+                                               current_fasta, long_read_filename, threads,
+                                               target_depth)
     polish_reads = os.path.join(polish_dir, 'polishing_reads.fastq')
     save_assembly_reads_to_file(polish_reads, polish_read_names, read_dict, graph,
                                 seg_nums_to_bridge, settings.RACON_CONTIG_DUPLICATION_COUNT)
@@ -309,17 +320,13 @@ def polish_unitigs_with_racon(unitig_graph, miniasm_dir, read_dict, graph, racon
     col_widths = [6, 12, 14]
     racon_table_header = ['Polish round', 'Assembly size', 'Mapping quality']
     print_table([racon_table_header], fixed_col_widths=col_widths, left_align_header=False,
-                alignments='LRR', indent=0)
+                alignments='LRR', indent=0, report_table='racon_polishing')
 
     best_fasta = None
     best_unitig_sequences = {}
     best_mapping_quality = 0
     times_quality_failed_to_beat_best = 0
 
-    counter = itertools.count(start=1)
-    current_fasta = os.path.join(polish_dir, ('%03d' % next(counter)) + '_unpolished_unitigs.fasta')
-    unitig_graph.save_to_fasta(current_fasta)
-
     if graph is None:  # Long-read-only assembly
         racon_loop_count = settings.RACON_POLISH_LOOP_COUNT_LONG_ONLY
     else:  # Hybrid assembly
@@ -344,6 +351,7 @@ def polish_unitigs_with_racon(unitig_graph, miniasm_dir, read_dict, graph, racon
                            float_to_str(mapping_quality, 2)]
         print_table([racon_table_row], fixed_col_widths=col_widths, left_align_header=False,
                     alignments='LRR', indent=0, header_format='normal', bottom_align_header=False)
+        report.add_table_rows('racon_polishing', [racon_table_row])
 
         # Do we have a new best?
         if mapping_quality > best_mapping_quality:
@@ -704,12 +712,33 @@ def find_contig_starts_and_ends(miniasm_dir, assembly_graph, unitig_graph, threa
         else:
             contig_search_table.append([str(contig_number), 'not found', '', '', ''])
             not_found_contig_numbers.append(contig_number)
-    print_table(contig_search_table, alignments='RLRRR', indent=0, sub_colour={'not found': 'red'})
+    print_table(contig_search_table, alignments='RLRRR', indent=0, sub_colour={'not found': 'red'},
+                report_table='contig_search')
     log.log('')
 
     return contig_positions, not_found_contig_numbers
 
 
+def select_polishing_reads(read_names, read_dict, unitig_graph, unitig_fasta, long_read_filename,
+                           threads, target_depth):
+    """
+    When the reads are much deeper than Racon needs, this subsamples them using their minimap
+    alignments to the unpolished unitigs. Reads which don't align to the unitigs wouldn't be used
+    by Racon anyway, so they are left out.
+    """
+    unitig_lengths = {seg.full_name: seg.get_length() for seg in unitig_graph.segments.values()}
+    if not target_depth or \
+            get_read_depth(read_names, read_dict, unitig_lengths) <= target_depth:
+        return read_names
+    minimap_alignments_str = minimap_align_reads(unitig_fasta, long_read_filename, threads, 3,
+                                                 preset_name='find contigs')
+    alignments_by_read = load_minimap_alignments(
+        minimap_alignments_str, filter_overlaps=True, allowed_overlap=10,
+        filter_by_minimisers=True, read_name_table=get_read_name_table(long_read_filename))
+    return select_reads('polishing', read_names, read_dict, alignments_by_read, unitig_lengths,
+                        target_depth, keep_unaligned=False)
+
+
 def make_racon_polish_alignments(current_fasta, mappings_filename, polish_reads, threads):
     mapping_quality = 0
     unitig_depths = collections.defaultdict(float)
@@ -780,6 +809,6 @@ def trim_dead_ends_based_on_miniasm_trimming(assembly_graph, miniasm_read_list):
 
     if len(dead_end_trim_table) > 1:
         print_table(dead_end_trim_table, fixed_col_widths=[7, 10, 7, 7, 10], alignments='LRRRR',
-                    indent=0, left_align_header=False)
+                    indent=0, left_align_header=False, report_table='dead_end_trimming')
     else:
         log.log('No dead ends required trimming.')
@@ -18,7 +18,8 @@ import os
 import sys
 from collections import defaultdict
 from .misc import get_nice_header, dim, line_iterator, range_overlap, range_is_contained, \
-    range_overlap_size, simplify_ranges
+    range_overlap_size, RangeSet
+from .read_ref import get_read_name_table
 from . import log
 from . import settings
 
@@ -46,6 +47,7 @@ class MinimapAlignment(object):
             self.matching_bases = 0
             self.num_bases = 0
             self.minimiser_count = 0
+            self.read_index = -1
             self.read_end_gap = 0
 
         else:
@@ -68,6 +70,13 @@ class MinimapAlignment(object):
             # Mapping quality is part 11, not currently used
             self.minimiser_count = int(line_parts[12].split('cm:i:')[-1])
 
+            # The read's position in the read file (0-based), used to rename reads which share a
+            # name with another read.
+            if len(line_parts) > 13 and line_parts[13].startswith('ri:i:'):
+                self.read_index = int(line_parts[13][5:])
+            else:
+                self.read_index = -1
+
             self.read_end_gap = self.read_length - self.read_end
 
     def get_concise_string(self):
@@ -102,17 +111,25 @@ class MinimapAlignment(object):
 
 
 def load_minimap_alignments(minimap_alignments_str, filter_by_minimisers=False,
-                            minimiser_ratio=10, filter_overlaps=False, allowed_overlap=0):
+                            minimiser_ratio=10, filter_overlaps=False, allowed_overlap=0,
+                            read_name_table=None):
     """
     Loads minimap's output string into MinimapAlignment objects, grouped by read.
     If filter_by_minimisers is True, it will remove low minimiser count hits.
     If filter_overlaps is True, it will exclude hits which overlap better hits.
+    If a read name table is given (see get_read_name_table), reads are renamed using their index
+    in the file, for read files with duplicate names. A read keeps minimap's name if the table's
+    entry at its index doesn't have that name in the file.
     """
     alignments = defaultdict(list)
     for line in line_iterator(minimap_alignments_str):
         try:
             log.log(dim(line), 3)
             alignment = MinimapAlignment(line)
+            if read_name_table is not None and 0 <= alignment.read_index < len(read_name_table):
+                file_read_name, read_name = read_name_table[alignment.read_index]
+                if alignment.read_name == file_read_name:
+                    alignment.read_name = read_name
             read_alignments = alignments[alignment.read_name]
             read_alignments.append(alignment)
             read_alignments = sorted(read_alignments, key=lambda x: x.minimiser_count, reverse=True)
@@ -152,7 +169,8 @@ def align_long_reads_to_assembly_graph(graph, long_read_filename, working_dir, t
         load_minimap_alignments(minimap_alignments_str, filter_overlaps=True,
                                 allowed_overlap=settings.ALLOWED_MINIMAP_OVERLAP,
                                 filter_by_minimisers=True,
-                                minimiser_ratio=settings.MAX_TO_MIN_MINIMISER_RATIO)
+                                minimiser_ratio=settings.MAX_TO_MIN_MINIMISER_RATIO,
+                                read_name_table=get_read_name_table(long_read_filename))
     log.log('Number of minimap alignments: ' + str(len(minimap_alignments)), 2)
     log.log('', 1)
     return minimap_alignments
@@ -194,7 +212,7 @@ def remove_conflicting_alignments(alignments, allowed_overlap):
     alignments = sorted(alignments, reverse=True,
                         key=lambda x: (x.matching_bases, x.minimiser_count, x.ref_name))
     kept_alignments = []
-    kept_alignment_ranges = []
+    kept_alignment_ranges = RangeSet()
     for a in alignments:
         this_range = (a.read_start, a.read_end)
 
@@ -207,6 +225,6 @@ def remove_conflicting_alignments(alignments, allowed_overlap):
             continue
 
         kept_alignments.append(a)
-        kept_alignment_ranges = simplify_ranges(kept_alignment_ranges + [this_range])
+        kept_alignment_ranges.add(this_range)
 
     return sorted(kept_alignments, key=lambda x: x.read_start)
@@ -18,15 +18,16 @@ import os
 import subprocess
 import random
 import math
-import gzip
 import argparse
+import bisect
 import shutil
 import re
 import textwrap
 import datetime
-import multiprocessing
 from . import settings
 from . import log
+from . import report
+from .resources import get_available_cpu_count
 
 
 REV_COMP_DICT = {'A': 'T', 'T': 'A', 'G': 'C', 'C': 'G',
@@ -39,6 +40,10 @@ REV_COMP_DICT = {'A': 'T', 'T': 'A', 'G': 'C', 'C': 'G',
                  'd': 'h', 'h': 'd', 'n': 'n',
                  '.': '.', '-': '-', '?': '?'}
 
+# A str.translate table for complementing ASCII sequences (unknown characters become N, like in
+# complement_base).
+REV_COMP_TABLE = str.maketrans({i: REV_COMP_DICT.get(chr(i), 'N') for i in range(128)})
+
 RANDOM_SEQ_DICT = {0: 'A', 1: 'C', 2: 'G', 3: 'T'}
 
 
@@ -108,6 +113,7 @@ def quit_with_error(message):
     Displays the given message and ends the program's execution.
     """
     log.log('Error: ' + message, 0, stderr=True)
+    report.finish_report('failed', error=message)
     sys.exit(1)
 
 
@@ -154,7 +160,11 @@ def reverse_complement(seq):
     """
     Given a DNA sequences, this function returns the reverse complement sequence.
     """
-    return ''.join([complement_base(x) for x in seq][::-1])
+    try:
+        seq.encode('ascii')
+    except UnicodeEncodeError:
+        return ''.join([complement_base(x) for x in seq][::-1])
+    return seq.translate(REV_COMP_TABLE)[::-1]
 
 
 def complement_base(base):
@@ -229,18 +239,20 @@ def round_to_nearest_odd(num):
 
 def get_compression_type(filename):
     """
-    Attempts to guess the compression (if any) on a file using the first few bytes.
+    Attempts to guess the compression (if any) on a file using the first few bytes: 'plain', 'gz'
+    or 'zstd'.
     http://stackoverflow.com/questions/13044562
     """
     magic_dict = {'gz': (b'\x1f', b'\x8b', b'\x08'),
                   'bz2': (b'\x42', b'\x5a', b'\x68'),
-                  'zip': (b'\x50', b'\x4b', b'\x03', b'\x04')}
-    max_len = max(len(x) for x in magic_dict)
+                  'zip': (b'\x50', b'\x4b', b'\x03', b'\x04'),
+                  'zstd': (b'\x28', b'\xb5', b'\x2f', b'\xfd')}
+    max_len = max(len(x) for x in magic_dict.values())
     with open(filename, 'rb') as unknown_file:
         file_start = unknown_file.read(max_len)
     compression_type = 'plain'
     for file_type, magic_bytes in magic_dict.items():
-        if file_start.startswith(magic_bytes):
+        if file_start.startswith(b''.join(magic_bytes)):
             compression_type = file_type
     if compression_type == 'bz2':
         quit_with_error('cannot use bzip2 format - use gzip instead')
@@ -251,12 +263,22 @@ def get_compression_type(filename):
 
 def get_open_function(filename):
     """
-    Returns either open or gzip.open, as appropriate for the file.
+    Returns either open or read_input.open_compressed (for gzip and zstd files), as appropriate
+    for the file. Compressed files can only be opened for reading.
     """
-    if get_compression_type(filename) == 'gz':
-        return gzip.open
-    else:  # plain text
+    if get_compression_type(filename) == 'plain':
         return open
+    from .read_input import open_compressed
+    return open_compressed
+
+
+def get_file_stamp(filename):
+    """
+    Returns a value which changes whenever the file is modified, used to tell whether a cache of
+    something derived from the file is still valid.
+    """
+    stat = os.stat(filename)
+    return stat.st_size, stat.st_mtime_ns
 
 
 def get_sequence_file_type(filename):
@@ -384,7 +406,7 @@ def strip_read_extensions(read_file_name):
     base_name = os.path.basename(read_file_name)
     name_parts = base_name.split('.')
 
-    endings_to_trim = ['gz', 'fasta', 'fna', 'fa', 'fas', 'fsa', 'fastq', 'fq']
+    endings_to_trim = ['gz', 'zst', 'fasta', 'fna', 'fa', 'fas', 'fsa', 'fastq', 'fq']
     while name_parts[-1].lower() in endings_to_trim:
         name_parts = name_parts[:-1]
     return '.'.join(name_parts)
@@ -426,10 +448,7 @@ class MyHelpFormatter(argparse.HelpFormatter):
         terminal_width = shutil.get_terminal_size().columns
         os.environ['COLUMNS'] = str(terminal_width)
         max_help_position = min(max(24, terminal_width // 3), 40)
-        try:
-            self.colours = int(subprocess.check_output(['tput', 'colors']).decode().strip())
-        except (ValueError, subprocess.CalledProcessError, FileNotFoundError, AttributeError):
-            self.colours = 1
+        self.colours = log.get_terminal_colour_count()
         super().__init__(prog, max_help_position=max_help_position)
 
     def _get_help_string(self, action):
@@ -552,7 +571,7 @@ def print_table(table, alignments='', max_col_width=30, col_separation=3, indent
                 row_colour=None, sub_colour=None, row_extra_text=None, leading_newline=False,
                 subsequent_indent='', return_str=False, header_format='underline',
                 hide_header=False, fixed_col_widths=None, left_align_header=True,
-                bottom_align_header=True, verbosity=1):
+                bottom_align_header=True, verbosity=1, report_table=None):
     """
     Args:
         table: a list of lists of strings (one row is one list, all rows should be the same length)
@@ -572,10 +591,13 @@ def print_table(table, alignments='', max_col_width=30, col_separation=3, indent
         left_align_header: if False, the header will follow the column alignments
         bottom_align_header: if False, the header will align to the top, like other rows
         verbosity: the table will only be logged if the logger verbosity is >= this value
+        report_table: if given, the table is also added to the run report with this name
     """
     column_count = len(table[0])
     table = [x[:column_count] for x in table]
     table = [x + [''] * (column_count - len(x)) for x in table]
+    if report_table is not None:
+        report.add_table(report_table, table)
     if row_colour is None:
         row_colour = {}
     if sub_colour is None:
@@ -793,7 +815,7 @@ def get_right_arrow():
 
 
 def get_default_thread_count():
-    return min(multiprocessing.cpu_count(), settings.MAX_AUTO_THREAD_COUNT)
+    return min(get_available_cpu_count(), settings.MAX_AUTO_THREAD_COUNT)
 
 
 def spades_path_and_version(spades_path):
@@ -932,7 +954,10 @@ def range_overlap(x1, x2, y1, y2):
 def range_is_contained(test_range, other_ranges):
     """
     Returns True if test_range is entirely contained within any range in other_ranges.
+    other_ranges can be a RangeSet, in which case the check doesn't need to look at every range.
     """
+    if isinstance(other_ranges, RangeSet):
+        return other_ranges.contains(test_range)
     start, end = test_range
     for other_range in other_ranges:
         if other_range[0] <= start and other_range[1] >= end:
@@ -941,6 +966,12 @@ def range_is_contained(test_range, other_ranges):
 
 
 def range_overlap_size(test_range, other_ranges):
+    """
+    Returns the largest overlap between test_range and any range in other_ranges (which can be a
+    RangeSet).
+    """
+    if isinstance(other_ranges, RangeSet):
+        return other_ranges.max_overlap_size(test_range)
     start, end = test_range
     max_overlap = 0
     for other_range in other_ranges:
@@ -953,30 +984,66 @@ def simplify_ranges(ranges):
     Collapses overlapping ranges together. Input ranges are tuples of (start, end) in the normal
     Python manner where the end isn't included.
     """
-    fixed_ranges = []
-    for int_range in ranges:
-        if int_range[0] > int_range[1]:
-            fixed_ranges.append((int_range[1], int_range[0]))
-        elif int_range[0] < int_range[1]:
-            fixed_ranges.append(int_range)
-    starts_ends = [(x[0], 1) for x in fixed_ranges]
-    starts_ends += [(x[1], -1) for x in fixed_ranges]
-    starts_ends.sort(key=lambda x: x[0])
-    current_sum = 0
-    cumulative_sum = []
-    for start_end in starts_ends:
-        current_sum += start_end[1]
-        cumulative_sum.append((start_end[0], current_sum))
-    prev_depth = 0
-    start = 0
-    combined = []
-    for pos, depth in cumulative_sum:
-        if prev_depth == 0:
-            start = pos
-        elif depth == 0:
-            combined.append((start, pos))
-        prev_depth = depth
-    return combined
+    return RangeSet(ranges).get_ranges()
+
+
+class RangeSet(object):
+    """
+    A set of (start, end) ranges, stored as sorted lists of starts and ends. Ranges which overlap
+    or touch are merged as they are added (just like simplify_ranges), so the stored ranges never
+    overlap and containment/overlap queries can use a binary search instead of checking every
+    range.
+    """
+    def __init__(self, ranges=None):
+        self.starts = []
+        self.ends = []
+        if ranges:
+            for int_range in sorted(ranges):
+                self.add(int_range)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __repr__(self):
+        return str(self.get_ranges())
+
+    def add(self, int_range):
+        start, end = int_range
+        if start > end:
+            start, end = end, start
+        elif start == end:
+            return
+
+        # Stored ranges first_i to last_i - 1 overlap or touch the new range and are merged into it.
+        first_i = bisect.bisect_left(self.ends, start)
+        last_i = bisect.bisect_right(self.starts, end)
+        if first_i < last_i:
+            start = min(start, self.starts[first_i])
+            end = max(end, self.ends[last_i - 1])
+        self.starts[first_i:last_i] = [start]
+        self.ends[first_i:last_i] = [end]
+
+    def contains(self, test_range):
+        """
+        Returns True if test_range is entirely contained within one of the stored ranges.
+        """
+        start, end = test_range
+        i = bisect.bisect_right(self.starts, start) - 1
+        return i >= 0 and self.ends[i] >= end
+
+    def max_overlap_size(self, test_range):
+        """
+        Returns the largest overlap between test_range and any one of the stored ranges.
+        """
+        start, end = test_range
+        max_overlap = 0
+        for i in range(bisect.bisect_right(self.ends, start),
+                       bisect.bisect_left(self.starts, end)):
+            max_overlap = max(max_overlap, min(end, self.ends[i]) - max(start, self.starts[i]))
+        return max_overlap
+
+    def get_ranges(self):
+        return list(zip(self.starts, self.ends))
 
 
 def remove_dupes_preserve_order(lst):
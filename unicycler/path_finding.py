@@ -20,7 +20,7 @@ from .misc import weighted_average, reverse_complement, get_num_agreement
 from . import settings
 
 try:
-    from .cpp_wrappers import fully_global_alignment, path_alignment
+    from .cpp_wrappers import fully_global_alignment_scores, path_alignment, path_alignment_scores
 except AttributeError as e:
     sys.exit('Error when importing C++ library: ' + str(e) + '\n'
              'Have you successfully built the library file using make?')
@@ -59,23 +59,22 @@ def get_best_paths_for_seq(graph, start_seg, end_seg, target_length, sequence, s
     # Sort by length discrepancy from the target so the closest length matches come first.
     paths = sorted(paths, key=lambda x: abs(target_length - graph.get_bridge_path_length(x)))
 
-    # We now align the consensus to each of the possible paths.
+    # If there is a consensus sequence, then we actually align it against each of the possible
+    # paths. Only the alignment scores are needed, so all paths are scored together.
+    if sequence:
+        sequence_pairs = [(sequence, graph.get_path_sequence(path)) for path in paths]
+        alignment_scores = fully_global_alignment_scores(sequence_pairs, scoring_scheme,
+                                                         True, 1000)
+    else:
+        alignment_scores = []
+
     paths_and_scores = []
-    for path in paths:
+    for i, path in enumerate(paths):
         path_len = graph.get_bridge_path_length(path)
         length_discrepancy = abs(path_len - target_length)
 
-        # If there is a consensus sequence, then we actually do an alignment against the path.
         if sequence:
-            path_seq = graph.get_path_sequence(path)
-            alignment_result = fully_global_alignment(sequence, path_seq, scoring_scheme,
-                                                      True, 1000)
-            if not alignment_result:
-                continue
-
-            seqan_parts = alignment_result.split(',', 9)
-            raw_score = int(seqan_parts[6])
-            scaled_score = float(seqan_parts[7])
+            raw_score, scaled_score = alignment_scores[i]
 
         # If there isn't a consensus sequence (i.e. the start and end overlap), then each
         # path is only scored on how well its length agrees with the target length.
@@ -325,17 +324,13 @@ def cull_paths(graph, paths, sequence, scoring_scheme, expected_scaled_score, cu
     else:
         seq_align_start = 0
 
-    scored_paths = []
     shortest_len = min(graph.get_path_length(x[1:]) for x in paths)
     seq_after_common_path = sequence[seq_align_start:]
-    for path in paths:
-        path_seq_after_common_path = \
-            graph.get_path_sequence(path[1:])[path_align_start:shortest_len]
-        alignment_result = path_alignment(path_seq_after_common_path, seq_after_common_path,
-                                          scoring_scheme, True, 500)
-        if alignment_result:
-            scaled_score = float(alignment_result.split(',', 8)[7])
-            scored_paths.append((path, scaled_score))
+    sequence_pairs = [(graph.get_path_sequence(path[1:])[path_align_start:shortest_len],
+                       seq_after_common_path) for path in paths]
+    alignment_scores = path_alignment_scores(sequence_pairs, scoring_scheme, True, 500)
+    scored_paths = [(path, scaled_score)
+                    for path, (_, scaled_score) in zip(paths, alignment_scores)]
 
     scored_paths = sorted(scored_paths, key=lambda x: x[1], reverse=True)
     if not scored_paths:
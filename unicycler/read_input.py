@@ -0,0 +1,336 @@
+"""
+Copyright 2017 Ryan Wick (rrwick@gmail.com)
+https://github.com/rrwick/Unicycler
+
+This module reads input files which may be compressed: plain, gzip (including BGZF, the blocked
+gzip made by bgzip) or zstd. Decompression is moved off the parsing thread where possible: BGZF
+blocks are decompressed in parallel by the thread pool, ordinary gzip goes through pigz when it's
+installed (otherwise zlib) and zstd uses the zstandard package or the zstd executable. Sequence
+files are parsed in binary mode by SequenceFile, which all of the read loaders use.
+
+This file is part of Unicycler. Unicycler is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version. Unicycler is distributed in
+the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along with Unicycler. If
+not, see <http://www.gnu.org/licenses/>.
+"""
+
+import collections
+import io
+import os
+import shutil
+import struct
+import subprocess
+import zlib
+from .misc import get_compression_type, quit_with_error
+from .resources import get_thread_pool
+from . import settings
+
+
+def open_compressed(filename, mode='rb', threads=1):
+    """
+    Opens a possibly compressed file for reading, in binary ('rb') or text ('r' or 'rt') mode.
+    With more than one thread, decompression can happen in parallel with the caller's parsing.
+    """
+    if mode not in ('r', 'rt', 'rb'):
+        raise ValueError('compressed files can only be opened for reading')
+    stream = open_binary_stream(filename, threads)
+    if mode == 'rb':
+        return stream
+    return io.TextIOWrapper(stream)
+
+
+def open_binary_stream(filename, threads):
+    compression_type = get_compression_type(filename)
+    raw_file = open(filename, 'rb', buffering=settings.READ_INPUT_BUFFER_SIZE)
+    if compression_type == 'plain':
+        stream = raw_file
+    elif compression_type == 'gz':
+        if threads > 1 and is_bgzf(filename):
+            stream = get_chunk_stream(iterate_bgzf_chunks(raw_file, threads), raw_file)
+        elif threads > 1 and shutil.which('pigz') is not None:
+            stream = get_chunk_stream(iterate_process_chunks(['pigz', '-dc'], raw_file), raw_file)
+        else:
+            stream = get_chunk_stream(iterate_gzip_chunks(raw_file), raw_file)
+    else:  # compression_type == 'zstd'
+        try:
+            import zstandard
+            stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw_file),
+                                       buffer_size=settings.READ_INPUT_BUFFER_SIZE)
+        except ImportError:
+            if shutil.which('zstd') is None:
+                raw_file.close()
+                quit_with_error('cannot read zstd-compressed file ' + filename + ' - install '
+                                'the zstandard Python package or zstd, or use gzip instead')
+            stream = get_chunk_stream(iterate_process_chunks(['zstd', '-dcq'], raw_file),
+                                      raw_file)
+
+    # The raw file is kept so the caller can see how far through the file decompression has got.
+    stream.raw_file = raw_file
+    return stream
+
+
+def get_fraction_read(stream):
+    """
+    Returns how far (0 to 1) through its file a stream from open_compressed is, judged by the
+    position in the (compressed) file. This works even when an external process is reading the
+    file, as it shares the file position.
+    """
+    raw_file = stream.buffer.raw_file if isinstance(stream, io.TextIOWrapper) else stream.raw_file
+    try:
+        file_size = os.fstat(raw_file.fileno()).st_size
+        position = os.lseek(raw_file.fileno(), 0, os.SEEK_CUR)
+    except (OSError, ValueError):
+        return 0.0
+    if file_size == 0:
+        return 1.0
+    return min(1.0, position / file_size)
+
+
+def is_bgzf(filename):
+    """
+    BGZF files are gzip files made of independent blocks, each with a 'BC' extra field holding the
+    block's size.
+    """
+    with open(filename, 'rb') as f:
+        header = f.read(18)
+    return len(header) == 18 and header[:3] == b'\x1f\x8b\x08' and bool(header[3] & 4) and \
+        header[12:14] == b'BC'
+
+
+class ChunkStream(io.RawIOBase):
+    """
+    A readable stream made from an iterator of bytes chunks (e.g. decompressed blocks).
+    """
+    def __init__(self, chunks, raw_file):
+        self.chunks = chunks
+        self.raw_file = raw_file
+        self.chunk = b''
+        self.chunk_pos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self.chunk_pos >= len(self.chunk):
+            try:
+                self.chunk, self.chunk_pos = next(self.chunks), 0
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self.chunk) - self.chunk_pos)
+        buffer[:size] = self.chunk[self.chunk_pos:self.chunk_pos + size]
+        self.chunk_pos += size
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.chunks.close()
+            self.raw_file.close()
+        super().close()
+
+
+def get_chunk_stream(chunks, raw_file):
+    return io.BufferedReader(ChunkStream(chunks, raw_file),
+                             buffer_size=settings.READ_INPUT_BUFFER_SIZE)
+
+
+def iterate_gzip_chunks(raw_file):
+    """
+    Yields the decompressed contents of a gzip file (which can have multiple members, like BGZF).
+    """
+    decompressor = zlib.decompressobj(31)
+    member_started = False
+    while True:
+        data = raw_file.read(settings.READ_INPUT_BUFFER_SIZE)
+        if not data:
+            break
+        while data:
+            member_started = True
+            try:
+                chunk = decompressor.decompress(data)
+            except zlib.error as e:
+                quit_with_error('could not decompress ' + raw_file.name + ': ' + str(e))
+            if chunk:
+                yield chunk
+            if decompressor.eof:
+                data = decompressor.unused_data
+                decompressor = zlib.decompressobj(31)
+                member_started = False
+            else:
+                data = b''
+    if member_started:
+        quit_with_error('could not decompress ' + raw_file.name + ': file is truncated')
+
+
+def iterate_process_chunks(command, raw_file):
+    """
+    Yields the output of an external decompression command which reads from the given file. If
+    the stream is closed before the end, the process is stopped.
+    """
+    process = subprocess.Popen(command, stdin=raw_file, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    finished = False
+    try:
+        while True:
+            chunk = process.stdout.read(settings.READ_INPUT_BUFFER_SIZE)
+            if not chunk:
+                break
+            yield chunk
+        finished = True
+    finally:
+        if not finished:
+            process.kill()
+        process.stdout.close()
+        error = process.stderr.read().decode(errors='replace').strip()
+        process.stderr.close()
+        if process.wait() != 0 and finished:
+            quit_with_error(command[0] + ' failed to decompress ' + raw_file.name +
+                            (': ' + error if error else ''))
+
+
+def iterate_bgzf_chunks(raw_file, threads):
+    """
+    Yields the decompressed contents of a BGZF file in order, with groups of blocks decompressed
+    in parallel (zlib releases the GIL). Only a few groups are in flight at once, so a huge file
+    isn't read into memory ahead of the caller.
+    """
+    pool = get_thread_pool(threads)
+    pending = collections.deque()
+    for block_group in iterate_bgzf_block_groups(raw_file):
+        pending.append(pool.apply_async(decompress_bgzf_blocks, (block_group,)))
+        if len(pending) >= threads * 2:
+            yield get_bgzf_result(pending.popleft(), raw_file)
+    while pending:
+        yield get_bgzf_result(pending.popleft(), raw_file)
+
+
+def get_bgzf_result(async_result, raw_file):
+    try:
+        return async_result.get()
+    except (ValueError, zlib.error) as e:
+        quit_with_bad_bgzf(raw_file, str(e))
+
+
+def iterate_bgzf_block_groups(raw_file):
+    """
+    Yields lists of BGZF blocks as (compressed data, CRC32, uncompressed size).
+    """
+    group = []
+    while True:
+        header = raw_file.read(12)
+        if not header:
+            break
+        if len(header) < 12 or header[:4] != b'\x1f\x8b\x08\x04':
+            quit_with_bad_bgzf(raw_file, 'bad block header')
+        try:
+            extra_length = struct.unpack('<H', header[10:12])[0]
+            block_size = get_bgzf_block_size(raw_file.read(extra_length))
+            if block_size is None:
+                quit_with_bad_bgzf(raw_file, 'block has no size')
+            rest_size = block_size - 12 - extra_length
+            rest = raw_file.read(rest_size)
+            if rest_size < 8 or len(rest) != rest_size:
+                quit_with_bad_bgzf(raw_file, 'incomplete block')
+            crc, uncompressed_size = struct.unpack('<II', rest[-8:])
+        except struct.error as e:
+            quit_with_bad_bgzf(raw_file, str(e))
+        group.append((rest[:-8], crc, uncompressed_size))
+        if len(group) == settings.BGZF_BLOCKS_PER_TASK:
+            yield group
+            group = []
+    if group:
+        yield group
+
+
+def quit_with_bad_bgzf(raw_file, problem):
+    quit_with_error('could not decompress ' + raw_file.name + ': truncated or corrupt BGZF file (' +
+                    problem + ')')
+
+
+def get_bgzf_block_size(extra_field):
+    """
+    Returns the total size of a BGZF block from its gzip extra field, or None if it doesn't have a
+    BC subfield.
+    """
+    i = 0
+    while i + 4 <= len(extra_field):
+        subfield_length = struct.unpack('<H', extra_field[i+2:i+4])[0]
+        if extra_field[i:i+2] == b'BC' and subfield_length == 2:
+            return struct.unpack('<H', extra_field[i+4:i+6])[0] + 1
+        i += 4 + subfield_length
+    return None
+
+
+def decompress_bgzf_blocks(block_group):
+    decompressed = []
+    for compressed_data, crc, uncompressed_size in block_group:
+        data = zlib.decompress(compressed_data, -15)
+        if len(data) != uncompressed_size or zlib.crc32(data) != crc:
+            raise ValueError('block failed its integrity check')
+        decompressed.append(data)
+    return b''.join(decompressed)
+
+
+class SequenceFile(object):
+    """
+    Iterates over the records of a (possibly compressed) FASTA or FASTQ file, giving a tuple of
+    (header, sequence, qualities) for each, all as bytes without the line endings (qualities is
+    None for FASTA). Blank lines are skipped, as are lines where a FASTQ header should be but
+    isn't, in which case well_formed is set to False.
+
+        with SequenceFile(filename, threads) as reads:
+            for header, sequence, qualities in reads:
+                ...
+    """
+    def __init__(self, filename, threads=1):
+        self.filename = filename
+        self.threads = threads
+        self.stream = None
+        self.well_formed = True
+
+    def __enter__(self):
+        self.stream = open_compressed(self.filename, 'rb', self.threads)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stream.close()
+
+    def __iter__(self):
+        first_line = self.stream.readline()
+        while first_line and not first_line.strip():
+            self.well_formed = False
+            first_line = self.stream.readline()
+        if first_line.startswith(b'>'):
+            return self.iterate_fasta(first_line)
+        return self.iterate_fastq(first_line)
+
+    def get_fraction_read(self):
+        return get_fraction_read(self.stream)
+
+    def iterate_fastq(self, line):
+        readline = self.stream.readline
+        while line:
+            if line.startswith(b'@'):
+                header = line[1:].strip()
+                sequence = readline().strip()
+                readline()
+                qualities = readline().strip()
+                yield header, sequence, qualities
+            else:
+                self.well_formed = False
+            line = readline()
+
+    def iterate_fasta(self, line):
+        header, sequence_parts = line[1:].strip(), []
+        for line in self.stream:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith(b'>'):
+                yield header, b''.join(sequence_parts), None
+                header, sequence_parts = line[1:], []
+            else:
+                sequence_parts.append(line)
+        yield header, b''.join(sequence_parts), None
@@ -13,19 +13,28 @@ details. You should have received a copy of the GNU General Public License along
 not, see <http://www.gnu.org/licenses/>.
 """
 
+import json
 import random
-import gzip
 import os
 import math
-from .misc import quit_with_error, get_nice_header, get_compression_type, get_sequence_file_type,\
+import shutil
+from .misc import quit_with_error, get_nice_header, get_sequence_file_type,\
     strip_read_extensions, print_table, float_to_str, range_is_contained, range_overlap_size, \
-    simplify_ranges, add_line_breaks_to_sequence
+    simplify_ranges, add_line_breaks_to_sequence, RangeSet, get_compression_type, get_file_stamp
+from .read_input import SequenceFile, open_compressed
 from . import settings
 from . import log
 
+# Read files aren't rewritten when their reads are given different names (e.g. to make duplicate
+# names unique). Instead, each read's name in the file and the name Unicycler uses are kept here
+# (in file order), key = absolute path of the read file.
+READ_NAME_TABLES = {}
+
+DECOMPRESSED_READS_CACHE_FILENAME = 'decompressed_reads.json'
+
 
 def load_references(fasta_filename, contamination=False, section_header='Loading references',
-                    show_progress=True):
+                    show_progress=True, threads=1):
     """
     This function loads in sequences from a FASTA file and returns a list of Reference objects.
     """
@@ -39,203 +48,192 @@ def load_references(fasta_filename, contamination=False, section_header='Loading
     except ValueError:
         quit_with_error(fasta_filename + ' is not in FASTA format')
 
-    if get_compression_type(fasta_filename) == 'gz':
-        open_func = gzip.open
-    else:  # plain text
-        open_func = open
-
-    with open_func(fasta_filename, 'rt') as fasta:
-        num_refs = sum(1 for line in fasta if line.startswith('>'))
-    if not num_refs:
+    progress = LoadingProgress(settings.LOADING_REFERENCES_PROGRESS_STEP, show_progress)
+    with SequenceFile(fasta_filename, threads) as fasta:
+        for header, sequence, _ in fasta:
+            name = get_nice_header(header.decode())
+            if contamination:
+                name = 'CONTAMINATION_' + name
+            references.append(Reference(name, sequence.decode()))
+            total_bases += len(sequence)
+            progress.update(fasta, len(references), total_bases)
+    if not references:
         quit_with_error('There are no references sequences in ' + fasta_filename)
-    if show_progress:
-        log.log_progress_line(0, num_refs)
-
-    fasta_file = open_func(fasta_filename, 'rt')
-    name = ''
-    sequence = ''
-    last_progress = 0.0
-    step = settings.LOADING_REFERENCES_PROGRESS_STEP
-    for line in fasta_file:
-        line = line.strip()
-        if not line:
-            continue
-        if line.startswith('>'):  # Header line = start of new contig
-            if name:
-                if contamination:
-                    name = 'CONTAMINATION_' + name
-                references.append(Reference(name, sequence))
-                total_bases += len(sequence)
-                progress = 100.0 * len(references) / num_refs
-                progress_rounded_down = math.floor(progress / step) * step
-                if progress == 100.0 or progress_rounded_down > last_progress:
-                    if show_progress:
-                        log.log_progress_line(len(references), num_refs, total_bases)
-                    last_progress = progress_rounded_down
-                sequence = ''
-            name = get_nice_header(line[1:])
-        else:
-            sequence += line
-    fasta_file.close()
-    if name:
-        if contamination:
-            name = 'CONTAMINATION_' + name
-        references.append(Reference(name, sequence))
-        total_bases += len(sequence)
-        if show_progress:
-            log.log_progress_line(len(references), num_refs, total_bases)
     if show_progress:
         log.log_progress_line(len(references), len(references), total_bases, end_newline=True)
 
     return references
 
 
-def load_long_reads(filename, silent=False, section_header='Loading reads', output_dir=None):
+def load_long_reads(filename, silent=False, section_header='Loading reads', output_dir=None,
+                    threads=1):
     """
     This function loads in long reads from a FASTQ file and returns a dictionary where key = read
     name and value = Read object. It also returns a list of read names, in the order they are in
-    the file.
+    the file, and the read filename to give tools which read the file themselves (e.g. minimap).
     """
-    # Read files can be either FASTA or FASTQ and optionally gzipped.
+    # Read files can be either FASTA or FASTQ and optionally compressed (gzip or zstd).
     try:
         file_type = get_sequence_file_type(filename)
     except ValueError:
         file_type = ''
         quit_with_error(filename + ' is not in either FASTA or FASTQ format')
-    if get_compression_type(filename) == 'gz':
-        open_func = gzip.open
-    else:  # plain text
-        open_func = open
 
     if not silent:
         log.log_section_header(section_header)
 
     read_dict = {}
     read_names = []
+    file_read_names = []  # names as minimap will give them
     total_bases = 0
-    last_progress = 0.0
-    step = settings.LOADING_READS_PROGRESS_STEP
     duplicate_read_names_found = False
-
-    if file_type == 'FASTQ':
-        with open_func(filename, 'rt') as fastq:
-            num_reads = sum(1 for _ in fastq) // 4
-    else:  # file_type == 'FASTA'
-        with open_func(filename, 'rt') as fasta:
-            num_reads = sum(1 for line in fasta if line.startswith('>'))
-    if not num_reads:
+    reads_renamed = False  # whether any names differ from the names minimap will use
+
+    # The reads are loaded in a single pass, so the progress total is estimated from how much of
+    # the file has been read.
+    progress = LoadingProgress(settings.LOADING_READS_PROGRESS_STEP, not silent)
+    with SequenceFile(filename, threads) as reads:
+        for header, sequence, qualities in reads:
+            header = header.decode()
+            if file_type == 'FASTQ':
+                original_name = header.split()[0] if header else ''
+                qualities = qualities.decode()
+            else:  # file_type == 'FASTA'
+                original_name = get_nice_header(header)
+
+            # Don't allow duplicate read names, so add a trailing number when they occur.
+            name = original_name
+            duplicate_name_number = 1
+            while name in read_dict:
+                duplicate_read_names_found = True
+                duplicate_name_number += 1
+                name = original_name + '_' + str(duplicate_name_number)
+            file_read_name = header.split()[0] if header else ''
+            if not reads_renamed and header and name != file_read_name:
+                reads_renamed = True
+
+            read_dict[name] = Read(name, sequence.decode(), qualities)
+            read_names.append(name)
+            file_read_names.append(file_read_name)
+            total_bases += len(sequence)
+            progress.update(reads, len(read_dict), total_bases)
+    if not read_names:
         quit_with_error('There are no read sequences in ' + filename)
+
     if not silent:
-        log.log_progress_line(0, num_reads)
+        log.log_progress_line(len(read_dict), len(read_dict), total_bases, end_newline=True)
 
-    if file_type == 'FASTQ':
-        with open_func(filename, 'rt') as fastq:
-            for line in fastq:
-                stripped_line = line.strip()
-                if len(stripped_line) == 0:
-                    continue
-                if not stripped_line.startswith('@'):
-                    continue
-                original_name = stripped_line[1:].split()[0]
-                sequence = next(fastq).strip()
-                _ = next(fastq)
-                qualities = next(fastq).strip()
-
-                # Don't allow duplicate read names, so add a trailing number when they occur.
-                name = original_name
-                duplicate_name_number = 1
-                while name in read_dict:
-                    duplicate_read_names_found = True
-                    duplicate_name_number += 1
-                    name = original_name + '_' + str(duplicate_name_number)
-
-                read_dict[name] = Read(name, sequence, qualities)
-                read_names.append(name)
-                total_bases += len(sequence)
-                progress = 100.0 * len(read_dict) / num_reads
-                progress_rounded_down = math.floor(progress / step) * step
-                if progress == 100.0 or progress_rounded_down > last_progress:
-                    if not silent:
-                        log.log_progress_line(len(read_dict), num_reads, total_bases)
-                    last_progress = progress_rounded_down
+    # minimap reads the read file itself, but it can't read zstd, so it gets a decompressed copy.
+    tool_filename = filename
+    if get_compression_type(filename) == 'zstd':
+        tool_filename = get_decompressed_reads(filename, file_type, output_dir, silent)
+
+    # The read file isn't rewritten when reads have been renamed (e.g. duplicate names). Instead,
+    # tools which read the file directly have their results renamed using the read name table.
+    full_path = os.path.abspath(tool_filename)
+    if reads_renamed:
+        READ_NAME_TABLES[full_path] = list(zip(file_read_names, read_names))
+        if duplicate_read_names_found and not silent:
+            log.log('\nDuplicate read names found: a number has been added to the names of the '
+                    'later reads.')
+    else:
+        READ_NAME_TABLES.pop(full_path, None)
 
-    else:  # file_type == 'FASTA'
-        with open_func(filename, 'rt') as fasta:
-            name = ''
-            sequence = ''
-            last_progress = 0.0
-            for line in fasta:
-                line = line.strip()
-                if not line:
-                    continue
-                if line.startswith('>'):  # Header line = start of new contig
-                    if name:
-                        read_dict[name] = Read(name, sequence, None)
-                        read_names.append(name)
-                        total_bases += len(sequence)
-                        progress = 100.0 * len(read_dict) / num_reads
-                        progress_rounded_down = math.floor(progress / step) * step
-                        if progress == 100.0 or progress_rounded_down > last_progress:
-                            if not silent:
-                                log.log_progress_line(len(read_dict), num_reads, total_bases)
-                            last_progress = progress_rounded_down
-                        sequence = ''
-
-                    # Don't allow duplicate read names, so add a trailing number when they occur.
-                    original_name = get_nice_header(line[1:])
-                    name = original_name
-                    duplicate_name_number = 1
-                    while name in read_dict:
-                        duplicate_read_names_found = True
-                        duplicate_name_number += 1
-                        name = original_name + '_' + str(duplicate_name_number)
-
-                else:
-                    sequence += line
-            if name:
-                read_dict[name] = Read(name, sequence, None)
-                read_names.append(name)
-                total_bases += len(sequence)
-                if not silent:
-                    log.log_progress_line(len(read_dict), num_reads, total_bases)
+    return read_dict, read_names, tool_filename
 
-    if not silent:
-        log.log_progress_line(len(read_dict), len(read_dict), total_bases, end_newline=True)
 
-    # If there were duplicate read names, then we save the reads back out to file with their fixed
-    # names.
-    if duplicate_read_names_found:
-        no_dup_filename = strip_read_extensions(filename) + '_no_duplicates'
-        if file_type == 'FASTQ':
-            no_dup_filename += '.fastq.gz'
-        else:  # file_type == 'FASTA'
-            no_dup_filename += '.fasta.gz'
-
-        # If an output directory was provided, we put the no duplicate read file there.
-        if output_dir is not None:
-            no_dup_filename = os.path.join(output_dir, no_dup_filename)
-
-        # If an output directory wasn't provided, we put the no duplicate read file in the same
-        # directory as the normal read file.
-        else:
-            no_dup_filename = os.path.join(os.path.dirname(os.path.abspath(filename)),
-                                           no_dup_filename)
+def get_read_name_table(filename):
+    """
+    Returns (name in the file, name Unicycler uses) tuples, in file order, for a read file whose
+    reads don't all have the names minimap would give them, or None if they do.
+    """
+    if not filename:
+        return None
+    return READ_NAME_TABLES.get(os.path.abspath(filename))
 
+
+def get_decompressed_reads(filename, file_type, output_dir, silent):
+    """
+    Saves a decompressed copy of a read file, or reuses one made for the same file by an earlier
+    run, and returns its filename.
+    """
+    decompressed_filename = strip_read_extensions(filename) + '_decompressed'
+    if file_type == 'FASTQ':
+        decompressed_filename += '.fastq'
+    else:  # file_type == 'FASTA'
+        decompressed_filename += '.fasta'
+
+    # If an output directory was provided, we put the decompressed read file there. If not, we
+    # put it in the same directory as the read file.
+    if output_dir is None:
+        output_dir = os.path.dirname(os.path.abspath(filename))
+    decompressed_filename = os.path.join(output_dir, decompressed_filename)
+
+    cache_filename = os.path.join(output_dir, DECOMPRESSED_READS_CACHE_FILENAME)
+    cache = {}
+    if os.path.isfile(cache_filename):
+        try:
+            with open(cache_filename, 'rt') as cache_file:
+                cache = json.load(cache_file)
+        except ValueError:
+            pass
+    full_path = os.path.abspath(filename)
+    file_stamp = list(get_file_stamp(filename))
+    cached = cache.get(decompressed_filename)
+    if cached is not None and cached['source'] == full_path and cached['stamp'] == file_stamp \
+            and os.path.isfile(decompressed_filename):
         if not silent:
-            log.log('\nDuplicate read names found. Saving duplicate-free file:')
-            log.log(no_dup_filename)
-        with gzip.open(no_dup_filename, 'wb') as f:
-            for read_name in read_names:
-                read = read_dict[read_name]
-                if file_type == 'FASTQ':
-                    f.write(read.get_fastq().encode())
-                else:  # file_type == 'FASTA'
-                    f.write(read.get_fasta().encode())
+            log.log('\nUsing decompressed reads from previous run: ' + decompressed_filename)
+        return decompressed_filename
 
-    else:
-        no_dup_filename = filename
+    if not silent:
+        log.log('\nSaving decompressed reads for minimap: ' + decompressed_filename)
 
-    return read_dict, read_names, no_dup_filename
+    # Both files are written to a temporary file first, so an interrupted run can't leave a
+    # truncated copy which the cache says is complete.
+    temp_filename = decompressed_filename + '.' + str(os.getpid()) + '.tmp'
+    try:
+        with open_compressed(filename, 'rb') as compressed, open(temp_filename, 'wb') as f:
+            shutil.copyfileobj(compressed, f, settings.READ_INPUT_BUFFER_SIZE)
+        os.replace(temp_filename, decompressed_filename)
+    finally:
+        if os.path.isfile(temp_filename):
+            os.remove(temp_filename)
+
+    cache[decompressed_filename] = {'source': full_path, 'stamp': file_stamp}
+    temp_cache_filename = cache_filename + '.' + str(os.getpid()) + '.tmp'
+    try:
+        with open(temp_cache_filename, 'wt') as cache_file:
+            json.dump(cache, cache_file)
+        os.replace(temp_cache_filename, cache_filename)
+    finally:
+        if os.path.isfile(temp_cache_filename):
+            os.remove(temp_cache_filename)
+    return decompressed_filename
+
+
+class LoadingProgress(object):
+    """
+    Logs progress lines while loading sequences in one pass, when the total count isn't known in
+    advance. The total is estimated from the count so far and the fraction of the file read.
+    """
+    def __init__(self, step, show_progress):
+        self.step = step
+        self.show_progress = show_progress
+        self.last_progress = 0.0
+
+    def update(self, sequence_file, count, total_bases):
+        if not self.show_progress or count % 100 != 0:
+            return
+        fraction_read = sequence_file.get_fraction_read()
+        if fraction_read <= 0.0:
+            return
+        progress = 100.0 * fraction_read
+        progress_rounded_down = math.floor(progress / self.step) * self.step
+        if progress_rounded_down > self.last_progress:
+            estimated_total = max(count + 1, int(round(count / fraction_read)))
+            log.log_progress_line(count, estimated_total, total_bases)
+            self.last_progress = progress_rounded_down
 
 
 class Reference(object):
@@ -295,10 +293,18 @@ class Read(object):
         This function removes alignments from the read which are likely to be spurious or
         redundant.
         """
+        # Ties are broken randomly, but with a generator seeded by the read name (not the shared
+        # one), so the result doesn't depend on which other reads were aligned first.
+        tiebreaker = random.Random(self.name)
         self.alignments = sorted(self.alignments, reverse=True,
-                                 key=lambda x: (x.raw_score, random.random()))
+                                 key=lambda x: (x.raw_score, tiebreaker.random()))
         kept_alignments = []
-        kept_alignment_ranges = []
+        kept_alignment_ranges = RangeSet()
+
+        # Kept alignments are also grouped by reference and strand, as an alignment can only be
+        # very similar to another on the same reference and strand.
+        kept_by_ref_and_strand = {}
+
         for alignment in self.alignments:
             this_range = alignment.read_start_end_positive_strand()
 
@@ -311,15 +317,14 @@ class Read(object):
                 continue
 
             # Don't keep alignments that seem to be very similar to an already kept alignment.
-            keep_alignment = True
-            for kept_alignment in kept_alignments:
-                if kept_alignment.is_very_similar(alignment):
-                    keep_alignment = False
-                    break
-
-            if keep_alignment:
-                kept_alignments.append(alignment)
-                kept_alignment_ranges = simplify_ranges(kept_alignment_ranges + [this_range])
+            ref_and_strand = (alignment.ref.name, alignment.rev_comp)
+            similar_kept = kept_by_ref_and_strand.setdefault(ref_and_strand, [])
+            if any(x.is_very_similar(alignment) for x in similar_kept):
+                continue
+
+            kept_alignments.append(alignment)
+            similar_kept.append(alignment)
+            kept_alignment_ranges.add(this_range)
 
         kept_alignments = sorted(kept_alignments,
                                  key=lambda x: x.read_start_end_positive_strand()[0])
@@ -0,0 +1,202 @@
+"""
+Copyright 2017 Ryan Wick (rrwick@gmail.com)
+https://github.com/rrwick/Unicycler
+
+This module chooses subsets of the long reads for the stages whose work grows with read depth
+(SeqAn alignment and Racon polishing). Beyond a certain depth, more reads add little to those
+stages but still cost time, so reads are chosen (preferring long, high-quality reads) until each
+part of the reference has about the target depth. The ends of anchor segments, which is where
+long-read bridges start and finish, are given extra depth.
+
+It also chooses which reads are worth SeqAn alignment when the alignments are only wanted for
+long-read bridging: reads whose minimap hits show they can't reach from one anchor segment to
+another are skipped.
+
+This file is part of Unicycler. Unicycler is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version. Unicycler is distributed in
+the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along with Unicycler. If
+not, see <http://www.gnu.org/licenses/>.
+"""
+
+from .misc import int_to_str, float_to_str, print_table
+from . import log
+from . import settings
+
+# The probability of a base being correct for each Phred+33 quality character.
+BASE_ACCURACY = {chr(q + 33): 1.0 - 10.0 ** (-q / 10.0) for q in range(94)}
+
+
+def get_read_depth(read_names, read_dict, reference_lengths):
+    """
+    Returns the mean depth the reads would give over the references.
+    """
+    total_reference_length = sum(reference_lengths.values())
+    if total_reference_length == 0:
+        return 0.0
+    return sum(read_dict[x].get_length() for x in read_names) / total_reference_length
+
+
+def select_reads(stage_name, read_names, read_dict, alignments_by_read, reference_lengths,
+                 target_depth, anchor_names=None, keep_unaligned=True):
+    """
+    Returns the names of the reads (in their original order) to use for the stage. Reads are
+    considered from best to worst and a read is used if any part of the reference it aligns to
+    (according to its minimap alignments) has less than the target depth so far. Reads without
+    alignments to the references are kept or dropped depending on keep_unaligned.
+
+    If the reads don't exceed the target depth (or the target is 0), all reads are used.
+    """
+    if not target_depth or get_read_depth(read_names, read_dict, reference_lengths) <= \
+            target_depth:
+        return read_names
+    if anchor_names is None:
+        anchor_names = set()
+
+    bin_size = settings.READ_SELECTION_BIN_SIZE
+    bin_depths = {name: [0.0] * (length // bin_size + 1)
+                  for name, length in reference_lengths.items()}
+    bin_targets = {name: [float(target_depth)] * (length // bin_size + 1)
+                   for name, length in reference_lengths.items()}
+    for name in anchor_names:
+        if name in bin_targets:
+            anchor_end_target = target_depth * settings.READ_SELECTION_ANCHOR_END_DEPTH_FACTOR
+            bin_targets[name][0] = anchor_end_target
+            bin_targets[name][-1] = anchor_end_target
+
+    selected_read_names = set()
+    for read in sorted((read_dict[x] for x in read_names), key=get_read_score, reverse=True):
+        coverage = get_bin_coverage(alignments_by_read.get(read.name, []), reference_lengths)
+        if not coverage:
+            if keep_unaligned:
+                selected_read_names.add(read.name)
+            continue
+        if any(bin_depths[ref_name][i] < bin_targets[ref_name][i]
+               for ref_name, i, _ in coverage):
+            selected_read_names.add(read.name)
+            for ref_name, i, depth in coverage:
+                bin_depths[ref_name][i] += depth
+
+    selected = [x for x in read_names if x in selected_read_names]
+    log_read_selection(stage_name, read_names, selected, read_dict, reference_lengths,
+                       target_depth)
+    return selected
+
+
+def get_read_score(read):
+    """
+    Reads are preferred by their expected number of correct bases: length times mean accuracy.
+    The accuracy is estimated from a sample of the qualities, which is plenty for ranking and
+    keeps this quick for very large read sets. Ties are broken by name, so the selection is always
+    the same.
+    """
+    qualities = read.qualities[::settings.READ_SELECTION_QUALITY_SAMPLE_STEP]
+    if qualities:
+        accuracy = sum(BASE_ACCURACY.get(q, 0.0) for q in qualities) / len(qualities)
+    else:
+        accuracy = 0.0
+    return read.get_length() * accuracy, read.name
+
+
+def get_bin_coverage(alignments, reference_lengths):
+    """
+    Returns a list of (reference name, bin index, depth) for the bins the alignments cover, where
+    the depth is the fraction of the bin covered.
+    """
+    bin_size = settings.READ_SELECTION_BIN_SIZE
+    coverage = []
+    for a in alignments:
+        # Alignments to other sequences (e.g. contamination) don't count.
+        if a.ref_name not in reference_lengths or a.ref_end <= a.ref_start:
+            continue
+        first_bin, last_bin = a.ref_start // bin_size, (a.ref_end - 1) // bin_size
+        for i in range(first_bin, last_bin + 1):
+            bin_start = i * bin_size
+            bin_end = min(bin_start + bin_size, reference_lengths[a.ref_name])
+            overlap = min(a.ref_end, bin_end) - max(a.ref_start, bin_start)
+            if overlap > 0:
+                coverage.append((a.ref_name, i, overlap / (bin_end - bin_start)))
+    return coverage
+
+
+def log_read_selection(stage_name, read_names, selected_read_names, read_dict, reference_lengths,
+                       target_depth):
+    all_bases = sum(read_dict[x].get_length() for x in read_names)
+    selected_bases = sum(read_dict[x].get_length() for x in selected_read_names)
+    all_depth = get_read_depth(read_names, read_dict, reference_lengths)
+    selected_depth = get_read_depth(selected_read_names, read_dict, reference_lengths)
+    skipped_count = len(read_names) - len(selected_read_names)
+
+    log.log('Selecting reads for ' + stage_name + ' (target depth: ' + str(target_depth) +
+            'x):')
+    table = [['Reads', 'Count', 'Bases', 'Depth'],
+             ['all', int_to_str(len(read_names)), int_to_str(all_bases),
+              float_to_str(all_depth, 1) + 'x'],
+             ['selected', int_to_str(len(selected_read_names)), int_to_str(selected_bases),
+              float_to_str(selected_depth, 1) + 'x'],
+             ['skipped', int_to_str(skipped_count), int_to_str(all_bases - selected_bases),
+              float_to_str(all_depth - selected_depth, 1) + 'x']]
+    print_table(table, alignments='LRRR', left_align_header=False,
+                report_table='read_selection')
+    log.log('')
+
+
+def select_bridging_reads(read_names, read_dict, alignments_by_read, reference_lengths,
+                          anchor_names, margin):
+    """
+    Returns the names of the reads (in their original order) which could contribute to long-read
+    bridges, judging by their minimap alignments:
+      * reads with two or more hits to anchor segments
+      * reads with a hit to an anchor segment which carry on past the anchor's end by more than
+        the margin (minimap may have missed their hit to the next anchor)
+    A small even sample of the other reads with alignments is also kept, as the minimum alignment
+    score is set from reads which align within a single contig.
+    """
+    bridging, overhanging, others = set(), set(), []
+    for read_name in read_names:
+        alignments = [x for x in alignments_by_read.get(read_name, [])
+                      if x.ref_name in reference_lengths]
+        anchor_alignments = [x for x in alignments if x.ref_name in anchor_names]
+        if len(anchor_alignments) >= 2:
+            bridging.add(read_name)
+        elif any(get_anchor_overhang(x) > margin for x in anchor_alignments):
+            overhanging.add(read_name)
+        elif alignments:
+            others.append(read_name)
+
+    calibration_count = min(len(others), settings.BRIDGING_READ_CALIBRATION_COUNT)
+    calibration = set(others[i * len(others) // calibration_count]
+                      for i in range(calibration_count))
+
+    selected = [x for x in read_names if x in bridging or x in overhanging or x in calibration]
+    skipped = [x for x in read_names if x not in bridging and x not in overhanging and
+               x not in calibration]
+
+    log.log('Selecting reads which could bridge anchor segments:')
+    table = [['Reads', 'Count', 'Bases']]
+    for label, names in (('multiple anchor hits', bridging),
+                         ('anchor end overhang', overhanging),
+                         ('score calibration', calibration),
+                         ('skipped', skipped)):
+        table.append([label, int_to_str(len(names)),
+                      int_to_str(sum(read_dict[x].get_length() for x in names))])
+    print_table(table, alignments='LRR', left_align_header=False,
+                report_table='bridging_read_selection')
+    log.log('')
+    return selected
+
+
+def get_anchor_overhang(alignment):
+    """
+    Returns how far (in bp) the read carries on past either end of the reference it's aligned to,
+    or a negative number if the read ends within the reference.
+    """
+    read_start_gap = alignment.read_start
+    read_end_gap = alignment.read_length - alignment.read_end
+    if alignment.read_strand == '-':
+        read_start_gap, read_end_gap = read_end_gap, read_start_gap
+    ref_start_gap = alignment.ref_start
+    ref_end_gap = alignment.ref_length - alignment.ref_end
+    return max(read_start_gap - ref_start_gap, read_end_gap - ref_end_gap)
@@ -0,0 +1,196 @@
+"""
+Copyright 2017 Ryan Wick (rrwick@gmail.com)
+https://github.com/rrwick/Unicycler
+
+This module builds a machine-readable report of a Unicycler run (unicycler_report.json in the
+output directory). It holds the same tables that are shown in the log (SPAdes assemblies, bridges,
+components, etc.), with values converted to numbers where possible, and the time taken by each
+section of the run. The report is saved at the start of each section, so a run which is still
+going (or which crashed) has a report up to that point.
+
+This file is part of Unicycler. Unicycler is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version. Unicycler is distributed in
+the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along with Unicycler. If
+not, see <http://www.gnu.org/licenses/>.
+"""
+
+import datetime
+import json
+import os
+import re
+import threading
+import time
+from . import log
+
+REPORT_FILENAME = 'unicycler_report.json'
+REPORT_FORMAT_VERSION = 1
+
+INTEGER_REGEX = re.compile(r'^-?\d{1,3}(,\d{3})*$|^-?\d+$')
+FLOAT_REGEX = re.compile(r'^-?\d*\.\d+(e-?\d+)?$')
+
+
+class Report(object):
+
+    def __init__(self, out_dir, command, version, args):
+        self.filename = os.path.join(out_dir, REPORT_FILENAME)
+        self.start_time = time.time()
+        self.data = {'report_format_version': REPORT_FORMAT_VERSION,
+                     'unicycler_version': version,
+                     'command': command,
+                     'options': {k: v for k, v in sorted(vars(args).items())
+                                 if v is None or isinstance(v, (str, int, float, bool, list))},
+                     'status': 'running',
+                     'start_time': get_iso_time(self.start_time),
+                     'end_time': None,
+                     'total_time': None,
+                     'sections': [],
+                     'stages': [],
+                     'tables': [],
+                     'outputs': {}}
+        self.section_start_time = None
+
+        # Stages can run at the same time (see stages.py), so changes to the report are locked.
+        self.lock = threading.RLock()
+
+    def start_section(self, name, start_time):
+        with self.lock:
+            self.end_section(start_time)
+            self.data['sections'].append({'name': name, 'start_time': get_iso_time(start_time),
+                                          'time': None})
+            self.section_start_time = start_time
+            self.save()
+
+    def end_section(self, end_time):
+        if self.data['sections'] and self.section_start_time is not None:
+            section_time = max(0.0, end_time - self.section_start_time)
+            self.data['sections'][-1]['time'] = round(section_time, 3)
+
+    def add_table(self, name, table):
+        with self.lock:
+            section = self.data['sections'][-1]['name'] if self.data['sections'] else None
+            self.data['tables'].append({'name': name, 'section': section,
+                                        'columns': [get_cell_value(x) or '' for x in table[0]],
+                                        'rows': []})
+            self.add_table_rows(name, table[1:])
+
+    def add_table_rows(self, name, rows):
+        if not rows:
+            return
+        with self.lock:
+            for table in reversed(self.data['tables']):
+                if table['name'] == name:
+                    table['rows'] += [[get_cell_value(x) for x in row] for row in rows]
+                    return
+            self.add_table(name, [[''] * len(rows[0])] + rows)
+
+    def add_stage(self, name, start_time, stage_time, threads):
+        with self.lock:
+            self.data['stages'].append({'name': name, 'start_time': get_iso_time(start_time),
+                                        'time': round(stage_time, 3), 'threads': threads})
+
+    def finish(self, status, error):
+        with self.lock:
+            end_time = time.time()
+            self.end_section(end_time)
+            self.data['status'] = status
+            if error is not None:
+                self.data['error'] = error
+            self.data['end_time'] = get_iso_time(end_time)
+            self.data['total_time'] = round(end_time - self.start_time, 3)
+            self.save()
+
+    def save(self):
+        with self.lock:
+            temp_filename = self.filename + '.tmp'
+            with open(temp_filename, 'wt') as report_file:
+                json.dump(self.data, report_file, indent=2)
+                report_file.write('\n')
+            os.replace(temp_filename, self.filename)
+
+
+# The report for the current run, or None if there isn't one (e.g. when unicycler_align is used on
+# its own or in tests), in which case the functions below do nothing. Sections and tables are added
+# in step with the log, so when stages run at the same time, they are grouped the same way as the
+# log is.
+report = None
+
+
+def start_report(out_dir, command, version, args):
+    global report
+    report = Report(out_dir, command, version, args)
+    report.save()
+
+
+def start_section(name, start_time):
+    """
+    Called for each section header in the log: the previous section's time is recorded and the
+    tables which follow belong to this section.
+    """
+    if report is not None:
+        log.in_log_order(report.start_section, name, start_time)
+
+
+def add_table(name, table):
+    """
+    Adds a table (a list of rows, the first being the header) to the report.
+    """
+    if report is not None:
+        log.in_log_order(report.add_table, name, table)
+
+
+def add_table_rows(name, rows):
+    """
+    Adds rows to the most recent table with the given name, for tables which are logged one row
+    at a time.
+    """
+    if report is not None:
+        log.in_log_order(report.add_table_rows, name, rows)
+
+
+def add_stage(name, start_time, stage_time, threads):
+    """
+    Records the time taken by a pipeline stage (see stages.py) and the threads it was given.
+    """
+    if report is not None:
+        report.add_stage(name, start_time, stage_time, threads)
+
+
+def add_output(name, filename):
+    if report is not None:
+        with report.lock:
+            report.data['outputs'][name] = filename
+
+
+def finish_report(status, error=None):
+    """
+    Saves the report one last time with the run's final status ('complete' or 'failed').
+    """
+    global report
+    if report is not None:
+        report.finish(status, error)
+        report = None
+
+
+def get_cell_value(cell):
+    """
+    Table cells are strings formatted for display, so this converts them back to plain values:
+    numbers where possible (thousands separators are removed), None for empty cells and
+    otherwise the text without any formatting.
+    """
+    if not isinstance(cell, str):
+        return cell
+    text = log.remove_formatting(cell).strip()
+    if not text:
+        return None
+    if INTEGER_REGEX.match(text):
+        return int(text.replace(',', ''))
+    if FLOAT_REGEX.match(text):
+        return float(text)
+    return text
+
+
+def get_iso_time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).isoformat(timespec='seconds')
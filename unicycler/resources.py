@@ -0,0 +1,235 @@
+"""
+Copyright 2017 Ryan Wick (rrwick@gmail.com)
+https://github.com/rrwick/Unicycler
+
+This module works out how much CPU and memory Unicycler can actually use (honouring CPU affinity
+and cgroup limits, e.g. in a container or a cluster job) and holds the thread pools which are
+shared by the stages that do their work in Python threads.
+
+This file is part of Unicycler. Unicycler is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version. Unicycler is distributed in
+the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along with Unicycler. If
+not, see <http://www.gnu.org/licenses/>.
+"""
+
+import math
+import os
+import threading
+
+from . import settings
+
+CGROUP_DIR = '/sys/fs/cgroup'
+PROC_CGROUP_FILE = '/proc/self/cgroup'
+
+thread_pools = {}
+thread_pool_pid = None
+thread_pool_lock = threading.Lock()
+
+
+def get_available_cpu_count(cgroup_dir=CGROUP_DIR):
+    """
+    Returns the number of CPUs this process may run on: the CPU affinity mask, further limited by
+    a cgroup CPU quota if there is one.
+    """
+    try:
+        cpu_count = len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS
+        cpu_count = os.cpu_count() or 1
+    cpu_quota = get_cgroup_cpu_quota(cgroup_dir)
+    if cpu_quota is not None:
+        cpu_count = min(cpu_count, max(1, math.ceil(cpu_quota)))
+    return cpu_count
+
+
+def get_cgroup_cpu_quota(cgroup_dir=CGROUP_DIR, proc_cgroup_file=PROC_CGROUP_FILE):
+    """
+    Returns the cgroup CPU quota as a number of CPUs (can be fractional), or None if there isn't
+    one. Both cgroup v2 (cpu.max) and cgroup v1 (cpu.cfs_quota_us/cpu.cfs_period_us) are checked,
+    in the process's own cgroup and the cgroups above it, and the lowest quota is used.
+    """
+    quotas = []
+    for directory in get_cgroup_dirs(cgroup_dir, None, proc_cgroup_file):
+        cpu_max = read_cgroup_file(os.path.join(directory, 'cpu.max'))
+        if cpu_max is not None:
+            parts = cpu_max.split()
+            try:
+                quotas.append(int(parts[0]) / int(parts[1]))
+            except (IndexError, ValueError, ZeroDivisionError):  # 'max' means no limit
+                pass
+    for v1_dir in ('cpu', 'cpu,cpuacct'):
+        for directory in get_cgroup_dirs(cgroup_dir, v1_dir, proc_cgroup_file):
+            quota = read_cgroup_file(os.path.join(directory, 'cpu.cfs_quota_us'))
+            period = read_cgroup_file(os.path.join(directory, 'cpu.cfs_period_us'))
+            try:
+                quota, period = int(quota), int(period)
+            except (TypeError, ValueError):
+                continue
+            if quota > 0 and period > 0:  # -1 means no limit
+                quotas.append(quota / period)
+    return min(quotas) if quotas else None
+
+
+def get_available_memory(cgroup_dir=CGROUP_DIR):
+    """
+    Returns the number of bytes of memory this process can use: the lower of the system's
+    available memory and whatever remains under a cgroup memory limit. Returns None if neither
+    can be determined.
+    """
+    available = get_system_available_memory()
+    cgroup_limit, cgroup_usage = get_cgroup_memory_limit_and_usage(cgroup_dir)
+    if cgroup_limit is not None:
+        cgroup_available = max(0, cgroup_limit - (cgroup_usage or 0))
+        available = cgroup_available if available is None else min(available, cgroup_available)
+    return available
+
+
+def get_memory_limit(cgroup_dir=CGROUP_DIR):
+    """
+    Returns the most memory (in bytes) this process could ever use: the physical memory size or
+    the cgroup memory limit, whichever is lower. Returns None if neither can be determined.
+    """
+    limit = get_physical_memory()
+    cgroup_limit, _ = get_cgroup_memory_limit_and_usage(cgroup_dir)
+    if cgroup_limit is not None:
+        limit = cgroup_limit if limit is None else min(limit, cgroup_limit)
+    return limit
+
+
+def get_system_available_memory():
+    """
+    Returns the system's available memory (MemAvailable in /proc/meminfo), falling back to the
+    physical memory size where /proc/meminfo doesn't exist.
+    """
+    try:
+        with open('/proc/meminfo', 'rt') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return get_physical_memory()
+
+
+def get_physical_memory():
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def get_cgroup_memory_limit_and_usage(cgroup_dir=CGROUP_DIR, proc_cgroup_file=PROC_CGROUP_FILE):
+    """
+    Returns the cgroup memory limit and current usage in bytes (either can be None). The process's
+    own cgroup and the cgroups above it are checked, and the lowest limit is used (along with the
+    usage of the cgroup it's set on). A cgroup v1 'limit' too large to be real (the kernel's way of
+    saying unlimited) counts as no limit.
+    """
+    best_limit, best_usage = None, None
+    for v1_dir, limit_file, usage_file in ((None, 'memory.max', 'memory.current'),
+                                           ('memory', 'memory.limit_in_bytes',
+                                            'memory.usage_in_bytes')):
+        for directory in get_cgroup_dirs(cgroup_dir, v1_dir, proc_cgroup_file):
+            try:
+                limit = int(read_cgroup_file(os.path.join(directory, limit_file)))
+            except (TypeError, ValueError):  # no file, or 'max' which means no limit
+                continue
+            if limit >= 2 ** 60 or (best_limit is not None and limit >= best_limit):
+                continue
+            try:
+                usage = int(read_cgroup_file(os.path.join(directory, usage_file)))
+            except (TypeError, ValueError):
+                usage = None
+            best_limit, best_usage = limit, usage
+    return best_limit, best_usage
+
+
+def get_cgroup_dirs(cgroup_dir, v1_dir, proc_cgroup_file=PROC_CGROUP_FILE):
+    """
+    Returns the directories of the cgroups whose limits apply to this process: its own cgroup
+    (from /proc/self/cgroup) and each one above it, up to the root. Under Slurm or systemd, a job's
+    limits are in its own cgroup, not the root. For cgroup v2, v1_dir is None. For cgroup v1, it's
+    the controller's directory (e.g. 'memory').
+    """
+    base_dir = cgroup_dir if v1_dir is None else os.path.join(cgroup_dir, v1_dir)
+    controllers = set() if v1_dir is None else set(v1_dir.split(','))
+    cgroup_path = '/'
+    try:
+        with open(proc_cgroup_file, 'rt') as proc_cgroup:
+            for line in proc_cgroup:
+                parts = line.strip().split(':', 2)
+                if len(parts) < 3:
+                    continue
+                line_controllers = set(parts[1].split(',')) if parts[1] else set()
+                if (not controllers and not line_controllers) or controllers & line_controllers:
+                    cgroup_path = parts[2]
+                    break
+    except OSError:
+        pass
+
+    dirs = []
+    path_parts = [x for x in cgroup_path.split('/') if x and x != '..']
+    for i in range(len(path_parts), -1, -1):
+        dirs.append(os.path.join(base_dir, *path_parts[:i]))
+    return dirs
+
+
+def read_cgroup_file(filename):
+    try:
+        with open(filename, 'rt') as cgroup_file:
+            return cgroup_file.read().strip()
+    except OSError:
+        return None
+
+
+def get_spades_memory_limit(cgroup_dir=CGROUP_DIR):
+    """
+    Returns the memory limit (in GB) to give SPAdes. SPAdes stops with an error when it goes over
+    its limit, which is better than being killed by the kernel partway through, so when there is a
+    hard limit (the machine's memory or the cgroup's), SPAdes gets that. Otherwise it gets
+    effectively no limit.
+    """
+    limit = get_memory_limit(cgroup_dir)
+    if limit is None:
+        return settings.SPADES_DEFAULT_MEMORY_GB
+    return max(1, min(settings.SPADES_DEFAULT_MEMORY_GB, limit // (1024 ** 3)))
+
+
+def get_memory_limited_count(count, bytes_per_item, cgroup_dir=CGROUP_DIR):
+    """
+    Reduces count (e.g. a number of worker processes) so that count * bytes_per_item fits in the
+    available memory, but never below one.
+    """
+    available = get_available_memory(cgroup_dir)
+    if available is None or bytes_per_item <= 0:
+        return count
+    return max(1, min(count, available // bytes_per_item))
+
+
+def get_thread_pool(threads):
+    """
+    Returns the shared thread pool with the given number of threads, so stages which run
+    Python-level work in parallel don't each start (and leak) their own threads. Stages running at
+    the same time with different thread counts get different pools. Pools inherited through a fork
+    (e.g. in batch mode) have no threads in the child process, so they are replaced.
+    """
+    global thread_pools, thread_pool_pid
+    with thread_pool_lock:
+        if thread_pool_pid != os.getpid():
+            thread_pools, thread_pool_pid = {}, os.getpid()
+        if threads not in thread_pools:
+            from multiprocessing.dummy import Pool as ThreadPool
+            thread_pools[threads] = ThreadPool(threads)
+        return thread_pools[threads]
+
+
+def close_thread_pool():
+    global thread_pools
+    with thread_pool_lock:
+        if thread_pool_pid == os.getpid():
+            for pool in thread_pools.values():
+                pool.close()
+                pool.join()
+        thread_pools = {}
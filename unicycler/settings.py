@@ -21,8 +21,8 @@ ALLOWED_MINIMAP_OVERLAP = 5
 # best hit.
 MAX_TO_MIN_MINIMISER_RATIO = 10
 
-# When testing various repeat counts using fully global alignment in Seqan, we use this band size
-# to make the alignment faster.
+# When testing various repeat counts using fully global alignment, we use this band size to make
+# the alignment faster.
 SIMPLE_REPEAT_BRIDGING_BAND_SIZE = 50
 
 # Illumina contigs are used as 'reads' in the miniasm and Racon steps. They are given this as a
@@ -34,6 +34,26 @@ RACON_POLISH_LOOP_COUNT_HYBRID = 2
 RACON_POLISH_LOOP_COUNT_LONG_ONLY = 4
 
 
+# Long reads beyond these depths (relative to the assembly size) add little to SeqAn alignment and
+# Racon polishing but still cost time, so the reads for those stages are subsampled to about this
+# depth (the --max_alignment_depth and --max_polishing_depth defaults, 0 = use all reads).
+LONG_READ_ALIGNMENT_TARGET_DEPTH = 100
+RACON_POLISH_TARGET_DEPTH = 100
+
+# When subsampling reads, depth is tracked in bins of this size (bp) over each reference. The
+# bins at the ends of anchor segments (where bridges start and finish) get this multiple of the
+# target depth, and read qualities are sampled at this step when ranking reads.
+READ_SELECTION_BIN_SIZE = 1000
+READ_SELECTION_ANCHOR_END_DEPTH_FACTOR = 2.0
+READ_SELECTION_QUALITY_SAMPLE_STEP = 10
+
+# When only the long reads which could bridge anchor segments are aligned with SeqAn, reads which
+# carry on past an anchor's end by more than this many bases are kept in case minimap missed their
+# next anchor (the --bridging_read_margin default), and about this many of the other reads are
+# aligned anyway to set the minimum alignment score.
+BRIDGING_READ_MARGIN = 100
+BRIDGING_READ_CALIBRATION_COUNT = 1000
+
 # This is the number of times assembly graph contigs are included in the Racon polish reads. E.g.
 # if 6, then each contig is included 6 times as a read (3 forward strand 3 reverse).
 RACON_CONTIG_DUPLICATION_COUNT = 1
@@ -54,6 +74,15 @@ MIN_LONG_READ_ALIGNMENT_LENGTH = 50
 # filtered out.
 ALLOWED_ALIGNMENT_OVERLAP = 1.1
 
+# Long read alignments are written to the SAM file by a background thread, which writes through a
+# buffer of this many bytes.
+SAM_WRITE_BUFFER_SIZE = 1048576
+
+# Compressed input files are read and decompressed in chunks of this many bytes, and BGZF blocks
+# (up to 64 kB each) are given to the decompression threads in groups of this many.
+READ_INPUT_BUFFER_SIZE = 1048576
+BGZF_BLOCKS_PER_TASK = 16
+
 # Unicycler will not use the lowest quality alignments for making bridges. This setting specifies
 # the threshold. E.g. if it is 5, then any alignment with a scaled score of less than the 5th
 # percentile scaled score will be thrown out.
@@ -66,6 +95,13 @@ MIN_SCALED_SCORE_PERCENTILE = 5.0
 # the threshold is at least a little bit better than a random sequence alignment.
 AUTO_SCORE_STDEV_ABOVE_RANDOM_ALIGNMENT_MEAN = 7
 
+# The number and length of the random alignments used for the low score threshold. For scoring
+# schemes that don't have precomputed values, the results are saved in this file in the user's
+# cache directory, so they only need to be made once.
+RANDOM_ALIGNMENT_COUNT = 25000
+RANDOM_ALIGNMENT_SEQ_LENGTH = 100
+RANDOM_ALIGNMENT_CACHE_FILENAME = 'random_alignment_scores.json'
+
 # When Unicycler is searching for paths connecting two graph segments which matches a read
 # consensus sequence, it will only consider paths which have a length similar to the expected
 # sequence (based on the consensus sequence length). These settings define the acceptable range.
@@ -152,6 +188,18 @@ PATHLESS_BRIDGE_QUAL_NO_DEAD_ENDS_WITH_LINEAR_SEQS = 0.2
 # explicitly asks for it!
 MAX_AUTO_THREAD_COUNT = 8
 
+# SPAdes is given a memory limit (in GB) of whatever memory is available to Unicycler, but never
+# more than this (which is also what it gets when the available memory can't be determined).
+SPADES_DEFAULT_MEMORY_GB = 1024
+
+# A rough upper bound on the memory used to load and clean a SPAdes graph, relative to the size of
+# its GFA file. This limits how many graphs are cleaned at once when memory is tight.
+GRAPH_CLEANING_MEMORY_PER_GFA_BYTE = 30
+
+# Progress lines (which overwrite each other on the screen) are shown at most this often (in
+# seconds), so logging doesn't slow down stages which complete many small tasks.
+PROGRESS_LINE_INTERVAL = 0.1
+
 # The default sequence line wrapping length (e.g. for use in FASTA files).
 BASES_PER_FASTA_LINE = 70
 
@@ -15,13 +15,20 @@ not, see <http://www.gnu.org/licenses/>.
 
 import os
 import subprocess
-import gzip
 import shutil
 import statistics
-
-from .misc import round_to_nearest_odd, get_compression_type, int_to_str, quit_with_error, \
-    bold, dim, print_table, get_left_arrow, float_to_str
+import multiprocessing
+import time
+import json
+import math
+import functools
+
+from .misc import round_to_nearest_odd, int_to_str, quit_with_error, \
+    bold, dim, print_table, get_left_arrow, float_to_str, get_open_function, get_file_stamp
 from .assembly_graph import AssemblyGraph
+from .read_input import SequenceFile
+from .resources import get_spades_memory_limit, get_memory_limited_count
+from . import settings
 from . import log
 
 
@@ -41,7 +48,7 @@ def get_best_spades_graph(short1, short2, short_unpaired, out_dir, read_depth_fi
         os.makedirs(spades_dir)
 
     threads = min(threads, 32)  # SPAdes can possibly crash if given too many threads.
-    check_fastqs(short1, short2, short_unpaired)
+    check_fastqs(short1, short2, short_unpaired, spades_dir, threads)
     reads = (short1, short2, short_unpaired)
 
     kmer_range = get_kmer_range(kmers, short1, short2, short_unpaired, spades_dir, kmer_count,
@@ -56,9 +63,9 @@ def get_best_spades_graph(short1, short2, short_unpaired, out_dir, read_depth_fi
 
     if verbosity > 1:
         spades_results_table = [['K-mer', 'Contigs', 'Links', 'Total length', 'N50',
-                                 'Longest contig', 'Dead ends', 'Score']]
+                                 'Longest contig', 'Dead ends', 'Score', 'Time (s)']]
     else:
-        spades_results_table = [['K-mer', 'Contigs', 'Dead ends', 'Score']]
+        spades_results_table = [['K-mer', 'Contigs', 'Dead ends', 'Score', 'Time (s)']]
 
     graph_files, insert_size_mean, insert_size_deviation = \
         run_spades_all_kmers(reads, spades_dir, kmer_range, threads, spades_path,
@@ -71,66 +78,69 @@ def get_best_spades_graph(short1, short2, short_unpaired, out_dir, read_depth_fi
     median_segment_count = statistics.median(count_segments_in_gfa(x)
                                              for x in existing_graph_files)
 
-    best_score, best_kmer, best_graph_filename = 0.0, 0, ''
-    for graph_file, kmer in zip(graph_files, kmer_range):
-        table_line = [int_to_str(kmer)]
-
-        if graph_file is None:
-            table_line += [''] * (7 if verbosity > 1 else 2)
-            table_line.append('failed')
-            spades_results_table.append(table_line)
-            continue
-
-        assembly_graph = AssemblyGraph(graph_file, kmer, insert_size_mean=insert_size_mean,
-                                       insert_size_deviation=insert_size_deviation)
+    # Each k-mer graph is loaded, cleaned and scored independently, so this is done in parallel
+    # (using processes, as graph cleaning is pure Python).
+    arg_list = [(graph_file, kmer, insert_size_mean, insert_size_deviation, read_depth_filter,
+                 largest_component, median_segment_count, expected_linear_seqs, spades_dir,
+                 verbosity)
+                for graph_file, kmer in zip(graph_files, kmer_range) if graph_file is not None]
+    largest_graph_size = max(os.path.getsize(x[0]) for x in arg_list)
+    process_count = get_memory_limited_count(
+        min(threads, len(arg_list)),
+        largest_graph_size * settings.GRAPH_CLEANING_MEMORY_PER_GFA_BYTE)
+    if process_count > 1:
+        log.log('Cleaning and scoring {} graphs using {} processes'.format(len(arg_list),
+                                                                          process_count), 2)
+        pool = multiprocessing.Pool(process_count, initializer=init_worker_logging,
+                                    initargs=(log.logger.stdout_verbosity_level,
+                                              log.logger.log_file_verbosity_level,
+                                              log.logger.log_file is not None))
+        results = pool.imap(functools.partial(clean_and_score_spades_graph, return_graph=False),
+                            arg_list)
+    else:
+        pool = None
+        results = map(clean_and_score_spades_graph, arg_list)
 
-        # If this graph has way too many segments, then we will just skip it because very complex
-        # graphs take forever to clean up.
-        # TO DO: I can remove this awkward hack if I make the graph cleaning more efficient.
-        if len(assembly_graph.segments) > 4 * median_segment_count:
-            table_line += [''] * (6 if verbosity > 1 else 2)
-            table_line.append('too complex')
+    best_score, best_kmer, assembly_graph = 0.0, 0, None
+    removed_count, removed_length = 0, 0
+    try:
+        for graph_file, kmer in zip(graph_files, kmer_range):
+            table_line = [int_to_str(kmer)]
+
+            if graph_file is None:
+                table_line += [''] * (6 if verbosity > 1 else 2)
+                table_line += ['failed', '']
+                spades_results_table.append(table_line)
+                continue
+
+            graph, score, graph_removed_count, graph_removed_length, table_cells, seconds, \
+                log_calls = next(results)
+            for function, args in log_calls:
+                function(*args)
+            table_line += table_cells + ['{:.1f}'.format(seconds)]
             spades_results_table.append(table_line)
-            continue
-
-        log.log('\nCleaning k{} graph'.format(kmer), 2)
-        assembly_graph.clean(read_depth_filter, largest_component)
-        clean_graph_filename = os.path.join(spades_dir, ('k%03d' % kmer) + '_assembly_graph.gfa')
-        assembly_graph.save_to_gfa(clean_graph_filename, verbosity=2)
-
-        segment_count = len(assembly_graph.segments)
-        dead_ends = assembly_graph.total_dead_end_count()
-
-        # If the user is expecting some linear sequences, then the dead end count can be adjusted
-        # down so expected dead ends don't penalise this k-mer.
-        adjusted_dead_ends = max(0, dead_ends - (2 * expected_linear_seqs))
-        if segment_count == 0:
-            score = 0.0
-        else:
-            score = 1.0 / (segment_count * (adjusted_dead_ends + 2))
-
-        # Prepare the table line for this k-mer graph.
-        table_line += [int_to_str(segment_count)]
-        if verbosity > 1:
-            n50, shortest, _, median, _, longest = assembly_graph.get_contig_stats()
-            table_line += [int_to_str(assembly_graph.get_total_link_count()),
-                           int_to_str(assembly_graph.get_total_length()),
-                           int_to_str(n50), int_to_str(longest)]
-        table_line += [int_to_str(dead_ends), '{:.2e}'.format(score)]
-        spades_results_table.append(table_line)
-
-        if score > best_score:
-            best_kmer, best_score, best_graph_filename = kmer, score, graph_file
 
+            # Only the best graph so far is kept, so the winner doesn't need to be rebuilt later.
+            if score > best_score:
+                best_kmer, best_score, assembly_graph = kmer, score, graph
+                removed_count, removed_length = graph_removed_count, graph_removed_length
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
     log.log('', 2)
 
     if not best_kmer:
         quit_with_error('none of the SPAdes graphs were suitable for scaffolding in Unicycler')
 
-    assembly_graph = AssemblyGraph(best_graph_filename, best_kmer,
-                                   insert_size_mean=insert_size_mean,
-                                   insert_size_deviation=insert_size_deviation)
-    removed_count, removed_length = assembly_graph.clean(read_depth_filter, largest_component)
+    # Graphs cleaned in worker processes aren't sent back (they can be large), so the best one is
+    # cleaned again here.
+    if assembly_graph is None:
+        assembly_graph = AssemblyGraph(graph_files[kmer_range.index(best_kmer)], best_kmer,
+                                       insert_size_mean=insert_size_mean,
+                                       insert_size_deviation=insert_size_deviation)
+        assembly_graph.clean(read_depth_filter, largest_component)
+
     clean_graph_filename = os.path.join(spades_dir, 'k' + str(best_kmer) + '_assembly_graph.gfa')
     assembly_graph.save_to_gfa(clean_graph_filename, verbosity=2)
 
@@ -140,8 +150,8 @@ def get_best_spades_graph(short1, short2, short_unpaired, out_dir, read_depth_fi
     # Print the SPAdes result table, highlighting the best k-mer in green.
     log.log_section_header('SPAdes assembly graph summary', 2)
     best_kmer_row = [x[0] for x in spades_results_table].index(int_to_str(best_kmer))
-    print_table(spades_results_table, alignments='RRRRRRRR', indent=0,
-                row_colour={best_kmer_row: 'green'},
+    print_table(spades_results_table, alignments='RRRRRRRRR', indent=0,
+                row_colour={best_kmer_row: 'green'}, report_table='spades_assemblies',
                 row_extra_text={best_kmer_row: ' ' + get_left_arrow() + 'best'})
 
     # Report on the results of the read depth filter (can help with identifying levels of
@@ -161,6 +171,80 @@ def get_best_spades_graph(short1, short2, short_unpaired, out_dir, read_depth_fi
     return assembly_graph
 
 
+def clean_and_score_spades_graph(all_args, return_graph=True):
+    """
+    Loads, cleans and scores one SPAdes k-mer graph. This may run in a worker process, so it
+    returns everything needed for the results table: the cleaned graph (None if it was skipped or
+    return_graph is False), its score, the read depth filter results, the table cells (after the
+    k-mer) and the time taken. Its log calls are held and returned last, for the caller to make in
+    k-mer order.
+    """
+    previous_stage_log = getattr(log.thread_state, 'stage_log', None)
+    held_log = log.StageLog()
+    log.set_stage_log(held_log)
+    try:
+        result = clean_and_score_graph(*all_args)
+    finally:
+        log.set_stage_log(previous_stage_log)
+    if not return_graph:
+        result = (None,) + result[1:]
+    return result + (held_log.held,)
+
+
+def init_worker_logging(stdout_verbosity_level, log_file_verbosity_level, has_log_file):
+    """
+    Used as a process pool initializer, so workers (whether forked or spawned) decide what to log
+    at the main process's verbosity. Their log calls are all held and returned to the main
+    process, so nothing is written to the stand-in log file.
+    """
+    log.logger = log.Log(log_filename=None, stdout_verbosity_level=stdout_verbosity_level,
+                         log_file_verbosity_level=log_file_verbosity_level)
+    if has_log_file:
+        log.logger.log_file = open(os.devnull, 'wt')
+
+
+def clean_and_score_graph(graph_file, kmer, insert_size_mean, insert_size_deviation,
+                          read_depth_filter, largest_component, median_segment_count,
+                          expected_linear_seqs, spades_dir, verbosity):
+    start_time = time.time()
+    assembly_graph = AssemblyGraph(graph_file, kmer, insert_size_mean=insert_size_mean,
+                                   insert_size_deviation=insert_size_deviation)
+
+    # If this graph has way too many segments, then we will just skip it because very complex
+    # graphs take forever to clean up.
+    # TO DO: I can remove this awkward hack if I make the graph cleaning more efficient.
+    if len(assembly_graph.segments) > 4 * median_segment_count:
+        table_cells = [''] * (6 if verbosity > 1 else 2) + ['too complex']
+        return None, 0.0, 0, 0, table_cells, time.time() - start_time
+
+    log.log('\nCleaning k{} graph'.format(kmer), 2)
+    removed_count, removed_length = assembly_graph.clean(read_depth_filter, largest_component)
+    clean_graph_filename = os.path.join(spades_dir, ('k%03d' % kmer) + '_assembly_graph.gfa')
+    assembly_graph.save_to_gfa(clean_graph_filename, verbosity=2)
+
+    segment_count = len(assembly_graph.segments)
+    dead_ends = assembly_graph.total_dead_end_count()
+
+    # If the user is expecting some linear sequences, then the dead end count can be adjusted
+    # down so expected dead ends don't penalise this k-mer.
+    adjusted_dead_ends = max(0, dead_ends - (2 * expected_linear_seqs))
+    if segment_count == 0:
+        score = 0.0
+    else:
+        score = 1.0 / (segment_count * (adjusted_dead_ends + 2))
+
+    # Prepare the table cells for this k-mer graph.
+    table_cells = [int_to_str(segment_count)]
+    if verbosity > 1:
+        n50, shortest, _, median, _, longest = assembly_graph.get_contig_stats()
+        table_cells += [int_to_str(assembly_graph.get_total_link_count()),
+                        int_to_str(assembly_graph.get_total_length()),
+                        int_to_str(n50), int_to_str(longest)]
+    table_cells += [int_to_str(dead_ends), '{:.2e}'.format(score)]
+    return assembly_graph, score, removed_count, removed_length, table_cells, \
+        time.time() - start_time
+
+
 def run_spades_all_kmers(read_files, spades_dir, kmers, threads, spades_path, spades_graph_prefix,
                          spades_options):
     """
@@ -178,12 +262,13 @@ def run_spades_all_kmers(read_files, spades_dir, kmers, threads, spades_path, sp
         os.path.isfile(short1) and os.path.isfile(short2)
     using_unpaired_reads = unpaired is not None and os.path.isfile(unpaired)
 
+    memory_gb = get_spades_memory_limit()
     graph_files, insert_size_means, insert_size_deviations = [], [], []
     for i in range(len(kmers)):
         biggest_kmer = kmers[i]
         command = build_spades_command(spades_path, spades_dir, threads, kmers, i, short1, short2,
                                        unpaired, using_paired_reads, using_unpaired_reads,
-                                       spades_options)
+                                       spades_options, memory_gb)
         log.log(' '.join(command))
         graph_file, insert_size_mean, insert_size_deviation = \
             run_spades_one_kmer(command, spades_dir, biggest_kmer)
@@ -204,10 +289,9 @@ def run_spades_all_kmers(read_files, spades_dir, kmers, threads, spades_path, sp
     else:
         # If we couldn't get the insert size from the SPAdes output (e.g. it was an
         # unpaired-reads-only assembly), we'll use the read length instead.
-        read_lengths = get_read_lengths(short1) + get_read_lengths(short2) + \
-                       get_read_lengths(unpaired)
-        insert_size_mean = statistics.mean(read_lengths)
-        insert_size_deviation = max(statistics.stdev(read_lengths), 1.0)
+        read_stats = [get_read_file_stats(x, spades_dir) for x in (short1, short2, unpaired)]
+        insert_size_mean, insert_size_deviation = get_read_length_mean_and_stdev(read_stats)
+        insert_size_deviation = max(insert_size_deviation, 1.0)
 
     log.log('', 2)
     log.log('Insert size mean: ' + float_to_str(insert_size_mean, 1) + ' bp', 2)
@@ -218,7 +302,8 @@ def run_spades_all_kmers(read_files, spades_dir, kmers, threads, spades_path, sp
 
 
 def build_spades_command(spades_path, spades_dir, threads, kmers, i, short1, short2, unpaired,
-                         using_paired_reads, using_unpaired_reads, spades_options):
+                         using_paired_reads, using_unpaired_reads, spades_options,
+                         memory_gb=settings.SPADES_DEFAULT_MEMORY_GB):
     kmer_string = ','.join([str(x) for x in kmers[:i+1]])
 
     command = [spades_path, '-o', spades_dir, '-k', kmer_string, '--threads', str(threads)]
@@ -234,7 +319,7 @@ def build_spades_command(spades_path, spades_dir, threads, kmers, i, short1, sho
     if spades_options:
         command += spades_options.split()
     if not spades_options or '-m' not in spades_options.split():
-        command += ['-m', '1024']
+        command += ['-m', str(memory_gb)]
     return command
 
 
@@ -279,24 +364,24 @@ def run_spades_one_kmer(command, spades_dir, biggest_kmer):
     return graph_file, insert_size_mean, insert_size_deviation
 
 
-def check_fastqs(short1, short2, short_unpaired):
+def check_fastqs(short1, short2, short_unpaired, cache_dir=None, threads=1):
     using_paired_reads = bool(short1) and bool(short2)
     using_unpaired_reads = bool(short_unpaired)
     if using_paired_reads:
         count_1, count_2 = 0, 0
         try:
-            count_1 = get_read_count(short1)
+            count_1 = get_read_count(short1, cache_dir, threads)
         except BadFastq:
             quit_with_error('this read file is not a properly formatted FASTQ: ' + short1)
         try:
-            count_2 = get_read_count(short2)
+            count_2 = get_read_count(short2, cache_dir, threads)
         except BadFastq:
             quit_with_error('this read file is not a properly formatted FASTQ: ' + short2)
         if count_1 != count_2:
             quit_with_error('the paired read input files have an unequal number of reads')
     if using_unpaired_reads:
         try:
-            get_read_count(short_unpaired)
+            get_read_count(short_unpaired, cache_dir, threads)
         except BadFastq:
             quit_with_error('this read file is not properly formatted as FASTQ: ' + short_unpaired)
 
@@ -357,10 +442,9 @@ def get_kmer_range(given_kmers, reads_1_filename, reads_2_filename, unpaired_rea
 
     # If the code got here, then the k-mer range doesn't already exist and we'll create one by
     # examining the read lengths.
-    read_lengths = get_read_lengths(reads_1_filename) + get_read_lengths(reads_2_filename) + \
-        get_read_lengths(unpaired_reads_filename)
-    read_lengths = sorted(read_lengths)
-    median_read_length = read_lengths[len(read_lengths) // 2 - 1]
+    read_stats = [get_read_file_stats(x, spades_dir)
+                  for x in (reads_1_filename, reads_2_filename, unpaired_reads_filename)]
+    median_read_length = get_median_read_length(read_stats)
     max_kmer = round_to_nearest_odd(max_kmer_frac * median_read_length)
     if max_kmer > max_spades_kmer:
         max_kmer = max_spades_kmer
@@ -392,54 +476,157 @@ def get_kmer_range(given_kmers, reads_1_filename, reads_2_filename, unpaired_rea
     return kmer_range
 
 
-def get_read_lengths(reads_filename):
+class ReadFileStats(object):
     """
-    Returns a list of the read lengths for the given read file.
+    Summary statistics for a FASTQ file, gathered in a single pass: the read count, a histogram of
+    read lengths and whether the file looked like a properly formatted FASTQ.
+    """
+    def __init__(self, read_count=0, length_counts=None, well_formed=True):
+        self.read_count = read_count
+        self.length_counts = length_counts if length_counts is not None else {}
+        self.well_formed = well_formed
+
+    def to_json(self):
+        return {'read_count': self.read_count, 'well_formed': self.well_formed,
+                'length_counts': [[length, count]
+                                  for length, count in sorted(self.length_counts.items())]}
+
+    @staticmethod
+    def from_json(json_stats):
+        return ReadFileStats(json_stats['read_count'],
+                             {length: count for length, count in json_stats['length_counts']},
+                             json_stats['well_formed'])
+
+
+# Read file stats which have already been gathered in this run, so each file is only read once.
+# Dict of absolute filename -> (file stamp, ReadFileStats).
+READ_FILE_STATS = {}
+
+READ_STATS_CACHE_FILENAME = 'read_stats.json'
+
+
+def get_read_file_stats(reads_filename, cache_dir=None, threads=1):
+    """
+    Returns a ReadFileStats for the given FASTQ file. The results are remembered for the rest of
+    the run and, if a cache directory is given, saved there to be reused by later runs (as long as
+    the file hasn't changed).
     """
     if reads_filename is None:
-        return []
-    if get_compression_type(reads_filename) == 'gz':
-        open_func = gzip.open
-    else:  # plain text
-        open_func = open
-    with open_func(reads_filename, 'rb') as reads:
-        read_lengths = []
-        i = 0
-        for line in reads:
-            if i % 4 == 1:
-                read_lengths.append(len(line.strip()))
-            i += 1
+        return ReadFileStats()
+    full_path = os.path.abspath(reads_filename)
+    file_stamp = list(get_file_stamp(reads_filename))
+    if full_path in READ_FILE_STATS and READ_FILE_STATS[full_path][0] == file_stamp:
+        return READ_FILE_STATS[full_path][1]
+
+    cached_stats = load_read_stats_cache(cache_dir)
+    if full_path in cached_stats and cached_stats[full_path]['stamp'] == file_stamp:
+        stats = ReadFileStats.from_json(cached_stats[full_path])
+    else:
+        stats = gather_read_file_stats(reads_filename, threads)
+        if cache_dir is not None and os.path.isdir(cache_dir):
+            cached_stats[full_path] = stats.to_json()
+            cached_stats[full_path]['stamp'] = file_stamp
+            with open(os.path.join(cache_dir, READ_STATS_CACHE_FILENAME), 'wt') as cache_file:
+                json.dump(cached_stats, cache_file)
+    READ_FILE_STATS[full_path] = (file_stamp, stats)
+    return stats
+
+
+def load_read_stats_cache(cache_dir):
+    if cache_dir is None:
+        return {}
+    cache_filename = os.path.join(cache_dir, READ_STATS_CACHE_FILENAME)
+    if not os.path.isfile(cache_filename):
+        return {}
+    try:
+        with open(cache_filename, 'rt') as cache_file:
+            return json.load(cache_file)
+    except ValueError:
+        return {}
+
+
+def gather_read_file_stats(reads_filename, threads=1):
+    """
+    Reads through a FASTQ file once, counting reads and read lengths.
+    """
+    length_counts = {}
+    read_count = 0
+    is_fastq = True
+    with SequenceFile(reads_filename, threads) as reads:
+        for _, sequence, qualities in reads:
+            if qualities is None:
+                is_fastq = False
+            read_count += 1
+            length = len(sequence)
+            length_counts[length] = length_counts.get(length, 0) + 1
+    return ReadFileStats(read_count, length_counts, reads.well_formed and is_fastq)
+
+
+def combine_length_counts(read_stats):
+    length_counts = {}
+    for stats in read_stats:
+        for length, count in stats.length_counts.items():
+            length_counts[length] = length_counts.get(length, 0) + count
+    return length_counts
+
+
+def get_median_read_length(read_stats):
+    """
+    Returns the median read length (the lower one for an even count) from the length histograms.
+    """
+    length_counts = combine_length_counts(read_stats)
+    total = sum(length_counts.values())
+    if total == 0:
+        return 0
+    index = total // 2 - 1
+    if index < 0:
+        index += total
+    reads_so_far = 0
+    for length, count in sorted(length_counts.items()):
+        reads_so_far += count
+        if reads_so_far > index:
+            return length
+
+
+def get_read_length_mean_and_stdev(read_stats):
+    """
+    Returns the mean and sample standard deviation of read lengths from the length histograms.
+    """
+    length_counts = combine_length_counts(read_stats)
+    total = sum(length_counts.values())
+    if total == 0:
+        return 0.0, 0.0
+    mean = sum(length * count for length, count in length_counts.items()) / total
+    if total < 2:
+        return mean, 0.0
+    variance = sum(count * (length - mean) ** 2
+                   for length, count in length_counts.items()) / (total - 1)
+    return mean, math.sqrt(variance)
+
+
+def get_read_lengths(reads_filename, cache_dir=None):
+    """
+    Returns a list of the read lengths for the given read file (in order of length).
+    """
+    stats = get_read_file_stats(reads_filename, cache_dir)
+    read_lengths = []
+    for length, count in sorted(stats.length_counts.items()):
+        read_lengths += [length] * count
     return read_lengths
 
 
-def get_read_count(reads_filename):
+def get_read_count(reads_filename, cache_dir=None, threads=1):
     """
     Returns the number of reads in the given file.
     """
     if reads_filename is None:
         return 0
-    if get_compression_type(reads_filename) == 'gz':
-        open_func = gzip.open
-    else:  # plain text
-        open_func = open
-    with open_func(reads_filename, 'rb') as reads:
-        read_count = 0
-        i = 0
-        for line in reads:
-            if i % 4 == 0:
-                try:
-                    assert line.startswith(b'@')
-                except AssertionError:
-                    raise BadFastq
-                read_count += 1
-            i += 1
-    return read_count
-
-
-def count_segments_in_gfa(fastg_file):
-    seq_count = 0
-    with open(fastg_file, 'rt') as fastg:
-        for line in fastg:
-            if line.startswith('S\t'):
-                seq_count += 1
-    return seq_count
+    stats = get_read_file_stats(reads_filename, cache_dir, threads)
+    if not stats.well_formed:
+        raise BadFastq
+    return stats.read_count
+
+
+def count_segments_in_gfa(gfa_file):
+    with get_open_function(gfa_file)(gfa_file, 'rb') as gfa:
+        return sum(1 for line in gfa if line.startswith(b'S\t'))
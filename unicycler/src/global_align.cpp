@@ -13,7 +13,7 @@
 
 #include <seqan/align.h>
 #include "semi_global_align.h"
-
+#include "score_only_align.h"
 
 
 char * fullyGlobalAlignment(char * s1, char * s2,
@@ -37,6 +37,32 @@ char * fullyGlobalAlignment(char * s1, char * s2,
         return cppStringToCString("");
 }
 
+// This function scores many pairs of sequences with a global alignment (the same as the
+// fullyGlobalAlignment function) but without making the alignments themselves. The raw and scaled
+// scores for each pair are stored in the given arrays.
+void fullyGlobalAlignmentScores(int pairCount, char ** s1s, char ** s2s,
+                                int matchScore, int mismatchScore, int gapOpenScore, int gapExtensionScore,
+                                bool useBanding, int bandSize,
+                                int * rawScores, double * scaledScores) {
+    std::string sequence1, sequence2;
+    for (int i = 0; i < pairCount; ++i) {
+        sequence1.assign(s1s[i]);
+        sequence2.assign(s2s[i]);
+        int lowerDiagonal = -int(sequence2.length());
+        int upperDiagonal = int(sequence1.length());
+        if (useBanding)
+            getFullyGlobalBand(sequence1.length(), sequence2.length(), bandSize,
+                               &lowerDiagonal, &upperDiagonal);
+        AlignmentScore score = bandedGlobalAlignmentScore(sequence1, sequence2,
+                                                          matchScore, mismatchScore,
+                                                          gapOpenScore, gapExtensionScore,
+                                                          false, lowerDiagonal, upperDiagonal);
+        rawScores[i] = score.rawScore;
+        scaledScores[i] = score.scaledScore;
+    }
+}
+
+
 // This function runs a global alignment between two sequences.
 ScoredAlignment * fullyGlobalAlignment(std::string s1, std::string s2,
                                        int matchScore, int mismatchScore, int gapOpenScore, int gapExtensionScore,
@@ -54,18 +80,8 @@ ScoredAlignment * fullyGlobalAlignment(std::string s1, std::string s2,
 
     AlignConfig<false, false, false, false> alignConfig;
     if (useBanding) {
-        int lowerDiagonal = -bandSize;
-        int upperDiagonal = bandSize;
-        int lengthDifference = length(s2) - length(s1);
-
-        // If s2 is longer, then we need to expand the lower diagonal a bit.
-        if (lengthDifference > 0)
-            lowerDiagonal -= lengthDifference;
-
-        // If s1 is longer, then we need to expand the upper diagonal a bit.
-        else if (lengthDifference < 0)
-            upperDiagonal -= lengthDifference;
-
+        int lowerDiagonal, upperDiagonal;
+        getFullyGlobalBand(s1.length(), s2.length(), bandSize, &lowerDiagonal, &upperDiagonal);
         try {
             globalAlignment(alignment, scoringScheme, alignConfig, lowerDiagonal, upperDiagonal);
         }
@@ -11,6 +11,55 @@
 
 #include "kmers.h"
 
+#include <algorithm>
+#include <cassert>
+#include <limits>
+
+
+#define EMPTY_SLOT std::numeric_limits<uint32_t>::max()
+
+// K-mers are 2-bit encoded in a uint32_t and the all-ones code is EMPTY_SLOT, so only k-mers up
+// to 15 bases have codes which fit and can't be mistaken for an empty slot.
+#define MAX_KMER_SIZE 15
+static_assert(LEVEL_0_KMER_SIZE <= MAX_KMER_SIZE && LEVEL_1_KMER_SIZE <= MAX_KMER_SIZE &&
+              LEVEL_2_KMER_SIZE <= MAX_KMER_SIZE && LEVEL_3_KMER_SIZE <= MAX_KMER_SIZE,
+              "KmerIndex k-mer sizes must be no more than MAX_KMER_SIZE");
+
+
+// Returns the 2-bit code for a base, or -1 for anything that isn't an upper case A, C, G or T.
+static inline int baseToCode(char base) {
+    switch (base) {
+    case 'A': return 0;
+    case 'C': return 1;
+    case 'G': return 2;
+    case 'T': return 3;
+    default: return -1;
+    }
+}
+
+
+// Calls the given function for each k-mer in the sequence which is made only of ACGT, passing
+// the k-mer's start position and its 2-bit encoding. The encoding is rolled along the sequence so
+// each position only costs a shift and a mask.
+template <typename Function>
+static void forEachKmerCode(char const * sequence, int sequenceLength, int kSize,
+                            Function function) {
+    uint32_t mask = (uint32_t(1) << (2 * kSize)) - 1;
+    uint32_t kmerCode = 0;
+    int validBases = 0;
+    for (int i = 0; i < sequenceLength; ++i) {
+        int baseCode = baseToCode(sequence[i]);
+        if (baseCode < 0) {
+            validBases = 0;
+            kmerCode = 0;
+            continue;
+        }
+        kmerCode = ((kmerCode << 2) | uint32_t(baseCode)) & mask;
+        if (++validBases >= kSize)
+            function(i - kSize + 1, kmerCode);
+    }
+}
+
 
 CommonKmer::CommonKmer(int hPosition, int vPosition) :
     m_hPosition(hPosition),
@@ -19,81 +68,82 @@ CommonKmer::CommonKmer(int hPosition, int vPosition) :
 }
 
 
-// This is the destructor for KmerPositions. It cleans up all the KmerPosMaps which were allocated
-// on the heap.
-KmerPositions::~KmerPositions() {
-    for (std::unordered_map<std::string, KmerPosMap *>::iterator i = m_kmerPositions.begin(); i != m_kmerPositions.end(); ++i)
-        delete i->second;
-}
+// Indexes all of the k-mers in the sequence. This is done in two passes: the first counts each
+// distinct k-mer (and remembers which hash slot each position went to) and the second lays the
+// positions out in one contiguous array, grouped by k-mer and in increasing order within a group.
+void KmerIndex::build(std::string const & sequence, int kSize) {
+    assert(kSize > 0 && kSize <= MAX_KMER_SIZE);
+    m_kSize = kSize;
+    int kmerCount = std::max(int(sequence.length()) - kSize + 1, 0);
 
-// Returns a vector all of k-mer position names (should be exact the same as the the sequence names).
-std::vector<std::string> KmerPositions::getAllNames() {
-    std::vector<std::string> returnVector;
-    m_mutex.lock();
-    for (std::unordered_map<std::string, KmerPosMap *>::iterator i = m_kmerPositions.begin(); i != m_kmerPositions.end(); ++i)
-        returnVector.push_back(i->first);
-    m_mutex.unlock();
-    return returnVector;
-}
+    // The table is sized to at most half full, and never bigger than needed to hold every
+    // possible k-mer.
+    long long maxDistinctKmers = std::min(kmerCount, 1 << (2 * kSize));
+    m_slotBits = 4;
+    while ((1LL << m_slotBits) < 2 * maxDistinctKmers)
+        ++m_slotBits;
+    size_t slotCount = size_t(1) << m_slotBits;
+    m_slotKeys.assign(slotCount, EMPTY_SLOT);
+    m_slotCounts.assign(slotCount, 0);
+    m_slotStarts.resize(slotCount);
+    m_positionSlots.assign(size_t(kmerCount), -1);
 
-// Returns the length of the sequence with the given name.
-int KmerPositions::getLength(std::string & name) {
-    int returnedLength = 0;
-    m_mutex.lock();
-    if (m_sequences.find(name) != m_sequences.end())
-        returnedLength = m_sequences[name].length();
-    m_mutex.unlock();
-    return returnedLength;
-}
+    forEachKmerCode(sequence.data(), int(sequence.length()), kSize,
+                    [this, slotCount](int position, uint32_t kmerCode) {
+        size_t slot = (kmerCode * 2654435761u) >> (32 - m_slotBits);
+        while (m_slotKeys[slot] != EMPTY_SLOT && m_slotKeys[slot] != kmerCode)
+            slot = (slot + 1) & (slotCount - 1);
+        m_slotKeys[slot] = kmerCode;
+        ++m_slotCounts[slot];
+        m_positionSlots[size_t(position)] = int(slot);
+    });
 
-// This function adds a sequence to the KmerPositions object. It creates a new KmerPosMap on the
-// heap (will be deleted in destructor), fills it up and adds it to m_kmerPositions.
-void KmerPositions::addPositions(std::string & name, std::string & sequence, int kSize) {
-    KmerPosMap * posMap = new KmerPosMap();
-    int kCount = sequence.size() - kSize + 1;
-    for (int i = 0; i < kCount; ++i) {
-        std::string kmer = sequence.substr(i, kSize);
-        if (posMap->find(kmer) == posMap->end())
-            (*posMap)[kmer] = std::vector<int>();
-        (*posMap)[kmer].push_back(i);
+    uint32_t total = 0;
+    for (size_t slot = 0; slot < slotCount; ++slot) {
+        m_slotStarts[slot] = total;
+        total += m_slotCounts[slot];
     }
+    m_positions.resize(total);
 
-    m_mutex.lock();
-    m_sequences[name] = sequence;
-    m_kmerPositions[name] = posMap;
-    m_mutex.unlock();
-}
-
-// This function retrieves a KmerPosMap from the object using the name as a key. If the name isn't
-// in the map, it returns 0.
-KmerPosMap * KmerPositions::getKmerPositions(std::string & name) {
-    KmerPosMap * returnedMap = 0;
-    m_mutex.lock();
-    if (m_kmerPositions.find(name) != m_kmerPositions.end())
-        returnedMap =  m_kmerPositions[name];
-    m_mutex.unlock();
-    return returnedMap;
+    // The starts are used as insertion cursors and then restored afterward.
+    for (int position = 0; position < kmerCount; ++position) {
+        int slot = m_positionSlots[size_t(position)];
+        if (slot >= 0)
+            m_positions[m_slotStarts[size_t(slot)]++] = position;
+    }
+    for (size_t slot = 0; slot < slotCount; ++slot)
+        m_slotStarts[slot] -= m_slotCounts[slot];
 }
 
-std::string * KmerPositions::getSequence(std::string & name) {
-    std::string * returnedSequence = 0;
-    m_mutex.lock();
-    if (m_kmerPositions.find(name) != m_kmerPositions.end())
-        returnedSequence = &(m_sequences[name]);
-    m_mutex.unlock();
-    return returnedSequence;
-}
 
-KmerPositions * newKmerPositions() {
-    return new KmerPositions();
+// Returns the hash table slot for the given k-mer, or -1 if the k-mer isn't in the index.
+int KmerIndex::findSlot(uint32_t kmerCode) const {
+    if (m_slotKeys.empty())
+        return -1;
+    size_t slotMask = m_slotKeys.size() - 1;
+    size_t slot = (kmerCode * 2654435761u) >> (32 - m_slotBits);
+    while (m_slotKeys[slot] != EMPTY_SLOT) {
+        if (m_slotKeys[slot] == kmerCode)
+            return int(slot);
+        slot = (slot + 1) & slotMask;
+    }
+    return -1;
 }
 
-void addKmerPositions(KmerPositions * kmerPositions, char * nameC, char * sequenceC, int kSize) {
-    std::string name(nameC);
-    std::string sequence(sequenceC);
-    kmerPositions->addPositions(name, sequence, kSize);
-}
 
-void deleteAllKmerPositions(KmerPositions * kmerPositions) {
-    delete kmerPositions;
+// Finds every k-mer shared between the indexed sequence and the other sequence. Common k-mers are
+// added in order of their position in the other sequence, then in order of their position in the
+// indexed sequence.
+void KmerIndex::findCommonKmers(char const * otherSequence, int otherLength,
+                                std::vector<CommonKmer> & commonKmers) const {
+    forEachKmerCode(otherSequence, otherLength, m_kSize,
+                    [this, &commonKmers](int position, uint32_t kmerCode) {
+        int slot = findSlot(kmerCode);
+        if (slot < 0)
+            return;
+        uint32_t start = m_slotStarts[size_t(slot)];
+        uint32_t end = start + m_slotCounts[size_t(slot)];
+        for (uint32_t j = start; j < end; ++j)
+            commonKmers.emplace_back(m_positions[j], position);
+    });
 }
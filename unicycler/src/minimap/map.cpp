@@ -373,7 +373,11 @@ static void *worker_pipeline(void *shared, int step, void *in)
 				std::cout << r->len << "\t";
 				std::cout << (r->re - r->rs > r->qe - r->qs? r->re - r->rs : r->qe - r->qs) << "\t";
 				std::cout << "255" << "\t";
-				std::cout << "cm:i:" << r->cnt << "\n";
+				std::cout << "cm:i:" << r->cnt << "\t";
+
+				// RRW: the read's index in the file is included so reads which share a name can
+				// still be told apart.
+				std::cout << "ri:i:" << t->rid << "\n";
 
 //				printf("%s\t%d\t%d\t%d\t%c\t", t->name, t->l_seq, r->qs, r->qe, "+-"[r->rev]);
 //				if (mi->name) fputs(mi->name[r->rid], stdout);
@@ -13,6 +13,7 @@
 
 #include <seqan/align.h>
 #include "semi_global_align.h"
+#include "score_only_align.h"
 
 
 char * pathAlignment(char * s1, char * s2,
@@ -36,6 +37,44 @@ char * pathAlignment(char * s1, char * s2,
         return cppStringToCString("");
 }
 
+// This function scores many pairs of sequences with a mostly-global alignment (the same as the
+// pathAlignment function) but without making the alignments themselves. The raw and scaled scores
+// for each pair are stored in the given arrays.
+void pathAlignmentScores(int pairCount, char ** s1s, char ** s2s,
+                         int matchScore, int mismatchScore, int gapOpenScore, int gapExtensionScore,
+                         bool useBanding, int bandSize,
+                         int * rawScores, double * scaledScores) {
+    std::string sequence1, sequence2;
+    for (int i = 0; i < pairCount; ++i) {
+        sequence1.assign(s1s[i]);
+        sequence2.assign(s2s[i]);
+        int lowerDiagonal = -int(sequence2.length());
+        int upperDiagonal = int(sequence1.length());
+        if (useBanding)
+            getPathBand(sequence1.length(), sequence2.length(), bandSize,
+                        &lowerDiagonal, &upperDiagonal);
+        AlignmentScore score = bandedGlobalAlignmentScore(sequence1, sequence2,
+                                                          matchScore, mismatchScore,
+                                                          gapOpenScore, gapExtensionScore,
+                                                          true, lowerDiagonal, upperDiagonal);
+        rawScores[i] = score.rawScore;
+        scaledScores[i] = score.scaledScore;
+    }
+}
+
+
+// Since the end of s2 can be left unaligned, the band only needs to be expanded when s1 is longer.
+void getPathBand(int length1, int length2, int bandSize, int * lowerDiagonal, int * upperDiagonal) {
+    *lowerDiagonal = -bandSize;
+    *upperDiagonal = bandSize;
+    int lengthDifference = length2 - length1;
+
+    // If s1 is longer, then we need to expand the upper diagonal a bit.
+    if (lengthDifference < 0)
+        *upperDiagonal -= lengthDifference;
+}
+
+
 // This function runs a mostly-global alignment between two sequences. The only free gaps are those
 // at the end of sequence 2.
 // It is intended to align a partial path sequence (s1) to a consensus read sequence (s2).
@@ -56,14 +95,8 @@ ScoredAlignment * pathAlignment(std::string s1, std::string s2,
     AlignConfig<false, false, true, false> alignConfig;
     int score;
     if (useBanding) {
-        int lowerDiagonal = -bandSize;
-        int upperDiagonal = bandSize;
-        int lengthDifference = length(s2) - length(s1);
-
-        // If s1 is longer, then we need to expand the upper diagonal a bit.
-        if (lengthDifference < 0)
-            upperDiagonal -= lengthDifference;
-
+        int lowerDiagonal, upperDiagonal;
+        getPathBand(s1.length(), s2.length(), bandSize, &lowerDiagonal, &upperDiagonal);
         try {
             score = globalAlignment(alignment, scoringScheme, alignConfig, lowerDiagonal, upperDiagonal);
         }
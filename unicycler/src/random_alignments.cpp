@@ -26,29 +26,61 @@
 
 
 // This function runs a bunch of alignments between random sequences to get a mean and std dev of
-// the scaled scores. It return them in a C string (for Python).
+// the scaled scores. It return them in a C string (for Python). The alignments are split between
+// threads.
 char * getRandomSequenceAlignmentScores(int seqLength, int n,
-                                        int matchScore, int mismatchScore, int gapOpenScore, int gapExtensionScore) {
+                                        int matchScore, int mismatchScore, int gapOpenScore, int gapExtensionScore,
+                                        int threadCount) {
     std::vector<double> scores;
+    std::mutex mut;
+
+    threadCount = std::max(1, std::min(threadCount, n));
+    std::vector<std::thread *> threads;
+    int alignmentsPerThread = n / threadCount;
+    int alignmentsInFirstThread = n - (alignmentsPerThread * (threadCount - 1));
+    for (int i = 0; i < threadCount; ++i) {
+        int alignmentsThisThread;
+        if (i == 0)
+            alignmentsThisThread = alignmentsInFirstThread;
+        else
+            alignmentsThisThread = alignmentsPerThread;
+        std::thread * thread = new std::thread(getRandomSequenceAlignmentScoresOneThread, seqLength, alignmentsThisThread,
+                                               matchScore, mismatchScore, gapOpenScore, gapExtensionScore,
+                                               &scores, &mut);
+        threads.push_back(thread);
+    }
+    for (int i = 0; i < threadCount; ++i) {
+        threads[i]->join();
+        delete threads[i];
+    }
+
+    double mean = 0.0, stdev = 0.0;
+    getMeanAndStDev(scores, mean, stdev);
+    return cppStringToCString(std::to_string(mean) + "," + std::to_string(stdev));
+}
 
+void getRandomSequenceAlignmentScoresOneThread(int seqLength, int n,
+                                               int matchScore, int mismatchScore, int gapOpenScore, int gapExtensionScore,
+                                               std::vector<double> * scores, std::mutex * mut) {
     std::random_device rd;
     std::mt19937 gen(rd());
     std::uniform_int_distribution<int> dist(0, 3);
 
+    std::vector<double> threadScores;
     for (int i = 0; i < n; ++i) {
         std::string s1 = getRandomSequence(seqLength, gen, dist);
         std::string s2 = getRandomSequence(seqLength, gen, dist);
         ScoredAlignment * alignment = fullyGlobalAlignment(s1, s2, matchScore, mismatchScore, gapOpenScore, gapExtensionScore);
 
         if (alignment != 0) {
-            scores.push_back(alignment->m_scaledScore);
+            threadScores.push_back(alignment->m_scaledScore);
             delete alignment;
         }
     }
 
-    double mean = 0.0, stdev = 0.0;
-    getMeanAndStDev(scores, mean, stdev);
-    return cppStringToCString(std::to_string(mean) + "," + std::to_string(stdev));
+    mut->lock();
+    scores->insert(scores->end(), threadScores.begin(), threadScores.end());
+    mut->unlock();
 }
 
 // This function returns lots of information about random global alignments.
@@ -11,14 +11,33 @@
 
 #include "ref_seqs.h"
 
-SeqMap * newRefSeqs() {
-    return new SeqMap();
+
+// Adds a reference sequence. If a reference with the same name was already added, the first one
+// is kept.
+void RefSeqs::add(std::string const & name, std::string const & sequence) {
+    if (m_ids.find(name) != m_ids.end())
+        return;
+    m_ids.emplace(name, int(m_names.size()));
+    m_names.push_back(name);
+    m_sequences.push_back(sequence);
+}
+
+// Returns the ID of the reference with the given name, or -1 if there isn't one.
+int RefSeqs::getId(std::string const & name) const {
+    auto it = m_ids.find(name);
+    if (it == m_ids.end())
+        return -1;
+    return it->second;
+}
+
+RefSeqs * newRefSeqs() {
+    return new RefSeqs();
 }
 
-void addRefSeq(SeqMap * seqMap, char * nameC, char * sequenceC) {
-    seqMap->emplace(nameC, sequenceC);
+void addRefSeq(RefSeqs * refSeqs, char * nameC, char * sequenceC) {
+    refSeqs->add(nameC, sequenceC);
 }
 
-void deleteRefSeqs(SeqMap * seqMap) {
-    delete seqMap;
+void deleteRefSeqs(RefSeqs * refSeqs) {
+    delete refSeqs;
 }
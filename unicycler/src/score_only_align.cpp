@@ -0,0 +1,263 @@
+// Copyright 2017 Ryan Wick (rrwick@gmail.com)
+// https://github.com/rrwick/Unicycler
+
+// This file is part of Unicycler. Unicycler is free software: you can redistribute it and/or
+// modify it under the terms of the GNU General Public License as published by the Free Software
+// Foundation, either version 3 of the License, or (at your option) any later version. Unicycler is
+// distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+// implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+// Public License for more details. You should have received a copy of the GNU General Public
+// License along with Unicycler. If not, see <http://www.gnu.org/licenses/>.
+
+#include "score_only_align.h"
+
+#include <algorithm>
+#include <cstdlib>
+#include <limits>
+#include <vector>
+
+
+// Each DP cell holds a single 64-bit key: the score in the high bits minus the alignment length
+// (number of columns) in the low bits. Taking the max of keys therefore picks the best score and
+// breaks ties with the shortest alignment, with no extra comparisons.
+typedef long long ScoreKey;
+static const ScoreKey KEY_SCORE_UNIT = 1LL << 32;
+static const ScoreKey NEG_KEY = std::numeric_limits<ScoreKey>::min() / 4;
+
+
+static ScoreKey stepKey(int score) {
+    return ScoreKey(score) * KEY_SCORE_UNIT - 1;
+}
+
+
+static int keyToScore(ScoreKey key) {
+    ScoreKey x = key + KEY_SCORE_UNIT - 1;
+    ScoreKey score = x / KEY_SCORE_UNIT;
+    if (x % KEY_SCORE_UNIT != 0 && x < 0)
+        --score;
+    return int(score);
+}
+
+
+struct StepKeys {
+    StepKeys(int matchScore, int mismatchScore, int gapOpenScore, int gapExtensionScore) :
+        match(stepKey(matchScore)), mismatch(stepKey(mismatchScore)),
+        open(stepKey(gapOpenScore)), extend(stepKey(gapExtensionScore)) {}
+    ScoreKey match, mismatch, open, extend;
+};
+
+
+// Bases are compared as Dna5 (like the Seqan aligners), so anything other than A, C, G or T is an N
+// and N matches N.
+static void encodeSequence(std::string const & seq, std::vector<char> & codes) {
+    codes.resize(seq.size());
+    for (size_t i = 0; i < seq.size(); ++i) {
+        switch (seq[i]) {
+        case 'A': case 'a': codes[i] = 0; break;
+        case 'C': case 'c': codes[i] = 1; break;
+        case 'G': case 'g': codes[i] = 2; break;
+        case 'T': case 't': codes[i] = 3; break;
+        default: codes[i] = 4;
+        }
+    }
+}
+
+
+// The DP goes one row (s2 position) at a time. best[j] holds the best key for the cell in the
+// current row and column j (s1 position). vertical[j] holds the best key for that cell which ends
+// in a gap in s1. Cells which haven't yet entered the band hold NEG_KEY.
+static void startRows(int n, int upperDiagonal, StepKeys const & keys,
+                      std::vector<ScoreKey> & best, std::vector<ScoreKey> & vertical) {
+    best.assign(n + 1, NEG_KEY);
+    vertical.assign(n + 1, NEG_KEY);
+    best[0] = 0;
+    for (int j = 1; j <= std::min(n, upperDiagonal); ++j)
+        best[j] = keys.open + (j - 1) * keys.extend;
+}
+
+
+// Fills in row i of the DP, where base2 is the s2 base for that row. Returns the last column in
+// the band.
+static int alignRow(std::vector<char> const & codes1, char base2, int i,
+                    int lowerDiagonal, int upperDiagonal, StepKeys const & keys,
+                    std::vector<ScoreKey> & best, std::vector<ScoreKey> & vertical) {
+    int n = int(codes1.size());
+    int jStart = std::max(0, i + lowerDiagonal);
+    int jEnd = std::min(n, i + upperDiagonal);
+    ScoreKey diagonal = (jStart > 0) ? best[jStart - 1] : NEG_KEY;
+    ScoreKey left = NEG_KEY, horizontal = NEG_KEY;
+    for (int j = jStart; j <= jEnd; ++j) {
+        ScoreKey up = best[j];
+        vertical[j] = std::max(up + keys.open, vertical[j] + keys.extend);
+        ScoreKey cell = vertical[j];
+        if (j > 0) {
+            horizontal = std::max(left + keys.open, horizontal + keys.extend);
+            ScoreKey diagonalStep = (codes1[j - 1] == base2) ? keys.match : keys.mismatch;
+            cell = std::max(cell, std::max(horizontal, diagonal + diagonalStep));
+        }
+        diagonal = up;
+        best[j] = cell;
+        left = cell;
+    }
+    return jEnd;
+}
+
+
+AlignmentScore bandedGlobalAlignmentScore(std::string const & s1, std::string const & s2,
+                                          int matchScore, int mismatchScore,
+                                          int gapOpenScore, int gapExtensionScore,
+                                          bool freeEndGapsSeq2,
+                                          int lowerDiagonal, int upperDiagonal) {
+    // The buffers are thread-local so their memory can be reused between alignments.
+    static thread_local std::vector<char> codes1, codes2;
+    static thread_local std::vector<ScoreKey> best, vertical;
+    encodeSequence(s1, codes1);
+    encodeSequence(s2, codes2);
+    int n = int(s1.size()), m = int(s2.size());
+    StepKeys keys(matchScore, mismatchScore, gapOpenScore, gapExtensionScore);
+
+    startRows(n, upperDiagonal, keys, best, vertical);
+    ScoreKey endKey = NEG_KEY;
+    if (freeEndGapsSeq2 && n <= upperDiagonal)
+        endKey = best[n];
+    for (int i = 1; i <= m; ++i) {
+        int jEnd = alignRow(codes1, codes2[i - 1], i, lowerDiagonal, upperDiagonal, keys,
+                            best, vertical);
+        if (freeEndGapsSeq2 && jEnd == n)
+            endKey = std::max(endKey, best[n]);
+    }
+    if (!freeEndGapsSeq2)
+        endKey = best[n];
+
+    AlignmentScore result;
+    result.rawScore = keyToScore(endKey);
+    result.alignmentLength = int(ScoreKey(result.rawScore) * KEY_SCORE_UNIT - endKey);
+    int perfectScore = matchScore * result.alignmentLength;
+    int worstScore = mismatchScore * result.alignmentLength;
+    if (perfectScore > worstScore)
+        result.scaledScore = 100.0 * double(result.rawScore - worstScore) /
+                             double(perfectScore - worstScore);
+    return result;
+}
+
+
+// The band for a global alignment must be wide enough to reach the end of both sequences, so it is
+// expanded on one side when the sequences differ in length.
+void getFullyGlobalBand(int length1, int length2, int bandSize,
+                        int * lowerDiagonal, int * upperDiagonal) {
+    *lowerDiagonal = -bandSize;
+    *upperDiagonal = bandSize;
+    int lengthDifference = length2 - length1;
+
+    // If s2 is longer, then we need to expand the lower diagonal a bit.
+    if (lengthDifference > 0)
+        *lowerDiagonal -= lengthDifference;
+
+    // If s1 is longer, then we need to expand the upper diagonal a bit.
+    else if (lengthDifference < 0)
+        *upperDiagonal -= lengthDifference;
+}
+
+
+void loopAlignmentScores(char * readC, char * startC, char * repeatC, char * middleC, char * endC,
+                         int maxLoopCount,
+                         int matchScore, int mismatchScore, int gapOpenScore, int gapExtensionScore,
+                         int bandSize, int * rawScores) {
+    std::string read(readC), startSeq(startC), repeatSeq(repeatC), middleSeq(middleC);
+    std::string endSeq(endC);
+    StepKeys keys(matchScore, mismatchScore, gapOpenScore, gapExtensionScore);
+    int n = int(read.size());
+    int unitLength = int(middleSeq.size() + repeatSeq.size());
+
+    // The forward pass aligns the read to start + repeat + (middle + repeat) * maxLoopCount, taking
+    // a copy of the band at the end of each loop. Each copy holds the best scores for aligning the
+    // start of the read to the test sequence (minus the end segment) for that loop count.
+    std::vector<char> readCodes, prefixCodes;
+    encodeSequence(read, readCodes);
+    std::string prefix = startSeq + repeatSeq;
+    for (int k = 0; k < maxLoopCount; ++k)
+        prefix += middleSeq + repeatSeq;
+    encodeSequence(prefix, prefixCodes);
+
+    std::vector<ScoreKey> best, vertical;
+    std::vector<int> loopEnds, windowStarts;
+    std::vector<std::vector<ScoreKey> > windows(maxLoopCount + 1);
+    for (int k = 0; k <= maxLoopCount; ++k)
+        loopEnds.push_back(int(startSeq.size() + repeatSeq.size()) + k * unitLength);
+    windowStarts.resize(maxLoopCount + 1);
+
+    // Like in the fullyGlobalAlignment function, the band is expanded on one side by the length
+    // difference between the read and the test sequence, using the loop count with the closest
+    // length to the read.
+    int closestLengthDifference = std::numeric_limits<int>::max();
+    for (int k = 0; k <= maxLoopCount; ++k) {
+        int lengthDifference = loopEnds[k] + int(endSeq.size()) - n;
+        if (std::abs(lengthDifference) < std::abs(closestLengthDifference))
+            closestLengthDifference = lengthDifference;
+    }
+    int lowerDiagonal, upperDiagonal;
+    getFullyGlobalBand(n, n + closestLengthDifference, bandSize, &lowerDiagonal, &upperDiagonal);
+
+    startRows(n, upperDiagonal, keys, best, vertical);
+    int k = 0;
+    for (int i = 0; i <= int(prefix.size()) && i <= n - lowerDiagonal; ++i) {
+        if (i > 0)
+            alignRow(readCodes, prefixCodes[i - 1], i, lowerDiagonal, upperDiagonal, keys,
+                     best, vertical);
+        for (; k <= maxLoopCount && loopEnds[k] == i; ++k) {
+            windowStarts[k] = std::max(0, i + lowerDiagonal);
+            int windowEnd = std::min(n, i + upperDiagonal);
+            if (windowStarts[k] <= windowEnd)
+                windows[k].assign(best.begin() + windowStarts[k], best.begin() + windowEnd + 1);
+        }
+    }
+
+    // The backward pass aligns the end of the read to the end segment (both reversed), giving
+    // the best score for aligning each read suffix in the band to the whole end segment.
+    std::string readRev(read.rbegin(), read.rend()), endRev(endSeq.rbegin(), endSeq.rend());
+    std::vector<char> readRevCodes, endRevCodes;
+    encodeSequence(readRev, readRevCodes);
+    encodeSequence(endRev, endRevCodes);
+    startRows(n, upperDiagonal, keys, best, vertical);
+    for (int i = 1; i <= int(endRev.size()); ++i)
+        alignRow(readRevCodes, endRevCodes[i - 1], i, lowerDiagonal, upperDiagonal, keys,
+                 best, vertical);
+    int suffixStart = std::max(0, n - int(endRev.size()) - upperDiagonal);
+    int suffixEnd = std::min(n, n - int(endRev.size()) - lowerDiagonal);
+    std::vector<ScoreKey> suffixKeys;
+    for (int j = suffixStart; j <= suffixEnd; ++j)
+        suffixKeys.push_back(best[n - j]);
+
+    // Joining the two passes gives the score for each loop count, allowing a gap in the read where
+    // they join (for when the read has more loops than the test sequence).
+    int negScore = keyToScore(NEG_KEY);
+    std::vector<int> joinedScores(maxLoopCount + 1, negScore);
+    for (k = 0; k <= maxLoopCount; ++k) {
+        for (size_t w = 0; w < windows[k].size(); ++w) {
+            if (windows[k][w] <= NEG_KEY / 2)
+                continue;
+            int prefixScore = keyToScore(windows[k][w]);
+            int j = windowStarts[k] + int(w);
+            for (int j2 = std::max(j, suffixStart); j2 <= suffixEnd; ++j2) {
+                ScoreKey suffixKey = suffixKeys[j2 - suffixStart];
+                if (suffixKey <= NEG_KEY / 2)
+                    continue;
+                int score = prefixScore + keyToScore(suffixKey);
+                if (j2 > j)
+                    score += gapOpenScore + (j2 - j - 1) * gapExtensionScore;
+                joinedScores[k] = std::max(joinedScores[k], score);
+            }
+        }
+    }
+
+    // Since the loops are identical, a test sequence with more loops than the read can be aligned
+    // as one with fewer loops and the extra loops as a single gap.
+    for (k = 0; k <= maxLoopCount; ++k) {
+        rawScores[k] = joinedScores[k];
+        for (int fewer = 0; fewer < k; ++fewer) {
+            int gapLength = (k - fewer) * unitLength;
+            int score = joinedScores[fewer] + gapOpenScore + (gapLength - 1) * gapExtensionScore;
+            rawScores[k] = std::max(rawScores[k], score);
+        }
+    }
+}
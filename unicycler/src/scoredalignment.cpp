@@ -20,7 +20,9 @@ ScoredAlignment::ScoredAlignment(Align<Dna5String, ArrayGaps> & alignment,
                                  bool startImmediately, bool goToEndSeq1, bool goToEndSeq2,
                                  Score<int, Simple> & scoringScheme):
     m_readName(readName), m_refName(refName), m_readLength(readLength), m_refLength(refLength),
-    m_readStartPos(-1), m_refStartPos(-1), m_rawScore(0), m_bandSize(bandSize)
+    m_readStartPos(-1), m_refStartPos(-1), m_rawScore(0),
+    m_matchCount(0), m_mismatchCount(0), m_insertionCount(0), m_deletionCount(0),
+    m_bandSize(bandSize)
 {
     // Extract the alignment sequences into C++ strings for constant time random access.
     std::ostringstream stream1;
@@ -106,7 +108,7 @@ ScoredAlignment::ScoredAlignment(Align<Dna5String, ArrayGaps> & alignment,
     cigarTypes.push_back(currentCigarType);
     cigarLengths.push_back(currentCigarLength);
 
-    // Build the CIGAR string and tally up the score.
+    // Build the CIGAR string and tally up the score and edit counts.
     m_cigar = "";
     int alignmentPos = 0;
     for (size_t i = 0; i < cigarTypes.size(); ++i) {
@@ -115,7 +117,8 @@ ScoredAlignment::ScoredAlignment(Align<Dna5String, ArrayGaps> & alignment,
 
         std::string cigarPart = getCigarPart(type, length);
         m_cigar += cigarPart;
-        int score = getCigarScore(type, length, scoringScheme, readAlignment, refAlignment, alignmentPos);
+        int score = scoreAndCountCigarPart(type, length, scoringScheme, readAlignment, refAlignment,
+                                           alignmentPos);
         m_rawScore += score;
         alignmentPos += length;
     }
@@ -152,7 +155,21 @@ std::string ScoredAlignment::getFullString() {
            std::to_string(m_rawScore) + "," +
            std::to_string(m_scaledScore) + "," +
            std::to_string(m_milliseconds) + "," +
-           m_cigar;
+           m_cigar + "," +
+           std::to_string(m_matchCount) + "," +
+           std::to_string(m_mismatchCount) + "," +
+           std::to_string(m_insertionCount) + "," +
+           std::to_string(m_deletionCount);
+}
+
+
+// Returns true if the other alignment places the read in the same spot with the same CIGAR, i.e.
+// the two are identical apart from how long they took to make.
+bool ScoredAlignment::isSameAlignment(ScoredAlignment * other) {
+    return m_readName == other->m_readName && m_refName == other->m_refName &&
+           m_readStartPos == other->m_readStartPos && m_readEndPos == other->m_readEndPos &&
+           m_refStartPos == other->m_refStartPos && m_refEndPos == other->m_refEndPos &&
+           m_cigar == other->m_cigar;
 }
 
 
@@ -200,26 +217,33 @@ std::string ScoredAlignment::getCigarPart(CigarType type, int length) {
 }
 
 
-int ScoredAlignment::getCigarScore(CigarType type, int length, Score<int, Simple> & scoringScheme,
-                                       std::string & readAlignment, std::string & refAlignment,
-                                       int alignmentPos) {
+// Returns the score for one part of the CIGAR and adds its bases to the match, mismatch,
+// insertion and deletion counts.
+int ScoredAlignment::scoreAndCountCigarPart(CigarType type, int length,
+                                            Score<int, Simple> & scoringScheme,
+                                            std::string & readAlignment, std::string & refAlignment,
+                                            int alignmentPos) {
 
     // Scoring indels is easy because we only need to know the length.
-    if (type == INSERTION || type == DELETION)
+    if (type == INSERTION || type == DELETION) {
+        if (type == INSERTION)
+            m_insertionCount += length;
+        else
+            m_deletionCount += length;
         return scoreGapOpen(scoringScheme) + ((length - 1) * scoreGapExtend(scoringScheme));
+    }
 
     // To score matches we must actually look at the bases.
     else if (type == MATCH) {
-        int score = 0;
+        int matches = 0;
         for (int i = 0; i < length; ++i) {
             int pos = alignmentPos + i;
-            bool match = (readAlignment[pos] == refAlignment[pos]);
-            if (match)
-                score += scoreMatch(scoringScheme);
-            else
-                score += scoreMismatch(scoringScheme);
+            if (readAlignment[pos] == refAlignment[pos])
+                ++matches;
         }
-        return score;
+        m_matchCount += matches;
+        m_mismatchCount += length - matches;
+        return matches * scoreMatch(scoringScheme) + (length - matches) * scoreMismatch(scoringScheme);
     }
     return 0;
 }
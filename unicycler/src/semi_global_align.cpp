@@ -22,26 +22,16 @@
 
 
 char * semiGlobalAlignment(char * readNameC, char * readSeqC, int verbosity,
-                           char * minimapAlignmentsStr, SeqMap * refSeqs,
+                           char * minimapAlignmentsStr, RefSeqs * refSeqs,
                            int matchScore, int mismatchScore, int gapOpenScore,
-                           int gapExtensionScore, double /*lowScoreThreshold*/, bool /*returnBad*/,
+                           int gapExtensionScore, double lowScoreThreshold, bool /*returnBad*/,
                            int sensitivityLevel) {
-    int kSize = LEVEL_0_KMER_SIZE;
-    if (sensitivityLevel == 1)
-        kSize = LEVEL_1_KMER_SIZE;
-    else if (sensitivityLevel == 2)
-        kSize = LEVEL_2_KMER_SIZE;
-    else if (sensitivityLevel == 3)
-        kSize = LEVEL_3_KMER_SIZE;
-
     std::string output;
     std::string returnString;
     std::vector<ScoredAlignment *> returnedAlignments;
 
     // Change the read name and sequence to C++ strings.
     std::string readName(readNameC);
-    std::string posReadName = readName + "+";
-    std::string negReadName = readName + "-";
     std::string posReadSeq(readSeqC);
     std::string negReadSeq;  // Will make later, if necessary.
     int readLength = int(posReadSeq.length());
@@ -57,8 +47,7 @@ char * semiGlobalAlignment(char * readNameC, char * readSeqC, int verbosity,
 
     // For each minimap alignment we find the appropriate part of the reference sequence.
     RefRangeMap refRanges;
-    for (size_t i = 0; i < minimapAlignments.size(); ++i) {
-        std::string minimapStr = minimapAlignments[i];
+    for (auto const & minimapStr : minimapAlignments) {
         std::vector<std::string> minimapStrParts = splitString(minimapStr, ',');
 
         int readStart = std::stoi(minimapStrParts[0]);
@@ -66,78 +55,99 @@ char * semiGlobalAlignment(char * readNameC, char * readSeqC, int verbosity,
         char readStrand = minimapStrParts[2][0];
         bool posStrand = readStrand == '+';
 
-        std::string refName = minimapStrParts[3];
+        int refId = refSeqs->getId(minimapStrParts[3]);
+        if (refId < 0)
+            continue;
         int refStart = std::stoi(minimapStrParts[4]);
         int refEnd = std::stoi(minimapStrParts[5]);
-        std::string & refSeq = refSeqs->at(refName);
-        int refLength = int(refSeq.length());
+        int refLength = int(refSeqs->getSequence(refId).length());
 
         StartEndRange refRange = getRefRange(refStart, refEnd, refLength, readStart, readEnd,
                                              readLength, posStrand);
-
-        // The first time we see the reference/strand, initialise it with an empty vector.
-        std::string refNameAndStrand = refName + readStrand;
-        if (refRanges.find(refNameAndStrand) == refRanges.end())
-            refRanges[refNameAndStrand] = std::vector<StartEndRange>();
-
-        refRanges[refNameAndStrand].push_back(refRange);
+        refRanges[RefIdAndStrand(refId, readStrand)].push_back(refRange);
     }
 
     // Simplify the reference ranges by combining overlapping ranges.
-    RefRangeMap simplifiedRefRanges;
-    for(auto const & r : refRanges) {
-        std::string refNameAndStrand = r.first;
-        std::vector<StartEndRange> ranges = r.second;
-        std::vector<StartEndRange> simplifiedRanges = simplifyRanges(ranges);
-        simplifiedRefRanges[refNameAndStrand] = simplifiedRanges;
-    }
+    for (auto & r : refRanges)
+        r.second = simplifyRanges(r.second);
     if (verbosity > 2)
-        displayRefRanges(output, simplifiedRefRanges);
-
-    // Make a new KmerPositions object for the read. We'll actually add positions later as
-    // necessary (because we may not need both the positive strand or the negative strand).
-    KmerPositions readKmerPositions;
-    bool posPositions = false, negPositions = false;
-
-    // Align to each reference range.
-    for(auto const & r : simplifiedRefRanges) {
-        std::string refName = r.first;
-        char readStrand = refName.back();
-        bool posStrand = readStrand == '+';
-        refName.pop_back();
-        std::string & refSeq = refSeqs->at(refName);
-        int refLength = int(refSeq.length());
-        std::vector<StartEndRange> ranges = r.second;
-
-        // Prepare some stuff for the read.
-        std::string * readSeq;
-        KmerPosMap * kmerPositions;
-        if (posStrand) {
-            if (!posPositions) {
-                readKmerPositions.addPositions(posReadName, posReadSeq, kSize);
-                posPositions = true;
+        displayRefRanges(output, refRanges, refSeqs);
+
+    // Each reference range gets its own common k-mers, which are kept between sensitivity levels
+    // so they only need to be found again when the k-mer size changes.
+    std::vector<std::pair<RefIdAndStrand, StartEndRange> > allRanges;
+    for (auto const & r : refRanges) {
+        for (auto const & range : r.second)
+            allRanges.emplace_back(r.first, range);
+    }
+    std::vector<RangeSeeds> allRangeSeeds(allRanges.size());
+    std::vector<bool> rangeAligned(allRanges.size(), false);
+
+    // The read's k-mer indices are built later as necessary (because we may not need both the
+    // positive strand or the negative strand). They and the other alignment buffers are
+    // thread-local so their memory can be reused from one read to the next.
+    static thread_local KmerIndex posReadKmers, negReadKmers;
+    static thread_local AlignmentScratch scratch;
+    int posIndexKSize = 0, negIndexKSize = 0;
+
+    // Every range is first aligned at sensitivity level 0. Ranges which don't get a good alignment
+    // (one which meets the low score threshold) are tried again at each higher level, up to the
+    // requested sensitivity.
+    for (int level = 0; level <= sensitivityLevel; ++level) {
+        int kSize = getKmerSize(level);
+        for (size_t i = 0; i < allRanges.size(); ++i) {
+            if (rangeAligned[i])
+                continue;
+            int refId = allRanges[i].first.first;
+            char readStrand = allRanges[i].first.second;
+            bool posStrand = readStrand == '+';
+
+            // Prepare some stuff for the read.
+            std::string * readSeq;
+            KmerIndex * readKmers;
+            if (posStrand) {
+                if (posIndexKSize != kSize) {
+                    posReadKmers.build(posReadSeq, kSize);
+                    posIndexKSize = kSize;
+                }
+                readSeq = &posReadSeq;
+                readKmers = &posReadKmers;
             }
-            readSeq = &posReadSeq;
-            kmerPositions = readKmerPositions.getKmerPositions(posReadName);
-        }
-        else {  // negative strand
-            if (!negPositions) {
-                negReadSeq = getReverseComplement(posReadSeq);
-                readKmerPositions.addPositions(negReadName, negReadSeq, kSize);
-                negPositions = true;
+            else {  // negative strand
+                if (negReadSeq.empty())
+                    negReadSeq = getReverseComplement(posReadSeq);
+                if (negIndexKSize != kSize) {
+                    negReadKmers.build(negReadSeq, kSize);
+                    negIndexKSize = kSize;
+                }
+                readSeq = &negReadSeq;
+                readKmers = &negReadKmers;
             }
-            readSeq = &negReadSeq;
-            kmerPositions = readKmerPositions.getKmerPositions(negReadName);
-        }
 
-        // Work on each range (there's probably just one, but there could be more).
-        for (auto const & range : ranges) {
+            if (verbosity > 2)
+                output += "Sensitivity level " + std::to_string(level) + ":\n";
             std::vector<ScoredAlignment *> a =
-                alignReadToReferenceRange(refSeqs, refName, range, refLength, readName, readStrand,
-                                          kmerPositions, kSize, readSeq, matchScore, mismatchScore,
-                                          gapOpenScore, gapExtensionScore, sensitivityLevel,
-                                          verbosity, output);
-            returnedAlignments.insert(returnedAlignments.end(), a.begin(), a.end());
+                alignReadToReferenceRange(refSeqs, refId, allRanges[i].second, readName,
+                                          readStrand, readKmers, allRangeSeeds[i], kSize, readSeq,
+                                          matchScore, mismatchScore, gapOpenScore,
+                                          gapExtensionScore, level, verbosity, output, scratch);
+
+            // Alignments found again at a higher level are only returned once.
+            for (auto const & alignment : a) {
+                if (alignment->m_scaledScore >= lowScoreThreshold)
+                    rangeAligned[i] = true;
+                bool duplicate = false;
+                for (auto const & existing : returnedAlignments) {
+                    if (existing->isSameAlignment(alignment)) {
+                        duplicate = true;
+                        break;
+                    }
+                }
+                if (duplicate)
+                    delete alignment;
+                else
+                    returnedAlignments.push_back(alignment);
+            }
         }
     }
 
@@ -146,6 +156,7 @@ char * semiGlobalAlignment(char * readNameC, char * readSeqC, int verbosity,
     for (auto const & alignment : returnedAlignments) {
         if (alignment != 0)
             returnString += alignment->getFullString() + ";";
+        delete alignment;
     }
     returnString += output;
 
@@ -153,15 +164,28 @@ char * semiGlobalAlignment(char * readNameC, char * readSeqC, int verbosity,
 }
 
 
-std::vector<ScoredAlignment *> alignReadToReferenceRange(SeqMap * refSeqs, std::string refName,
-                                                         StartEndRange refRange, int refLen,
-                                                         std::string readName, char readStrand,
-                                                         KmerPosMap * kmerPositions, int kSize,
+int getKmerSize(int sensitivityLevel) {
+    if (sensitivityLevel == 1)
+        return LEVEL_1_KMER_SIZE;
+    else if (sensitivityLevel == 2)
+        return LEVEL_2_KMER_SIZE;
+    else if (sensitivityLevel == 3)
+        return LEVEL_3_KMER_SIZE;
+    return LEVEL_0_KMER_SIZE;
+}
+
+
+std::vector<ScoredAlignment *> alignReadToReferenceRange(RefSeqs * refSeqs, int refId,
+                                                         StartEndRange refRange,
+                                                         std::string & readName, char readStrand,
+                                                         KmerIndex * readKmers,
+                                                         RangeSeeds & rangeSeeds, int kSize,
                                                          std::string * readSeq, int matchScore,
                                                          int mismatchScore, int gapOpenScore,
                                                          int gapExtensionScore,
-                                                         int sensitivityLevel,
-                                                         int verbosity, std::string & output) {
+                                                         int sensitivityLevel, int verbosity,
+                                                         std::string & output,
+                                                         AlignmentScratch & scratch) {
     long long startTime = getTime();
 
     // Set parameters based on the sensitivity level.
@@ -184,41 +208,47 @@ std::vector<ScoredAlignment *> alignReadToReferenceRange(SeqMap * refSeqs, std::
         maxLineTraceCount = LEVEL_3_MAX_LINE_TRACE_COUNT;
     }
 
-    // Extract the part of the reference to which we're aligning the read.
+    // Get the part of the reference to which we're aligning the read. This is a view into the
+    // reference sequence, not a copy.
+    std::string refName = refSeqs->getName(refId);
+    std::string const & refSeq = refSeqs->getSequence(refId);
+    int refLen = int(refSeq.length());
     int refStart = refRange.first;
     int refEnd = refRange.second;
     int readLen = int(readSeq->length());
-    std::string trimmedRefSeq = refSeqs->at(refName).substr(size_t(refStart),
-                                                            size_t(refEnd - refStart));
-    int trimmedRefLen = int(trimmedRefSeq.length());
+    char const * trimmedRefSeq = refSeq.data() + refStart;
+    int trimmedRefLen = refEnd - refStart;
     if (verbosity > 2)
         output += "Range: " + refName + ": " + std::to_string(refStart) + " - " + std::to_string(refEnd) + "\n";
 
-    // Find all common k-mer positions.
-    std::vector<CommonKmer> commonKmers;
-    int maxI = trimmedRefLen - kSize + 1;
-    for (int i = 0; i < maxI; ++i) {
-        std::string refKmer = trimmedRefSeq.substr(size_t(i), size_t(kSize));
-        if (kmerPositions->find(refKmer) != kmerPositions->end() ) {  // if k-mer is in the read
-            std::vector<int> & readPositions = kmerPositions->at(refKmer);
-            for (size_t j = 0; j < readPositions.size(); ++j)
-                commonKmers.emplace_back(readPositions[j], i);
-        }
+    // Find all common k-mer positions (unless a lower sensitivity level already found them).
+    std::vector<CommonKmer> & commonKmers = rangeSeeds.commonKmers;
+    if (rangeSeeds.kSize != kSize) {
+        commonKmers.clear();
+        readKmers->findCommonKmers(trimmedRefSeq, trimmedRefLen, commonKmers);
+        rangeSeeds.kSize = kSize;
     }
     if (verbosity > 2)
         output += "    common " + std::to_string(kSize) + "-mers: " + std::to_string(commonKmers.size()) + "\n";
     if (verbosity > 3)
         saveCommonKmersToFile(readName, readStrand, refName, commonKmers, output);
 
-    // Build a nanoflann point cloud with all of the common k-mer points.
-    PointSet usedPoints;
-    PointCloud cloud;
-    addKmerPointsToNanoflann(cloud, commonKmers, usedPoints);
-    my_kd_tree_t index(2, cloud, KDTreeSingleIndexAdaptorParams(10));
-    index.buildIndex();
+    std::vector<ScoredAlignment *> alignments;
+    if (commonKmers.empty())
+        return alignments;
 
-    // Use nanoflann and line tracing to get a set of common k-mer positions around a line.
-    std::vector<PointSet> goodPointSets;
+    // Index the common k-mer points and score each one's density, which is kept up to date as the
+    // line traces use points.
+    scratch.pointIndex.build(commonKmers, readLen);
+    int pointCount = int(commonKmers.size());
+    scratch.usedPoints.assign(pointCount, false);
+    scratch.usedPointCount = 0;
+    scratch.inPointSet.assign(pointCount, false);
+    scratch.nearLine.assign(pointCount, false);
+    setPointDensities(scratch);
+
+    // Use line tracing to get a set of common k-mer positions around a line.
+    std::vector<PointVector> goodPointSets;
     std::vector<int> goodLineNums;
     double bestPointScore = 0.0;
     int maxLineNum = 0;
@@ -226,10 +256,9 @@ std::vector<ScoredAlignment *> alignReadToReferenceRange(SeqMap * refSeqs, std::
         maxLineNum = lineNum;
         bool failedLine = false;
         double pointSetScore = 0.0;
-        PointSet pointSet = lineTracingWithNanoflann(commonKmers, usedPoints, cloud, index,
-                                                     readName, readStrand, readSeq, readLen,
-                                                     refName, trimmedRefSeq, lineNum, verbosity,
-                                                     output, failedLine, pointSetScore);
+        PointVector pointSet = traceLine(scratch, readName, readStrand, readLen, refName,
+                                         trimmedRefLen, lineNum, verbosity, output, failedLine,
+                                         pointSetScore);
         if (pointSetScore > bestPointScore)
             bestPointScore = pointSetScore;
 
@@ -248,27 +277,22 @@ std::vector<ScoredAlignment *> alignReadToReferenceRange(SeqMap * refSeqs, std::
             break;
 
         // If we've used all the points, we can't do another line!
-        if (usedPoints.size() >= commonKmers.size())
+        if (scratch.usedPointCount >= pointCount)
             break;
     }
 
-    std::vector<ScoredAlignment *> alignments;
     if (goodPointSets.size() == 0)
         return alignments;
 
     for (size_t i = 0; i < goodPointSets.size(); ++i) {
-        PointSet const & goodPointSet = goodPointSets[i];
+        PointVector & goodPointSet = goodPointSets[i];
         int goodLineNum = goodLineNums[i];
 
         // Now add the points to Seqan and get a global chain so we can do a banded alignment. We
         // sort them first so they're added in a consistent order.
         String<TSeed> seeds;
-        PointVector goodPointSetVector;
-        goodPointSetVector.reserve(goodPointSet.size());
+        std::sort(goodPointSet.begin(), goodPointSet.end());
         for (auto const &p : goodPointSet)
-            goodPointSetVector.push_back(p);
-        std::sort(goodPointSetVector.begin(), goodPointSetVector.end());
-        for (auto const &p : goodPointSetVector)
             appendValue(seeds, TSeed(size_t(p.x), size_t(p.y), size_t(kSize)));
         TSeedSet seedSet;
         for (unsigned i = 0; i < length(seeds); ++i) {
@@ -294,7 +318,7 @@ std::vector<ScoredAlignment *> alignReadToReferenceRange(SeqMap * refSeqs, std::
         Align<Dna5String, ArrayGaps> alignment;
         resize(rows(alignment), 2);
         assignSource(row(alignment, 0), *readSeq);
-        assignSource(row(alignment, 1), trimmedRefSeq);
+        assignSource(row(alignment, 1), infix(refSeq, refStart, refEnd));
         AlignConfig<true, true, true, true> alignConfig;
         Score<int, Simple> scoringScheme(matchScore, mismatchScore, gapExtensionScore,
                                          gapOpenScore);
@@ -347,67 +371,60 @@ long long getMaxSeedChainGapArea(String<TSeed> & seedChain, int readLen, int tri
 }
 
 
-PointSet lineTracingWithNanoflann(std::vector<CommonKmer> & commonKmers, PointSet & usedPoints,
-                                  PointCloud & cloud, my_kd_tree_t & index, std::string readName,
-                                  char readStrand, std::string * readSeq, int readLen,
-                                  std::string refName, std::string & trimmedRefSeq, int lineNum,
-                                  int verbosity, std::string & output, bool & failedLine,
-                                  double & pointSetScore) {
-
-    // First find the highest density point in the region, which we will use to start the trace.
-    PointCloud startingPointCloud;
-    addKmerPointsToNanoflann(startingPointCloud, commonKmers, usedPoints);
-    my_kd_tree_t startingPointIndex(2, startingPointCloud, KDTreeSingleIndexAdaptorParams(10));
-    startingPointIndex.buildIndex();
-    Point startPoint = getHighestDensityPoint(LINE_TRACING_START_POINT_SEARCH_RADIUS,
-                                              startingPointCloud, startingPointIndex,
-                                              trimmedRefSeq, readSeq);
+PointVector traceLine(AlignmentScratch & scratch, std::string & readName, char readStrand,
+                      int readLen, std::string & refName, int trimmedRefLen, int lineNum,
+                      int verbosity, std::string & output, bool & failedLine,
+                      double & pointSetScore) {
+    PointIndex & pointIndex = scratch.pointIndex;
+
+    // First find the highest density unused point, which we will use to start the trace.
+    Point startPoint = pointIndex.pts[getHighestDensityPoint(scratch)];
     Point p = startPoint;
     PointVector traceDots;
     traceDots.push_back(p);
 
     // Start the point collection using points around the starting point.
-    PointVector nearbyPoints = radiusSearchAroundPoint(p, TRACE_LINE_COLLECTION_DISTANCE, cloud,
-                                                       index);
-    PointSet pointSet(nearbyPoints.begin(), nearbyPoints.end());
+    std::vector<int> & pointSet = scratch.pointSet;
+    pointSet.clear();
+    pointIndex.radiusSearch(p, int(TRACE_LINE_COLLECTION_DISTANCE), scratch.radiusMatches);
+    for (auto const & id : scratch.radiusMatches)
+        addPointToSet(id, pointSet, scratch.inPointSet);
 
     // Trace the line forward then backward.
     int directions[2] = {1, -1};
     for (auto const & direction : directions) {
         p = startPoint;
-//        std::cout << "  starting point: " << p.x << "," << p.y << "\n" << std::flush;  // TEMP
         int maxX = readLen;
-        int maxY = int(trimmedRefSeq.length());
+        int maxY = trimmedRefLen;
         while (true) {
             int step = direction * TRACE_LINE_STEP_DISTANCE;
             Point previousP = p;
             Point newP(p.x + step, p.y + step);
-//            std::cout << "  stepped point: " << newP.x << "," << newP.y << "\n" << std::flush;  // TEMP
 
             bool leftAlignmentRectangle = false;
             if (direction == 1 && (newP.x > maxX || newP.y > maxY))
                 leftAlignmentRectangle = true;
             if (direction == -1 && (newP.x < 0 || newP.y < 0))
                 leftAlignmentRectangle = true;
-//            std::cout << "  leftAlignmentRectangle: " << leftAlignmentRectangle << "\n" << std::flush;  // TEMP
-
-            PointSet pointsNearLine;
-            p = mutateLineToBestFitPoints(previousP, newP, cloud, index, pointsNearLine, leftAlignmentRectangle);
-//            std::cout << "  mutated point: " << p.x << "," << p.y << "\n" << std::flush;  // TEMP
 
+            p = mutateLineToBestFitPoints(previousP, newP, scratch, leftAlignmentRectangle);
             traceDots.push_back(p);
-            addPointsNearLine(previousP, p, pointsNearLine, pointSet,
-                              TRACE_LINE_COLLECTION_DISTANCE);
+            addPointsNearLine(previousP, p, scratch, TRACE_LINE_COLLECTION_DISTANCE);
 
             if (leftAlignmentRectangle)
                 break;
         }
     }
-    pointSetScore = scorePointSet(pointSet, traceDots, failedLine);
+
+    PointVector points;
+    points.reserve(pointSet.size());
+    for (auto const & id : pointSet)
+        points.push_back(pointIndex.pts[id]);
+    pointSetScore = scorePointSet(points, traceDots, failedLine);
 
     if (verbosity > 2) {
         output += "    line " + std::to_string(lineNum + 1) + ": ";
-        output += std::to_string(pointSet.size()) + " points, ";
+        output += std::to_string(points.size()) + " points, ";
         output += "score=" + std::to_string(pointSetScore) + " (";
         if (failedLine)
             output += "bad";
@@ -416,14 +433,17 @@ PointSet lineTracingWithNanoflann(std::vector<CommonKmer> & commonKmers, PointSe
         output += ")\n";
     }
     if (verbosity > 3)
-        saveTraceDotsToFile(readName, readStrand, refName, traceDots, pointSet, output, lineNum);
+        saveTraceDotsToFile(readName, readStrand, refName, traceDots, points, output, lineNum);
 
     // Set the points in the point set as 'used' so they are excluded from future starting points
     // (to ensure that subsequent line traces begin from a sufficiently different location).
-    for (auto const & p : pointSet)
-        usedPoints.insert(p);
+    for (auto const & id : pointSet) {
+        scratch.inPointSet[id] = false;
+        if (!scratch.usedPoints[id])
+            setPointUsed(id, scratch);
+    }
 
-    return pointSet;
+    return points;
 }
 
 
@@ -441,23 +461,33 @@ Point shiftPointDown(Point p, int steps) {
 }
 
 
-Point mutateLineToBestFitPoints(Point p1, Point p2, PointCloud & cloud, my_kd_tree_t & index,
-                                PointSet & pointsNearLine, bool leftAlignmentRectangle) {
-
+// Moves p2 (perpendicular to the diagonal) to the position which gives the best scoring line
+// segment from p1. The points within reach of the segment are left in the scratch's
+// pointsNearLine.
+Point mutateLineToBestFitPoints(Point p1, Point p2, AlignmentScratch & scratch,
+                                bool leftAlignmentRectangle) {
+    PointIndex & pointIndex = scratch.pointIndex;
+    std::vector<int> & pointsNearLine = scratch.pointsNearLine;
+    pointsNearLine.clear();
     int radius = int(TRACE_LINE_STEP_DISTANCE * 1.1);
-    PointVector pointsNearP1 = radiusSearchAroundPoint(p1, radius, cloud, index);
-    PointVector pointsNearP2 = radiusSearchAroundPoint(p2, radius, cloud, index);
-    pointsNearLine.insert(pointsNearP1.begin(), pointsNearP1.end());
-    pointsNearLine.insert(pointsNearP2.begin(), pointsNearP2.end());
+    pointIndex.radiusSearch(p1, radius, scratch.radiusMatches);
+    for (auto const & id : scratch.radiusMatches)
+        addPointToSet(id, pointsNearLine, scratch.nearLine);
+    pointIndex.radiusSearch(p2, radius, scratch.radiusMatches);
+    for (auto const & id : scratch.radiusMatches)
+        addPointToSet(id, pointsNearLine, scratch.nearLine);
+    for (auto const & id : pointsNearLine)
+        scratch.nearLine[id] = false;
 
     if (leftAlignmentRectangle)
         return p2;
 
     Point p2Up = shiftPointUp(p2, TRACE_LINE_MUTATION_SIZE);
     Point p2Down = shiftPointDown(p2, TRACE_LINE_MUTATION_SIZE);
-    double unmutatedScore = scoreLineSegment(p1, p2, pointsNearLine);
-    double mutatedUpScore = scoreLineSegment(p1, p2Up, pointsNearLine);
-    double mutatedDownScore = scoreLineSegment(p1, p2Down, pointsNearLine);
+    PointVector const & pts = pointIndex.pts;
+    double unmutatedScore = scoreLineSegment(p1, p2, pointsNearLine, pts);
+    double mutatedUpScore = scoreLineSegment(p1, p2Up, pointsNearLine, pts);
+    double mutatedDownScore = scoreLineSegment(p1, p2Down, pointsNearLine, pts);
 
     while (true) {
         // If neither mutation helps, then we're done!
@@ -470,7 +500,7 @@ Point mutateLineToBestFitPoints(Point p1, Point p2, PointCloud & cloud, my_kd_tr
             p2 = p2Up;
             unmutatedScore = mutatedUpScore;
             p2Up = shiftPointUp(p2, TRACE_LINE_MUTATION_SIZE);
-            mutatedUpScore = scoreLineSegment(p1, p2Up, pointsNearLine);
+            mutatedUpScore = scoreLineSegment(p1, p2Up, pointsNearLine, pts);
         }
 
         else if (mutatedDownScore > unmutatedScore) {
@@ -479,7 +509,7 @@ Point mutateLineToBestFitPoints(Point p1, Point p2, PointCloud & cloud, my_kd_tr
             p2 = p2Down;
             unmutatedScore = mutatedDownScore;
             p2Down = shiftPointDown(p2, TRACE_LINE_MUTATION_SIZE);
-            mutatedDownScore = scoreLineSegment(p1, p2Down, pointsNearLine);
+            mutatedDownScore = scoreLineSegment(p1, p2Down, pointsNearLine, pts);
         }
     }
     return p2;
@@ -488,7 +518,8 @@ Point mutateLineToBestFitPoints(Point p1, Point p2, PointCloud & cloud, my_kd_tr
 
 // Line segments are scored on two fronts: their slope (closer to 1 is better) and the closeness
 // of points to the line segment.
-double scoreLineSegment(Point p1, Point p2, PointSet & pointsNearLine) {
+double scoreLineSegment(Point p1, Point p2, std::vector<int> const & pointsNearLine,
+                        PointVector const & pts) {
     double slope = getSlope(p1, p2);
     if (slope > 1.0)
         slope = 1.0 / slope;
@@ -496,19 +527,27 @@ double scoreLineSegment(Point p1, Point p2, PointSet & pointsNearLine) {
                         (slope - MIN_ACCEPTABLE_LINE_SEGMENT_SLOPE);
     double maxScorePerPoint = MAX_POINTS_SCORE / TRACE_LINE_STEP_DISTANCE;
     double pointDistanceScore = 0.0;
-    for (auto const & p : pointsNearLine) {
-        double dist = distanceToLineSegment(p, p1, p2);
+    for (auto const & id : pointsNearLine) {
+        double dist = distanceToLineSegment(pts[id], p1, p2);
         pointDistanceScore += maxScorePerPoint / (dist + 1.0);
     }
     double finalScore = slopeScore + pointDistanceScore;
     return finalScore;
 }
 
-void addPointsNearLine(Point p1, Point p2, PointSet & pointsNearLine, PointSet & pointSet,
-                       double radius) {
-    for (auto const & p : pointsNearLine) {
-        if (distanceToLineSegment(p, p1, p2) <= radius)
-            pointSet.insert(p);
+void addPointToSet(int pointId, std::vector<int> & pointSet, std::vector<bool> & inPointSet) {
+    if (!inPointSet[pointId]) {
+        inPointSet[pointId] = true;
+        pointSet.push_back(pointId);
+    }
+}
+
+
+void addPointsNearLine(Point p1, Point p2, AlignmentScratch & scratch, double radius) {
+    PointVector const & pts = scratch.pointIndex.pts;
+    for (auto const & id : scratch.pointsNearLine) {
+        if (distanceToLineSegment(pts[id], p1, p2) <= radius)
+            addPointToSet(id, scratch.pointSet, scratch.inPointSet);
     }
 }
 
@@ -543,65 +582,121 @@ double distanceToLineSegment(Point p, Point l1, Point l2) {
 }
 
 
-void addKmerPointsToNanoflann(PointCloud & cloud, std::vector<CommonKmer> & commonKmers,
-                              PointSet & usedPoints) {
-    PointVector points;
-    for (size_t i = 0; i < commonKmers.size(); ++i) {
-        Point p(commonKmers[i].m_hPosition, commonKmers[i].m_vPosition);
-        bool alreadyUsed = usedPoints.find(p) != usedPoints.end();
-        if (!alreadyUsed)
-            points.push_back(p);
-    }
-    size_t pCount = points.size();
-    cloud.pts.resize(pCount);
-    for (size_t i = 0; i < pCount; ++i) {
-        cloud.pts[i].x = points[i].x;
-        cloud.pts[i].y = points[i].y;
+void PointIndex::build(std::vector<CommonKmer> const & commonKmers, int readLen) {
+    int pointCount = int(commonKmers.size());
+    int columnCount = std::max(readLen, 0) / LINE_TRACING_INDEX_COLUMN_WIDTH + 1;
+    pts.clear();
+    pts.reserve(pointCount);
+    m_columnStarts.assign(columnCount + 1, 0);
+    for (auto const & k : commonKmers) {
+        pts.emplace_back(k.m_hPosition, k.m_vPosition);
+        int column = std::min(k.m_hPosition / LINE_TRACING_INDEX_COLUMN_WIDTH, columnCount - 1);
+        ++m_columnStarts[column + 1];
+    }
+    for (int c = 0; c < columnCount; ++c)
+        m_columnStarts[c + 1] += m_columnStarts[c];
+
+    // Bucket the point IDs by column, then sort each column by y.
+    m_ids.resize(pointCount);
+    std::vector<int> nextSlot(m_columnStarts.begin(), m_columnStarts.end() - 1);
+    for (int i = 0; i < pointCount; ++i) {
+        int column = std::min(pts[i].x / LINE_TRACING_INDEX_COLUMN_WIDTH, columnCount - 1);
+        m_ids[nextSlot[column]++] = i;
+    }
+    for (int c = 0; c < columnCount; ++c)
+        std::sort(m_ids.begin() + m_columnStarts[c], m_ids.begin() + m_columnStarts[c + 1],
+                  [this](int a, int b) {return pts[a].y < pts[b].y ||
+                                               (pts[a].y == pts[b].y && a < b);});
+    m_xs.resize(pointCount);
+    m_ys.resize(pointCount);
+    for (int i = 0; i < pointCount; ++i) {
+        m_xs[i] = pts[m_ids[i]].x;
+        m_ys[i] = pts[m_ids[i]].y;
     }
 }
 
 
-PointVector radiusSearchAroundPoint(Point point, int radius, PointCloud & cloud,
-                                    my_kd_tree_t & index) {
-    PointVector points;
-    nanoflann::SearchParams params;
-    std::vector<std::pair<size_t,int> > ret_matches;
-    const int query_pt[2] = {point.x, point.y};
-    index.radiusSearch(query_pt, radius, ret_matches, params);
-    for (auto const & i : ret_matches)
-        points.push_back(cloud.pts[i.first]);
-    return points;
+// Fills matches with the IDs of the points less than the radius away from the given point
+// (using Manhattan distance). The matches vector is passed in so its memory can be reused from one
+// search to the next.
+void PointIndex::radiusSearch(Point p, int radius, std::vector<int> & matches) const {
+    matches.clear();
+    if (radius <= 0 || p.x + radius - 1 < 0)
+        return;
+    int columnCount = int(m_columnStarts.size()) - 1;
+    int firstColumn = std::max(p.x - radius + 1, 0) / LINE_TRACING_INDEX_COLUMN_WIDTH;
+    int lastColumn = std::min((p.x + radius - 1) / LINE_TRACING_INDEX_COLUMN_WIDTH,
+                              columnCount - 1);
+    for (int c = firstColumn; c <= lastColumn; ++c) {
+        auto columnEnd = m_ys.begin() + m_columnStarts[c + 1];
+        auto it = std::lower_bound(m_ys.begin() + m_columnStarts[c], columnEnd,
+                                   p.y - radius + 1);
+        for (; it != columnEnd && *it < p.y + radius; ++it) {
+            size_t i = it - m_ys.begin();
+            if (abs(m_xs[i] - p.x) + abs(*it - p.y) < radius)
+                matches.push_back(m_ids[i]);
+        }
+    }
+}
+
+
+// Scores the density of every point. Only unused points count towards density, so when a point
+// is used, its contribution is taken away from its neighbours (see setPointUsed).
+void setPointDensities(AlignmentScratch & scratch) {
+    PointIndex & pointIndex = scratch.pointIndex;
+    std::vector<double> & densities = scratch.pointDensities;
+    int pointCount = int(pointIndex.pts.size());
+    densities.assign(pointCount, 0.0);
+    for (int i = 0; i < pointCount; ++i) {
+        Point p = pointIndex.pts[i];
+        pointIndex.radiusSearch(p, LINE_TRACING_START_POINT_SEARCH_RADIUS, scratch.radiusMatches);
+        for (auto const & id : scratch.radiusMatches)
+            densities[i] += getPointDensityContribution(p, pointIndex.pts[id]);
+    }
+}
+
+
+// A point's density score is the sum of these contributions from each of its neighbours.
+// Specifically, it rewards points that have lots of neighbours close to the diagonal, but it
+// punishes points with too many neighbours away from the diagonal.
+double getPointDensityContribution(Point p1, Point p2) {
+    double a = 1.0 / SCORE_DISTANCE_FROM_DIAGONAL;
+    int xDiff = p2.x - p1.x;
+    int yDiff = p2.y - p1.y;
+    return ((1.0 + a) / (abs(xDiff-yDiff) + 1.0)) - a;
 }
 
 
-Point getHighestDensityPoint(int densityRadius, PointCloud & cloud, my_kd_tree_t & index,
-                             std::string & trimmedRefSeq, std::string * readSeq) {
-    Point highestDensityPoint = cloud.pts[0];
+// Returns the ID of the unused point with the highest density score (or the first unused point if
+// none score above zero).
+int getHighestDensityPoint(AlignmentScratch & scratch) {
+    int highestDensityPoint = -1;
     double highestDensityScore = 0.0;
-    for (auto const & point : cloud.pts) {
-        double densityScore = getPointDensityScore(densityRadius, point, cloud, index);
-        if (densityScore > highestDensityScore) {
-            highestDensityScore = densityScore;
-            highestDensityPoint = point;
+    int pointCount = int(scratch.pointDensities.size());
+    for (int i = 0; i < pointCount; ++i) {
+        if (scratch.usedPoints[i])
+            continue;
+        if (highestDensityPoint == -1)
+            highestDensityPoint = i;
+        if (scratch.pointDensities[i] > highestDensityScore) {
+            highestDensityScore = scratch.pointDensities[i];
+            highestDensityPoint = i;
         }
     }
     return highestDensityPoint;
 }
 
 
-// For a given point, the function scores it based on the density of nearby points. Specifically,
-// it rewards points that have lots of neighbours close to the diagonal, but it punishes points
-// with too many neighbours away from the diagonal.
-double getPointDensityScore(int densityRadius, Point p, PointCloud & cloud, my_kd_tree_t & index) {
-    PointVector neighbourPoints = radiusSearchAroundPoint(p, densityRadius, cloud, index);
-    double a = 1.0 / SCORE_DISTANCE_FROM_DIAGONAL;
-    double densityScore = 0.0;
-    for (auto const & neighbourPoint : neighbourPoints) {
-        int xDiff = neighbourPoint.x - p.x;
-        int yDiff = neighbourPoint.y - p.y;
-        densityScore += ((1.0 + a) / (abs(xDiff-yDiff) + 1.0)) - a;
+void setPointUsed(int pointId, AlignmentScratch & scratch) {
+    PointIndex & pointIndex = scratch.pointIndex;
+    Point p = pointIndex.pts[pointId];
+    scratch.usedPoints[pointId] = true;
+    ++scratch.usedPointCount;
+    pointIndex.radiusSearch(p, LINE_TRACING_START_POINT_SEARCH_RADIUS, scratch.radiusMatches);
+    for (auto const & id : scratch.radiusMatches) {
+        if (!scratch.usedPoints[id])
+            scratch.pointDensities[id] -= getPointDensityContribution(p, pointIndex.pts[id]);
     }
-    return densityScore;
 }
 
 
@@ -664,15 +759,14 @@ void displayRFunctions(std::string & output) {
 }
 
 
-void displayRefRanges(std::string & output, RefRangeMap & simplifiedRefRanges) {
+void displayRefRanges(std::string & output, RefRangeMap & refRanges, RefSeqs * refSeqs) {
     output += "Reference ranges:\n";
-    for(auto const & r : simplifiedRefRanges) {
-        std::string refName = r.first;
-        std::vector<StartEndRange> ranges = r.second;
-        for (auto const & refRange : ranges) {
+    for (auto const & r : refRanges) {
+        std::string refNameAndStrand = refSeqs->getName(r.first.first) + r.first.second;
+        for (auto const & refRange : r.second) {
             int refStart = refRange.first;
             int refEnd = refRange.second;
-            output += "    " + refName + ": " + std::to_string(refStart) + " - " + std::to_string(refEnd) + "\n";
+            output += "    " + refNameAndStrand + ": " + std::to_string(refStart) + " - " + std::to_string(refEnd) + "\n";
         }
     }
 }
@@ -713,7 +807,7 @@ void saveChainedSeedsToFile(std::string readName, char readStrand, std::string r
 
 
 void saveTraceDotsToFile(std::string readName, char readStrand, std::string refName,
-                         PointVector & traceDots, PointSet & pointSet, std::string & output,
+                         PointVector & traceDots, PointVector & pointSet, std::string & output,
                          int lineNum) {
     std::ofstream traceDotsFile;
     std::string lineNumStr = std::to_string(lineNum+1);
@@ -748,7 +842,7 @@ double variance(std::vector<double> & v) {
 
 // This function gives a point set a quality score so we can choose between alternative point sets
 // for an alignment. It also labels the point set as failed or not.
-double scorePointSet(PointSet & pointSet, PointVector & traceDots, bool & failedLine) {
+double scorePointSet(PointVector & pointSet, PointVector & traceDots, bool & failedLine) {
 
     // If there's only one point, we can't proceed.
     if (pointSet.size() == 1)
@@ -0,0 +1,157 @@
+"""
+Copyright 2017 Ryan Wick (rrwick@gmail.com)
+https://github.com/rrwick/Unicycler
+
+This module runs pipeline stages which don't depend on each other at the same time, e.g. the
+miniasm assembly, simple long-read bridging and long-read alignment of a hybrid assembly, which
+all only need the cleaned graph and the reads. The stages share the thread budget between them,
+and their log output is held back and released stage by stage, so the log (and the run report)
+reads the same as if they had been run one after another.
+
+This file is part of Unicycler. Unicycler is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version. Unicycler is distributed in
+the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along with Unicycler. If
+not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+import threading
+import time
+from . import log
+from . import report
+
+
+class Stage(object):
+    """
+    A stage is called as function(threads, *results_of_dependencies). Its weight sets its share
+    of the threads relative to the stages it runs alongside, and stages which can't make use of
+    many threads can be given a maximum.
+    """
+    def __init__(self, name, function, dependencies=(), weight=1, max_threads=None):
+        self.name = name
+        self.function = function
+        self.dependencies = list(dependencies)
+        self.weight = weight
+        self.max_threads = max_threads
+        self.threads = 0
+        self.started = False
+        self.finished = False
+        self.result = None
+        self.error = None
+        self.stage_log = log.StageLog()
+
+    def __repr__(self):
+        return self.name
+
+    def is_ready(self, stages_by_name):
+        return not self.started and \
+            all(stages_by_name[x].finished for x in self.dependencies)
+
+    def get_thread_count(self, threads):
+        if self.max_threads is None:
+            return threads
+        return max(1, min(threads, self.max_threads))
+
+    def run(self, stages_by_name):
+        dependency_results = [stages_by_name[x].result for x in self.dependencies]
+        start_time = time.time()
+        self.result = self.function(self.threads, *dependency_results)
+        report.add_stage(self.name, start_time, time.time() - start_time, self.threads)
+
+
+def run_stages(stages, threads):
+    """
+    Runs the stages and returns their results in a dictionary (key = stage name). The stages must
+    be given in the order they would run one after another (each after its dependencies), which is
+    the order their log output appears in. With only one thread, they are simply run in that order.
+    """
+    stages_by_name = {x.name: x for x in stages}
+    for i, stage in enumerate(stages):
+        if any(x not in stages_by_name or stages.index(stages_by_name[x]) >= i
+               for x in stage.dependencies):
+            raise ValueError('stage ' + stage.name + ' must come after its dependencies')
+
+    if threads < 2 or len(stages) < 2:
+        for stage in stages:
+            stage.threads = stage.get_thread_count(threads)
+            stage.started = True
+            stage.run(stages_by_name)
+            stage.finished = True
+    else:
+        run_stages_concurrently(stages, stages_by_name, threads)
+
+    return {x.name: x.result for x in stages}
+
+
+def run_stages_concurrently(stages, stages_by_name, threads):
+    stage_finished = threading.Condition()
+    free_threads = threads
+    running_stages = []
+    live_stage_index = 0
+
+    while True:
+        with stage_finished:
+            for stage in [x for x in running_stages if x.finished]:
+                free_threads += stage.threads
+                running_stages.remove(stage)
+
+            # Ready stages share the free threads by weight (each gets at least one). A stage
+            # which becomes ready when no threads are free waits for another stage to finish.
+            ready_stages = [x for x in stages if x.is_ready(stages_by_name)]
+            ready_weight = sum(x.weight for x in ready_stages)
+            for i, stage in enumerate(ready_stages):
+                if free_threads == 0:
+                    break
+                if i == len(ready_stages) - 1:
+                    stage.threads = stage.get_thread_count(free_threads)
+                else:
+                    share = max(1, free_threads * stage.weight // ready_weight)
+                    stage.threads = stage.get_thread_count(share)
+                free_threads -= stage.threads
+                ready_weight -= stage.weight
+                stage.started = True
+                running_stages.append(stage)
+                thread = threading.Thread(target=run_stage_in_thread,
+                                          args=(stage, stages_by_name, stage_finished),
+                                          daemon=True)
+                thread.start()
+
+            # The first unfinished stage logs directly. Everything logged by the stages before it
+            # (which are finished) is released in order.
+            while live_stage_index < len(stages):
+                stage = stages[live_stage_index]
+                if not stage.started:
+                    break
+                stage.stage_log.go_live()
+                if not stage.finished:
+                    break
+                live_stage_index += 1
+
+            failed_stages = [x for x in stages if x.error is not None]
+            if failed_stages:
+                break
+            if all(x.finished for x in stages):
+                return
+
+            stage_finished.wait()
+
+    # If a stage failed, the log is released up to and including that stage before its error is
+    # raised here (any other stages still running are abandoned).
+    failed_stage = failed_stages[0]
+    for stage in stages[live_stage_index:stages.index(failed_stage) + 1]:
+        stage.stage_log.go_live()
+    raise failed_stage.error[1].with_traceback(failed_stage.error[2])
+
+
+def run_stage_in_thread(stage, stages_by_name, stage_finished):
+    log.set_stage_log(stage.stage_log)
+    try:
+        stage.run(stages_by_name)
+    except BaseException:  # including SystemExit from quit_with_error
+        stage.error = sys.exc_info()
+    with stage_finished:
+        stage.finished = stage.error is None
+        stage_finished.notify()
@@ -16,50 +16,62 @@ not, see <http://www.gnu.org/licenses/>.
 """
 
 import argparse
+import copy
+import json
 import os
 import sys
 import shutil
 import random
 import itertools
-import multiprocessing
-from .alignment import AlignmentScoringScheme
-from .assembly_graph import AssemblyGraph
-from .assembly_graph_copy_depth import determine_copy_depth
-from .bridge_long_read_simple import create_simple_long_read_bridges
-from .miniasm_assembly import make_miniasm_string_graph
-from .bridge_miniasm import create_miniasm_bridges
-from .bridge_long_read import create_long_read_bridges
-from .bridge_spades_contig import create_spades_contig_bridges
-from .bridge_loop_unroll import create_loop_unrolling_bridges
+from collections import defaultdict
 from .misc import int_to_str, float_to_str, quit_with_error, get_percentile, bold, \
     check_input_files, MyHelpFormatter, print_table, get_ascii_art, \
     get_default_thread_count, spades_path_and_version, makeblastdb_path_and_version, \
     tblastn_path_and_version, racon_path_and_version, gfa_path, red
-from .spades_func import get_best_spades_graph
-from .blast_func import find_start_gene, CannotFindStart
-from .unicycler_align import fix_up_arguments, semi_global_align_long_reads, load_references, \
-    load_sam_alignments, print_alignment_summary_table
-from .read_ref import get_read_nickname_dict, load_long_reads
+from .resources import get_available_cpu_count, get_available_memory, close_thread_pool
 from . import log
+from . import report
 from . import settings
 from .version import __version__
 
+# The assembly pipeline's modules (and through them the C++ library) are imported in the functions
+# which use them, so --help, --version and argument errors don't have to wait for them to load.
+
 
 def main():
     """
     Script execution starts here.
     """
-    random.seed(0)  # Fixed seed so the program produces the same output every time it's run.
-
     full_command = ' '.join(('"' + x + '"' if ' ' in x else x) for x in sys.argv)
     args = get_arguments()
+    assemble(args, full_command)
+
+
+def assemble(args, full_command, dependencies_checked=False):
+    """
+    Runs the whole Unicycler pipeline for one sample. Batch mode calls this for each of its
+    samples, after it has checked the dependencies once for all of them.
+    """
+    from .assembly_graph import AssemblyGraph, gfa_cache_filename
+    from .assembly_graph_copy_depth import determine_copy_depth
+    from .miniasm_assembly import make_miniasm_string_graph
+    from .bridge_spades_contig import create_spades_contig_bridges
+    from .bridge_loop_unroll import create_loop_unrolling_bridges
+    from .spades_func import get_best_spades_graph
+    from .read_ref import get_read_nickname_dict, load_long_reads
+    from .alignment import AlignmentScoringScheme
+
+    random.seed(0)  # Fixed seed so the program produces the same output every time it's run.
+
     out_dir_message = make_output_directory(args.out, args.verbosity)
+    report.start_report(args.out, full_command, __version__, args)
     short_reads_available = bool(args.short1) or bool(args.unpaired)
     long_reads_available = bool(args.long)
 
     check_input_files(args)
     print_intro_message(args, full_command, out_dir_message)
-    check_dependencies(args, short_reads_available, long_reads_available)
+    if not dependencies_checked:
+        check_dependencies(args, short_reads_available, long_reads_available)
 
     counter = itertools.count(start=1)  # Files are numbered in chronological order.
     bridges = []
@@ -71,7 +83,7 @@ def main():
         if os.path.isfile(best_spades_graph):
             log.log('\nSPAdes graph already exists. Will use this graph instead of running '
                     'SPAdes:\n  ' + best_spades_graph)
-            graph = AssemblyGraph(best_spades_graph, None)
+            graph = AssemblyGraph(best_spades_graph, None, use_cache=True)
         else:
             graph = get_best_spades_graph(args.short1, args.short2, args.unpaired, args.out,
                                           args.depth_filter, args.verbosity,
@@ -82,7 +94,7 @@ def main():
         determine_copy_depth(graph)
         if args.keep > 0 and not os.path.isfile(best_spades_graph):
             graph.save_to_gfa(best_spades_graph, save_copy_depth_info=True, newline=True,
-                              include_insert_size=True)
+                              include_insert_size=True, save_cache=True)
 
         clean_up_spades_graph(graph)
         if args.keep > 0:
@@ -109,12 +121,18 @@ def main():
     scoring_scheme = AlignmentScoringScheme(args.scores)
 
     if long_reads_available:
-        read_dict, read_names, long_read_filename = load_long_reads(args.long, output_dir=args.out)
+        read_dict, read_names, long_read_filename = load_long_reads(args.long, output_dir=args.out,
+                                                                    threads=args.threads)
         read_nicknames = get_read_nickname_dict(read_names)
     else:
         read_dict, read_names, long_read_filename, read_nicknames = {}, [], '', {}
 
-    if long_reads_available and not args.no_miniasm:
+    if short_reads_available and long_reads_available:
+        bridges += create_all_long_read_bridges(graph, anchor_segments, read_dict, read_names,
+                                                long_read_filename, read_nicknames,
+                                                scoring_scheme, counter, args, full_command)
+        string_graph = None
+    elif long_reads_available and not args.no_miniasm:
         string_graph = make_miniasm_string_graph(graph, read_dict, long_read_filename,
                                                  scoring_scheme, read_nicknames, counter, args,
                                                  anchor_segments, args.existing_long_read_assembly)
@@ -124,26 +142,6 @@ def main():
     if not short_reads_available and string_graph is None:
         quit_with_error('miniasm assembly failed')
 
-    if short_reads_available and long_reads_available:
-        if string_graph is not None and not args.no_miniasm:
-            bridges += create_miniasm_bridges(graph, string_graph, anchor_segments,
-                                              scoring_scheme, args.verbosity, args.min_bridge_qual)
-
-        if not args.no_simple_bridges:
-            bridges += create_simple_long_read_bridges(graph, args.out, args.keep, args.threads,
-                                                       read_dict, long_read_filename,
-                                                       scoring_scheme, anchor_segments)
-        if not args.no_long_read_alignment:
-            read_names, min_scaled_score, min_alignment_length = \
-                align_long_reads_to_assembly_graph(graph, anchor_segments, args, full_command,
-                                                   read_dict, read_names, long_read_filename)
-
-            expected_linear_seqs = args.linear_seqs > 0
-            bridges += create_long_read_bridges(graph, read_dict, read_names, anchor_segments,
-                                                args.verbosity, min_scaled_score, args.threads,
-                                                scoring_scheme, min_alignment_length,
-                                                expected_linear_seqs, args.min_bridge_qual)
-
     if short_reads_available:
         seg_nums_used_in_bridges = graph.apply_bridges(bridges, args.verbosity,
                                                        args.min_bridge_qual)
@@ -186,19 +184,32 @@ def main():
     graph.save_to_gfa(final_assembly_gfa)
     graph.save_to_fasta(final_assembly_fasta, min_length=args.min_fasta_length)
 
+    # The depth filter graph's cache is only for resuming an unfinished run, so it is deleted
+    # with the other temp files.
+    if short_reads_available and args.keep < 3:
+        spades_graph_cache = gfa_cache_filename(best_spades_graph)
+        if os.path.isfile(spades_graph_cache):
+            log.log('Deleting ' + spades_graph_cache, 2)
+            os.remove(spades_graph_cache)
+    close_thread_pool()
+    report.add_output('assembly_gfa', final_assembly_gfa)
+    report.add_output('assembly_fasta', final_assembly_fasta)
+    report.finish_report('complete')
+
     log.log('')
 
 
-def get_arguments():
+def get_arguments(argv=None):
     """
-    Parse the command line arguments.
+    Parse the command line arguments (or the given list of arguments, as used by batch mode).
     """
     description = bold('Unicycler: an assembly pipeline for bacterial genomes')
     this_script_dir = os.path.dirname(os.path.realpath(__file__))
 
-    if '--helpall' in sys.argv or '--allhelp' in sys.argv or '--all_help' in sys.argv:
-        sys.argv.append('--help_all')
-    show_all_args = '--help_all' in sys.argv
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if '--helpall' in argv or '--allhelp' in argv or '--all_help' in argv:
+        argv.append('--help_all')
+    show_all_args = '--help_all' in argv
 
     # Show the ASCII art if the terminal is wide enough for it.
     terminal_width = shutil.get_terminal_size().columns
@@ -316,6 +327,12 @@ def get_arguments():
     miniasm_group.add_argument('--racon_path', type=str, default='racon',
                                help='Path to the Racon executable'
                                     if show_all_args else argparse.SUPPRESS)
+    miniasm_group.add_argument('--max_polishing_depth', type=int,
+                               default=settings.RACON_POLISH_TARGET_DEPTH,
+                               help='Long reads are subsampled to about this depth for Racon '
+                                    'polishing, preferring long and high-quality reads (0 = use '
+                                    'all reads)'
+                                    if show_all_args else argparse.SUPPRESS)
     miniasm_group.add_argument('--existing_long_read_assembly', type=str, default=None,
                                help='A pre-prepared long-read assembly for the sample in GFA '
                                     'or FASTA format. If this option is used, Unicycler will skip '
@@ -335,6 +352,23 @@ def get_arguments():
                             help='Skip long-read-alignment-based bridging (default: use long-read '
                                  'alignments to produce bridges)'
                                  if show_all_args else argparse.SUPPRESS)
+    long_group.add_argument('--max_alignment_depth', type=int,
+                            default=settings.LONG_READ_ALIGNMENT_TARGET_DEPTH,
+                            help='Long reads are subsampled to about this depth for alignment to '
+                                 'the assembly graph, preferring long and high-quality reads (0 = '
+                                 'use all reads)'
+                                 if show_all_args else argparse.SUPPRESS)
+    long_group.add_argument('--align_all_reads', action='store_true',
+                            help='Align all long reads to the assembly graph (default: only align '
+                                 'reads whose minimap hits suggest they could bridge anchor '
+                                 'segments)'
+                                 if show_all_args else argparse.SUPPRESS)
+    long_group.add_argument('--bridging_read_margin', type=int,
+                            default=settings.BRIDGING_READ_MARGIN,
+                            help='Reads with one anchor segment hit are still aligned if they '
+                                 'carry on past the end of the anchor by more than this many '
+                                 'bases'
+                                 if show_all_args else argparse.SUPPRESS)
     long_group.add_argument('--contamination', required=False,
                             help='FASTA file of known contamination in long reads'
                             if show_all_args else argparse.SUPPRESS)
@@ -392,11 +426,13 @@ def get_arguments():
 
     # If no arguments were used, print the entire help (argparse default is to just give an error
     # like '--out is required').
-    if len(sys.argv) == 1:
+    if not argv:
         parser.print_help(file=sys.stderr)
         sys.exit(1)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+
+    from .unicycler_align import fix_up_arguments
     fix_up_arguments(args)
 
     if (args.short1 and not args.short2) or (args.short2 and not args.short1):
@@ -422,6 +458,12 @@ def get_arguments():
     if args.kmer_count < 1:
         quit_with_error('--kmer_count must be at least 1')
 
+    if args.max_alignment_depth < 0 or args.max_polishing_depth < 0:
+        quit_with_error('--max_alignment_depth and --max_polishing_depth cannot be negative')
+
+    if args.bridging_read_margin < 0:
+        quit_with_error('--bridging_read_margin cannot be negative')
+
     if args.kmers is not None:
         args.kmers = args.kmers.split(',')
         try:
@@ -627,7 +669,10 @@ def print_intro_message(args, full_command, out_dir_message):
     log.log('Unicycler version: v' + __version__)
     log.log('Using ' + str(args.threads) + ' thread' + ('' if args.threads == 1 else 's'))
     log.log('')
-    if args.threads > 2 * multiprocessing.cpu_count():
+    available_memory = get_available_memory()
+    if available_memory is not None:
+        log.log('Available memory: ' + float_to_str(available_memory / (1024 ** 3), 1) + ' GB', 2)
+    if args.threads > 2 * get_available_cpu_count():
         log.log(red('Warning: you have specified a lot more threads than this machine seems to '
                     'have! Was this intentional?'))
         log.log('')
@@ -711,7 +756,7 @@ def check_dependencies(args, short_reads_available, long_reads_available):
             row_colours[i] = 'red'
 
     print_table(program_table, alignments='LLLL', row_colour=row_colours, max_col_width=60,
-                sub_colour={'good': 'green'})
+                sub_colour={'good': 'green'}, report_table='dependencies')
 
     quit_if_dependency_problem(spades_status, racon_status, makeblastdb_status, tblastn_status,
                                args)
@@ -750,6 +795,7 @@ def quit_if_dependency_problem(spades_status, racon_status, makeblastdb_status,
 
 
 def rotate_completed_replicons(graph, args, counter):
+    from .blast_func import find_start_gene, CannotFindStart
     completed_replicons = graph.completed_circular_replicons()
     if len(completed_replicons) > 0:
         log.log_section_header('Rotating completed replicons')
@@ -797,19 +843,96 @@ def rotate_completed_replicons(graph, args, counter):
 
         log.log('', 2)
         print_table(rotation_result_table, alignments='RRRLRLRR', indent=0,
-                    sub_colour={'none found': 'red'})
+                    sub_colour={'none found': 'red'}, report_table='rotation')
         if rotation_count and args.keep > 0:
             graph.save_to_gfa(gfa_path(args.out, next(counter), 'rotated'), newline=True)
         if args.keep < 3 and os.path.exists(blast_dir):
             shutil.rmtree(blast_dir, ignore_errors=True)
 
 
+def create_all_long_read_bridges(graph, anchor_segments, read_dict, read_names,
+                                 long_read_filename, read_nicknames, scoring_scheme, counter, args,
+                                 full_command):
+    """
+    Makes the miniasm, simple and full long-read bridges for a hybrid assembly. Apart from the
+    miniasm bridges (which need the miniasm assembly), these only depend on the graph and the
+    reads, so they are run as stages which can overlap. The bridges are returned in the same order
+    as if they had been made one after another.
+    """
+    from .bridge_long_read_simple import create_simple_long_read_bridges
+    from .miniasm_assembly import make_miniasm_string_graph
+    from .bridge_miniasm import create_miniasm_bridges
+    from .bridge_long_read import create_long_read_bridges
+    from .stages import Stage, run_stages
+
+    def miniasm_assembly(threads):
+        return make_miniasm_string_graph(graph, read_dict, long_read_filename, scoring_scheme,
+                                         read_nicknames, counter, get_stage_args(args, threads),
+                                         anchor_segments, args.existing_long_read_assembly)
+
+    def miniasm_bridges(_, string_graph):
+        if string_graph is None:
+            return []
+        return create_miniasm_bridges(graph, string_graph, anchor_segments, scoring_scheme,
+                                      args.verbosity, args.min_bridge_qual)
+
+    def simple_bridges(threads):
+        return create_simple_long_read_bridges(graph, args.out, args.keep, threads, read_dict,
+                                               long_read_filename, scoring_scheme,
+                                               anchor_segments)
+
+    def long_read_alignment(threads):
+        return align_long_reads_to_assembly_graph(graph, anchor_segments,
+                                                  get_stage_args(args, threads), full_command,
+                                                  read_dict, read_names, long_read_filename)
+
+    def long_read_bridges(threads, alignment_results):
+        aligned_read_names, min_scaled_score, min_alignment_length, read_lengths = \
+            alignment_results
+        expected_linear_seqs = args.linear_seqs > 0
+        return create_long_read_bridges(graph, read_dict, aligned_read_names, anchor_segments,
+                                        args.verbosity, min_scaled_score, threads,
+                                        scoring_scheme, min_alignment_length,
+                                        expected_linear_seqs, args.min_bridge_qual, read_lengths)
+
+    stages = []
+    if not args.no_miniasm:
+        stages.append(Stage('miniasm_assembly', miniasm_assembly))
+        stages.append(Stage('miniasm_bridges', miniasm_bridges, ['miniasm_assembly'],
+                            max_threads=1))
+    if not args.no_simple_bridges:
+        stages.append(Stage('simple_bridges', simple_bridges))
+    if not args.no_long_read_alignment:
+        stages.append(Stage('long_read_alignment', long_read_alignment, weight=2))
+        stages.append(Stage('long_read_bridges', long_read_bridges, ['long_read_alignment']))
+    results = run_stages(stages, args.threads)
+
+    bridges = []
+    for name in ('miniasm_bridges', 'simple_bridges', 'long_read_bridges'):
+        bridges += results.get(name) or []
+    return bridges
+
+
+def get_stage_args(args, threads):
+    """
+    Returns a copy of the arguments with the thread count of a stage.
+    """
+    stage_args = copy.copy(args)
+    stage_args.threads = threads
+    return stage_args
+
+
 def align_long_reads_to_assembly_graph(graph, anchor_segments, args, full_command,
                                        read_dict, read_names, long_read_filename):
+    from .alignment import AlignmentScoringScheme
+    from .unicycler_align import semi_global_align_long_reads, load_references, \
+        load_sam_alignments, print_alignment_summary_table
+
     alignment_dir = os.path.join(args.out, 'read_alignment')
     graph_fasta = os.path.join(alignment_dir, 'all_segments.fasta')
     anchor_segment_names = set(str(x.number) for x in anchor_segments)
     alignments_sam = os.path.join(alignment_dir, 'long_read_alignments.sam')
+    minimap_read_names_json = os.path.join(alignment_dir, 'minimap_read_names.json')
     scoring_scheme = AlignmentScoringScheme(args.scores)
     min_alignment_length = settings.MIN_LONG_READ_ALIGNMENT_LENGTH
 
@@ -829,6 +952,11 @@ def align_long_reads_to_assembly_graph(graph, anchor_segments, args, full_comman
         for alignment in alignments:
             read_dict[alignment.read.name].alignments.append(alignment)
         print_alignment_summary_table(read_dict, args.verbosity, False)
+        try:
+            with open(minimap_read_names_json, 'rt') as f:
+                minimap_read_names = json.load(f)
+        except (OSError, ValueError):
+            minimap_read_names = None
 
     # Conduct the alignment if an existing SAM is not available.
     else:
@@ -837,12 +965,19 @@ def align_long_reads_to_assembly_graph(graph, anchor_segments, args, full_comman
 
         allowed_overlap = int(round(graph.overlap * settings.ALLOWED_ALIGNMENT_OVERLAP))
         low_score_threshold = [args.low_score]
+        bridging_read_margin = None if args.align_all_reads else args.bridging_read_margin
+        minimap_read_names = []
         semi_global_align_long_reads(references, graph_fasta, read_dict, read_names,
                                      long_read_filename, args.threads, scoring_scheme,
                                      low_score_threshold, False, min_alignment_length,
                                      alignments_in_progress, full_command, allowed_overlap,
                                      0, args.contamination, args.verbosity,
-                                     single_copy_segment_names=anchor_segment_names)
+                                     single_copy_segment_names=anchor_segment_names,
+                                     target_depth=args.max_alignment_depth,
+                                     bridging_read_margin=bridging_read_margin,
+                                     minimap_read_names=minimap_read_names)
+        with open(minimap_read_names_json, 'wt') as f:
+            json.dump(minimap_read_names, f)
         shutil.move(alignments_in_progress, alignments_sam)
 
         if args.keep < 2:
@@ -876,7 +1011,20 @@ def align_long_reads_to_assembly_graph(graph, anchor_segments, args, full_comman
             float_to_str(settings.MIN_SCALED_SCORE_PERCENTILE, 1) +
             'th percentile of full read alignments: ' + float_to_str(min_scaled_score, 2), 2)
 
-    return read_names, min_scaled_score, min_alignment_length
+    # Each bridge's expected read count comes from the lengths of the reads which aligned to the
+    # graph. This uses the reads with minimap hits, as many of those may not have been given SeqAn
+    # alignments (only reads which could bridge anchors are). SAM files from older runs don't have
+    # these, so the reads with SeqAn alignments are used instead.
+    if minimap_read_names is None:
+        counted_read_names = [x for x in read_names if read_dict[x].alignments]
+    else:
+        minimap_read_names = set(minimap_read_names)
+        counted_read_names = [x for x in read_names if x in minimap_read_names]
+    read_lengths = defaultdict(int)
+    for read_name in counted_read_names:
+        read_lengths[read_dict[read_name].get_length()] += 1
+
+    return read_names, min_scaled_score, min_alignment_length, read_lengths
 
 
 def clean_up_spades_graph(graph):
@@ -34,17 +34,22 @@ not, see <http://www.gnu.org/licenses/>.
 
 import sys
 import os
+import json
 import time
 import math
-from multiprocessing.dummy import Pool as ThreadPool
+import gzip
+import queue
 import threading
 from .misc import int_to_str, float_to_str, quit_with_error, weighted_average_list, \
-    get_sequence_file_type, dim, magenta, colour
-from .read_ref import load_references
+    get_sequence_file_type, dim, magenta, colour, get_open_function
+from .read_ref import load_references, get_read_name_table
 from .alignment import Alignment
 from . import settings
+from .resources import get_thread_pool
 from .minimap_alignment import load_minimap_alignments
+from .read_selection import select_reads, select_bridging_reads
 from . import log
+from . import report
 
 try:
     from .cpp_wrappers import semi_global_alignment, new_ref_seqs, add_ref_seq, \
@@ -54,18 +59,6 @@ except AttributeError as e:
              'Have you successfully built the library file using make?')
 
 
-# Used to ensure that multiple threads writing to the same SAM file don't write at the same time.
-SAM_WRITE_LOCK = threading.Lock()
-
-# VERBOSITY controls how much the script prints to the screen.
-# 0 = nothing is printed
-# 1 = a relatively simple output is printed
-# 2 = a more thorough output is printed, including details on each Seqan alignment
-# 3 = even more output is printed, including stuff from the C++ code
-# 4 = tons of stuff is printed, including all k-mer positions in each Seqan alignment
-VERBOSITY = 0
-
-
 def fix_up_arguments(args):
     # If the user just said 'lambda' for the contamination, then we use the lambda phage FASTA
     # included with Unicycler.
@@ -90,19 +83,33 @@ def semi_global_align_long_reads(references, ref_fasta, read_dict, read_names, r
                                  min_align_length, sam_filename, full_command, allowed_overlap,
                                  sensitivity_level, contamination_fasta, verbosity=None,
                                  stdout_header='Aligning reads', display_low_score=True,
-                                 single_copy_segment_names=None):
+                                 single_copy_segment_names=None, target_depth=None,
+                                 bridging_read_margin=None, minimap_read_names=None):
     """
     This function does the primary work of this module: aligning long reads to references in an
     end-gap-free, semi-global manner. It returns a dictionary of Read objects which contain their
     alignments.
     The low score threshold is taken as a list so the function can alter it and the caller can
     get the altered value.
+    If a target depth is given, only a subset of the reads (chosen using their minimap alignments)
+    go on to SeqAn alignment, and the others are left without alignments. Likewise if a bridging
+    read margin is given, only reads which could bridge the single copy segments are aligned.
+    If a minimap_read_names list is given, the names of the reads considered for SeqAn alignment
+    (i.e. after any target depth subsampling) which have minimap hits to the references are added
+    to it, whether or not they were then aligned.
     """
     if sensitivity_level is None:
         sensitivity_level = 0
-    if verbosity:
-        global VERBOSITY
-        VERBOSITY = verbosity
+    # The verbosity is passed along (rather than kept in a global) because this function can run
+    # in more than one thread at once with different verbosities (e.g. the miniasm contig search
+    # runs silently alongside the main long-read alignment).
+    # 0 = nothing is printed
+    # 1 = a relatively simple output is printed
+    # 2 = a more thorough output is printed, including details on each Seqan alignment
+    # 3 = even more output is printed, including stuff from the C++ code
+    # 4 = tons of stuff is printed, including all k-mer positions in each Seqan alignment
+    if verbosity is None:
+        verbosity = 0
 
     if single_copy_segment_names is None:
         single_copy_segment_names = set()
@@ -126,7 +133,8 @@ def semi_global_align_long_reads(references, ref_fasta, read_dict, read_names, r
             log.log('Automatically choosing a threshold using random alignment scores.\n')
         std_devs_over_mean = settings.AUTO_SCORE_STDEV_ABOVE_RANDOM_ALIGNMENT_MEAN
         low_score_threshold, rand_mean, rand_std_dev = get_auto_score_threshold(scoring_scheme,
-                                                                                std_devs_over_mean)
+                                                                                std_devs_over_mean,
+                                                                                threads)
         low_score_threshold_list[0] = low_score_threshold
         if display_low_score and verbosity > 0:
             log.log('Random alignment mean score: ' + float_to_str(rand_mean, 2))
@@ -135,6 +143,7 @@ def semi_global_align_long_reads(references, ref_fasta, read_dict, read_names, r
                     str(std_devs_over_mean) + ' x ' + float_to_str(rand_std_dev, 2) + ') = ' +
                     float_to_str(low_score_threshold, 2))
 
+    reference_lengths = {x.name: x.get_length() for x in references}
     using_contamination = contamination_fasta is not None
     if using_contamination:
         references += load_references(contamination_fasta, contamination=True)
@@ -144,39 +153,38 @@ def semi_global_align_long_reads(references, ref_fasta, read_dict, read_names, r
     if verbosity > 0:
         log.log_section_header('Aligning reads with minimap', verbosity=2)
     minimap_alignments_str = minimap_align_reads(ref_fasta, reads_fastq, threads, 0, 'default')
-    minimap_alignments = load_minimap_alignments(minimap_alignments_str)
+    minimap_alignments = load_minimap_alignments(minimap_alignments_str,
+                                                 read_name_table=get_read_name_table(reads_fastq))
     if verbosity > 0:
         log.log('', 3)
         log.log('Done! ' + str(len(minimap_alignments)) + ' out of ' +
                 str(len(read_dict)) + ' reads aligned', 2)
 
-    # Create the SAM file.
-    if sam_filename:
-        with open(sam_filename, 'w') as sam_file:
-            # Header line.
-            sam_file.write('@HD' + '\t')
-            sam_file.write('VN:1.5' + '\t')
-            sam_file.write('SO:unknown' + '\n')
-
-            # Reference lines.
-            for ref in references:
-                sam_file.write('@SQ' + '\t')
-                sam_file.write('SN:' + ref.name + '\t')
-                sam_file.write('LN:' + str(ref.get_length()) + '\n')
-
-            # Program line.
-            sam_file.write('@PG' + '\t')
-            sam_file.write('ID:' + 'unicycler_align')
-            if full_command:
-                sam_file.write('\tCL:' + full_command + '\t')
-            sam_file.write('SC:' + str(scoring_scheme) + '\n')
-
+    if verbosity > 0:
+        log.log_section_header(stdout_header)
+    if target_depth:
+        read_names = select_reads('alignment', read_names, read_dict, minimap_alignments,
+                                  reference_lengths, target_depth, single_copy_segment_names)
+    if minimap_read_names is not None:
+        minimap_read_names += [x for x in read_names
+                               if any(a.ref_name in reference_lengths
+                                      for a in minimap_alignments.get(x, []))]
+    if bridging_read_margin is not None:
+        read_names = select_bridging_reads(read_names, read_dict, minimap_alignments,
+                                           reference_lengths, single_copy_segment_names,
+                                           bridging_read_margin)
     reads_to_align = [read_dict[x] for x in read_names]
 
+    # The SAM file is written by a background thread, so the alignment threads don't need to wait
+    # on it.
+    if sam_filename:
+        sam_writer = SamWriter(sam_filename, get_sam_header(references, full_command,
+                                                            scoring_scheme), read_names)
+    else:
+        sam_writer = None
+
     num_alignments = len(reads_to_align)
-    if verbosity > 0:
-        log.log_section_header(stdout_header)
-    if VERBOSITY == 1:
+    if verbosity == 1:
         log.log_progress_line(0, num_alignments)
     completed_count = 0
 
@@ -190,48 +198,51 @@ def semi_global_align_long_reads(references, ref_fasta, read_dict, read_names, r
         for read in reads_to_align:
             output = seqan_alignment(read, reference_dict, scoring_scheme, ref_seqs_ptr,
                                      low_score_threshold, keep_bad, min_align_length,
-                                     sam_filename, allowed_overlap, minimap_alignments[read.name],
-                                     sensitivity_level, single_copy_segment_names)
+                                     sam_writer, allowed_overlap, minimap_alignments[read.name],
+                                     sensitivity_level, single_copy_segment_names, verbosity)
             completed_count += 1
-            if VERBOSITY == 1:
+            if verbosity == 1:
                 log.log_progress_line(completed_count, num_alignments)
-            if VERBOSITY > 1:
+            if verbosity > 1:
                 fraction = str(completed_count) + '/' + str(num_alignments) + ': '
                 log.log(fraction + output + '\n', 2, end='')
 
     # If multi-threaded, use a thread pool.
     else:
-        pool = ThreadPool(threads)
+        pool = get_thread_pool(threads)
         arg_list = []
         for read in reads_to_align:
             arg_list.append((read, reference_dict, scoring_scheme, ref_seqs_ptr,
                              low_score_threshold, keep_bad, min_align_length,
-                             sam_filename, allowed_overlap, minimap_alignments[read.name],
-                             sensitivity_level, single_copy_segment_names))
+                             sam_writer, allowed_overlap, minimap_alignments[read.name],
+                             sensitivity_level, single_copy_segment_names, verbosity))
 
         # If the verbosity is 1, then the order doesn't matter, so use imap_unordered to deliver
         # the results evenly. If the verbosity is higher, deliver the results in order with imap.
-        if VERBOSITY > 1:
+        if verbosity > 1:
             imap_function = pool.imap
         else:
             imap_function = pool.imap_unordered
 
         for output in imap_function(seqan_alignment_one_arg, arg_list):
             completed_count += 1
-            if VERBOSITY == 1:
+            if verbosity == 1:
                 log.log_progress_line(completed_count, num_alignments)
-            if VERBOSITY > 1:
+            if verbosity > 1:
                 fraction = str(completed_count) + '/' + str(num_alignments) + ': '
                 log.log(fraction + output + '\n', 2, end='')
 
     # We're done with the C++ ReferenceSeqs object, so delete it now.
     delete_ref_seqs(ref_seqs_ptr)
+    if sam_writer:
+        sam_writer.close()
 
-    if VERBOSITY == 1:
+    if verbosity == 1:
         log.log_progress_line(completed_count, completed_count, end_newline=True)
 
     if verbosity > 0:
-        print_alignment_summary_table(read_dict, VERBOSITY, using_contamination)
+        aligned_read_dict = {x.name: x for x in reads_to_align}
+        print_alignment_summary_table(aligned_read_dict, verbosity, using_contamination)
     return read_dict
 
 
@@ -309,6 +320,97 @@ def print_alignment_summary_table(read_dict, verbosity, using_contamination):
     mean_identity = weighted_average_list(identities, lengths)
     log.log('Mean alignment identity: ' + float_to_str(mean_identity, 1, max_v) + '%')
 
+    summary = [('Total read count', len(read_dict)), ('Fully aligned reads', len(fully_aligned)),
+               ('Partially aligned reads', len(partially_aligned)),
+               ('Unaligned reads', len(unaligned)), ('Total bases aligned', ref_bases_aligned),
+               ('Mean alignment identity', mean_identity)]
+    if using_contamination:
+        summary += [('Contaminant reads', contaminant_reads),
+                    ('Contaminant bases', contaminant_bases)]
+    report.add_table('read_alignment_summary', [[x[0] for x in summary], [x[1] for x in summary]])
+
+
+def get_sam_header(references, full_command, scoring_scheme):
+    """
+    Returns the header lines for a SAM file of alignments to the given references.
+    """
+    header = '@HD\tVN:1.5\tSO:unknown\n'
+    for ref in references:
+        header += '@SQ\tSN:' + ref.name + '\tLN:' + str(ref.get_length()) + '\n'
+    header += '@PG\tID:unicycler_align'
+    if full_command:
+        header += '\tCL:' + full_command + '\t'
+    header += 'SC:' + str(scoring_scheme) + '\n'
+    return header
+
+
+class SamWriter(object):
+    """
+    This class writes alignments to a SAM file from a background thread, so alignment threads
+    never have to wait on file I/O. Reads are written in the order they were given (not the order
+    they finish aligning) through a large write buffer. A filename ending in '.gz' gives gzipped
+    output.
+    """
+    def __init__(self, sam_filename, header, read_names):
+        self.sam_filename = sam_filename
+        self.header = header
+        self.read_names = read_names
+        self.queue = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target=self.write_sam_file)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def add_read(self, read_name, sam_lines):
+        self.queue.put((read_name, sam_lines))
+
+    def close(self):
+        """
+        Waits for the writer thread to finish writing everything it has been given.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            quit_with_error('could not write ' + self.sam_filename + ': ' + str(self.error))
+
+    def write_sam_file(self):
+        try:
+            if self.sam_filename.endswith('.gz'):
+                sam_file = gzip.open(self.sam_filename, 'wt')
+            else:
+                sam_file = open(self.sam_filename, 'wt',
+                                buffering=settings.SAM_WRITE_BUFFER_SIZE)
+            with sam_file:
+                sam_file.write(self.header)
+
+                # Reads which finish out of order wait here until the reads before them are done.
+                waiting_reads = {}
+                next_read_index = 0
+                while True:
+                    item = self.queue.get()
+                    if item is None:
+                        break
+                    read_name, sam_lines = item
+                    waiting_reads[read_name] = sam_lines
+                    ready_lines = []
+                    while next_read_index < len(self.read_names) and \
+                            self.read_names[next_read_index] in waiting_reads:
+                        ready_lines += waiting_reads.pop(self.read_names[next_read_index])
+                        next_read_index += 1
+                    if ready_lines:
+                        sam_file.write(''.join(ready_lines))
+
+                # Anything left over (reads given to the writer which weren't in its list of
+                # names) goes at the end.
+                for sam_lines in waiting_reads.values():
+                    sam_file.write(''.join(sam_lines))
+        except (IOError, OSError) as e:
+            self.error = e
+
+            # Keep taking from the queue so the alignment threads aren't held up.
+            while self.queue.get() is not None:
+                pass
+
 
 def load_sam_alignments(sam_filename, read_dict, reference_dict, scoring_scheme):
     """
@@ -317,12 +419,13 @@ def load_sam_alignments(sam_filename, read_dict, reference_dict, scoring_scheme)
     log.log_section_header('Loading alignments')
 
     sam_lines = []
-    sam_file = open(sam_filename, 'rt')
+    open_func = get_open_function(sam_filename)
+    sam_file = open_func(sam_filename, 'rt')
     for line in sam_file:
         line = line.strip()
         if line and not line.startswith('@') and line.split('\t', 3)[2] != '*':
             sam_lines.append(line)
-    num_alignments = sum(1 for line in open(sam_filename) if not line.startswith('@'))
+    num_alignments = sum(1 for line in open_func(sam_filename, 'rt') if not line.startswith('@'))
     if not num_alignments:
         return []
     log.log_progress_line(0, num_alignments)
@@ -359,17 +462,17 @@ def seqan_alignment_one_arg(all_args):
     in a thread pool.
     """
     read, reference_dict, scoring_scheme, ref_seqs_ptr, low_score_threshold, keep_bad, \
-        min_align_length, sam_filename, allowed_overlap, minimap_alignments, \
-        sensitivity_level, single_copy_segment_names = all_args
+        min_align_length, sam_writer, allowed_overlap, minimap_alignments, \
+        sensitivity_level, single_copy_segment_names, verbosity = all_args
     return seqan_alignment(read, reference_dict, scoring_scheme, ref_seqs_ptr,
                            low_score_threshold, keep_bad, min_align_length,
-                           sam_filename, allowed_overlap, minimap_alignments, sensitivity_level,
-                           single_copy_segment_names)
+                           sam_writer, allowed_overlap, minimap_alignments, sensitivity_level,
+                           single_copy_segment_names, verbosity)
 
 
 def seqan_alignment(read, reference_dict, scoring_scheme, ref_seqs_ptr, low_score_threshold,
-                    keep_bad, min_align_length, sam_filename, allowed_overlap,
-                    minimap_alignments, sensitivity_level, single_copy_segment_names):
+                    keep_bad, min_align_length, sam_writer, allowed_overlap,
+                    minimap_alignments, sensitivity_level, single_copy_segment_names, verbosity):
     """
     Aligns a single read against all reference sequences using Seqan.
     """
@@ -378,31 +481,28 @@ def seqan_alignment(read, reference_dict, scoring_scheme, ref_seqs_ptr, low_scor
 
     # Don't bother trying to align reads too short to have a good alignment.
     if read.get_length() < min_align_length:
-        if VERBOSITY > 1:
+        if verbosity > 1:
             output += '  too short to align\n'
     else:
         minimap_alignments_str = ';'.join([x.get_concise_string() for x in minimap_alignments])
-        alignment_strings = []
-
-        # Try at each sensitivity up to the current level. E.g. if sensitivity level is 2,
-        # we try the Seqan alignment at levels 0, 1 and 2. This produces many redundant
-        # alignments but we'll filter them out later.
-        for sensitivity in range(0, sensitivity_level+1):
-            results = semi_global_alignment(read.name, read.sequence, VERBOSITY,
-                                            minimap_alignments_str, ref_seqs_ptr,
-                                            scoring_scheme.match, scoring_scheme.mismatch,
-                                            scoring_scheme.gap_open, scoring_scheme.gap_extend,
-                                            low_score_threshold, keep_bad, sensitivity).split(';')
-
-            alignment_strings += results[:-1]
-            output += results[-1]
-
-            for alignment_string in alignment_strings:
-                alignment = Alignment(seqan_output=alignment_string, read=read,
-                                      reference_dict=reference_dict, scoring_scheme=scoring_scheme)
-                read.alignments.append(alignment)
-
-        if VERBOSITY > 2:
+
+        # The C++ aligner tries the read at sensitivity level 0 and then retries any reference
+        # ranges without a good alignment at each higher level, up to the given level. Alignments
+        # found at more than one level are only returned once.
+        results = semi_global_alignment(read.name, read.sequence, verbosity,
+                                        minimap_alignments_str, ref_seqs_ptr,
+                                        scoring_scheme.match, scoring_scheme.mismatch,
+                                        scoring_scheme.gap_open, scoring_scheme.gap_extend,
+                                        low_score_threshold, keep_bad,
+                                        sensitivity_level).split(';')
+        alignment_strings = results[:-1]
+        output += results[-1]
+        for alignment_string in alignment_strings:
+            alignment = Alignment(seqan_output=alignment_string, read=read,
+                                  reference_dict=reference_dict, scoring_scheme=scoring_scheme)
+            read.alignments.append(alignment)
+
+        if verbosity > 2:
             if not alignment_strings:
                 output += '  None\n'
             else:
@@ -415,23 +515,19 @@ def seqan_alignment(read, reference_dict, scoring_scheme, ref_seqs_ptr, low_scor
             read.remove_low_score_alignments(low_score_threshold)
         read.remove_short_alignments(min_align_length)
 
-        if VERBOSITY > 2:
+        if verbosity > 2:
             output += 'Final alignments:\n'
-        if VERBOSITY > 1:
+        if verbosity > 1:
             if read.alignments:
                 output += read.get_alignment_table()
             else:
                 output += '  None\n'
 
-        # Write alignments to SAM.
-        if sam_filename and read.alignments:
-            SAM_WRITE_LOCK.acquire()
-            sam_file = open(sam_filename, 'a')
-            for alignment in read.alignments:
-                if not alignment.ref.name.startswith('CONTAMINATION_'):
-                    sam_file.write(alignment.get_sam_line())
-            sam_file.close()
-            SAM_WRITE_LOCK.release()
+    # Pass the alignments to the SAM writer. This is done even for reads without alignments so the
+    # writer knows it can move on to the next read.
+    if sam_writer:
+        sam_writer.add_read(read.name, [x.get_sam_line() for x in read.alignments
+                                        if not x.ref.name.startswith('CONTAMINATION_')])
 
     # Colour the output title based on the alignment quality.
     if read.mostly_aligns_to_contamination() or not read.alignments:
@@ -470,46 +566,51 @@ def group_reads_by_fraction_aligned(read_dict):
     return fully_aligned_reads, partially_aligned_reads, unaligned_reads
 
 
-def get_auto_score_threshold(scoring_scheme, std_devs_over_mean):
+# Random alignment score mean and standard deviation for typical scoring schemes, made with a lot of
+# iterations so they should be pretty good.
+PRECOMPUTED_RANDOM_ALIGNMENT_SCORES = {
+    '1,0,0,0': (50.225667, 2.467919),
+    '0,-1,-1,-1': (49.024927, 2.724548),
+    '1,-1,-1,-1': (51.741783, 2.183467),
+    '5,-4,-8,-6': (42.707636, 2.435548),   # GraphMap
+    '5,-6,-10,0': (58.65047, 0.853201),    # BLASR
+    '2,-5,-2,-1': (72.712148, 0.95266),    # BWA-MEM
+    '1,-3,-5,-2': (46.257408, 2.162765),   # CUSHAW2 / blastn-short
+    '5,-11,-2,-4': (73.221967, 1.363692),  # proovread
+    '3,-6,-5,-2': (61.656918, 1.314624),   # Unicycler-align
+    '2,-3,-5,-2': (47.453862, 1.985947),   # blastn / dc-megablast
+    '1,-2,0,0': (81.720641, 0.77204),      # megablast
+    '0,-6,-5,-3': (62.647055, 1.738603),   # Bowtie2 end-to-end
+    '2,-6,-5,-3': (59.713806, 1.641191),   # Bowtie2 local
+    '1,-4,-6,-1': (60.328393, 1.176776),   # BWA
+}
+
+
+def get_auto_score_threshold(scoring_scheme, std_devs_over_mean, threads=1):
     """
     This function determines a good low score threshold for the alignments. To do this it examines
     the distribution of scores acquired by aligning random sequences.
     """
     # If the scoring scheme is a typical one, don't actually do the random alignments now - just
-    # use precomputed values (made with a lot of iterations so they should be pretty good).
+    # use precomputed values.
     scoring_scheme_str = str(scoring_scheme)
-    if scoring_scheme_str == '1,0,0,0':
-        mean, std_dev = 50.225667, 2.467919
-    elif scoring_scheme_str == '0,-1,-1,-1':
-        mean, std_dev = 49.024927, 2.724548
-    elif scoring_scheme_str == '1,-1,-1,-1':
-        mean, std_dev = 51.741783, 2.183467
-    elif scoring_scheme_str == '5,-4,-8,-6':   # GraphMap
-        mean, std_dev = 42.707636, 2.435548
-    elif scoring_scheme_str == '5,-6,-10,0':   # BLASR
-        mean, std_dev = 58.65047, 0.853201
-    elif scoring_scheme_str == '2,-5,-2,-1':   # BWA-MEM
-        mean, std_dev = 72.712148, 0.95266
-    elif scoring_scheme_str == '1,-3,-5,-2':   # CUSHAW2 / blastn-short
-        mean, std_dev = 46.257408, 2.162765
-    elif scoring_scheme_str == '5,-11,-2,-4':  # proovread
-        mean, std_dev = 73.221967, 1.363692
-    elif scoring_scheme_str == '3,-6,-5,-2':   # Unicycler-align
-        mean, std_dev = 61.656918, 1.314624
-    elif scoring_scheme_str == '2,-3,-5,-2':   # blastn / dc-megablast
-        mean, std_dev = 47.453862, 1.985947
-    elif scoring_scheme_str == '1,-2,0,0':     # megablast
-        mean, std_dev = 81.720641, 0.77204
-    elif scoring_scheme_str == '0,-6,-5,-3':   # Bowtie2 end-to-end
-        mean, std_dev = 62.647055, 1.738603
-    elif scoring_scheme_str == '2,-6,-5,-3':   # Bowtie2 local
-        mean, std_dev = 59.713806, 1.641191
-    elif scoring_scheme_str == '1,-4,-6,-1':   # BWA
-        mean, std_dev = 60.328393, 1.176776
-
-    # If scheme doesn't match any of the above, then we have to actually do the random alignments.
+    if scoring_scheme_str in PRECOMPUTED_RANDOM_ALIGNMENT_SCORES:
+        mean, std_dev = PRECOMPUTED_RANDOM_ALIGNMENT_SCORES[scoring_scheme_str]
+
+    # If the scheme doesn't match any of the above, then we have to actually do the random
+    # alignments, unless they were already done in an earlier run.
     else:
-        mean, std_dev = get_random_sequence_alignment_mean_and_std_dev(100, 25000, scoring_scheme)
+        cached_scores = load_random_alignment_cache()
+        cache_key = '%s (%d x %d bp)' % (scoring_scheme_str, settings.RANDOM_ALIGNMENT_COUNT,
+                                         settings.RANDOM_ALIGNMENT_SEQ_LENGTH)
+        try:
+            mean, std_dev = (float(x) for x in cached_scores[cache_key])
+        except (KeyError, TypeError, ValueError):
+            mean, std_dev = get_random_sequence_alignment_mean_and_std_dev(
+                settings.RANDOM_ALIGNMENT_SEQ_LENGTH, settings.RANDOM_ALIGNMENT_COUNT,
+                scoring_scheme, threads)
+            cached_scores[cache_key] = [mean, std_dev]
+            save_random_alignment_cache(cached_scores)
 
     threshold = mean + (std_devs_over_mean * std_dev)
 
@@ -518,3 +619,48 @@ def get_auto_score_threshold(scoring_scheme, std_devs_over_mean):
     threshold = max(threshold, 50.0)
 
     return threshold, mean, std_dev
+
+
+def get_random_alignment_cache_filename():
+    """
+    The random alignment cache is kept in the user's cache directory (following the XDG
+    convention), so it is shared by all of their Unicycler runs.
+    """
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'unicycler', settings.RANDOM_ALIGNMENT_CACHE_FILENAME)
+
+
+def load_random_alignment_cache():
+    cache_filename = get_random_alignment_cache_filename()
+    if not os.path.isfile(cache_filename):
+        return {}
+    try:
+        with open(cache_filename, 'rt') as cache_file:
+            cached_scores = json.load(cache_file)
+        if isinstance(cached_scores, dict):
+            return cached_scores
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def save_random_alignment_cache(cached_scores):
+    """
+    Failing to save the cache isn't a problem (e.g. if the home directory is read-only), it just
+    means the random alignments will be done again next time.
+    """
+    cache_filename = get_random_alignment_cache_filename()
+    temp_filename = cache_filename + '.' + str(os.getpid()) + '.tmp'
+    try:
+        os.makedirs(os.path.dirname(cache_filename), exist_ok=True)
+        with open(temp_filename, 'wt') as cache_file:
+            json.dump(cached_scores, cache_file)
+        os.replace(temp_filename, cache_filename)
+    except OSError:
+        pass
+    finally:
+        try:
+            if os.path.isfile(temp_filename):
+                os.remove(temp_filename)
+        except OSError:
+            pass